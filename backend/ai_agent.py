@@ -7,31 +7,73 @@ This module wires together all components:
 - ResponseOrchestrator for executing response protocols
 - WebSocketServer for broadcasting status updates to frontend
 
+One process can serve many homes (see sites): each site has its own
+analyzer, alarm state, protocols and dashboard model, while the Tuya
+transport, command dispatcher, processing stages and broadcast layer are
+shared.
+
 The agent processes Tuya device events in real-time, analyzes threat patterns,
 and coordinates appropriate responses.
+
+Time is read from an injectable clock (see clock); the replay engine (see
+replay) runs the same pipeline on virtual time.
 """
 
+import os
+
+# The green-thread WebSocket server mode needs the standard library patched
+# before anything else (threading, socket, time) is imported
+if os.getenv('WEBSOCKET_ASYNC_MODE', 'threading') == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
 import logging
+import threading
 import signal
 import sys
 import time
 from datetime import datetime
-from typing import Optional
+from typing import Callable, Dict, List, Optional, Tuple
 # dotenv import removed - handled in config.py
 
 from config import load_config
+from clock import SYSTEM_CLOCK, Clock
+from structured_logging import configure_logging, log_event, shutdown_logging
 from tuya_connection_manager import TuyaConnectionManager
 from threat_analyzer import ThreatAnalyzer
 from response_orchestrator import ResponseOrchestrator
 from websocket_server import WebSocketServer
+from dashboard_state import DashboardState
+from device_registry import DeviceRegistry, build_registry
+from event_history import KIND_CLASSIFICATION, KIND_SENSOR_EVENT, EventHistory
+from event_journal import RECORD_CLASSIFICATION, RECORD_EVENT, RECORD_RAW, EventJournal
+from broadcast_aggregator import BroadcastAggregator
+from broadcast_bus import BusPublisher, spawn_broadcast_workers, stop_broadcast_workers
+from state_snapshot import AgentSnapshot, StateSnapshotter
+from event_debouncer import DebounceRule, EventDebouncer
+from alarm_state_machine import AlarmStateMachine
+from notification_outbox import NotificationOutbox
+from protocol_plans import DEFAULT_PROTOCOLS, compile_protocols, load_protocol_file
+from command_dispatcher import CommandDispatcher
+from event_pipeline import OVERFLOW_BLOCK, PipelineStage
+from latency_tracing import configure_tracing, get_tracer
+from metrics import get_registry, start_metrics_server
+from sites import Site, SiteConfig, load_sites_file
+from config_reload import (OUTCOME_APPLIED, OUTCOME_PENDING, OUTCOME_REJECTED, ConfigWatcher,
+                           config_module_path, load_fresh_config, report_reload)
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
+_metrics = get_registry()
+_events_ingested_total = _metrics.counter(
+    'securex_events_ingested_total', 'Device events accepted for processing', ('device_type',))
+_events_suppressed_total = _metrics.counter(
+    'securex_events_suppressed_total', 'Device events dropped before analysis', ('reason',))
+_analyzer_evaluation_seconds = _metrics.histogram(
+    'securex_analyzer_evaluation_seconds', 'Threat analyzer insert plus sequence analysis time')
+_classifications_total = _metrics.counter(
+    'securex_classifications_total', 'Threat classifications', ('status',))
+
 
 class AIAgent:
     """
@@ -41,33 +83,98 @@ class AIAgent:
     to response execution and frontend visualization.
     """
     
-    def __init__(self):
-        """Initialize AI Agent and all components."""
+    def __init__(self, config=None, clock: Optional[Clock] = None,
+                 tuya_manager: Optional[TuyaConnectionManager] = None, broadcast_sink=None):
+        """
+        Initialize AI Agent and all components.
+        
+        Args:
+            config: Loaded configuration (load_config() if omitted)
+            clock: Time source (the system clock if omitted)
+            tuya_manager: Device transport to use instead of connecting a
+                          TuyaConnectionManager (e.g. the replay engine's)
+            broadcast_sink: Receiver of broadcasts (anything with emit() and
+                            emit_device_frame()) to use instead of the
+                            WebSocket server or broadcast bus
+        """
         logger.info("Initializing AI Agent...")
         
         # Load configuration
-        try:
-            self.config = load_config()
-            logger.info("Configuration loaded successfully")
-        except ValueError as e:
-            logger.error(f"Configuration error: {e}")
-            sys.exit(1)
+        if config is None:
+            try:
+                config = load_config()
+                logger.info("Configuration loaded successfully")
+            except ValueError as e:
+                logger.error(f"Configuration error: {e}")
+                sys.exit(1)
+        self.config = config
+        self.clock = clock or SYSTEM_CLOCK
+        self.broadcast_sink = broadcast_sink
         
         # Initialize components
-        self.tuya_manager: Optional[TuyaConnectionManager] = None
-        self.threat_analyzer: Optional[ThreatAnalyzer] = None
-        self.response_orchestrator: Optional[ResponseOrchestrator] = None
+        self.device_registry: Optional[DeviceRegistry] = None
+        self.tuya_manager: Optional[TuyaConnectionManager] = tuya_manager
         self.websocket_server: Optional[WebSocketServer] = None
+        self.event_history: Optional[EventHistory] = None
+        self.event_journal: Optional[EventJournal] = None
+        self.broadcast_aggregator: Optional[BroadcastAggregator] = None
+        self.broadcast_bus: Optional[BusPublisher] = None
+        self.broadcast_workers = []
+        self.metrics_server = None
+        self.notification_outbox: Optional[NotificationOutbox] = None
+        self.command_dispatcher: Optional[CommandDispatcher] = None
+        self.ingest_stage: Optional[PipelineStage] = None
+        self.response_stage: Optional[PipelineStage] = None
+        
+        # Sites by home ID (the configured home is the default site) and
+        # the site owning each device
+        self.sites: Dict[str, Site] = {}
+        self.default_site: Optional[Site] = None
+        self.device_sites: Dict[str, Site] = {}
+        
+        # Hot configuration reload (SIGHUP or a changed configuration file)
+        self.config_watcher: Optional[ConfigWatcher] = None
+        self.config_generation = 1
+        self.reload_requested = False
+        # (finish, swaps done) of a reload whose swaps have not all run yet
+        self._pending_reload: Optional[Tuple[Callable[[], None], List[threading.Event]]] = None
+        
+        # Last known device states restored from snapshot (skips hydration)
+        self.restored_device_states = {}
         
         # Shutdown flag
         self.shutdown_requested = False
         
-        # Set up signal handlers for graceful shutdown
-        signal.signal(signal.SIGINT, self._signal_handler)
-        signal.signal(signal.SIGTERM, self._signal_handler)
-        
         logger.info("AI Agent initialized")
     
+    def _setting(self, name: str, default):
+        """
+        Look up an optional setting.
+        
+        Checks the loaded config object (lowercase attribute) first, then the
+        environment (uppercase variable), then falls back to the default.
+        Environment strings are coerced to the type of the default.
+        
+        Args:
+            name: Setting name (e.g. SNAPSHOT_PATH)
+            default: Value used when the setting is not configured
+            
+        Returns:
+            The configured value or the default
+        """
+        value = getattr(self.config, name.lower(), None)
+        if value is not None:
+            return value
+        
+        value = os.getenv(name.upper())
+        if value is None:
+            return default
+        if isinstance(default, bool):
+            return value.strip().lower() in ('1', 'true', 'yes', 'on')
+        if isinstance(default, (int, float)):
+            return type(default)(value)
+        return value
+    
     def _signal_handler(self, signum, frame):
         """
         Handle shutdown signals for graceful termination.
@@ -79,129 +186,284 @@ class AIAgent:
         logger.info(f"Received signal {signum}, initiating graceful shutdown...")
         self.shutdown_requested = True
     
+    def _reload_signal_handler(self, signum, frame):
+        """
+        Handle SIGHUP: reload the configuration in the main loop.
+        
+        Args:
+            signum: Signal number
+            frame: Current stack frame
+        """
+        logger.info(f"Received signal {signum}, configuration reload requested")
+        self.reload_requested = True
+    
+    def _event_time(self, msg) -> datetime:
+        """
+        Extract the source event time from a Tuya message.
+        
+        Uses the timestamp stamped by the poller (epoch seconds) or the
+        Pulsar ``t`` field (epoch milliseconds), falling back to the
+        processing time if the message carries none.
+        
+        Args:
+            msg: Message from Tuya Cloud
+            
+        Returns:
+            datetime: When the event occurred at the source
+        """
+        if isinstance(msg, dict):
+            source_ts = msg.get('timestamp', msg.get('t'))
+            if isinstance(source_ts, (int, float)):
+                # Pulsar timestamps are in milliseconds
+                if source_ts > 1e11:
+                    source_ts = source_ts / 1000.0
+                return datetime.fromtimestamp(source_ts)
+        return self.clock.now()
+    
     def _on_tuya_message(self, msg):
         """
         Callback for incoming Tuya device messages.
         
-        Processes device events, adds them to threat analyzer, analyzes
-        the sequence, and triggers appropriate responses.
+        Runs on the poller thread: only normalizes the message and queues it
+        in the ingestion stage, so downstream processing never delays the
+        next poll.
         
         Args:
             msg: Message from Tuya Cloud containing device event data
         """
-        try:
-            logger.debug(f"Received Tuya message: {msg}")
+        log_event(logger, logging.DEBUG, 'tuya_message_received', msg=msg)
+        if self.event_journal:
+            self.event_journal.append(RECORD_RAW, msg)
+        
+        # Extract device information from message
+        # Tuya message format varies, handle common structures
+        device_id = None
+        event_data = {}
+        
+        if isinstance(msg, dict):
+            # Extract device_id from various possible locations
+            device_id = msg.get('devId') or msg.get('device_id') or msg.get('deviceId')
             
-            # Extract device information from message
-            # Tuya message format varies, handle common structures
-            device_id = None
-            event_data = {}
+            # Extract event data
+            if 'status' in msg:
+                event_data = msg['status']
+            elif 'data' in msg:
+                event_data = msg['data']
+            else:
+                event_data = msg
+        
+        if not device_id:
+            logger.warning(f"Could not extract device_id from message: {msg}")
+            return
+        
+        self.ingest_stage.put({
+            'device_id': device_id,
+            'event_data': event_data,
+            'timestamp': self._event_time(msg),
+            'trace_id': msg.get('trace_id'),
+            'queued_at': time.perf_counter()
+        })
+    
+    def _process_event(self, item: dict) -> None:
+        """
+        Ingestion stage worker: debounce, broadcast and classify one device event.
+        
+        Routes the event to the site owning the device, adds it to that
+        site's threat analyzer, analyzes the sequence, and queues the
+        classification for the response stage.
+        
+        Args:
+            item: Normalized event queued by _on_tuya_message
+        """
+        tracer = get_tracer()
+        device_id = item['device_id']
+        event_data = item['event_data']
+        timestamp = item['timestamp']
+        trace_id = item['trace_id']
+        ingest_started = time.perf_counter()
+        cpu_started = time.thread_time()
+        tracer.record(trace_id, 'ingest_queue', ingest_started - item['queued_at'])
+        
+        site = self.device_sites.get(device_id)
+        if site is None:
+            logger.warning(f"Unknown device ID: {device_id}")
+            return
+        
+        try:
+            log_event(logger, logging.INFO, 'device_event', device_id=device_id, home=site.home_id)
             
-            if isinstance(msg, dict):
-                # Extract device_id from various possible locations
-                device_id = msg.get('devId') or msg.get('device_id') or msg.get('deviceId')
-                
-                # Extract event data
-                if 'status' in msg:
-                    event_data = msg['status']
-                elif 'data' in msg:
-                    event_data = msg['data']
-                else:
-                    event_data = msg
+            # Broadcast device state change to frontend (sensors and
+            # actuators), debounced or not, so the dashboard never shows a
+            # stale state; unchanged datapoints produce no delta
+            self._broadcast_device_update(site, device_id, event_data, trace_id=trace_id)
             
-            if not device_id:
-                logger.warning(f"Could not extract device_id from message: {msg}")
+            # Drop chattering/duplicate events before they reach analysis
+            if not site.event_debouncer.should_process(device_id, event_data, timestamp):
+                _events_suppressed_total.labels('debounce').inc()
                 return
             
-            logger.info(f"Processing event from device: {device_id}")
-            
-            # Handle all device events - both sensors and actuators
-            all_devices = [
-                self.config.living_room_motion_id,
-                self.config.window_vibration_id,
-                self.config.front_door_lock_id,
-                self.config.smart_bulb_id,
-                self.config.siren_id
-            ]
-            
-            # Broadcast device state change to frontend
-            self._broadcast_device_update(device_id, event_data)
+            device_info = site.registry.info(device_id)
+            _events_ingested_total.labels(device_info['type']).inc()
             
             # Only process sensor events for threat analysis
-            sensor_devices = [
-                self.config.living_room_motion_id,
-                self.config.window_vibration_id,
-                self.config.front_door_lock_id
-            ]
-            
-            if device_id not in sensor_devices:
-                logger.info(f"Device state updated (actuator): {device_id}")
+            if not site.registry.is_sensor(device_id):
+                log_event(logger, logging.INFO, 'actuator_state_updated', device_id=device_id)
                 return
             
-            # Add event to threat analyzer with current timestamp
-            timestamp = datetime.now()
-            self.threat_analyzer.add_event(device_id, event_data, timestamp)
+            # Add event to threat analyzer with its source (event) time
+            analyzer = site.threat_analyzer
+            analysis_started = time.perf_counter()
+            event = analyzer.add_event(device_id, event_data, timestamp, trace_id=trace_id)
+            if event is None:
+                # Older than the watermark - too late to analyze
+                _events_suppressed_total.labels('late').inc()
+                return
             
-            # Analyze the event sequence
-            status, zone = self.threat_analyzer.analyze_sequence(
-                living_room_motion_id=self.config.living_room_motion_id,
-                window_vibration_id=self.config.window_vibration_id,
-                front_door_lock_id=self.config.front_door_lock_id
+            self.event_history.record(
+                KIND_SENSOR_EVENT,
+                timestamp=event.timestamp.isoformat(),
+                device_id=device_id,
+                device_type=device_info['type'],
+                zone=device_info['zone'],
+                home=site.home_id,
+                state=event_data
             )
+            if self.event_journal:
+                self.event_journal.append(RECORD_EVENT, {
+                    'device_id': device_id,
+                    'device_type': device_info['type'],
+                    'zone': device_info['zone'],
+                    'home': site.home_id,
+                    'event_time': event.timestamp.isoformat(),
+                    'state': event_data,
+                    'trace_id': trace_id
+                })
             
-            logger.info(f"Threat analysis result: {status} in {zone}")
-            
-            # Execute appropriate response protocol
-            if status == "RED_CRITICAL":
-                self.response_orchestrator.execute_red_protocol(zone)
-            elif status == "YELLOW_WARNING":
-                self.response_orchestrator.execute_yellow_protocol(zone)
-            elif status == "GREEN_SAFE":
-                self.response_orchestrator.execute_green_protocol(zone)
+            if analyzer.is_late(event):
+                # Out-of-order arrival: only re-check the windows it falls into
+                result = analyzer.analyze_late_event(
+                    event,
+                    living_room_motion_id=site.motion_id,
+                    window_vibration_id=site.window_id
+                )
+                if result is None:
+                    return
+                status, zone = result
             else:
-                logger.warning(f"Unknown status: {status}")
+                # Analyze the event sequence
+                status, zone = analyzer.analyze_sequence(
+                    living_room_motion_id=site.motion_id,
+                    window_vibration_id=site.window_id,
+                    front_door_lock_id=site.door_lock_id
+                )
+            
+            analysis_seconds = time.perf_counter() - analysis_started
+            tracer.record(trace_id, 'analysis', analysis_seconds)
+            _analyzer_evaluation_seconds.observe(analysis_seconds)
+            _classifications_total.labels(status).inc()
+            log_event(logger, logging.INFO, 'threat_analysis_result', status=status, zone=zone, home=site.home_id)
+            self.event_history.record(
+                KIND_CLASSIFICATION,
+                timestamp=event.timestamp.isoformat(),
+                device_id=device_id,
+                status=status,
+                zone=zone,
+                home=site.home_id,
+                score=analyzer.last_score,
+                pattern=analyzer.last_pattern
+            )
+            if self.event_journal:
+                self.event_journal.append(RECORD_CLASSIFICATION, {
+                    'device_id': device_id,
+                    'home': site.home_id,
+                    'status': status,
+                    'zone': zone,
+                    'score': analyzer.last_score,
+                    'pattern': analyzer.last_pattern,
+                    'event_time': event.timestamp.isoformat(),
+                    'trace_id': trace_id
+                })
+            
+            # Execute the response protocol only on alarm state transitions
+            self.response_stage.put({
+                'kind': 'classification',
+                'site': site,
+                'status': status,
+                'zone': zone,
+                'score': analyzer.last_score,
+                'now': event.timestamp,
+                'disarm': analyzer.last_pattern == 'door_unlock',
+                'pattern': analyzer.last_pattern,
+                'trace_id': event.trace_id
+            })
         
         except Exception as e:
             logger.error(f"Error processing Tuya message: {e}", exc_info=True)
+        
+        finally:
+            ingest_seconds = time.perf_counter() - ingest_started
+            tracer.record(trace_id, 'ingest', ingest_seconds)
+            site.account_event(ingest_seconds, time.thread_time() - cpu_started)
+    
+    def _respond(self, item: dict) -> None:
+        """
+        Response stage: feed a classification or auto-clear tick into the orchestrator.
+        
+        All alarm state changes run on this stage's single worker thread.
+        
+        Args:
+            item: {'kind': 'classification', 'site': Site, ...} from
+                  _process_event or {'kind': 'tick', 'now': datetime} from
+                  the main loop
+        """
+        if item['kind'] == 'tick':
+            # Timed auto-clear of a quiet alarm, for every site
+            for site in self.sites.values():
+                cpu_started = time.thread_time()
+                transition = site.response_orchestrator.check_auto_clear(item['now'])
+                site.account_work(time.thread_time() - cpu_started, transition=transition is not None)
+            return
+        
+        site = item['site']
+        cpu_started = time.thread_time()
+        with get_tracer().span(item['trace_id'], 'response', status=item['status']):
+            transition = site.response_orchestrator.handle_classification(
+                item['status'], item['zone'],
+                score=item['score'],
+                now=item['now'],
+                disarm=item['disarm'],
+                trace_id=item['trace_id'],
+                pattern=item.get('pattern')
+            )
+        site.account_work(time.thread_time() - cpu_started, transition=transition is not None)
     
-    def _broadcast_device_update(self, device_id: str, event_data: dict):
+    def _broadcast_device_update(self, site: Site, device_id: str, event_data: dict,
+                                 trace_id: Optional[str] = None):
         """
         Broadcast device state update to frontend clients.
         
         Args:
+            site: Site owning the device
             device_id: ID of the device that changed state
             event_data: New state data from the device
+            trace_id: Latency trace of the event, if traced
         """
         try:
-            # Map device IDs to friendly names and locations
-            device_mapping = {
-                self.config.living_room_motion_id: {'name': 'Motion Sensor', 'location': 'Living Room', 'type': 'motion'},
-                self.config.window_vibration_id: {'name': 'Window Sensor', 'location': 'Master Bedroom', 'type': 'window'},
-                self.config.front_door_lock_id: {'name': 'Door Lock', 'location': 'Foyer', 'type': 'door-lock'},
-                self.config.smart_bulb_id: {'name': 'Smart Bulb', 'location': 'Master Bedroom', 'type': 'bulb'},
-                self.config.siren_id: {'name': 'Siren', 'location': 'Foyer', 'type': 'siren'}
-            }
+            device_info = site.registry.info(device_id)
             
-            device_info = device_mapping.get(device_id)
-            if not device_info:
-                logger.warning(f"Unknown device ID: {device_id}")
+            # Create device update delta (changed datapoints only); the
+            # site's model stamps its home for routing
+            update_message = site.dashboard_state.apply_device(
+                device_id, device_info, event_data, self.clock.now().isoformat()
+            )
+            if update_message is None:
                 return
             
-            # Create device update message
-            update_message = {
-                'type': 'device_update',
-                'device_id': device_id,
-                'device_type': device_info['type'],
-                'device_name': device_info['name'],
-                'location': device_info['location'],
-                'state': event_data,
-                'timestamp': datetime.now().isoformat()
-            }
-            
             # Broadcast to all connected clients
-            if self.websocket_server:
-                self.websocket_server.get_socketio().emit('device_update', update_message)
-                logger.info(f"Broadcasted device update: {device_info['name']} in {device_info['location']}")
+            if self.broadcast_aggregator:
+                self.broadcast_aggregator.emit('device_update', update_message, trace_id=trace_id)
+                log_event(logger, logging.INFO, 'device_update_broadcast',
+                          device=device_info['name'], location=device_info['location'])
         
         except Exception as e:
             logger.error(f"Error broadcasting device update: {e}", exc_info=True)
@@ -213,52 +475,549 @@ class AIAgent:
         Creates instances of:
         - WebSocketServer for frontend communication
         - TuyaConnectionManager for device communication
-        - ThreatAnalyzer for event processing
-        - ResponseOrchestrator for response coordination
+        - One Site per home (ThreatAnalyzer, ResponseOrchestrator, ...)
+        - CommandDispatcher and pipeline stages shared by all sites
+        
+        Raises:
+            ValueError: If the device or sites configuration is invalid
         """
         logger.info("Initializing system components...")
         
-        # Initialize WebSocket server first (needed by ResponseOrchestrator)
-        self.websocket_server = WebSocketServer(host='0.0.0.0', port=5000)
-        logger.info("WebSocket server initialized")
-        
-        # Initialize Tuya Connection Manager
-        device_ids = {
-            'LIVING_ROOM_MOTION_ID': self.config.living_room_motion_id,
-            'WINDOW_VIBRATION_ID': self.config.window_vibration_id,
-            'FRONT_DOOR_LOCK_ID': self.config.front_door_lock_id,
-            'SMART_BULB_ID': self.config.smart_bulb_id,
-            'SIREN_ID': self.config.siren_id
-        }
-        
-        self.tuya_manager = TuyaConnectionManager(
-            client_id=self.config.client_id,
-            secret_key=self.config.secret_key,
-            device_ids=device_ids
+        # Device lookup tables, built once: the configured home is the
+        # default site, SITES_FILE lists further sites
+        registries, protocol_files, config_files = self._load_sites()
+        home_id = next(iter(registries))
+        self.device_registry = self._combined_registry(registries)
+        logger.info(f"Device registry built ({len(self.device_registry)} devices, {len(registries)} sites)")
+        
+        # Authoritative dashboard model of each site: snapshot on connect, deltas after
+        dashboard_states = {site_home: DashboardState(home=site_home) for site_home in registries}
+        
+        # Recent events, classifications and protocol runs for /events and /status/history
+        self.event_history = EventHistory(self._setting('EVENT_HISTORY_SIZE', 1000))
+        
+        # Append-only journal of raw messages, events, classifications and commands
+        journal_dir = self._setting('JOURNAL_DIR', '')
+        if journal_dir:
+            self.event_journal = EventJournal(
+                journal_dir,
+                segment_bytes=int(self._setting('JOURNAL_SEGMENT_MB', 64) * 1024 * 1024),
+                commit_interval_seconds=self._setting('JOURNAL_COMMIT_INTERVAL_SECONDS', 0.05),
+                max_segments=self._setting('JOURNAL_MAX_SEGMENTS', 0)
+            )
+            logger.info(f"Event journal initialized in {journal_dir}")
+        
+        # Initialize the broadcast layer first (needed by ResponseOrchestrator):
+        # either an in-process WebSocket server, or a local bus feeding
+        # separate broadcast worker processes (or the injected sink)
+        if self.broadcast_sink is not None:
+            broadcast_sink = self.broadcast_sink
+        elif self._setting('BROADCAST_WORKERS', 0) > 0:
+            if len(registries) > 1:
+                # Workers mirror a single dashboard model
+                raise ValueError("BROADCAST_WORKERS cannot be combined with SITES_FILE")
+            self.broadcast_bus = BusPublisher(
+                self._setting('BROADCAST_BUS_PATH', '/tmp/securex_bus.sock'),
+                snapshot_provider=dashboard_states[home_id].snapshot,
+                history_provider=self.event_history.records
+            )
+            self.event_history.add_listener(self.broadcast_bus.emit_history)
+            broadcast_sink = self.broadcast_bus
+            logger.info("Broadcast bus initialized")
+        else:
+            self.websocket_server = WebSocketServer(
+                host='0.0.0.0',
+                port=5000,
+                async_mode=os.getenv('WEBSOCKET_ASYNC_MODE', 'threading'),
+                ping_interval=self._setting('WEBSOCKET_PING_INTERVAL_SECONDS', 25),
+                ping_timeout=self._setting('WEBSOCKET_PING_TIMEOUT_SECONDS', 20),
+                state=dashboard_states[home_id],
+                default_home=home_id,
+                history=self.event_history,
+                max_backlog_frames=self._setting('WEBSOCKET_MAX_BACKLOG_FRAMES', 32),
+                disconnect_backlog_frames=self._setting('WEBSOCKET_DISCONNECT_BACKLOG_FRAMES', 512),
+                slow_consumer_seconds=self._setting('WEBSOCKET_SLOW_CONSUMER_SECONDS', 30.0),
+                site_states={site_home: state for site_home, state in dashboard_states.items()
+                             if site_home != home_id}
+            )
+            broadcast_sink = self.websocket_server
+            logger.info("WebSocket server initialized")
+        
+        # All broadcasts go through the aggregator: device updates are sent
+        # in fixed-rate frames, status changes immediately
+        self.broadcast_aggregator = BroadcastAggregator(
+            broadcast_sink,
+            tick_seconds=self._setting('BROADCAST_TICK_SECONDS', 0.1)
+        )
+        
+        # Initialize Tuya Connection Manager (one transport for every site)
+        if self.tuya_manager is None:
+            self.tuya_manager = TuyaConnectionManager(
+                client_id=self.config.client_id,
+                secret_key=self.config.secret_key,
+                device_ids=self.device_registry.name_map()
+            )
+            logger.info("Tuya Connection Manager initialized")
+        
+        # Initialize webhook notification outbox if a webhook is configured
+        webhook_url = self._setting('WEBHOOK_URL', '')
+        if webhook_url and webhook_url != 'your_webhook_url_here':
+            self.notification_outbox = NotificationOutbox(
+                path=self._setting('OUTBOX_PATH', 'securex_outbox.db'),
+                channels={'default': webhook_url},
+                max_attempts=self._setting('WEBHOOK_MAX_ATTEMPTS', 8),
+                dedupe_window_seconds=self._setting('WEBHOOK_DEDUPE_WINDOW_SECONDS', 60.0),
+                retention_seconds=self._setting('OUTBOX_RETENTION_SECONDS', 7 * 24 * 3600)
+            )
+            logger.info("Notification outbox initialized")
+        else:
+            logger.info("No webhook configured, notifications are logged only")
+        
+        # Coalesce close-together commands to the same device into one request;
+        # critical commands preempt and get reserved workers and rate budget
+        self.command_dispatcher = CommandDispatcher(
+            self.tuya_manager,
+            coalesce_window_seconds=self._setting('COMMAND_COALESCE_WINDOW_SECONDS', 0.15),
+            max_workers=self._setting('COMMAND_MAX_WORKERS', 4),
+            critical_reserved_workers=self._setting('COMMAND_CRITICAL_RESERVED_WORKERS', 1),
+            rate_limit_per_second=self._setting('COMMAND_RATE_LIMIT_PER_SECOND', 0.0),
+            rate_limit_burst=self._setting('COMMAND_RATE_LIMIT_BURST', 10.0),
+            critical_reserved_tokens=self._setting('COMMAND_CRITICAL_RESERVED_TOKENS', 2.0),
+            clock=self.clock
+        )
+        
+        # Per-site analyzer, alarm state, protocols and debouncer
+        for site_home, registry in registries.items():
+            site = self._build_site(
+                self._compile_site_config(site_home, registry, protocol_files[site_home]),
+                dashboard_states[site_home],
+                snapshot_path=self._snapshot_path(site_home, home_id)
+            )
+            self.sites[site_home] = site
+            for device_id in registry.ids():
+                self.device_sites[device_id] = site
+        self.default_site = self.sites[home_id]
+        logger.info(f"{len(self.sites)} site(s) initialized: {', '.join(self.sites)}")
+        
+        # Staged pipeline: the poller queues events in the ingestion stage,
+        # whose worker analyzes them and queues classifications for the response stage. A full
+        # response queue holds the ingestion worker up to 60 s (block), backing up into the
+        # ingestion queue, whose overflow policy is configurable; only then is a classification
+        # dropped (and counted in securex_pipeline_dropped_total).
+        self.ingest_stage = PipelineStage(
+            'ingest',
+            self._process_event,
+            capacity=self._setting('INGEST_QUEUE_SIZE', 1000),
+            overflow=self._setting('INGEST_OVERFLOW_POLICY', 'drop_oldest')
+        )
+        self.response_stage = PipelineStage(
+            'response',
+            self._respond,
+            capacity=self._setting('RESPONSE_QUEUE_SIZE', 100),
+            overflow=OVERFLOW_BLOCK,
+            block_timeout_seconds=60.0
+        )
+        
+        # Watch the configuration files for hot reload
+        self.config_watcher = ConfigWatcher(self._setting('CONFIG_WATCH_INTERVAL_SECONDS', 5.0))
+        self.config_watcher.watch(config_files + [config_module_path()])
+        
+        logger.info("All components initialized successfully")
+    
+    def _load_sites(self):
+        """
+        Read the devices and protocol file of every site from the configuration.
+        
+        Returns:
+            Tuple[Dict[str, DeviceRegistry], Dict[str, str], List[str]]:
+            Registry and protocol file per home (the default home first),
+            and the configuration files that were read
+            
+        Raises:
+            ValueError: If a device or sites file is invalid
+            OSError: If a device or sites file cannot be read
+        """
+        home_id = self._setting('HOME_ID', 'home')
+        devices_file = self._setting('DEVICES_FILE', '')
+        sites_file = self._setting('SITES_FILE', '')
+        registries = {home_id: build_registry(self.config, home_id=home_id, devices_file=devices_file)}
+        protocol_files = {home_id: self._setting('PROTOCOLS_FILE', '')}
+        config_files = [devices_file, sites_file]
+        for definition in (load_sites_file(sites_file) if sites_file else []):
+            if definition.home_id in registries:
+                raise ValueError(f"Site '{definition.home_id}' is already defined")
+            registries[definition.home_id] = DeviceRegistry(definition.devices)
+            protocol_files[definition.home_id] = definition.protocols_file
+            config_files.append(definition.devices_file)
+        config_files.extend(protocol_files.values())
+        return registries, protocol_files, config_files
+    
+    @staticmethod
+    def _combined_registry(registries: Dict[str, DeviceRegistry]) -> DeviceRegistry:
+        """All devices of all sites (rejects a device registered to two sites)."""
+        return DeviceRegistry(
+            registry.get(device_id) for registry in registries.values() for device_id in registry.ids()
+        )
+    
+    def _snapshot_path(self, home_id: str, default_home: str) -> str:
+        """Snapshot file of a site (securex_state.snap, further sites securex_state.<home>.snap)."""
+        snapshot_path = self._setting('SNAPSHOT_PATH', 'securex_state.snap')
+        if home_id == default_home:
+            return snapshot_path
+        root, ext = os.path.splitext(snapshot_path)
+        return f"{root}.{home_id}{ext}"
+    
+    def _compile_site_config(self, home_id: str, registry: DeviceRegistry, protocols_file: str) -> SiteConfig:
+        """
+        Validate and precompile one site's configuration.
+        
+        Args:
+            home_id: Home ID of the site
+            registry: The site's devices
+            protocols_file: Response protocol file ('' = built-in protocols)
+            
+        Returns:
+            SiteConfig: The compiled configuration
+            
+        Raises:
+            ValueError: If the protocols or thresholds are invalid
+            OSError: If the protocol file cannot be read
+        """
+        # Compile response protocols (from the protocol file if configured)
+        protocol_definition = load_protocol_file(protocols_file) if protocols_file else DEFAULT_PROTOCOLS
+        protocol_plans = compile_protocols(protocol_definition, registry.inventory())
+        
+        # Motion and vibration sensors re-trigger constantly; the lock and
+        # actuators only have identical consecutive reports collapsed.
+        sensor_rule = DebounceRule(
+            min_retrigger_seconds=self._setting('DEBOUNCE_MIN_RETRIGGER_SECONDS', 2.0),
+            collapse_identical=True,
+            burst_window_seconds=self._setting('DEBOUNCE_BURST_WINDOW_SECONDS', 1.0)
         )
-        logger.info("Tuya Connection Manager initialized")
+        
+        return SiteConfig(
+            home_id=home_id,
+            registry=registry,
+            protocol_plans=protocol_plans,
+            default_debounce_rule=DebounceRule(collapse_identical=True),
+            debounce_rules={device_id: sensor_rule for device_id in registry.ids_of_type('motion', 'window')},
+            window_seconds=self._setting('MOTION_VIBRATION_WINDOW_SECONDS', 10.0),
+            allowed_lateness_seconds=self._setting('ALLOWED_LATENESS_SECONDS', 30.0),
+            critical_threshold=self._setting('CRITICAL_THREAT_THRESHOLD', 80.0),
+            warning_threshold=self._setting('WARNING_THREAT_THRESHOLD', 40.0),
+            hysteresis=self._setting('ALARM_HYSTERESIS', 10.0),
+            min_hold_seconds={
+                'RED_CRITICAL': self._setting('RED_HOLD_SECONDS', 60.0),
+                'YELLOW_WARNING': self._setting('YELLOW_HOLD_SECONDS', 15.0)
+            },
+            auto_clear_seconds={
+                'RED_CRITICAL': self._setting('RED_AUTO_CLEAR_SECONDS', 300.0),
+                'YELLOW_WARNING': self._setting('YELLOW_AUTO_CLEAR_SECONDS', 120.0)
+            }
+        )
+    
+    def _build_site(self, config: SiteConfig, dashboard_state: DashboardState, snapshot_path: str) -> Site:
+        """
+        Create one site's detection and response components.
+        
+        Args:
+            config: The site's compiled configuration
+            dashboard_state: The site's dashboard model
+            snapshot_path: The site's state snapshot file
+            
+        Returns:
+            Site: The site
+        """
+        registry = config.registry
         
         # Initialize Threat Analyzer
-        self.threat_analyzer = ThreatAnalyzer()
-        logger.info("Threat Analyzer initialized")
+        threat_analyzer = ThreatAnalyzer(
+            allowed_lateness_seconds=config.allowed_lateness_seconds,
+            window_seconds=config.window_seconds,
+            critical_threshold=config.critical_threshold,
+            warning_threshold=config.warning_threshold
+        )
         
-        # Initialize Response Orchestrator
-        self.response_orchestrator = ResponseOrchestrator(
+        alarm_state = AlarmStateMachine(
+            critical_threshold=config.critical_threshold,
+            warning_threshold=config.warning_threshold,
+            hysteresis=config.hysteresis,
+            min_hold_seconds=dict(config.min_hold_seconds),
+            auto_clear_seconds=dict(config.auto_clear_seconds)
+        )
+        response_orchestrator = ResponseOrchestrator(
             tuya_manager=self.tuya_manager,
-            socketio=self.websocket_server.get_socketio(),
-            smart_bulb_id=self.config.smart_bulb_id,
-            siren_id=self.config.siren_id,
-            front_door_lock_id=self.config.front_door_lock_id
+            socketio=self.broadcast_aggregator,
+            smart_bulb_id=registry.first('bulb'),
+            siren_id=registry.first('siren'),
+            front_door_lock_id=registry.first('door-lock'),
+            alarm_state=alarm_state,
+            notification_outbox=self.notification_outbox,
+            protocol_plans=config.protocol_plans,
+            command_dispatcher=self.command_dispatcher,
+            dashboard_state=dashboard_state,
+            event_history=self.event_history,
+            home_id=config.home_id,
+            event_journal=self.event_journal,
+            clock=self.clock
         )
-        logger.info("Response Orchestrator initialized")
         
-        logger.info("All components initialized successfully")
+        # Initialize debounce stage for chattering sensors
+        event_debouncer = EventDebouncer(
+            default_rule=config.default_debounce_rule,
+            device_rules=config.debounce_rules
+        )
+        
+        # Initialize state snapshotter for warm restarts
+        state_snapshotter = StateSnapshotter(
+            path=snapshot_path,
+            interval_seconds=self._setting('SNAPSHOT_INTERVAL_SECONDS', 30.0),
+            max_age_seconds=self._setting('SNAPSHOT_MAX_AGE_SECONDS', 3600.0),
+            clock=self.clock
+        )
+        
+        logger.info(f"Site '{config.home_id}' initialized ({len(registry)} devices)")
+        return Site(config, threat_analyzer, response_orchestrator,
+                    event_debouncer, dashboard_state, state_snapshotter)
+    
+    def restore_state(self) -> bool:
+        """
+        Restore detection state from the last snapshots, if any.
+        
+        Reloads each site's analyzer event buffer and orchestrator warning
+        states so sequences that started before a restart are still
+        detected, and keeps the last known device states so subscription
+        can skip hydration.
+        
+        Returns:
+            bool: True if at least one site's snapshot was restored
+        """
+        restored = False
+        for site in self.sites.values():
+            restored = self._restore_site(site) or restored
+        return restored
+    
+    def _restore_site(self, site: Site) -> bool:
+        """
+        Restore one site from its snapshot.
+        
+        Args:
+            site: Site to restore
+            
+        Returns:
+            bool: True if a snapshot was restored
+        """
+        snapshot = site.state_snapshotter.load()
+        if snapshot is None:
+            return False
+        
+        site.threat_analyzer.restore_events(snapshot.events)
+        site.response_orchestrator.restore_warning_states(snapshot.warning_states)
+        site.response_orchestrator.alarm_state.restore(
+            snapshot.alarm_state,
+            snapshot.alarm_zone,
+            datetime.fromtimestamp(snapshot.alarm_entered_at) if snapshot.alarm_entered_at else None,
+            datetime.fromtimestamp(snapshot.alarm_last_trigger_at) if snapshot.alarm_last_trigger_at else None
+        )
+        self.restored_device_states.update(snapshot.device_states)
+        site.dashboard_state.apply_status(snapshot.alarm_state, snapshot.alarm_zone)
+        
+        now = self.clock.time()
+        for name, due in snapshot.deadlines.items():
+            if due < now:
+                logger.info(f"Sequence window '{name}' of site '{site.home_id}' closed while agent was down")
+            else:
+                logger.info(f"Sequence window '{name}' of site '{site.home_id}' still open for {due - now:.1f}s")
+        
+        return True
+    
+    def save_state(self) -> None:
+        """Write a snapshot of every site's current detection state to disk."""
+        for site in self.sites.values():
+            self._save_site(site)
+    
+    def _save_site(self, site: Site) -> None:
+        """
+        Write a snapshot of one site's detection state.
+        
+        Args:
+            site: Site to snapshot
+        """
+        try:
+            alarm = site.response_orchestrator.alarm_state
+            deadlines = site.threat_analyzer.get_pending_deadlines(site.motion_id, site.window_id)
+            auto_clear = alarm.get_auto_clear_deadline()
+            if auto_clear is not None:
+                deadlines['alarm_auto_clear'] = auto_clear
+            
+            device_states = getattr(self.tuya_manager, 'device_states', {})
+            snapshot = AgentSnapshot(
+                saved_at=self.clock.time(),
+                events=site.threat_analyzer.get_events(),
+                deadlines=deadlines,
+                warning_states=sorted(site.response_orchestrator.warning_states),
+                device_states={device_id: device_states[device_id]
+                               for device_id in site.registry.ids() if device_id in device_states},
+                alarm_state=alarm.state,
+                alarm_zone=alarm.zone,
+                alarm_entered_at=alarm.entered_at.timestamp() if alarm.entered_at else 0.0,
+                alarm_last_trigger_at=alarm.last_trigger_at.timestamp() if alarm.last_trigger_at else 0.0
+            )
+            site.state_snapshotter.save(snapshot)
+        except Exception as e:
+            logger.error(f"Error saving state snapshot of site '{site.home_id}': {e}", exc_info=True)
+    
+    def reload_config(self, trigger: str) -> bool:
+        """
+        Reload the configuration without restarting.
+        
+        Loads, validates and compiles the new configuration on the calling
+        (main) thread while events keep flowing, then swaps it in between
+        two pipeline items. Analyzer buffers, debounce history and alarm
+        states are kept; new sites are created and removed sites dropped
+        (after a last snapshot). A configuration that fails to load or
+        compile is rejected and nothing changes.
+        
+        Args:
+            trigger: What requested the reload (SIGHUP or the changed files)
+            
+        Returns:
+            bool: True if the new configuration was applied
+        """
+        started = time.perf_counter()
+        previous_config = self.config
+        home_id = self.default_site.home_id
+        try:
+            self.config = load_fresh_config()
+            registries, protocol_files, config_files = self._load_sites()
+            if next(iter(registries)) != home_id:
+                raise ValueError("HOME_ID cannot be changed without a restart")
+            if self.broadcast_bus and len(registries) > 1:
+                raise ValueError("BROADCAST_WORKERS cannot be combined with SITES_FILE")
+            device_registry = self._combined_registry(registries)
+            site_configs = {
+                site_home: self._compile_site_config(site_home, registry, protocol_files[site_home])
+                for site_home, registry in registries.items()
+            }
+        except Exception as e:
+            # Includes errors in config.py itself; the running configuration stays
+            self.config = previous_config
+            report_reload(OUTCOME_REJECTED, time.perf_counter() - started, self.config_generation,
+                          trigger=trigger, error=str(e))
+            return False
+        
+        if (self.config.client_id, self.config.secret_key) != (previous_config.client_id, previous_config.secret_key):
+            logger.warning("Tuya credential changes take effect after a restart")
+        
+        # New sites are built whole (resuming their snapshot, if any);
+        # existing sites keep their components and get the new configuration
+        old_sites = self.sites
+        sites: Dict[str, Site] = {}
+        added = []
+        for site_home, site_config in site_configs.items():
+            site = old_sites.get(site_home)
+            if site is None:
+                site = self._build_site(site_config, DashboardState(home=site_home),
+                                        self._snapshot_path(site_home, home_id))
+                self._restore_site(site)
+                added.append(site_home)
+            sites[site_home] = site
+        removed = [site_home for site_home in old_sites if site_home not in sites]
+        device_sites = {device_id: sites[site_home]
+                        for site_home, registry in registries.items() for device_id in registry.ids()}
+        
+        detection_swapped = threading.Event()
+        response_swapped = threading.Event()
+        
+        def swap_detection():
+            for site_home, site_config in site_configs.items():
+                if site_home not in added:
+                    sites[site_home].apply_detection_config(site_config)
+            self.device_sites = device_sites
+            detection_swapped.set()
+        
+        def swap_response():
+            for site_home, site_config in site_configs.items():
+                if site_home not in added:
+                    sites[site_home].apply_response_config(site_config)
+            self.sites = sites
+            response_swapped.set()
+        
+        def finish():
+            self.default_site = sites[home_id]
+            if self.websocket_server:
+                for site_home in added:
+                    self.websocket_server.site_states[site_home] = sites[site_home].dashboard_state
+                for site_home in removed:
+                    self.websocket_server.site_states.pop(site_home, None)
+            for site_home in removed:
+                self._save_site(old_sites[site_home])
+            
+            self.device_registry = device_registry
+            self._resubscribe()
+            self.config_watcher.watch(config_files + [config_module_path()])
+            
+            self.config_generation += 1
+            report_reload(OUTCOME_APPLIED, time.perf_counter() - started, self.config_generation,
+                          trigger=trigger, sites=len(sites), devices=len(device_registry),
+                          added_sites=added, removed_sites=removed)
+        
+        # Each half runs on the worker that owns that state, between two
+        # items. A worker that does not get to it in time still runs it
+        # later: the rest waits for both (see finish_pending_reload).
+        swapped = self.ingest_stage.call(swap_detection)
+        swapped = self.response_stage.call(swap_response) and swapped
+        if not swapped:
+            self._pending_reload = (finish, [detection_swapped, response_swapped])
+            report_reload(OUTCOME_PENDING, time.perf_counter() - started, self.config_generation,
+                          trigger=trigger, error="a pipeline stage has not swapped in the configuration yet")
+            return False
+        finish()
+        return True
+    
+    def finish_pending_reload(self) -> bool:
+        """
+        Finish a reload whose configuration swaps timed out, once both have run.
+        
+        Returns:
+            bool: True if no reload is pending (any longer)
+        """
+        if self._pending_reload is None:
+            return True
+        finish, swaps = self._pending_reload
+        if not all(swap.is_set() for swap in swaps):
+            return False
+        self._pending_reload = None
+        finish()
+        return True
+    
+    def _resubscribe(self) -> None:
+        """Poll the devices of the current registry, fetching the state of new devices only."""
+        self.tuya_manager.device_ids = self.device_registry.name_map()
+        device_ids = list(self.device_registry.ids())
+        if device_ids == list(getattr(self.tuya_manager, 'subscribed_devices', [])):
+            return
+        
+        known_states = dict(self.tuya_manager.device_states)
+        try:
+            self.tuya_manager.subscribe_to_devices(device_ids, initial_states=known_states)
+        except Exception as e:
+            logger.error(f"Failed to update device subscription: {e}")
+            return
+        
+        now = self.clock.now().isoformat()
+        for device_id in device_ids:
+            state = self.tuya_manager.device_states.get(device_id)
+            if device_id not in known_states and state is not None:
+                site = self.device_sites[device_id]
+                site.dashboard_state.apply_device(device_id, site.registry.info(device_id), state, now)
+        logger.info(f"Device subscription updated ({len(device_ids)} devices)")
     
     def connect_to_tuya(self):
         """
         Establish connection to Tuya Cloud and subscribe to devices.
         
-        Connects to Tuya Cloud, subscribes to all configured devices,
+        Connects to Tuya Cloud, subscribes to the devices of every site,
         and registers the message callback for event processing.
         """
         logger.info("Connecting to Tuya Cloud...")
@@ -274,17 +1033,21 @@ class AIAgent:
         self.tuya_manager.on_message(self._on_tuya_message)
         logger.info("Message callback registered")
         
-        # Subscribe to all configured devices
-        device_id_list = [
-            self.config.living_room_motion_id,
-            self.config.window_vibration_id,
-            self.config.front_door_lock_id,
-            self.config.smart_bulb_id,
-            self.config.siren_id
-        ]
+        # Subscribe to all registered devices
+        device_id_list = list(self.device_registry.ids())
         
-        self.tuya_manager.subscribe_to_devices(device_id_list)
+        self.tuya_manager.subscribe_to_devices(
+            device_id_list,
+            initial_states=self.restored_device_states
+        )
         logger.info(f"Subscribed to {len(device_id_list)} devices")
+        
+        # Seed the dashboard models so the first clients get a full snapshot
+        now = self.clock.now().isoformat()
+        for device_id, state in self.tuya_manager.device_states.items():
+            site = self.device_sites.get(device_id)
+            if site:
+                site.dashboard_state.apply_device(device_id, site.registry.info(device_id), state, now)
     
     def run(self):
         """
@@ -295,21 +1058,62 @@ class AIAgent:
         """
         logger.info("Starting AI Agent...")
         
+        # Set up signal handlers for graceful shutdown
+        signal.signal(signal.SIGINT, self._signal_handler)
+        signal.signal(signal.SIGTERM, self._signal_handler)
+        if hasattr(signal, 'SIGHUP'):
+            # Not available on Windows
+            signal.signal(signal.SIGHUP, self._reload_signal_handler)
+        
         # Initialize all components
         self.initialize_components()
         
+        # Journal everything from the first message on
+        if self.event_journal:
+            self.event_journal.start()
+        
+        # Resume from the last snapshot before any new events arrive
+        self.restore_state()
+        
         # Connect to Tuya Cloud
         self.connect_to_tuya()
         
-        # Start WebSocket server in background thread
-        import threading
-        websocket_thread = threading.Thread(
-            target=self.websocket_server.run,
-            kwargs={'debug': False},
-            daemon=True
-        )
-        websocket_thread.start()
-        logger.info("WebSocket server started in background thread")
+        if self.broadcast_bus:
+            # Dashboards are served by separate worker processes
+            self.broadcast_bus.start()
+            self.broadcast_workers = spawn_broadcast_workers(
+                self._setting('BROADCAST_WORKERS', 0),
+                self.broadcast_bus.path,
+                host='0.0.0.0',
+                base_port=self._setting('BROADCAST_BASE_PORT', 5001),
+                home_id=self.default_site.home_id,
+                history_size=self.event_history.capacity
+            )
+            # The agent's own metrics (polling, analysis, commands) need a
+            # listener of their own; workers serve /metrics for their clients
+            metrics_port = self._setting('METRICS_PORT', 9100)
+            if metrics_port > 0:
+                self.metrics_server = start_metrics_server('0.0.0.0', metrics_port)
+        elif self.websocket_server:
+            # Start WebSocket server in background thread
+            import threading
+            websocket_thread = threading.Thread(
+                target=self.websocket_server.run,
+                kwargs={'debug': False},
+                daemon=True
+            )
+            websocket_thread.start()
+            logger.info("WebSocket server started in background thread")
+        
+        # Start command dispatch, the processing stages and broadcast frames
+        self.command_dispatcher.start()
+        self.response_stage.start()
+        self.ingest_stage.start()
+        self.broadcast_aggregator.start()
+        
+        # Start webhook delivery worker (also resumes undelivered notifications)
+        if self.notification_outbox:
+            self.notification_outbox.start()
         
         # Main event loop
         logger.info("AI Agent is now running. Press Ctrl+C to stop.")
@@ -321,8 +1125,27 @@ class AIAgent:
                 # Poll devices for status changes
                 self.tuya_manager.poll_device_changes()
                 
+                # Timed auto-clear of a quiet alarm (on the response stage,
+                # which owns the alarm state). Never waits for room: a full
+                # queue drops this tick and the next poll sends another
+                self.response_stage.put({'kind': 'tick', 'now': self.clock.now()}, block=False)
+                
+                # Hot reload on SIGHUP or when a configuration file changed,
+                # once a reload still waiting for the pipeline has finished
+                if self.finish_pending_reload():
+                    changed_files = self.config_watcher.poll()
+                    if self.reload_requested or changed_files:
+                        trigger = 'SIGHUP' if self.reload_requested else ', '.join(changed_files)
+                        self.reload_requested = False
+                        self.reload_config(trigger)
+                
+                # Periodic state snapshots for warm restart
+                for site in self.sites.values():
+                    if site.state_snapshotter.is_due():
+                        self._save_site(site)
+                
                 # Sleep for 2 seconds before next poll
-                time.sleep(2)
+                self.clock.sleep(2)
                 
         except KeyboardInterrupt:
             logger.info("Keyboard interrupt received")
@@ -339,6 +1162,47 @@ class AIAgent:
         """
         logger.info("Shutting down AI Agent...")
         
+        # Finish events already polled: ingestion first, then their responses
+        for stage in (self.ingest_stage, self.response_stage):
+            if stage:
+                stage.stop()
+                log_event(logger, logging.INFO, 'pipeline_stage_stopped', stage=stage.name, **stage.get_stats())
+        
+        # Persist detection state so the next start resumes where we stopped
+        self.save_state()
+        for site in self.sites.values():
+            log_event(logger, logging.INFO, 'site_stats', **site.get_stats())
+        
+        # Send any commands still waiting in the coalescing window
+        if self.command_dispatcher:
+            try:
+                self.command_dispatcher.stop()
+                stats = self.command_dispatcher.get_stats()
+                for priority, wait in stats['queue_wait_ms'].items():
+                    if wait['count']:
+                        logger.info(f"Command queue wait [{priority}]: {wait['count']} requests, "
+                                    f"p50 {wait['p50_ms']:.0f}ms, p95 {wait['p95_ms']:.0f}ms")
+            except Exception as e:
+                logger.error(f"Error stopping command dispatcher: {e}")
+        
+        # Commit the journal after the last event, classification and command
+        if self.event_journal:
+            self.event_journal.close()
+            log_event(logger, logging.INFO, 'event_journal_stats', **self.event_journal.get_stats())
+        
+        # Send the last device frame
+        if self.broadcast_aggregator:
+            self.broadcast_aggregator.stop()
+        
+        # Stop broadcast workers and the bus
+        if self.broadcast_workers:
+            stop_broadcast_workers(self.broadcast_workers)
+            self.broadcast_workers = []
+        if self.broadcast_bus:
+            self.broadcast_bus.stop()
+        if self.metrics_server:
+            self.metrics_server.shutdown()
+        
         # Disconnect from Tuya Cloud
         if self.tuya_manager:
             try:
@@ -347,6 +1211,13 @@ class AIAgent:
             except Exception as e:
                 logger.error(f"Error disconnecting from Tuya: {e}")
         
+        # Stop webhook delivery; undelivered notifications stay in the outbox
+        if self.notification_outbox:
+            try:
+                self.notification_outbox.stop()
+            except Exception as e:
+                logger.error(f"Error stopping notification outbox: {e}")
+        
         # Note: WebSocket server will be stopped when the main thread exits
         # since it's running in a daemon thread
         
@@ -360,6 +1231,15 @@ def main():
     
     Creates and runs the AI Agent, handling any startup errors.
     """
+    # Single logging configuration point for the whole process
+    configure_logging(
+        level=os.getenv('LOG_LEVEL', 'INFO'),
+        log_file=os.getenv('LOG_FILE')
+    )
+    
+    # Latency tracing (spans exported only if TRACE_EXPORT_PATH is set)
+    tracer = configure_tracing(os.getenv('TRACE_EXPORT_PATH') or None)
+    
     logger.info("=" * 60)
     logger.info("Tuya Security Digital Twin - AI Agent")
     logger.info("=" * 60)
@@ -370,6 +1250,10 @@ def main():
     except Exception as e:
         logger.error(f"Fatal error: {e}", exc_info=True)
         sys.exit(1)
+    finally:
+        logger.info("Per-stage latency summary:\n" + tracer.format_summary())
+        tracer.close()
+        shutdown_logging()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,240 @@
+"""
+Alarm state machine for the home's security status.
+
+This module models the alarm as an explicit GREEN_SAFE / YELLOW_WARNING /
+RED_CRITICAL state machine so that response protocols run only on real
+transitions instead of on every classification. It provides:
+- Hysteresis on the score thresholds (a state is left only when the score
+  drops a margin below the threshold that entered it)
+- Minimum hold durations before de-escalation
+- Timed auto-clear back to GREEN_SAFE when no supporting events arrive
+- Immediate disarm on a safe-arrival pattern (door unlock)
+
+Only positive evidence moves the alarm down: a classification that matched
+no pattern (e.g. the PIR going back to idle) says nothing about whether
+the intruder has left, so it neither supports nor clears an alarm.
+"""
+
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+GREEN_SAFE = "GREEN_SAFE"
+YELLOW_WARNING = "YELLOW_WARNING"
+RED_CRITICAL = "RED_CRITICAL"
+
+# Severity ordering used to tell escalation from de-escalation
+SEVERITY = {GREEN_SAFE: 0, YELLOW_WARNING: 1, RED_CRITICAL: 2}
+
+# Transition reasons
+REASON_ESCALATE = 'escalate'
+REASON_DEESCALATE = 'de-escalate'
+REASON_ZONE_CHANGE = 'zone_change'
+REASON_AUTO_CLEAR = 'auto_clear'
+REASON_DISARM = 'disarm'
+
+# Analyzer pattern of a classification that matched nothing (no evidence)
+PATTERN_NONE = 'none'
+
+
+@dataclass
+class Transition:
+    """
+    A change of alarm state.
+
+    Attributes:
+        from_state: State before the transition
+        to_state: State after the transition
+        zone: Zone associated with the new state
+        reason: Why the transition happened (escalate, de-escalate, ...)
+        at: When the transition happened
+    """
+    from_state: str
+    to_state: str
+    zone: str
+    reason: str
+    at: datetime
+
+
+class AlarmStateMachine:
+    """
+    Tracks the current alarm state and decides when it changes.
+
+    Feed every classification into ``evaluate`` and call ``tick``
+    periodically; both return a Transition only when the state (or the
+    zone of the current state) actually changes.
+    """
+
+    def __init__(self, critical_threshold: float = 80, warning_threshold: float = 40,
+                 hysteresis: float = 10,
+                 min_hold_seconds: Optional[Dict[str, float]] = None,
+                 auto_clear_seconds: Optional[Dict[str, float]] = None):
+        """
+        Initialize the alarm state machine in GREEN_SAFE.
+
+        Args:
+            critical_threshold: Score at or above which RED_CRITICAL is entered
+            warning_threshold: Score at or above which YELLOW_WARNING is entered
+            hysteresis: Margin below a threshold required to leave its state
+            min_hold_seconds: Minimum time per state before de-escalation
+            auto_clear_seconds: Time per state without supporting events
+                after which the alarm clears to GREEN_SAFE
+        """
+        self.critical_threshold = critical_threshold
+        self.warning_threshold = warning_threshold
+        self.hysteresis = hysteresis
+        self.min_hold_seconds = min_hold_seconds or {RED_CRITICAL: 60, YELLOW_WARNING: 15}
+        self.auto_clear_seconds = auto_clear_seconds or {RED_CRITICAL: 300, YELLOW_WARNING: 120}
+
+        self.state = GREEN_SAFE
+        self.zone = "HOUSE"
+        self.entered_at: Optional[datetime] = None
+        self.last_trigger_at: Optional[datetime] = None
+        self.transition_count = 0
+        self.suppressed_count = 0
+
+        logger.info("AlarmStateMachine initialized")
+
+    def _target_state(self, score: float) -> str:
+        """
+        Map a score to a target state, applying hysteresis to the current state.
+
+        Args:
+            score: Final weighted threat score
+
+        Returns:
+            str: Target state for the score
+        """
+        critical_exit = self.critical_threshold - self.hysteresis
+        warning_exit = self.warning_threshold - self.hysteresis
+
+        if score >= self.critical_threshold:
+            return RED_CRITICAL
+        if self.state == RED_CRITICAL and score >= critical_exit:
+            return RED_CRITICAL
+        if score >= self.warning_threshold:
+            return YELLOW_WARNING
+        if self.state in (RED_CRITICAL, YELLOW_WARNING) and score >= warning_exit:
+            return YELLOW_WARNING
+        return GREEN_SAFE
+
+    def _transition(self, to_state: str, zone: str, reason: str, now: datetime) -> Transition:
+        transition = Transition(self.state, to_state, zone, reason, now)
+        if to_state != self.state:
+            self.entered_at = now
+        self.state = to_state
+        self.zone = zone
+        self.last_trigger_at = now if to_state != GREEN_SAFE else None
+        self.transition_count += 1
+        logger.info(f"Alarm transition {transition.from_state} -> {to_state} "
+                    f"({reason}) in {zone}")
+        return transition
+
+    def evaluate(self, score: float, zone: str, now: datetime,
+                 disarm: bool = False, pattern: Optional[str] = None) -> Optional[Transition]:
+        """
+        Feed a classification into the state machine.
+
+        Escalation is immediate. De-escalation waits for the minimum hold
+        duration of the current state unless ``disarm`` is set, and only a
+        classification that matched a pattern counts: one with pattern
+        ``'none'`` is ignored, so an alarm is left only by disarm, auto-clear
+        or a positive low-threat classification.
+
+        Args:
+            score: Final weighted threat score of the classification
+            zone: Zone of the classification
+            now: Time of the classification
+            disarm: True for a safe-arrival pattern, which clears immediately
+            pattern: Analyzer pattern of the classification, if known
+
+        Returns:
+            Optional[Transition]: The transition, or None if the state is unchanged
+        """
+        if disarm:
+            if self.state == GREEN_SAFE:
+                self.suppressed_count += 1
+                return None
+            return self._transition(GREEN_SAFE, zone, REASON_DISARM, now)
+
+        if pattern == PATTERN_NONE:
+            self.suppressed_count += 1
+            return None
+
+        target = self._target_state(score)
+        current_severity = SEVERITY[self.state]
+        target_severity = SEVERITY[target]
+
+        if target_severity > current_severity:
+            return self._transition(target, zone, REASON_ESCALATE, now)
+
+        if target_severity == current_severity:
+            if target != GREEN_SAFE:
+                # Supporting event keeps the alarm alive
+                self.last_trigger_at = now
+                if zone != self.zone and target == YELLOW_WARNING:
+                    return self._transition(target, zone, REASON_ZONE_CHANGE, now)
+            self.suppressed_count += 1
+            return None
+
+        # De-escalation: honour the minimum hold of the current state
+        hold = self.min_hold_seconds.get(self.state, 0)
+        if self.entered_at is not None and (now - self.entered_at).total_seconds() < hold:
+            self.suppressed_count += 1
+            return None
+        return self._transition(target, zone if target != GREEN_SAFE else "HOUSE",
+                                REASON_DEESCALATE, now)
+
+    def tick(self, now: datetime) -> Optional[Transition]:
+        """
+        Apply timed auto-clear.
+
+        Args:
+            now: Current time
+
+        Returns:
+            Optional[Transition]: Auto-clear transition to GREEN_SAFE, or None
+        """
+        if self.state == GREEN_SAFE or self.last_trigger_at is None:
+            return None
+        timeout = self.auto_clear_seconds.get(self.state)
+        if timeout is None or (now - self.last_trigger_at).total_seconds() < timeout:
+            return None
+        return self._transition(GREEN_SAFE, "HOUSE", REASON_AUTO_CLEAR, now)
+
+    def get_auto_clear_deadline(self) -> Optional[float]:
+        """
+        Get when the current alarm will auto-clear.
+
+        Returns:
+            Optional[float]: Epoch seconds of the auto-clear, or None in GREEN_SAFE
+        """
+        if self.state == GREEN_SAFE or self.last_trigger_at is None:
+            return None
+        timeout = self.auto_clear_seconds.get(self.state)
+        if timeout is None:
+            return None
+        return self.last_trigger_at.timestamp() + timeout
+
+    def restore(self, state: str, zone: str, entered_at: Optional[datetime],
+                last_trigger_at: Optional[datetime]) -> None:
+        """
+        Restore the alarm state from a state snapshot.
+
+        Args:
+            state: Alarm state
+            zone: Zone of the alarm state
+            entered_at: When the state was entered
+            last_trigger_at: Time of the last supporting event
+        """
+        if state not in SEVERITY:
+            logger.warning(f"Ignoring unknown alarm state in snapshot: {state}")
+            return
+        self.state = state
+        self.zone = zone
+        self.entered_at = entered_at
+        self.last_trigger_at = last_trigger_at
+        logger.info(f"Restored alarm state {state} in {zone}")
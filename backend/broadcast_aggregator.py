@@ -0,0 +1,163 @@
+"""
+Fixed-rate broadcast coalescing for dashboard clients.
+
+Emitting every device update the moment it happens turns a burst of
+device changes into a burst of frames for every client. The
+BroadcastAggregator sits in front of the WebSocketServer and is used in
+place of the SocketIO instance (it has the same ``emit(event, data)``
+signature):
+
+- ``device_update`` deltas are collected and sent once per tick (default
+  every 100 ms); several updates to the same device within a tick are
+  collapsed into one delta carrying the merged changed fields
+- Every other event, in particular ``status_update``, is emitted
+  immediately, bypassing the tick
+
+Each tick is handed to ``WebSocketServer.emit_device_frame``: a frame
+with one changed device is sent as a regular ``device_update``, one with
+several as a single ``device_updates`` frame
+(``{"updates": [<device_update>, ...]}``), so each client receives at
+most one device frame per tick regardless of how many devices change.
+
+The ``broadcast`` latency span of a traced event is recorded here, when
+the event has actually been handed to the server: immediately for
+pass-through events, at the next tick for device updates.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from latency_tracing import get_tracer
+from structured_logging import log_event
+
+logger = logging.getLogger(__name__)
+
+
+class BroadcastAggregator:
+    """
+    Collapses device updates into per-tick frames; passes everything else through.
+    """
+
+    def __init__(self, server, tick_seconds: float = 0.1):
+        """
+        Initialize the aggregator.
+
+        Args:
+            server: WebSocketServer (anything with emit() and emit_device_frame())
+            tick_seconds: Frame interval for device updates (0 = emit immediately)
+        """
+        self.server = server
+        self.tick_seconds = tick_seconds
+
+        self._pending: Dict[str, Dict] = {}
+        # Traced device updates waiting for the tick: (trace_id, perf_counter at emit)
+        self._pending_traces: List[Tuple[str, float]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Counters
+        self.updates_received = 0
+        self.updates_collapsed = 0
+        self.frames_sent = 0
+        self.immediate_sent = 0
+
+        logger.info(f"BroadcastAggregator initialized (tick {tick_seconds * 1000:.0f}ms)")
+
+    def emit(self, event: str, data: Dict, trace_id: Optional[str] = None) -> None:
+        """
+        Broadcast an event to the subscribed clients.
+
+        Args:
+            event: Event name
+            data: Event payload; ``device_update`` payloads need ``device_id``
+                  and a ``state`` dict of changed fields
+            trace_id: Latency trace of the triggering event, if traced
+        """
+        if event != 'device_update' or self.tick_seconds <= 0 or self._thread is None:
+            self.immediate_sent += 1
+            with get_tracer().span(trace_id, 'broadcast', event=event):
+                self.server.emit(event, data)
+            return
+
+        with self._lock:
+            self.updates_received += 1
+            if trace_id is not None:
+                self._pending_traces.append((trace_id, time.perf_counter()))
+            pending = self._pending.get(data['device_id'])
+            if pending is None:
+                self._pending[data['device_id']] = dict(data, state=dict(data.get('state', {})))
+                return
+            # Same device within the tick: merge changed fields, keep the newest version
+            self.updates_collapsed += 1
+            pending['state'].update(data.get('state', {}))
+            for key, value in data.items():
+                if key != 'state':
+                    pending[key] = value
+
+    def flush(self) -> int:
+        """
+        Send the device updates collected since the last tick.
+
+        Returns:
+            int: Number of device updates sent
+        """
+        with self._lock:
+            if not self._pending:
+                return 0
+            updates = list(self._pending.values())
+            self._pending = {}
+            traces, self._pending_traces = self._pending_traces, []
+
+        self.server.emit_device_frame(updates)
+        self.frames_sent += 1
+        if traces:
+            tracer = get_tracer()
+            sent = time.perf_counter()
+            for trace_id, queued_at in traces:
+                tracer.record(trace_id, 'broadcast', sent - queued_at, event='device_update',
+                              devices=len(updates))
+        log_event(logger, logging.DEBUG, 'device_frame_sent', devices=len(updates))
+        return len(updates)
+
+    def start(self) -> None:
+        """Start the tick thread (device updates are emitted immediately until started)."""
+        if self._thread is not None or self.tick_seconds <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='broadcast-tick', daemon=True)
+        self._thread.start()
+        logger.info("Broadcast aggregator started")
+
+    def stop(self) -> None:
+        """Stop the tick thread and send anything still pending."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(self.tick_seconds * 10 + 1.0)
+        self._thread = None
+        self.flush()
+        logger.info("Broadcast aggregator stopped")
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.tick_seconds):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error sending device frame: {e}", exc_info=True)
+
+    def get_stats(self) -> Dict:
+        """
+        Get aggregator counters.
+
+        Returns:
+            Dict: Updates received and collapsed, frames and immediate events sent
+        """
+        return {
+            'updates_received': self.updates_received,
+            'updates_collapsed': self.updates_collapsed,
+            'frames_sent': self.frames_sent,
+            'immediate_sent': self.immediate_sent
+        }
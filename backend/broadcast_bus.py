@@ -0,0 +1,284 @@
+"""
+Local pub/sub bus for multi-process WebSocket fan-out.
+
+With BROADCAST_WORKERS > 0 the agent does not serve dashboards itself.
+Instead it publishes every broadcast on a Unix domain socket and N
+separate broadcast worker processes (broadcast_worker.py), each running
+its own WebSocketServer, subscribe to it. Dashboard scale-out then no
+longer shares a core and a GIL with polling and analysis, and no
+external broker is involved.
+
+Wire format: each frame is a u32 little-endian length followed by a JSON
+array ``[kind, event, data]``:
+
+    ["snapshot", null, <state_snapshot>]   first frame after connecting
+    ["emit", <event>, <payload>]           routed event (status_update, ...)
+    ["frame", null, [<device_update>, ...]] one aggregator tick
+    ["history_snapshot", null, [<record>, ...]]  retained event history,
+                                                 right after the snapshot
+    ["history", null, <record>]            new event history record
+
+Every message is serialized once and the same bytes are written to every
+subscriber. A subscriber that cannot keep up (send timeout) is dropped;
+it reconnects and starts again from a fresh snapshot.
+"""
+
+import json
+import logging
+import os
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from metrics import get_registry
+
+logger = logging.getLogger(__name__)
+
+_broadcast_fanout_seconds = get_registry().histogram(
+    'securex_broadcast_fanout_seconds', 'Time to emit one broadcast to all recipients', ('event',))
+
+_LENGTH = struct.Struct('<I')
+
+KIND_SNAPSHOT = 'snapshot'
+KIND_EMIT = 'emit'
+KIND_FRAME = 'frame'
+KIND_HISTORY_SNAPSHOT = 'history_snapshot'
+KIND_HISTORY = 'history'
+
+
+def _encode_frame(kind: str, event: Optional[str], data) -> bytes:
+    body = json.dumps([kind, event, data], separators=(',', ':'), default=str).encode('utf-8')
+    return _LENGTH.pack(len(body)) + body
+
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    chunks = bytearray()
+    while len(chunks) < size:
+        chunk = sock.recv(size - len(chunks))
+        if not chunk:
+            return None
+        chunks += chunk
+    return bytes(chunks)
+
+
+class BusPublisher:
+    """
+    Agent side of the bus; used in place of the WebSocketServer by the
+    BroadcastAggregator (same ``emit`` / ``emit_device_frame`` interface).
+    """
+
+    def __init__(self, path: str, snapshot_provider: Callable[[], Dict],
+                 send_timeout_seconds: float = 1.0,
+                 history_provider: Optional[Callable[[], List[Dict]]] = None):
+        """
+        Initialize the publisher.
+
+        Args:
+            path: Unix socket path to listen on
+            snapshot_provider: Returns the current state_snapshot for new subscribers
+            send_timeout_seconds: Subscribers that block a send this long are dropped
+            history_provider: Returns the retained event history for new subscribers
+        """
+        self.path = path
+        self.snapshot_provider = snapshot_provider
+        self.send_timeout_seconds = send_timeout_seconds
+        self.history_provider = history_provider
+
+        self._subscribers: List[socket.socket] = []
+        self._lock = threading.Lock()
+        self._server: Optional[socket.socket] = None
+        self._thread: Optional[threading.Thread] = None
+
+        # Counters
+        self.published_count = 0
+        self.dropped_subscribers = 0
+
+    def start(self) -> None:
+        """Bind the Unix socket and start accepting subscribers."""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.path)
+        self._server.listen(64)
+        self._thread = threading.Thread(target=self._accept_loop, name='broadcast-bus', daemon=True)
+        self._thread.start()
+        logger.info(f"Broadcast bus listening on {self.path}")
+
+    def stop(self) -> None:
+        """Close all subscriber connections and the listening socket."""
+        with self._lock:
+            for sock in self._subscribers:
+                sock.close()
+            self._subscribers = []
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        logger.info("Broadcast bus stopped")
+
+    def _accept_loop(self) -> None:
+        while self._server is not None:
+            try:
+                sock, _ = self._server.accept()
+            except OSError:
+                return
+            sock.settimeout(self.send_timeout_seconds)
+            # Snapshot first, under the publish lock, so no delta can overtake it
+            with self._lock:
+                try:
+                    sock.sendall(_encode_frame(KIND_SNAPSHOT, None, self.snapshot_provider()))
+                    if self.history_provider is not None:
+                        sock.sendall(_encode_frame(KIND_HISTORY_SNAPSHOT, None, self.history_provider()))
+                except OSError as e:
+                    logger.warning(f"Broadcast worker failed to receive snapshot: {e}")
+                    sock.close()
+                    continue
+                self._subscribers.append(sock)
+                count = len(self._subscribers)
+            logger.info(f"Broadcast worker subscribed ({count} connected)")
+
+    def _publish(self, kind: str, event: Optional[str], data) -> None:
+        started = time.perf_counter()
+        frame = _encode_frame(kind, event, data)
+        with self._lock:
+            self.published_count += 1
+            for sock in list(self._subscribers):
+                try:
+                    sock.sendall(frame)
+                except OSError as e:
+                    logger.warning(f"Dropping slow or closed broadcast worker: {e}")
+                    self.dropped_subscribers += 1
+                    self._subscribers.remove(sock)
+                    sock.close()
+        _broadcast_fanout_seconds.labels(f"bus_{event or kind}").observe(time.perf_counter() - started)
+
+    def emit(self, event: str, data: Dict) -> None:
+        """Publish a routed event to all workers."""
+        self._publish(KIND_EMIT, event, data)
+
+    def emit_device_frame(self, updates: List[Dict]) -> None:
+        """Publish one aggregator tick of device updates to all workers."""
+        self._publish(KIND_FRAME, None, updates)
+
+    def emit_history(self, record: Dict) -> None:
+        """Publish a new event history record to all workers."""
+        self._publish(KIND_HISTORY, None, record)
+
+    def get_subscriber_count(self) -> int:
+        """Get the number of connected workers."""
+        with self._lock:
+            return len(self._subscribers)
+
+
+class BusSubscriber:
+    """
+    Worker side of the bus: reads frames and hands them to a callback,
+    reconnecting (and so resyncing from a fresh snapshot) if the
+    connection is lost.
+    """
+
+    def __init__(self, path: str, on_message: Callable[[str, Optional[str], object], None],
+                 reconnect_delay_seconds: float = 1.0):
+        """
+        Initialize the subscriber.
+
+        Args:
+            path: Unix socket path of the publisher
+            on_message: Called with (kind, event, data) for every frame
+            reconnect_delay_seconds: Delay between connection attempts
+        """
+        self.path = path
+        self.on_message = on_message
+        self.reconnect_delay_seconds = reconnect_delay_seconds
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start the reader thread."""
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='broadcast-bus-reader', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop reading after the current frame."""
+        self._running = False
+
+    def _run(self) -> None:
+        while self._running:
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                    sock.connect(self.path)
+                    logger.info(f"Connected to broadcast bus {self.path}")
+                    self._read(sock)
+            except OSError as e:
+                logger.debug(f"Broadcast bus unavailable: {e}")
+            if self._running:
+                time.sleep(self.reconnect_delay_seconds)
+
+    def _read(self, sock: socket.socket) -> None:
+        while self._running:
+            header = _recv_exact(sock, _LENGTH.size)
+            if header is None:
+                logger.warning("Broadcast bus closed the connection")
+                return
+            (length,) = _LENGTH.unpack(header)
+            body = _recv_exact(sock, length)
+            if body is None:
+                return
+            kind, event, data = json.loads(body)
+            try:
+                self.on_message(kind, event, data)
+            except Exception as e:
+                logger.error(f"Error handling broadcast bus message: {e}", exc_info=True)
+
+
+def spawn_broadcast_workers(count: int, bus_path: str, host: str, base_port: int,
+                            home_id: str, history_size: int = 1000) -> List[subprocess.Popen]:
+    """
+    Start broadcast worker processes on consecutive ports.
+
+    Args:
+        count: Number of workers
+        bus_path: Unix socket path of the bus
+        host: Host address the workers bind to
+        base_port: Port of the first worker (worker i listens on base_port + i)
+        home_id: Default home for clients that do not subscribe
+        history_size: Capacity of each worker's mirrored event history
+
+    Returns:
+        List[subprocess.Popen]: Worker processes
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'broadcast_worker.py')
+    workers = []
+    for index in range(count):
+        port = base_port + index
+        workers.append(subprocess.Popen([
+            sys.executable, script,
+            '--bus', bus_path, '--host', host, '--port', str(port), '--home', home_id,
+            '--history-size', str(history_size)
+        ]))
+        logger.info(f"Started broadcast worker {index} on port {port}")
+    return workers
+
+
+def stop_broadcast_workers(workers: List[subprocess.Popen], timeout: float = 5.0) -> None:
+    """
+    Terminate broadcast worker processes.
+
+    Args:
+        workers: Processes from spawn_broadcast_workers
+        timeout: Seconds to wait for each worker before killing it
+    """
+    for worker in workers:
+        if worker.poll() is None:
+            worker.terminate()
+    for worker in workers:
+        try:
+            worker.wait(timeout)
+        except subprocess.TimeoutExpired:
+            worker.kill()
@@ -0,0 +1,108 @@
+"""
+Broadcast worker process for multi-process WebSocket fan-out.
+
+Runs one WebSocketServer that mirrors the agent's dashboard state from the
+local broadcast bus (see broadcast_bus) and fans every event out to its
+own clients. The agent starts BROADCAST_WORKERS of these on consecutive
+ports; put a load balancer with sticky sessions in front of them.
+
+Usage:
+    python broadcast_worker.py --bus /tmp/securex_bus.sock --port 5001
+"""
+
+import os
+
+# The green-thread server mode needs the standard library patched first
+if os.getenv('WEBSOCKET_ASYNC_MODE', 'threading') == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+import argparse
+import logging
+import sys
+
+from structured_logging import configure_logging, shutdown_logging
+from dashboard_state import DashboardState
+from event_history import EventHistory
+from websocket_server import WebSocketServer
+from broadcast_bus import (
+    KIND_EMIT, KIND_FRAME, KIND_HISTORY, KIND_HISTORY_SNAPSHOT, KIND_SNAPSHOT, BusSubscriber
+)
+
+logger = logging.getLogger(__name__)
+
+
+class BroadcastWorker:
+    """Bridges the broadcast bus to one WebSocketServer."""
+
+    def __init__(self, bus_path: str, host: str, port: int, home_id: str,
+                 history_size: int = 1000):
+        """
+        Initialize the worker.
+
+        Args:
+            bus_path: Unix socket path of the agent's broadcast bus
+            host: Host address to bind to
+            port: Port to listen on
+            home_id: Default home for clients that do not subscribe
+            history_size: Capacity of the mirrored event history
+        """
+        self.state = DashboardState()
+        self.history = EventHistory(history_size)
+        self.server = WebSocketServer(
+            host=host,
+            port=port,
+            async_mode=os.getenv('WEBSOCKET_ASYNC_MODE', 'threading'),
+            state=self.state,
+            default_home=home_id,
+            history=self.history,
+            max_backlog_frames=int(os.getenv('WEBSOCKET_MAX_BACKLOG_FRAMES', '32')),
+            disconnect_backlog_frames=int(os.getenv('WEBSOCKET_DISCONNECT_BACKLOG_FRAMES', '512')),
+            slow_consumer_seconds=float(os.getenv('WEBSOCKET_SLOW_CONSUMER_SECONDS', '30'))
+        )
+        self.subscriber = BusSubscriber(bus_path, self._on_bus_message)
+
+    def _on_bus_message(self, kind: str, event, data) -> None:
+        if kind == KIND_SNAPSHOT:
+            # (Re)connected to the agent: replace the mirror and resync clients
+            self.state.load_snapshot(data)
+            self.server.resync_clients()
+        elif kind == KIND_EMIT:
+            self.state.apply_message(event, data)
+            self.server.emit(event, data)
+        elif kind == KIND_FRAME:
+            for update in data:
+                self.state.apply_message('device_update', update)
+            self.server.emit_device_frame(data)
+        elif kind == KIND_HISTORY_SNAPSHOT:
+            self.history.load(data)
+        elif kind == KIND_HISTORY:
+            self.history.append_record(data)
+
+    def run(self) -> None:
+        """Subscribe to the bus and serve clients until terminated."""
+        self.subscriber.start()
+        self.server.run(debug=False)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="SecureX broadcast worker")
+    parser.add_argument('--bus', required=True, help="Unix socket path of the broadcast bus")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--home', default='home', help="Default home for clients that do not subscribe")
+    parser.add_argument('--history-size', type=int, default=1000, help="Capacity of the mirrored event history")
+    args = parser.parse_args(argv)
+
+    configure_logging(level=os.getenv('LOG_LEVEL', 'INFO'), log_file=os.getenv('LOG_FILE'))
+    try:
+        BroadcastWorker(args.bus, args.host, args.port, args.home, args.history_size).run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shutdown_logging()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
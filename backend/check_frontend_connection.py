@@ -10,16 +10,14 @@ from flask import Flask
 from flask_socketio import SocketIO, emit
 from flask_cors import CORS
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+from structured_logging import configure_logging, shutdown_logging
+
 logger = logging.getLogger(__name__)
 
 
 def main():
     """Run diagnostic WebSocket server."""
+    configure_logging()
     
     print("=" * 70)
     print("FRONTEND CONNECTION DIAGNOSTIC")
@@ -112,6 +110,8 @@ def main():
         logger.error("1. Port 5000 already in use - close other applications")
         logger.error("2. Missing dependencies - run: pip install flask flask-socketio flask-cors")
         logger.error("3. Firewall blocking - temporarily disable firewall")
+    finally:
+        shutdown_logging()
 
 
 if __name__ == '__main__':
@@ -6,6 +6,7 @@ This script helps diagnose permission issues with Tuya Cloud/SaaS projects.
 
 from config import load_config
 from tuya_connection_manager import TuyaConnectionManager
+from structured_logging import configure_logging
 
 def check_connection():
     """Check if we can connect to Tuya Cloud."""
@@ -101,6 +102,7 @@ def check_connection():
 
 
 if __name__ == "__main__":
+    configure_logging()
     try:
         check_connection()
     except Exception as e:
@@ -0,0 +1,194 @@
+"""
+Backpressure for slow dashboard clients.
+
+Every client already has its own outbound packet queue in the Socket.IO
+transport. This module bounds it: the WebSocket server periodically reads
+each client's queue depth (backlog) and classifies the client.
+
+    backlog <= max_backlog_frames        healthy
+    backlog >  max_backlog_frames        lagging: device frames are no
+                                         longer queued for the client
+    backlog <= max_backlog_frames / 2    (while lagging) caught up: the
+                                         client gets one fresh
+                                         state_snapshot, which collapses
+                                         every device delta it missed
+    lagging > slow_consumer_seconds      disconnected (slow_consumer)
+    backlog >= disconnect_backlog_frames disconnected (backlog_overflow)
+
+``status_update`` is never skipped. A client that cannot even keep up
+with status changes hits the hard backlog limit, is disconnected, and
+gets the current status in its snapshot when it reconnects.
+
+The backlog is read from python-socketio/engineio internals (see
+transport_backlog); if a library upgrade removes them, every backlog
+reads as 0 and backpressure is off rather than broken.
+"""
+
+import logging
+import threading
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Events that may be skipped for a lagging client (recovered by a snapshot)
+DROPPABLE_EVENTS = ('device_update', 'device_updates')
+
+DROP_LAGGING = 'lagging'
+DISCONNECT_SLOW_CONSUMER = 'slow_consumer'
+DISCONNECT_BACKLOG_OVERFLOW = 'backlog_overflow'
+
+_internals_missing_logged = False
+
+
+def _internals_missing(detail: str) -> int:
+    global _internals_missing_logged
+
+    if not _internals_missing_logged:
+        _internals_missing_logged = True
+        logger.warning(f"Cannot read client transport backlogs ({detail}); backpressure is disabled")
+    return 0
+
+
+def transport_backlog(server, sid: str, namespace: str = '/') -> int:
+    """
+    Get the number of packets queued for a client in the Socket.IO transport.
+
+    Reads private engineio state (``eio._get_socket(sid).queue``). If it is
+    missing, logs once and reports 0 instead of raising.
+
+    Args:
+        server: python-socketio Server (``socketio.server``)
+        sid: Client session ID
+        namespace: Socket.IO namespace of the client
+
+    Returns:
+        int: Queued packets (0 if the client is gone or unknown)
+    """
+    try:
+        eio_sid = server.manager.eio_sid_from_sid(sid, namespace)
+        get_socket = server.eio._get_socket
+    except AttributeError as e:
+        return _internals_missing(str(e))
+    if eio_sid is None:
+        return 0
+    try:
+        socket = get_socket(eio_sid)
+    except Exception:
+        # Client already gone
+        return 0
+    queue = getattr(socket, 'queue', None)
+    if queue is None:
+        return _internals_missing('engineio socket has no packet queue')
+    return queue.qsize()
+
+
+class ClientBackpressure:
+    """
+    Tracks lagging clients and decides on skips, resyncs and disconnects.
+
+    Thread-safe; holds no reference to the server.
+    """
+
+    def __init__(self, max_backlog_frames: int = 32, disconnect_backlog_frames: int = 512,
+                 slow_consumer_seconds: float = 30.0):
+        """
+        Initialize the policy.
+
+        Args:
+            max_backlog_frames: Backlog above which device frames are skipped
+            disconnect_backlog_frames: Backlog at which a client is disconnected
+            slow_consumer_seconds: Maximum time a client may stay lagging
+        """
+        self.max_backlog_frames = max_backlog_frames
+        self.resume_backlog_frames = max_backlog_frames // 2
+        self.disconnect_backlog_frames = disconnect_backlog_frames
+        self.slow_consumer_seconds = slow_consumer_seconds
+
+        # sid -> monotonic time the client started lagging
+        self._lagging: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+        # Counters
+        self.dropped: Dict[str, int] = {DROP_LAGGING: 0}
+        self.disconnects: Dict[str, int] = {DISCONNECT_SLOW_CONSUMER: 0, DISCONNECT_BACKLOG_OVERFLOW: 0}
+        self.resyncs = 0
+
+    def lagging_clients(self) -> List[str]:
+        """Get the clients device frames are currently skipped for."""
+        with self._lock:
+            return list(self._lagging)
+
+    def note_dropped(self, count: int, reason: str = DROP_LAGGING) -> None:
+        """
+        Count frames skipped for lagging clients.
+
+        Args:
+            count: Number of (client, frame) pairs skipped
+            reason: Drop reason
+        """
+        if count:
+            with self._lock:
+                self.dropped[reason] = self.dropped.get(reason, 0) + count
+
+    def evaluate(self, backlogs: Dict[str, int], now: float) -> Tuple[List[str], List[Tuple[str, str]]]:
+        """
+        Classify clients by their current backlog.
+
+        Args:
+            backlogs: Client session ID mapped to queued outbound packets
+            now: Current time.monotonic()
+
+        Returns:
+            Tuple[List[str], List[Tuple[str, str]]]: Clients to resync with a
+            snapshot, and (client, reason) pairs to disconnect
+        """
+        resync = []
+        disconnect = []
+        with self._lock:
+            for sid, backlog in backlogs.items():
+                since = self._lagging.get(sid)
+                if backlog >= self.disconnect_backlog_frames:
+                    reason = DISCONNECT_BACKLOG_OVERFLOW
+                elif since is not None and now - since > self.slow_consumer_seconds:
+                    reason = DISCONNECT_SLOW_CONSUMER
+                elif backlog > self.max_backlog_frames:
+                    if since is None:
+                        self._lagging[sid] = now
+                        logger.info(f"Client {sid} is lagging ({backlog} queued frames)")
+                    continue
+                else:
+                    if since is not None and backlog <= self.resume_backlog_frames:
+                        del self._lagging[sid]
+                        self.resyncs += 1
+                        resync.append(sid)
+                    continue
+                self._lagging.pop(sid, None)
+                self.disconnects[reason] += 1
+                disconnect.append((sid, reason))
+        return resync, disconnect
+
+    def remove_client(self, sid: str) -> None:
+        """
+        Forget a disconnected client.
+
+        Args:
+            sid: Client session ID
+        """
+        with self._lock:
+            self._lagging.pop(sid, None)
+
+    def get_stats(self) -> Dict:
+        """
+        Get backpressure counters.
+
+        Returns:
+            Dict: Lagging clients, skipped frames and disconnects per reason,
+            and snapshot resyncs
+        """
+        with self._lock:
+            return {
+                'lagging_clients': len(self._lagging),
+                'dropped': dict(self.dropped),
+                'disconnects': dict(self.disconnects),
+                'resyncs': self.resyncs
+            }
@@ -0,0 +1,114 @@
+"""
+Injectable time source.
+
+Components that need the current time (the agent's event-time fallback,
+auto-clear ticks and poll interval, the command scheduler and the
+orchestrator's history records) read it from a Clock instead of calling
+datetime.now()/time.monotonic() directly. In production this is the
+SystemClock; the replay engine (see replay) passes a VirtualClock, so
+scripted or recorded event streams run on virtual time, as fast as the
+CPU allows and with the same result every run.
+
+Latency measurements (pipeline, tracing, metrics) keep using the real
+clocks: they measure the process, not the scenario.
+"""
+
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Optional
+
+
+class Clock(ABC):
+    """
+    Source of wall-clock and monotonic time.
+    """
+
+    @abstractmethod
+    def now(self) -> datetime:
+        """Get the current local time."""
+
+    @abstractmethod
+    def time(self) -> float:
+        """Get the current time in epoch seconds."""
+
+    @abstractmethod
+    def monotonic(self) -> float:
+        """Get a monotonic time in seconds (for intervals and deadlines)."""
+
+    @abstractmethod
+    def sleep(self, seconds: float) -> None:
+        """Wait for a number of seconds."""
+
+
+class SystemClock(Clock):
+    """
+    The real clocks.
+    """
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+    def time(self) -> float:
+        return time.time()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+
+class VirtualClock(Clock):
+    """
+    Clock that only moves when told to.
+
+    ``sleep`` advances the clock instead of waiting. Not thread-safe: the
+    replay engine drives it and the pipeline from one thread.
+    """
+
+    def __init__(self, start: Optional[datetime] = None):
+        """
+        Initialize the clock.
+
+        Args:
+            start: Initial local time (default 2024-01-01 00:00, so runs do
+                   not depend on when they happen)
+        """
+        self.start = start or datetime(2024, 1, 1)
+        self._start_epoch = self.start.timestamp()
+        self.elapsed = 0.0
+
+    def now(self) -> datetime:
+        return self.start + timedelta(seconds=self.elapsed)
+
+    def time(self) -> float:
+        return self._start_epoch + self.elapsed
+
+    def monotonic(self) -> float:
+        return self.elapsed
+
+    def sleep(self, seconds: float) -> None:
+        self.advance(seconds)
+
+    def advance(self, seconds: float) -> None:
+        """
+        Move the clock forward.
+
+        Args:
+            seconds: Seconds to advance (negative values are ignored)
+        """
+        if seconds > 0:
+            self.elapsed += seconds
+
+    def advance_to(self, when: datetime) -> None:
+        """
+        Move the clock forward to a local time (no-op if it is in the past).
+
+        Args:
+            when: Target time
+        """
+        self.advance((when - self.start).total_seconds() - self.elapsed)
+
+
+SYSTEM_CLOCK = SystemClock()
@@ -0,0 +1,473 @@
+"""
+Per-device command coalescing for actuator control.
+
+Protocol transitions that happen close together (e.g. YELLOW then RED
+within a second) would otherwise send separate ``POST /commands`` calls to
+the same device, each with its own retries. The CommandDispatcher holds
+commands for a short coalescing window and merges everything pending for
+a device into one request, last-write-wins per datapoint code:
+- Superseded pending values are dropped before they are sent
+- A newer batch for a device aborts the retries of the in-flight batch;
+  its codes that were not overridden are folded into the newer batch
+- Only one request per device is in flight at a time, preserving order
+
+Commands carry a priority class (critical, warning, routine). Critical
+commands skip the coalescing window, are dispatched ahead of everything
+else, can always use a reserved share of the worker slots and of the
+request rate budget, and take over lower-priority commands still pending
+for the same device: those are sent with the critical batch, except the
+codes it overrides. Queue wait time is tracked per class.
+
+Scheduling (coalescing windows, rate-limit refill, queue wait) reads time
+from an injectable Clock. With a VirtualClock the replay engine drives the
+dispatcher without its threads: ``next_flush_at`` tells when the next
+batch is due and ``dispatch_due`` sends due batches on the calling thread.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from clock import SYSTEM_CLOCK, Clock
+from structured_logging import log_event
+from latency_tracing import LatencyHistogram, get_tracer
+from metrics import get_registry
+
+logger = logging.getLogger(__name__)
+
+# Shared with the orchestrator's direct (dispatcher-less) command path
+command_latency_seconds = get_registry().histogram(
+    'securex_command_latency_seconds', 'Device command send time including retries', ('priority',))
+_command_rate_limited_total = get_registry().counter(
+    'securex_command_rate_limited_total', 'Times a due command waited for rate-limit budget', ('priority',))
+
+PRIORITY_CRITICAL = 'critical'
+PRIORITY_WARNING = 'warning'
+PRIORITY_ROUTINE = 'routine'
+
+# Lower rank is more urgent
+PRIORITY_RANKS = {PRIORITY_CRITICAL: 0, PRIORITY_WARNING: 1, PRIORITY_ROUTINE: 2}
+
+
+@dataclass
+class PendingBatch:
+    """
+    Commands waiting to be sent to one device.
+
+    Attributes:
+        device_id: Target device ID
+        codes: Datapoint code mapped to its latest value (insertion ordered)
+        flush_at: Monotonic time at which the batch is sent
+        submitted_at: Monotonic time of the first merged submission
+        timeout: Overall time budget for the request (latest submission wins)
+        submissions: Number of submissions merged into this batch
+        trace_ids: Latency traces waiting on this batch
+        priority: Most urgent priority class merged into the batch
+    """
+    device_id: str
+    codes: Dict[str, object] = field(default_factory=dict)
+    flush_at: float = 0.0
+    submitted_at: float = 0.0
+    timeout: Optional[float] = None
+    submissions: int = 0
+    trace_ids: List[str] = field(default_factory=list)
+    priority: str = PRIORITY_ROUTINE
+
+    @property
+    def rank(self) -> int:
+        """Priority rank of the batch (lower is more urgent)."""
+        return PRIORITY_RANKS[self.priority]
+
+    def payload(self) -> Dict:
+        """Build the Tuya command payload for the batch."""
+        return {"commands": [{"code": code, "value": value} for code, value in self.codes.items()]}
+
+
+class TokenBucket:
+    """
+    Request rate limiter with part of the budget reserved for critical commands.
+
+    Non-critical requests may only take a token while more than
+    ``reserved_tokens`` remain, so a burst of routine traffic can never
+    exhaust the budget a critical command needs.
+    """
+
+    def __init__(self, rate_per_second: float, burst: float, reserved_tokens: float = 0.0,
+                 now: Optional[float] = None):
+        """
+        Initialize the bucket (full).
+
+        Args:
+            rate_per_second: Token refill rate (0 = unlimited)
+            burst: Bucket capacity
+            reserved_tokens: Tokens only critical requests may use
+            now: Current monotonic time (time.monotonic() if omitted)
+        """
+        self.rate_per_second = rate_per_second
+        self.burst = max(burst, 1.0)
+        self.reserved_tokens = min(reserved_tokens, self.burst - 1.0)
+        self.tokens = self.burst
+        self._updated = time.monotonic() if now is None else now
+
+    def try_take(self, critical: bool, now: float) -> float:
+        """
+        Take one token if the request's class may use one.
+
+        Args:
+            critical: Whether the request is critical
+            now: Current monotonic time
+
+        Returns:
+            float: 0.0 if a token was taken, otherwise seconds until one is available
+        """
+        if self.rate_per_second <= 0:
+            return 0.0
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+        floor = 0.0 if critical else self.reserved_tokens
+        if self.tokens - 1.0 >= floor:
+            self.tokens -= 1.0
+            return 0.0
+        return (floor + 1.0 - self.tokens) / self.rate_per_second
+
+
+class CommandDispatcher:
+    """
+    Asynchronous, coalescing command path in front of TuyaConnectionManager.
+
+    ``submit`` returns immediately; a scheduler thread sends each device's
+    merged batch once its coalescing window has elapsed, most urgent first.
+    """
+
+    def __init__(self, tuya_manager, coalesce_window_seconds: float = 0.15,
+                 max_workers: int = 4, critical_reserved_workers: int = 1,
+                 rate_limit_per_second: float = 0.0, rate_limit_burst: float = 10.0,
+                 critical_reserved_tokens: float = 2.0, clock: Optional[Clock] = None):
+        """
+        Initialize the dispatcher.
+
+        Args:
+            tuya_manager: TuyaConnectionManager used to send commands
+            coalesce_window_seconds: How long a device's first pending command
+                                     waits for further commands to merge
+            max_workers: Maximum concurrent in-flight requests (across devices)
+            critical_reserved_workers: Worker slots non-critical requests may not use
+            rate_limit_per_second: Maximum request rate (0 = unlimited)
+            rate_limit_burst: Request burst allowed by the rate limit
+            critical_reserved_tokens: Rate-limit tokens reserved for critical requests
+            clock: Time source for scheduling (the system clock if omitted)
+        """
+        self.tuya_manager = tuya_manager
+        self.clock = clock or SYSTEM_CLOCK
+        self.coalesce_window_seconds = coalesce_window_seconds
+        self.max_workers = max_workers
+        self.critical_reserved_workers = min(critical_reserved_workers, max_workers - 1)
+        self._rate_limit = TokenBucket(rate_limit_per_second, rate_limit_burst, critical_reserved_tokens,
+                                       now=self.clock.monotonic())
+
+        self._pending: Dict[str, PendingBatch] = {}
+        self._in_flight: Dict[str, PendingBatch] = {}
+        self._cond = threading.Condition()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._scheduler: Optional[threading.Thread] = None
+        self._running = False
+
+        # Counters
+        self.submitted_count = 0
+        self.coalesced_count = 0
+        self.superseded_codes = 0
+        self.request_count = 0
+        self.failed_count = 0
+        self.aborted_count = 0
+        self.cancelled_count = 0
+        self.submitted_by_priority = {priority: 0 for priority in PRIORITY_RANKS}
+        self.queue_wait = {priority: LatencyHistogram() for priority in PRIORITY_RANKS}
+
+        logger.info(f"CommandDispatcher initialized (window {coalesce_window_seconds * 1000:.0f}ms, "
+                    f"{max_workers} workers, {self.critical_reserved_workers} reserved for critical)")
+
+    def submit(self, device_id: str, commands: Dict, timeout: Optional[float] = None,
+               trace_id: Optional[str] = None, priority: str = PRIORITY_ROUTINE) -> None:
+        """
+        Queue commands for a device, merging with anything already pending.
+
+        A submission that is more urgent than the batch pending for the
+        device starts a new batch at its own priority, which takes over the
+        pending batch's codes it does not override (and its traces).
+
+        Args:
+            device_id: Target device ID
+            commands: Tuya command payload ({"commands": [{"code", "value"}, ...]})
+            timeout: Optional overall time budget for the request
+            trace_id: Latency trace of the triggering event, if traced
+            priority: Priority class (critical, warning or routine)
+
+        Raises:
+            ValueError: If the priority class is unknown
+        """
+        if priority not in PRIORITY_RANKS:
+            raise ValueError(f"Unknown command priority '{priority}'")
+        rank = PRIORITY_RANKS[priority]
+
+        now = self.clock.monotonic()
+        with self._cond:
+            self.submitted_count += 1
+            self.submitted_by_priority[priority] += 1
+            batch = self._pending.get(device_id)
+            preempted = None
+            if batch is not None and rank < batch.rank:
+                self.cancelled_count += 1
+                log_event(logger, logging.INFO, 'command_preempted', device_id=device_id,
+                          priority=batch.priority, by=priority, codes=len(batch.codes))
+                preempted, batch = batch, None
+            if batch is None:
+                # Critical commands skip the coalescing window
+                flush_at = now if priority == PRIORITY_CRITICAL else now + self.coalesce_window_seconds
+                batch = PendingBatch(
+                    device_id=device_id,
+                    flush_at=flush_at,
+                    submitted_at=now,
+                    priority=priority
+                )
+                if preempted is not None:
+                    # Keep what the urgent commands do not override
+                    batch.codes = dict(preempted.codes)
+                    batch.trace_ids = list(preempted.trace_ids)
+                    batch.submissions = preempted.submissions
+                self._pending[device_id] = batch
+            else:
+                self.coalesced_count += 1
+
+            for command in commands.get("commands", []):
+                code = command["code"]
+                if code in batch.codes:
+                    self.superseded_codes += 1
+                    # Re-insert so the code moves to its latest position
+                    del batch.codes[code]
+                batch.codes[code] = command["value"]
+            batch.timeout = timeout
+            batch.submissions += 1
+            if trace_id is not None:
+                batch.trace_ids.append(trace_id)
+            self._cond.notify()
+
+        log_event(logger, logging.DEBUG, 'command_queued', device_id=device_id, priority=batch.priority,
+                  codes=len(batch.codes), merged=batch.submissions)
+
+    def has_pending(self, device_id: str, max_rank: Optional[int] = None) -> bool:
+        """
+        Check whether a newer batch is waiting for a device.
+
+        Args:
+            device_id: Device ID
+            max_rank: Only count batches at least this urgent (None = any)
+
+        Returns:
+            bool: True if commands are pending for the device
+        """
+        with self._cond:
+            batch = self._pending.get(device_id)
+            return batch is not None and (max_rank is None or batch.rank <= max_rank)
+
+    def start(self) -> None:
+        """Start the scheduler thread and worker pool."""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                            thread_name_prefix='command-worker')
+        self._scheduler = threading.Thread(target=self._run, name='command-scheduler', daemon=True)
+        self._scheduler.start()
+        logger.info("Command dispatcher started")
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """
+        Send everything still pending, then stop.
+
+        Args:
+            timeout: Maximum seconds to wait for the scheduler to exit
+        """
+        with self._cond:
+            if not self._running:
+                return
+            self._running = False
+            # Flush immediately instead of waiting out the windows
+            for batch in self._pending.values():
+                batch.flush_at = 0.0
+            self._cond.notify_all()
+        if self._scheduler is not None:
+            self._scheduler.join(timeout)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        logger.info("Command dispatcher stopped")
+
+    def _next_due(self, now: float):
+        """
+        Pop due batches for idle devices, most urgent first, within the
+        worker and rate limits; return them and the next wake-up delay.
+        """
+        candidates = []
+        next_wait = None
+        for device_id, batch in self._pending.items():
+            if device_id in self._in_flight:
+                continue
+            if batch.flush_at <= now:
+                candidates.append(batch)
+            else:
+                wait = batch.flush_at - now
+                next_wait = wait if next_wait is None else min(next_wait, wait)
+
+        due = []
+        in_flight = len(self._in_flight)
+        non_critical = sum(1 for b in self._in_flight.values() if b.priority != PRIORITY_CRITICAL)
+        for batch in sorted(candidates, key=lambda b: (b.rank, b.submitted_at)):
+            critical = batch.priority == PRIORITY_CRITICAL
+            if in_flight >= self.max_workers:
+                break
+            if not critical and non_critical >= self.max_workers - self.critical_reserved_workers:
+                continue
+            wait = self._rate_limit.try_take(critical, now)
+            if wait:
+                _command_rate_limited_total.labels(batch.priority).inc()
+                next_wait = wait if next_wait is None else min(next_wait, wait)
+                continue
+            due.append(self._pending.pop(batch.device_id))
+            in_flight += 1
+            if not critical:
+                non_critical += 1
+        return due, next_wait
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                due, next_wait = self._next_due(self.clock.monotonic())
+                if not due:
+                    if not self._running and not self._pending and not self._in_flight:
+                        return
+                    self._cond.wait(next_wait if next_wait is not None else 1.0)
+                    continue
+                for batch in due:
+                    self._in_flight[batch.device_id] = batch
+            for batch in due:
+                self._executor.submit(self._send, batch)
+
+    def next_flush_at(self) -> Optional[float]:
+        """
+        Get when the next pending batch is due.
+
+        Returns:
+            Optional[float]: Clock monotonic time of the earliest coalescing
+            deadline of an idle device, or None if nothing is pending
+        """
+        with self._cond:
+            deadlines = [batch.flush_at for device_id, batch in self._pending.items()
+                         if device_id not in self._in_flight]
+        return min(deadlines) if deadlines else None
+
+    def dispatch_due(self) -> int:
+        """
+        Send every due batch on the calling thread, without the scheduler.
+
+        For a dispatcher that was not started (replay): batches become due
+        as its clock advances.
+
+        Returns:
+            int: Number of requests sent
+
+        Raises:
+            RuntimeError: If the scheduler thread is running
+        """
+        sent = 0
+        while True:
+            with self._cond:
+                if self._running:
+                    raise RuntimeError("dispatch_due() needs a dispatcher that was not started")
+                due, _ = self._next_due(self.clock.monotonic())
+                for batch in due:
+                    self._in_flight[batch.device_id] = batch
+            if not due:
+                return sent
+            for batch in due:
+                self._send(batch)
+            sent += len(due)
+
+    def _send(self, batch: PendingBatch) -> None:
+        device_id = batch.device_id
+        tracer = get_tracer()
+        waited = self.clock.monotonic() - batch.submitted_at
+        started = time.monotonic()
+        for trace_id in batch.trace_ids:
+            tracer.record(trace_id, 'command_queue', waited, device_id=device_id, priority=batch.priority)
+
+        with self._cond:
+            self.request_count += 1
+        try:
+            # Only an equally or more urgent batch may abort this one's retries
+            ok = self.tuya_manager.send_command(
+                device_id,
+                batch.payload(),
+                timeout=batch.timeout,
+                should_abort=lambda: self.has_pending(device_id, max_rank=batch.rank)
+            )
+        except Exception as e:
+            logger.error(f"Error dispatching command to {device_id}: {e}", exc_info=True)
+            ok = False
+
+        elapsed = time.monotonic() - started
+        tracer.record(batch.trace_ids[0] if batch.trace_ids else None, 'command_api',
+                      elapsed, device_id=device_id, ok=ok)
+        command_latency_seconds.labels(batch.priority).observe(elapsed)
+        if ok:
+            for trace_id in batch.trace_ids:
+                tracer.end_trace(trace_id, device_id=device_id)
+
+        with self._cond:
+            self.queue_wait[batch.priority].observe(waited * 1000.0)
+            del self._in_flight[device_id]
+            newer = self._pending.get(device_id)
+            if not ok and newer is not None:
+                # Superseded or preempted mid-retry: keep our codes the newer
+                # batch did not override
+                if newer.rank < batch.rank:
+                    self.cancelled_count += 1
+                else:
+                    self.aborted_count += 1
+                carried = {code: value for code, value in batch.codes.items()
+                           if code not in newer.codes}
+                carried.update(newer.codes)
+                newer.codes = carried
+                newer.trace_ids = batch.trace_ids + newer.trace_ids
+            elif not ok:
+                self.failed_count += 1
+            self._cond.notify()
+
+    def get_stats(self) -> Dict:
+        """
+        Get dispatcher counters.
+
+        Returns:
+            Dict: Submissions, merges, superseded codes, API requests, failures,
+            cancellations and queue wait summaries per priority class
+        """
+        with self._cond:
+            queue_wait = {
+                priority: {key: value for key, value in histogram.summary().items() if key != 'buckets'}
+                for priority, histogram in self.queue_wait.items()
+            }
+            return {
+                'submitted': self.submitted_count,
+                'coalesced': self.coalesced_count,
+                'superseded_codes': self.superseded_codes,
+                'requests': self.request_count,
+                'failed': self.failed_count,
+                'aborted': self.aborted_count,
+                'cancelled': self.cancelled_count,
+                'submitted_by_priority': dict(self.submitted_by_priority),
+                'queue_wait_ms': queue_wait,
+                'pending_devices': len(self._pending),
+                'in_flight_devices': len(self._in_flight)
+            }
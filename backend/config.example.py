@@ -115,6 +115,20 @@ SMART_BULB_ID = "your_smart_bulb_device_id"
 SIREN_ID = "your_siren_device_id"
 
 
+# Optional JSON file with further devices (any number), loaded into the device registry
+# next to the five devices above:
+#   [{"id": "...", "type": "motion", "zone": "Hallway", "name": "Hall Motion", "location": "Hallway"}]
+# Types: motion, window, door-lock (sensors, analyzed); bulb, siren (actuators)
+DEVICES_FILE = ""
+
+# Optional JSON file with further sites (homes) served by this agent next to HOME_ID, each with
+# its own devices, analyzer, alarm state, protocols, dashboard rooms and snapshot file:
+#   [{"home": "cabin", "devices": [...] or "devices_file": "cabin_devices.json",
+#     "protocols_file": "cabin_protocols.json"}]
+# Not supported with BROADCAST_WORKERS > 0
+SITES_FILE = ""
+
+
 # ============================================================================
 # HOW TO FIND DEVICE IDs FROM TUYA IoT PLATFORM
 # ============================================================================
@@ -182,6 +196,12 @@ Troubleshooting:
 # Webhook URL for push notifications (Discord, Slack, or custom endpoint)
 WEBHOOK_URL = "your_webhook_url_here"
 
+# Notifications are queued in a local outbox and delivered in the background
+OUTBOX_PATH = "securex_outbox.db"     # SQLite outbox file
+WEBHOOK_MAX_ATTEMPTS = 8              # Delivery attempts before giving up (exponential backoff)
+WEBHOOK_DEDUPE_WINDOW_SECONDS = 60    # Identical notifications within this window are sent once
+OUTBOX_RETENTION_SECONDS = 604800     # Delivered/failed notifications are pruned after this long (7 days)
+
 
 # ============================================================================
 # HOW TO SET UP WEBHOOK URL FOR PUSH NOTIFICATIONS
@@ -287,9 +307,21 @@ TUYA_ENDPOINT = "https://openapi.tuyaus.com"
 
 # Threat detection parameters
 MOTION_VIBRATION_WINDOW_SECONDS = 10  # Time window for motion+vibration pattern
+ALLOWED_LATENESS_SECONDS = 30         # Out-of-order events older than this behind the newest are dropped
+
+# Debounce for chattering motion/vibration sensors
+DEBOUNCE_MIN_RETRIGGER_SECONDS = 2    # Minimum time between accepted events per sensor
+DEBOUNCE_BURST_WINDOW_SECONDS = 1     # Followers within this quiet period are coalesced
 CRITICAL_THREAT_THRESHOLD = 80        # Score threshold for RED_CRITICAL
 WARNING_THREAT_THRESHOLD = 40         # Score threshold for YELLOW_WARNING
 
+# Alarm state machine
+ALARM_HYSTERESIS = 10             # Score must drop this far below a threshold to leave its state
+RED_HOLD_SECONDS = 60             # Minimum time in RED_CRITICAL before de-escalation
+YELLOW_HOLD_SECONDS = 15          # Minimum time in YELLOW_WARNING before de-escalation
+RED_AUTO_CLEAR_SECONDS = 300      # RED_CRITICAL clears after this long without supporting events
+YELLOW_AUTO_CLEAR_SECONDS = 120   # YELLOW_WARNING clears after this long without supporting events
+
 # Time contextual weighting
 NIGHTTIME_MULTIPLIER = 1.5   # Threat score multiplier for nighttime (22:00-06:00)
 DAYTIME_MULTIPLIER = 0.7     # Threat score multiplier for daytime (06:00-22:00)
@@ -298,8 +330,86 @@ DAYTIME_MULTIPLIER = 0.7     # Threat score multiplier for daytime (06:00-22:00)
 MAX_RECONNECT_DELAY_SECONDS = 16  # Maximum delay for exponential backoff
 INITIAL_RECONNECT_DELAY_SECONDS = 1  # Initial delay for reconnection
 
+# Response protocols (optional JSON file; built-in protocols are used if empty)
+# See backend/protocols.example.json for the format
+PROTOCOLS_FILE = ""
+
 # Command retry settings
 MAX_COMMAND_RETRIES = 3  # Maximum number of retries for failed commands
+COMMAND_COALESCE_WINDOW_SECONDS = 0.15  # Commands to one device within this window are merged
+
+# Command priority scheduling (RED = critical, YELLOW = warning, GREEN = routine)
+COMMAND_MAX_WORKERS = 4                 # Concurrent in-flight command requests
+COMMAND_CRITICAL_RESERVED_WORKERS = 1   # Worker slots only critical commands may use
+COMMAND_RATE_LIMIT_PER_SECOND = 0       # Command request rate limit (0 = unlimited)
+COMMAND_RATE_LIMIT_BURST = 10           # Requests allowed in a burst
+COMMAND_CRITICAL_RESERVED_TOKENS = 2    # Rate-limit budget only critical commands may use
+
+# Logging (read from the environment by ai_agent.main)
+LOG_LEVEL = "INFO"   # DEBUG, INFO, WARNING, ERROR
+LOG_FILE = ""        # Optional file path; logs always go to stderr
+
+# WebSocket server
+# WEBSOCKET_ASYNC_MODE is read from the environment before any import:
+#   threading - Werkzeug development server, one OS thread per client (default)
+#   gevent    - production server, one greenlet per client (pip install gevent gevent-websocket)
+WEBSOCKET_ASYNC_MODE = "threading"
+WEBSOCKET_PING_INTERVAL_SECONDS = 25  # Keep-alive ping interval per client
+WEBSOCKET_PING_TIMEOUT_SECONDS = 20   # Drop clients that miss a pong for this long
+# Slow clients: device frames are skipped while more than WEBSOCKET_MAX_BACKLOG_FRAMES are queued
+# for a client (it gets a fresh snapshot once it catches up); status updates are never skipped.
+# Clients lagging longer than WEBSOCKET_SLOW_CONSUMER_SECONDS or with
+# WEBSOCKET_DISCONNECT_BACKLOG_FRAMES queued are disconnected.
+# (Broadcast workers read these from the environment.)
+WEBSOCKET_MAX_BACKLOG_FRAMES = 32
+WEBSOCKET_DISCONNECT_BACKLOG_FRAMES = 512
+WEBSOCKET_SLOW_CONSUMER_SECONDS = 30
+BROADCAST_TICK_SECONDS = 0.1          # Device updates are batched into one frame per tick (0 = off)
+HOME_ID = "home"                      # Subscription room of this home; clients that do not
+                                      # subscribe explicitly join it on connect
+
+# Multi-process fan-out: with BROADCAST_WORKERS > 0 the agent publishes broadcasts on a local
+# Unix socket bus and that many broadcast_worker.py processes serve the dashboards on ports
+# BROADCAST_BASE_PORT, BROADCAST_BASE_PORT + 1, ... (put a sticky-session load balancer in front)
+BROADCAST_WORKERS = 0
+BROADCAST_BASE_PORT = 5001
+BROADCAST_BUS_PATH = "/tmp/securex_bus.sock"
+
+# Event history served by GET /events and GET /status/history
+EVENT_HISTORY_SIZE = 1000             # Recent sensor events, classifications and protocol runs kept
+
+# Processing pipeline: the poller queues events for an ingestion worker (analysis), which queues
+# classifications for a response worker. Ingestion overflow policy when the queue is full:
+#   drop_oldest - discard the oldest queued event (default)
+#   drop_newest - discard the new event
+#   block       - hold the poller up to 1 s, then discard the new event
+INGEST_QUEUE_SIZE = 1000
+INGEST_OVERFLOW_POLICY = "drop_oldest"
+RESPONSE_QUEUE_SIZE = 100              # A full queue blocks ingestion up to 60 s before a classification is dropped
+
+# Prometheus metrics: GET /metrics on the WebSocket server. With BROADCAST_WORKERS > 0 the agent
+# serves its own metrics on this port instead (0 = off)
+METRICS_PORT = 9100
+
+# Latency tracing (read from the environment by ai_agent.main)
+# Spans are appended as JSON lines; summarise with: python latency_tracing.py <file>
+TRACE_EXPORT_PATH = ""
+
+# State snapshots for warm restart
+SNAPSHOT_PATH = "securex_state.snap"  # Binary snapshot file
+SNAPSHOT_INTERVAL_SECONDS = 30        # Periodic snapshot interval (also saved on shutdown)
+SNAPSHOT_MAX_AGE_SECONDS = 3600       # Ignore snapshots older than this on startup
+
+# Append-only event journal of raw messages, events, classifications and commands ("" = off)
+# Dump with: python event_journal.py <dir> [--type classification] [--since <seq>]
+JOURNAL_DIR = ""
+JOURNAL_SEGMENT_MB = 64               # Start a new segment file at this size
+JOURNAL_COMMIT_INTERVAL_SECONDS = 0.05  # Records appended within this interval share one fsync
+JOURNAL_MAX_SEGMENTS = 0              # Segments kept; older ones are deleted (0 = keep all)
+
+# Hot configuration reload: send SIGHUP, or edit config.py, DEVICES_FILE, SITES_FILE or a
+# protocol/device file; changes are picked up within this interval (0 = SIGHUP only)
+CONFIG_WATCH_INTERVAL_SECONDS = 5
 
 
 # ============================================================================
@@ -0,0 +1,164 @@
+"""
+Hot configuration reload.
+
+A reload is triggered by SIGHUP or by a change to one of the watched
+configuration files (config.py, DEVICES_FILE, SITES_FILE and the protocol
+and device files of every site), detected by comparing modification times
+once per CONFIG_WATCH_INTERVAL_SECONDS.
+
+The agent then re-executes config.py, and reads and validates every file.
+It compiles every site's registry, debounce rules and protocols on the main
+thread, between two polls; events keep flowing through the pipeline
+meanwhile. Only a configuration that compiled completely is applied; a
+rejected one changes nothing. The compiled configuration is swapped in by
+the pipeline stage workers between two items (see event_pipeline), so every
+event is processed entirely under the old or entirely under the new
+configuration, and analyzer buffers, debounce history and alarm states carry
+over.
+
+Reloadable: device lists and sites, protocols, alarm thresholds, hysteresis,
+hold and auto-clear times, analyzer windows and debounce rules. Credentials,
+HOME_ID, queue sizes, ports and the broadcast layer need a restart.
+
+If a stage worker does not run its swap within the control call timeout,
+the reload is reported as pending: it is finished (registry, subscriptions,
+removed sites' last snapshots) and reported as applied by the main loop
+once both swaps have run, and no further reload starts until then.
+
+Reloads are reported as log events (``config_reload``) and metrics:
+
+    securex_config_reloads_total         reloads {outcome: applied|pending|rejected}
+    securex_config_reload_seconds        time from trigger to swap
+    securex_config_generation            number of applied configurations
+"""
+
+import importlib
+import logging
+import os
+import sys
+import time
+from typing import Dict, Iterable, List, Optional
+
+from metrics import get_registry
+from structured_logging import log_event
+
+logger = logging.getLogger(__name__)
+
+OUTCOME_APPLIED = 'applied'
+OUTCOME_PENDING = 'pending'
+OUTCOME_REJECTED = 'rejected'
+
+_metrics = get_registry()
+_reloads_total = _metrics.counter(
+    'securex_config_reloads_total', 'Configuration reloads', ('outcome',))
+_reload_seconds = _metrics.histogram(
+    'securex_config_reload_seconds', 'Time to validate, compile and swap in a configuration')
+_generation = _metrics.gauge(
+    'securex_config_generation', 'Number of configurations applied (1 = the startup configuration)')
+_generation.set(1)
+
+
+def load_fresh_config():
+    """
+    Re-execute config.py and load the configuration from it.
+
+    Returns:
+        The configuration object returned by config.load_config()
+
+    Raises:
+        ValueError: If the configuration is invalid
+    """
+    module = sys.modules.get('config')
+    if module is None:
+        module = importlib.import_module('config')
+    else:
+        module = importlib.reload(module)
+    return module.load_config()
+
+
+def config_module_path() -> Optional[str]:
+    """Get the path of the loaded config.py (None if it is not a file)."""
+    module = sys.modules.get('config')
+    return getattr(module, '__file__', None)
+
+
+def _mtime(path: str) -> Optional[float]:
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+class ConfigWatcher:
+    """
+    Detects changes to configuration files by polling their modification times.
+
+    Used from the agent's main loop only (not thread-safe).
+    """
+
+    def __init__(self, interval_seconds: float = 5.0):
+        """
+        Initialize the watcher.
+
+        Args:
+            interval_seconds: Minimum time between two checks (0 = never check)
+        """
+        self.interval_seconds = interval_seconds
+        self._mtimes: Dict[str, Optional[float]] = {}
+        self._next_check = 0.0
+
+    def watch(self, paths: Iterable[str]) -> None:
+        """
+        Replace the watched files, remembering their current modification times.
+
+        Args:
+            paths: Files to watch (empty entries are ignored)
+        """
+        self._mtimes = {path: _mtime(path) for path in paths if path}
+
+    def paths(self) -> List[str]:
+        """Get the watched files."""
+        return sorted(self._mtimes)
+
+    def poll(self, now: Optional[float] = None) -> List[str]:
+        """
+        Check the watched files if the interval has passed.
+
+        Args:
+            now: Current time.monotonic() (taken if omitted)
+
+        Returns:
+            List[str]: Files modified, created or removed since the last check
+        """
+        if self.interval_seconds <= 0 or not self._mtimes:
+            return []
+        now = time.monotonic() if now is None else now
+        if now < self._next_check:
+            return []
+        self._next_check = now + self.interval_seconds
+
+        changed = []
+        for path, mtime in self._mtimes.items():
+            current = _mtime(path)
+            if current != mtime:
+                self._mtimes[path] = current
+                changed.append(path)
+        return changed
+
+
+def report_reload(outcome: str, seconds: float, generation: int, **fields) -> None:
+    """
+    Report a reload as a log event and metrics.
+
+    Args:
+        outcome: OUTCOME_APPLIED, OUTCOME_PENDING or OUTCOME_REJECTED
+        seconds: Time from trigger to swap (or rejection)
+        generation: Number of configurations applied so far
+        **fields: Further log event fields (trigger, error, counts)
+    """
+    _reloads_total.labels(outcome).inc()
+    _reload_seconds.observe(seconds)
+    _generation.set(generation)
+    level = {OUTCOME_APPLIED: logging.INFO, OUTCOME_PENDING: logging.WARNING}.get(outcome, logging.ERROR)
+    log_event(logger, level, 'config_reload', outcome=outcome, seconds=round(seconds, 4),
+              generation=generation, **fields)
@@ -0,0 +1,205 @@
+"""
+Authoritative dashboard state for snapshot-plus-delta client sync.
+
+The server keeps the current security status and the last known state of
+every device in memory. Every change bumps a monotonically increasing
+version. New clients receive the whole model as a ``state_snapshot`` on
+connect; afterwards ``status_update`` and ``device_update`` carry only the
+version and what changed (for devices: the changed datapoint codes).
+
+Clients apply deltas whose version is newer than their snapshot and can
+ask for a fresh snapshot at any time with a ``sync`` event. Broadcast
+worker processes keep a mirror of the agent's model the same way
+(``load_snapshot`` + ``apply_message``).
+
+In multi-site mode every site has its own model; a model created with a
+``home`` stamps it on every message so the server routes it to that
+home's rooms.
+"""
+
+import logging
+import threading
+from typing import Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_state(state: Union[Dict, List, None]) -> Dict:
+    """
+    Convert a Tuya status payload to a {code: value} dict.
+
+    Args:
+        state: Either a {code: value} dict or a Tuya status list
+               ([{"code": ..., "value": ...}, ...])
+
+    Returns:
+        Dict: Datapoint code mapped to value
+    """
+    if not state:
+        return {}
+    if isinstance(state, dict):
+        return dict(state)
+    return {item['code']: item['value'] for item in state if isinstance(item, dict) and 'code' in item}
+
+
+class DashboardState:
+    """
+    Versioned in-memory model of what the dashboard displays.
+
+    All methods are thread-safe. Methods that change the model return the
+    delta message to broadcast (or None if nothing changed).
+    """
+
+    def __init__(self, status: str = 'GREEN_SAFE', zone: str = 'HOUSE', home: Optional[str] = None):
+        """
+        Initialize the model.
+
+        Args:
+            status: Initial security status
+            zone: Initial zone of the status
+            home: Home (site) added to every message (omitted if None)
+        """
+        self.home = home
+        self.version = 0
+        self.status = status
+        self.zone = zone
+        self.devices: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def apply_status(self, status: str, zone: str) -> Dict:
+        """
+        Record a security status change.
+
+        Args:
+            status: Status code (RED_CRITICAL, YELLOW_WARNING, GREEN_SAFE)
+            zone: Zone identifier
+
+        Returns:
+            Dict: ``status_update`` message ({"status", "zone", "version"},
+            plus "home" if the model has one)
+        """
+        with self._lock:
+            self.version += 1
+            self.status = status
+            self.zone = zone
+            return self._with_home({'status': status, 'zone': zone, 'version': self.version})
+
+    def apply_device(self, device_id: str, device_info: Dict, state: Union[Dict, List],
+                     timestamp: str) -> Optional[Dict]:
+        """
+        Record a device state report and compute the changed fields.
+
+        Args:
+            device_id: Device ID
+            device_info: Static device description ({"type", "name", "location", "zone"})
+            state: Reported device state ({code: value} or Tuya status list)
+            timestamp: ISO timestamp of the report
+
+        Returns:
+            Optional[Dict]: ``device_update`` delta message, or None if the
+            report changed nothing. The first delta of a device also
+            carries its "device_name" and "location".
+        """
+        new_state = normalize_state(state)
+        with self._lock:
+            device = self.devices.get(device_id)
+            is_new = device is None
+            if is_new:
+                device = self.devices[device_id] = {
+                    'device_type': device_info['type'],
+                    'device_name': device_info['name'],
+                    'location': device_info['location'],
+                    'zone': device_info.get('zone'),
+                    'state': {},
+                    'timestamp': timestamp
+                }
+            old_state = device['state']
+
+            changed = {code: value for code, value in new_state.items()
+                       if code not in old_state or old_state[code] != value}
+            if not changed:
+                return None
+
+            # Reports may be partial (single datapoints), so merge rather than replace
+            old_state.update(changed)
+            device['timestamp'] = timestamp
+            self.version += 1
+            message = {
+                'version': self.version,
+                'device_id': device_id,
+                'device_type': device['device_type'],
+                'zone': device['zone'],
+                'state': changed,
+                'timestamp': timestamp
+            }
+            if is_new:
+                message['device_name'] = device['device_name']
+                message['location'] = device['location']
+            return self._with_home(message)
+
+    def load_snapshot(self, snapshot: Dict) -> None:
+        """
+        Replace the model with a snapshot (mirror of another process's model).
+
+        Args:
+            snapshot: ``state_snapshot`` message
+        """
+        with self._lock:
+            self.version = snapshot.get('version', 0)
+            self.status = snapshot.get('status', self.status)
+            self.zone = snapshot.get('zone', self.zone)
+            self.devices = {
+                device_id: dict(device, state=dict(device.get('state', {})))
+                for device_id, device in snapshot.get('devices', {}).items()
+            }
+
+    def apply_message(self, event: str, data: Dict) -> None:
+        """
+        Apply a delta produced by another process's model.
+
+        Args:
+            event: ``status_update`` or ``device_update``
+            data: The delta message
+        """
+        with self._lock:
+            if event == 'status_update':
+                self.status = data['status']
+                self.zone = data['zone']
+            elif event == 'device_update':
+                device = self.devices.setdefault(data['device_id'], {
+                    'device_type': data.get('device_type'),
+                    'device_name': data.get('device_name'),
+                    'location': data.get('location'),
+                    'zone': data.get('zone'),
+                    'state': {},
+                    'timestamp': data.get('timestamp')
+                })
+                device['state'].update(data.get('state', {}))
+                device['timestamp'] = data.get('timestamp')
+            else:
+                return
+            self.version = max(self.version, data.get('version', 0))
+
+    def snapshot(self) -> Dict:
+        """
+        Get the complete model for a newly connected client.
+
+        Returns:
+            Dict: ``state_snapshot`` message with version, status, zone and
+            every device's description and full state
+        """
+        with self._lock:
+            return self._with_home({
+                'version': self.version,
+                'status': self.status,
+                'zone': self.zone,
+                'devices': {
+                    device_id: dict(device, state=dict(device['state']))
+                    for device_id, device in self.devices.items()
+                }
+            })
+
+    def _with_home(self, message: Dict) -> Dict:
+        if self.home is not None:
+            message['home'] = self.home
+        return message
@@ -0,0 +1,254 @@
+"""
+Device registry shared by all components.
+
+Built once at startup from the configured device IDs and, optionally, a
+device file with any number of further devices. Every per-message lookup
+(type, role, name, zone, home) is a single dict access, and derived views
+(ID list, sensor set, per-type and per-zone IDs, protocol inventory) are
+precomputed, so nothing is rebuilt while events are processed.
+
+Device file (DEVICES_FILE), a JSON list:
+
+    [
+      {"id": "bf...", "type": "motion", "name": "Hall Motion",
+       "location": "Hallway", "zone": "Hallway", "home": "home"},
+      ...
+    ]
+
+``name``, ``location`` and ``home`` are optional (defaults: the type,
+the zone and the registry's default home).
+"""
+
+import json
+import logging
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ROLE_SENSOR = 'sensor'
+ROLE_ACTUATOR = 'actuator'
+
+# Device type -> role; sensor events are analyzed, actuator reports only displayed
+DEVICE_ROLES = {
+    'motion': ROLE_SENSOR,
+    'window': ROLE_SENSOR,
+    'door-lock': ROLE_SENSOR,
+    'bulb': ROLE_ACTUATOR,
+    'siren': ROLE_ACTUATOR
+}
+
+
+@dataclass(frozen=True)
+class Device:
+    """
+    Static description of one device.
+
+    Attributes:
+        device_id: Tuya device ID
+        type: Device type (motion, window, door-lock, bulb, siren)
+        role: sensor or actuator (derived from the type)
+        name: Friendly name
+        location: Room shown on the dashboard
+        zone: Zone used for classification and subscription rooms
+        home: Home (site) the device belongs to
+    """
+    device_id: str
+    type: str
+    role: str
+    name: str
+    location: str
+    zone: str
+    home: str
+
+
+def make_device(device_id: str, device_type: str, zone: str, home: str,
+                name: Optional[str] = None, location: Optional[str] = None) -> Device:
+    """
+    Build a Device, deriving its role from its type.
+
+    Raises:
+        ValueError: If the device type is unknown
+    """
+    role = DEVICE_ROLES.get(device_type)
+    if role is None:
+        raise ValueError(f"Unknown device type '{device_type}' for device {device_id} "
+                         f"(expected one of {sorted(DEVICE_ROLES)})")
+    return Device(device_id, device_type, role, name or device_type, location or zone, zone, home)
+
+
+class DeviceRegistry:
+    """
+    Immutable device lookup tables.
+    """
+
+    def __init__(self, devices: Iterable[Device]):
+        """
+        Build the lookup tables.
+
+        Args:
+            devices: Devices to register
+
+        Raises:
+            ValueError: If a device ID is registered twice
+        """
+        self._devices: Dict[str, Device] = {}
+        by_type: Dict[str, List[str]] = {}
+        by_zone: Dict[str, List[str]] = {}
+        for device in devices:
+            if device.device_id in self._devices:
+                raise ValueError(f"Device {device.device_id} is registered twice")
+            self._devices[device.device_id] = device
+            by_type.setdefault(device.type, []).append(device.device_id)
+            by_zone.setdefault(device.zone, []).append(device.device_id)
+
+        self._ids: Tuple[str, ...] = tuple(self._devices)
+        self._sensor_ids: FrozenSet[str] = frozenset(
+            device_id for device_id, device in self._devices.items() if device.role == ROLE_SENSOR)
+        self._by_type = {device_type: tuple(ids) for device_type, ids in by_type.items()}
+        self._by_zone = {zone: tuple(ids) for zone, ids in by_zone.items()}
+        # Dashboard descriptions, shared read-only by every update
+        self._info = {
+            device_id: {'name': d.name, 'location': d.location, 'zone': d.zone, 'type': d.type, 'home': d.home}
+            for device_id, d in self._devices.items()
+        }
+        self._inventory = [
+            {'id': d.device_id, 'type': d.type, 'zone': d.zone} for d in self._devices.values()
+        ]
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def __contains__(self, device_id: str) -> bool:
+        return device_id in self._devices
+
+    def get(self, device_id: str) -> Optional[Device]:
+        """Get a device by ID (None if unknown)."""
+        return self._devices.get(device_id)
+
+    def info(self, device_id: str) -> Optional[Dict]:
+        """
+        Get the dashboard description of a device.
+
+        Returns:
+            Optional[Dict]: {'name', 'location', 'zone', 'type', 'home'} (do
+            not modify), or None if unknown
+        """
+        return self._info.get(device_id)
+
+    def is_sensor(self, device_id: str) -> bool:
+        """Check whether a device's events are analyzed."""
+        return device_id in self._sensor_ids
+
+    def ids(self) -> Tuple[str, ...]:
+        """Get all device IDs in registration order."""
+        return self._ids
+
+    def ids_of_type(self, *device_types: str) -> Tuple[str, ...]:
+        """Get the IDs of all devices of the given types."""
+        if len(device_types) == 1:
+            return self._by_type.get(device_types[0], ())
+        return tuple(device_id for device_type in device_types for device_id in self._by_type.get(device_type, ()))
+
+    def ids_in_zone(self, zone: str) -> Tuple[str, ...]:
+        """Get the IDs of all devices in a zone."""
+        return self._by_zone.get(zone, ())
+
+    def first(self, device_type: str) -> Optional[str]:
+        """Get the first registered device of a type (the configured one), or None."""
+        ids = self._by_type.get(device_type)
+        return ids[0] if ids else None
+
+    def inventory(self) -> List[Dict]:
+        """Get the device inventory for protocol compilation ([{'id', 'type', 'zone'}])."""
+        return self._inventory
+
+    def name_map(self) -> Dict[str, str]:
+        """Get friendly name mapped to device ID (repeated names get the ID appended)."""
+        names: Dict[str, str] = {}
+        for d in self._devices.values():
+            names[d.name if d.name not in names else f"{d.name} ({d.device_id})"] = d.device_id
+        return names
+
+
+def parse_devices(entries, default_home: str, source: str = 'device list') -> List[Device]:
+    """
+    Build devices from device file entries.
+
+    Args:
+        entries: JSON list of {"id", "type", "zone", ...} entries
+        default_home: Home of devices that do not name one
+        source: Where the entries came from (for error messages)
+
+    Returns:
+        List[Device]: Devices in list order
+
+    Raises:
+        ValueError: If an entry is malformed, has an unknown type or
+                    repeats a device ID
+    """
+    if not isinstance(entries, list):
+        raise ValueError(f"{source} must be a JSON list")
+    devices = []
+    seen = set()
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict) or not all(entry.get(key) for key in ('id', 'type', 'zone')):
+            raise ValueError(f"{source}: entry {index} needs 'id', 'type' and 'zone'")
+        if entry['id'] in seen:
+            raise ValueError(f"{source}: entry {index} repeats device ID {entry['id']}")
+        seen.add(entry['id'])
+        devices.append(make_device(
+            entry['id'], entry['type'], entry['zone'], entry.get('home') or default_home,
+            name=entry.get('name'), location=entry.get('location')
+        ))
+    return devices
+
+
+def load_device_file(path: str, default_home: str) -> List[Device]:
+    """
+    Load additional devices from a JSON device file.
+
+    Args:
+        path: Path to the device file
+        default_home: Home of devices that do not name one
+
+    Returns:
+        List[Device]: Devices in file order
+
+    Raises:
+        ValueError: If an entry is malformed or has an unknown type
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    devices = parse_devices(entries, default_home, source=f"Device file {path}")
+    logger.info(f"Loaded {len(devices)} devices from {path}")
+    return devices
+
+
+def build_registry(config, home_id: str, devices_file: str = '') -> DeviceRegistry:
+    """
+    Build the registry from the five configured devices plus an optional device file.
+
+    Args:
+        config: Loaded configuration (device ID attributes)
+        home_id: Home of the configured devices
+        devices_file: Optional path of a device file with further devices
+
+    Returns:
+        DeviceRegistry: The registry
+    """
+    devices = [
+        make_device(config.living_room_motion_id, 'motion', 'LivingRoom', home_id,
+                    name='Motion Sensor', location='Living Room'),
+        make_device(config.window_vibration_id, 'window', 'MasterBedroom', home_id,
+                    name='Window Sensor', location='Master Bedroom'),
+        make_device(config.front_door_lock_id, 'door-lock', 'Foyer', home_id,
+                    name='Door Lock', location='Foyer'),
+        make_device(config.smart_bulb_id, 'bulb', 'MasterBedroom', home_id,
+                    name='Smart Bulb', location='Master Bedroom'),
+        make_device(config.siren_id, 'siren', 'Foyer', home_id,
+                    name='Siren', location='Foyer')
+    ]
+    if devices_file:
+        devices.extend(load_device_file(devices_file, home_id))
+    return DeviceRegistry(devices)
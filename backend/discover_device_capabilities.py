@@ -7,6 +7,7 @@ each device actually supports.
 
 from config import load_config
 from tuya_connection_manager import TuyaConnectionManager
+from structured_logging import configure_logging
 import json
 
 def discover_device(device_id, device_name):
@@ -123,4 +124,5 @@ def main():
 
 
 if __name__ == "__main__":
+    configure_logging()
     main()
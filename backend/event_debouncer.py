@@ -0,0 +1,170 @@
+"""
+Debounce and deduplication stage for chattering sensors.
+
+This module sits in front of the ThreatAnalyzer and drops redundant
+device events before they turn into analysis, protocol execution and
+broadcast cycles. Each device can be given its own rule:
+- Collapse events whose datapoint values all equal the last values seen
+  for the device (seen, not accepted: a suppressed reset still counts, so
+  the next real trigger is never mistaken for a duplicate)
+- Enforce a minimum re-trigger interval since the last accepted event
+- Coalesce bursts: accept the leading event, suppress followers until the
+  device has been quiet for the burst window
+"""
+
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Optional
+
+from dashboard_state import normalize_state
+from structured_logging import log_event
+
+logger = logging.getLogger(__name__)
+
+# Suppression reasons (also the counter keys)
+REASON_DUPLICATE = 'duplicate'
+REASON_RETRIGGER = 'retrigger'
+REASON_BURST = 'burst'
+
+
+@dataclass
+class DebounceRule:
+    """
+    Debounce settings for a device.
+
+    Attributes:
+        min_retrigger_seconds: Minimum time between accepted events (0 = off)
+        collapse_identical: Drop events whose datapoints all equal the last seen values
+        burst_window_seconds: Quiet period that ends a burst (0 = off)
+    """
+    min_retrigger_seconds: float = 0.0
+    collapse_identical: bool = True
+    burst_window_seconds: float = 0.0
+
+
+@dataclass
+class _DeviceState:
+    """Per-device debounce bookkeeping."""
+    last_accepted_time: Optional[datetime] = None
+    last_seen_time: Optional[datetime] = None
+    # Last seen value of each datapoint, accepted or not
+    last_values: Dict = field(default_factory=dict)
+
+
+class EventDebouncer:
+    """
+    Per-device debounce/dedup filter for incoming device events.
+
+    Call ``should_process`` for every event; only events it accepts should
+    be broadcast and analyzed. Suppressed events are counted per device and
+    reason.
+    """
+
+    def __init__(self, default_rule: Optional[DebounceRule] = None,
+                 device_rules: Optional[Dict[str, DebounceRule]] = None):
+        """
+        Initialize the debouncer.
+
+        Args:
+            default_rule: Rule for devices without a specific rule
+            device_rules: Optional rule per device ID
+        """
+        self.default_rule = default_rule or DebounceRule()
+        self.device_rules: Dict[str, DebounceRule] = dict(device_rules or {})
+        self._states: Dict[str, _DeviceState] = {}
+        self.accepted_count = 0
+        self.suppressed_counts: Dict[str, Dict[str, int]] = {}
+
+        logger.info(f"EventDebouncer initialized with {len(self.device_rules)} device rules")
+
+    def set_rule(self, device_id: str, rule: DebounceRule) -> None:
+        """
+        Set the debounce rule for a device.
+
+        Args:
+            device_id: Device identifier
+            rule: Rule to apply to the device
+        """
+        self.device_rules[device_id] = rule
+
+    def should_process(self, device_id: str, event_data: dict, timestamp: datetime) -> bool:
+        """
+        Decide whether an event should continue down the pipeline.
+
+        Args:
+            device_id: Device identifier
+            event_data: Event datapoints (code -> value)
+            timestamp: Event time
+
+        Returns:
+            bool: True if the event is accepted, False if suppressed
+        """
+        rule = self.device_rules.get(device_id, self.default_rule)
+        state = self._states.get(device_id)
+        if state is None:
+            state = self._states[device_id] = _DeviceState()
+
+        values = normalize_state(event_data)
+        duplicate = bool(values) and all(
+            code in state.last_values and state.last_values[code] == value for code, value in values.items())
+
+        reason = None
+        if rule.collapse_identical and duplicate:
+            reason = REASON_DUPLICATE
+        elif (rule.min_retrigger_seconds > 0 and state.last_accepted_time is not None and
+              (timestamp - state.last_accepted_time).total_seconds() < rule.min_retrigger_seconds):
+            reason = REASON_RETRIGGER
+        elif (rule.burst_window_seconds > 0 and state.last_seen_time is not None and
+              (timestamp - state.last_seen_time).total_seconds() < rule.burst_window_seconds):
+            reason = REASON_BURST
+
+        if state.last_seen_time is None or timestamp > state.last_seen_time:
+            state.last_seen_time = timestamp
+        state.last_values.update(values)
+
+        if reason is not None:
+            counts = self.suppressed_counts.setdefault(device_id, {})
+            counts[reason] = counts.get(reason, 0) + 1
+            log_event(logger, logging.DEBUG, 'event_suppressed', device_id=device_id, reason=reason)
+            return False
+
+        state.last_accepted_time = timestamp
+        self.accepted_count += 1
+        return True
+
+    def get_suppressed_total(self) -> int:
+        """
+        Get the total number of suppressed events across all devices.
+
+        Returns:
+            int: Number of suppressed events
+        """
+        return sum(sum(counts.values()) for counts in self.suppressed_counts.values())
+
+    def get_stats(self) -> Dict:
+        """
+        Get accepted/suppressed counters.
+
+        Returns:
+            Dict: Accepted total, suppressed total and per-device breakdown
+        """
+        return {
+            'accepted': self.accepted_count,
+            'suppressed': self.get_suppressed_total(),
+            'suppressed_by_device': {
+                device_id: dict(counts) for device_id, counts in self.suppressed_counts.items()
+            }
+        }
+
+    def reset(self, device_id: Optional[str] = None) -> None:
+        """
+        Forget debounce state so the next event is always accepted.
+
+        Args:
+            device_id: Device to reset, or None to reset all devices
+        """
+        if device_id is None:
+            self._states.clear()
+        else:
+            self._states.pop(device_id, None)
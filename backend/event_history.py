@@ -0,0 +1,205 @@
+"""
+Bounded in-memory history of recent events for the REST endpoints.
+
+The agent records every accepted sensor event, every classification and
+every protocol execution in a fixed-size ring buffer. Each record gets a
+monotonically increasing sequence number, which doubles as the pagination
+cursor: ``GET /events?since=<seq>`` returns records after ``seq``, and the
+response's ``next_since`` continues from there.
+
+Records are kept in sequence order in a list that is trimmed from the
+front in batches (amortized O(1) per append), so a record can be indexed
+in O(1). Finding the cursor position is an offset from the oldest
+retained sequence number, and a query only scans the records after it. The ETag of a query is derived from the
+newest sequence number and the query parameters, so it changes exactly
+when new records are appended.
+"""
+
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+KIND_SENSOR_EVENT = 'sensor_event'
+KIND_CLASSIFICATION = 'classification'
+KIND_PROTOCOL = 'protocol'
+
+
+class EventHistory:
+    """
+    Thread-safe ring buffer of recent history records.
+    """
+
+    def __init__(self, capacity: int = 1000):
+        """
+        Initialize the history.
+
+        Args:
+            capacity: Maximum number of records kept (oldest are evicted)
+        """
+        self.capacity = capacity
+        # Retained records are self._buffer[self._head:]; evicted ones are
+        # dropped from the front once they make up half the buffer
+        self._buffer: List[Dict] = []
+        self._head = 0
+        self._last_seq = 0
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def add_listener(self, listener) -> None:
+        """
+        Register a callback invoked with every new record (e.g. to publish it).
+
+        Args:
+            listener: Callable taking the record dict
+        """
+        self._listeners.append(listener)
+
+    def record(self, kind: str, timestamp: Optional[str] = None, **fields) -> Dict:
+        """
+        Append a record.
+
+        Args:
+            kind: Record kind (sensor_event, classification, protocol)
+            timestamp: ISO timestamp of the recorded event (default now)
+            **fields: Record fields; device_id, zone and status are filterable
+
+        Returns:
+            Dict: The stored record, including its sequence number
+        """
+        with self._lock:
+            self._last_seq += 1
+            record = {
+                'seq': self._last_seq,
+                'kind': kind,
+                'timestamp': timestamp or time.strftime('%Y-%m-%dT%H:%M:%S'),
+                **fields
+            }
+            self._append(record)
+        for listener in self._listeners:
+            listener(record)
+        return record
+
+    def append_record(self, record: Dict) -> None:
+        """
+        Add a record produced by another process's history (keeps its sequence number).
+
+        Listeners run outside the producer's lock, so records can arrive
+        slightly out of order or twice (also right after ``load``); they
+        are put in sequence order and duplicates are ignored.
+
+        Args:
+            record: Record from EventHistory.record
+        """
+        seq = record['seq']
+        with self._lock:
+            if seq > self._last_seq:
+                self._last_seq = seq
+                self._append(record)
+                return
+            index = len(self._buffer)
+            while index > self._head and self._buffer[index - 1]['seq'] > seq:
+                index -= 1
+            if index > self._head and self._buffer[index - 1]['seq'] == seq:
+                return
+            if len(self._buffer) - self._head == self.capacity:
+                if index == self._head:
+                    return
+                # Evict the oldest to make room
+                self._head += 1
+            self._buffer.insert(index, record)
+            self._compact()
+
+    def load(self, records: Iterable[Dict]) -> None:
+        """
+        Replace the history with another process's records.
+
+        Args:
+            records: Records in sequence order
+        """
+        with self._lock:
+            self._buffer = list(records)[-self.capacity:] if self.capacity else []
+            self._head = 0
+            self._last_seq = self._buffer[-1]['seq'] if self._buffer else 0
+
+    def records(self) -> List[Dict]:
+        """Get all retained records in sequence order."""
+        with self._lock:
+            return self._buffer[self._head:]
+
+    def _append(self, record: Dict) -> None:
+        self._buffer.append(record)
+        if len(self._buffer) - self._head > self.capacity:
+            self._head += 1
+            self._compact()
+
+    def _compact(self) -> None:
+        if self._head >= max(self.capacity, 1):
+            del self._buffer[:self._head]
+            self._head = 0
+
+    @property
+    def last_seq(self) -> int:
+        """Sequence number of the newest record (0 if none)."""
+        return self._last_seq
+
+    def query(self, kinds: Optional[Tuple[str, ...]] = None, since: int = 0, limit: int = 100,
+              device_id: Optional[str] = None, zone: Optional[str] = None,
+              status: Optional[str] = None, home: Optional[str] = None) -> Tuple[List[Dict], int]:
+        """
+        Get records after a cursor, optionally filtered.
+
+        Args:
+            kinds: Record kinds to include (None = all)
+            since: Return records with a sequence number greater than this
+            limit: Maximum number of records to return
+            device_id: Only records of this device
+            zone: Only records of this zone
+            status: Only records with this status
+            home: Only records of this home (site)
+
+        Returns:
+            Tuple[List[Dict], int]: Matching records and the cursor to pass
+            as ``since`` for the next page
+        """
+        with self._lock:
+            buffer = self._buffer
+            head = self._head
+            if head == len(buffer):
+                return [], since
+            first_seq = buffer[head]['seq']
+            start = head + min(max(0, since - first_seq + 1), len(buffer) - head)
+            # Exact for contiguous sequence numbers; step back over gaps (mirrors)
+            while start > head and buffer[start - 1]['seq'] > since:
+                start -= 1
+            results = []
+            cursor = since
+            for index in range(start, len(buffer)):
+                record = buffer[index]
+                cursor = record['seq']
+                if kinds is not None and record['kind'] not in kinds:
+                    continue
+                if device_id is not None and record.get('device_id') != device_id:
+                    continue
+                if zone is not None and record.get('zone') != zone:
+                    continue
+                if status is not None and record.get('status') != status:
+                    continue
+                if home is not None and record.get('home') != home:
+                    continue
+                results.append(record)
+                if len(results) >= limit:
+                    break
+            return results, max(cursor, since)
+
+    def etag(self, *params) -> str:
+        """
+        Build the ETag for a query.
+
+        Args:
+            *params: The query parameters
+
+        Returns:
+            str: Entity tag (unquoted)
+        """
+        return f"{self._last_seq:x}-{zlib.crc32(repr(params).encode('utf-8')):08x}"
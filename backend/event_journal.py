@@ -0,0 +1,550 @@
+"""
+Append-only journal of what the agent sees and decides.
+
+Every raw device message, normalized sensor event, classification and
+device command can be appended to a journal on disk, for audits, replay
+and offline analytics. Appending only queues the record; a writer thread
+encodes queued records, writes them in one batch and fsyncs once per
+batch (group commit), so the hot path never waits for the disk.
+
+The journal is a directory of segment files named after the sequence
+number of their first record (``journal-<first_seq>.sxj``). A segment is
+closed and a new one started once it reaches the segment size.
+
+Segment layout (little-endian):
+    header:  magic "SXJL" | u16 version | u64 first_seq
+    record:  u32 payload length | u32 crc32 | u8 type | u64 seq |
+             f64 timestamp (epoch seconds) | payload (compact JSON)
+
+The CRC covers type, seq, timestamp and payload. Readers map segments
+with mmap and read them sequentially, checking the CRC of every record;
+a torn record at the end of a segment (crash mid-write) or a corrupt
+record of any type ends that segment. After a restart, or after a batch
+failed to write, the writer continues the sequence in a new segment.
+
+Usage (dump as JSON lines):
+    python event_journal.py /var/lib/securex/journal --type classification --since 1000
+"""
+
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from metrics import get_registry
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_MAGIC = b'SXJL'
+JOURNAL_VERSION = 1
+SEGMENT_PREFIX = 'journal-'
+SEGMENT_SUFFIX = '.sxj'
+
+_SEGMENT_HEADER = struct.Struct('<4sHQ')
+_RECORD_HEADER = struct.Struct('<IIBQd')
+# Part of the record header covered by the CRC (type, seq, timestamp)
+_RECORD_META = struct.Struct('<BQd')
+
+# Record types
+RECORD_RAW = 1
+RECORD_EVENT = 2
+RECORD_CLASSIFICATION = 3
+RECORD_COMMAND = 4
+
+RECORD_TYPE_NAMES = {
+    RECORD_RAW: 'raw',
+    RECORD_EVENT: 'event',
+    RECORD_CLASSIFICATION: 'classification',
+    RECORD_COMMAND: 'command'
+}
+RECORD_TYPES = {name: record_type for record_type, name in RECORD_TYPE_NAMES.items()}
+
+_metrics = get_registry()
+_records_total = _metrics.counter(
+    'securex_journal_records_total', 'Records written to the event journal', ('type',))
+_dropped_total = _metrics.counter(
+    'securex_journal_dropped_total', 'Records dropped because the journal writer fell behind or a write failed')
+_commit_seconds = _metrics.histogram(
+    'securex_journal_commit_seconds', 'Time to write and fsync one journal batch')
+_pending = _metrics.gauge(
+    'securex_journal_pending', 'Records queued for the journal writer')
+
+
+@dataclass(frozen=True)
+class JournalRecord:
+    """
+    One record read back from the journal.
+
+    Attributes:
+        seq: Sequence number (increasing across segments and restarts)
+        type: Record type name (raw, event, classification, command)
+        timestamp: Epoch seconds when the record was appended
+        payload: Record contents
+    """
+    seq: int
+    type: str
+    timestamp: float
+    payload: Dict
+
+
+def encode_record(seq: int, record_type: int, timestamp: float, payload: Dict) -> bytes:
+    """
+    Encode one record in the journal record format.
+
+    Args:
+        seq: Sequence number
+        record_type: RECORD_* type
+        timestamp: Epoch seconds
+        payload: JSON-serializable contents
+
+    Returns:
+        bytes: Encoded record
+    """
+    body = json.dumps(payload, separators=(',', ':'), default=str).encode('utf-8')
+    meta = _RECORD_META.pack(record_type, seq, timestamp)
+    crc = zlib.crc32(body, zlib.crc32(meta))
+    return _RECORD_HEADER.pack(len(body), crc, record_type, seq, timestamp) + body
+
+
+def segment_name(first_seq: int) -> str:
+    """File name of the segment starting at a sequence number."""
+    return f"{SEGMENT_PREFIX}{first_seq:020d}{SEGMENT_SUFFIX}"
+
+
+def list_segments(directory: str) -> List[str]:
+    """
+    Get the segment files of a journal, oldest first.
+
+    Args:
+        directory: Journal directory
+
+    Returns:
+        List[str]: Segment paths (empty if the directory does not exist)
+    """
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, name) for name in sorted(names)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)]
+
+
+def _segment_first_seq(path: str) -> int:
+    return int(os.path.basename(path)[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+
+class JournalReader:
+    """
+    Sequential reader over a journal directory.
+
+    Segments are memory-mapped one at a time; only records of the requested
+    types are JSON-decoded.
+    """
+
+    def __init__(self, directory: str):
+        """
+        Initialize the reader.
+
+        Args:
+            directory: Journal directory
+        """
+        self.directory = directory
+        self.torn_records = 0
+
+    def records(self, since_seq: int = 0, types: Optional[Iterable[str]] = None) -> Iterator[JournalRecord]:
+        """
+        Iterate over records in sequence order.
+
+        Args:
+            since_seq: Only records with a greater sequence number
+            types: Record type names to include (None = all)
+
+        Yields:
+            JournalRecord: Records in sequence order
+
+        Raises:
+            ValueError: If a type name is unknown
+        """
+        wanted = None
+        if types is not None:
+            unknown = set(types) - set(RECORD_TYPES)
+            if unknown:
+                raise ValueError(f"Unknown journal record types {sorted(unknown)} "
+                                 f"(expected some of {sorted(RECORD_TYPES)})")
+            wanted = {RECORD_TYPES[name] for name in types}
+
+        segments = list_segments(self.directory)
+        for index, path in enumerate(segments):
+            # Skip segments that end before the cursor
+            if index + 1 < len(segments) and _segment_first_seq(segments[index + 1]) <= since_seq + 1:
+                continue
+            yield from self._read_segment(path, since_seq, wanted)
+
+    def _read_segment(self, path: str, since_seq: int, wanted) -> Iterator[JournalRecord]:
+        try:
+            f = open(path, 'rb')
+        except OSError as e:
+            logger.warning(f"Cannot open journal segment {path}: {e}")
+            return
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _SEGMENT_HEADER.size:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                magic, version, _ = _SEGMENT_HEADER.unpack_from(buf, 0)
+                if magic != JOURNAL_MAGIC or version != JOURNAL_VERSION:
+                    logger.warning(f"Skipping journal segment {path}: bad header")
+                    return
+                offset = _SEGMENT_HEADER.size
+                while offset + _RECORD_HEADER.size <= size:
+                    length, crc, record_type, seq, timestamp = _RECORD_HEADER.unpack_from(buf, offset)
+                    start = offset + _RECORD_HEADER.size
+                    end = start + length
+                    if end > size:
+                        self.torn_records += 1
+                        return
+                    # Check every record, wanted or not: the lengths that
+                    # follow a corrupt record cannot be trusted
+                    body = buf[start:end]
+                    if zlib.crc32(body, zlib.crc32(_RECORD_META.pack(record_type, seq, timestamp))) != crc:
+                        self.torn_records += 1
+                        return
+                    if seq > since_seq and (wanted is None or record_type in wanted):
+                        yield JournalRecord(seq, RECORD_TYPE_NAMES.get(record_type, str(record_type)),
+                                            timestamp, json.loads(body))
+                    offset = end
+                if offset < size:
+                    # Crash in the middle of a record header
+                    self.torn_records += 1
+
+    def last_seq(self, path: Optional[str] = None) -> int:
+        """
+        Get the sequence number of the last complete record.
+
+        Args:
+            path: Only look at this segment (default the whole journal)
+
+        Returns:
+            int: The sequence number (0 if there is no complete record)
+        """
+        segments = [path] if path else list_segments(self.directory)
+        for segment in reversed(segments):
+            last = 0
+            for record in self._read_segment(segment, 0, None):
+                last = record.seq
+            if last:
+                return last
+        return 0
+
+
+class EventJournal:
+    """
+    Group-committing journal writer.
+
+    ``append`` is thread-safe and non-blocking: records wait in a bounded
+    queue for the writer thread, and are dropped (and counted) if the disk
+    cannot keep up. A batch that fails to write is dropped and counted
+    too, and the writer continues in a fresh segment.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024,
+                 commit_interval_seconds: float = 0.05, max_pending: int = 100000,
+                 max_segments: int = 0):
+        """
+        Initialize the journal.
+
+        Args:
+            directory: Journal directory (created if missing)
+            segment_bytes: Size at which a segment is closed and a new one started
+            commit_interval_seconds: Minimum time between two fsyncs; records
+                                     appended meanwhile share the next one
+            max_pending: Maximum records waiting for the writer
+            max_segments: Segments to keep; older ones are deleted (0 = keep all)
+        """
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.commit_interval_seconds = commit_interval_seconds
+        self.max_pending = max_pending
+        self.max_segments = max_segments
+
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._running = False
+        self._idle = False
+        self._flush_requested = False
+        self._thread: Optional[threading.Thread] = None
+        self._file = None
+        self._segment_size = 0
+
+        self._next_seq = 1
+        self._committed_seq = 0
+        # Last seq the writer handled (committed or failed) and last failed seq
+        self._processed_seq = 0
+        self._failed_seq = 0
+
+        # Counters
+        self.written_count = 0
+        self.dropped_count = 0
+        self.commit_count = 0
+
+        self._type_metrics = {record_type: _records_total.labels(name)
+                              for record_type, name in RECORD_TYPE_NAMES.items()}
+        _pending.set_function(lambda: len(self._pending))
+
+    def start(self) -> None:
+        """Resume the sequence after the last complete record and start the writer thread."""
+        os.makedirs(self.directory, exist_ok=True)
+        reader = JournalReader(self.directory)
+        last_seq = 0
+        # Trailing segments without a complete record (crash right after a
+        # rotation) are removed, so the new segment sorts after every record
+        for path in reversed(list_segments(self.directory)):
+            last_seq = reader.last_seq(path)
+            if last_seq:
+                break
+            logger.warning(f"Removing journal segment {path} without complete records")
+            os.unlink(path)
+        self._next_seq = last_seq + 1
+        self._committed_seq = last_seq
+        self._processed_seq = last_seq
+        self._open_segment(self._next_seq)
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='event-journal', daemon=True)
+        self._thread.start()
+        logger.info(f"Event journal started in {self.directory} at seq {self._next_seq}")
+
+    def append(self, record_type: int, payload: Dict, timestamp: Optional[float] = None) -> int:
+        """
+        Queue a record (the payload must not be modified afterwards).
+
+        Args:
+            record_type: RECORD_* type
+            payload: JSON-serializable contents
+            timestamp: Epoch seconds (now if omitted)
+
+        Returns:
+            int: The record's sequence number, or 0 if it was dropped
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        with self._cond:
+            if not self._running:
+                return 0
+            if len(self._pending) >= self.max_pending:
+                self.dropped_count += 1
+                _dropped_total.inc()
+                if self.dropped_count == 1 or self.dropped_count % 1000 == 0:
+                    logger.warning(f"Event journal is behind; {self.dropped_count} records dropped so far")
+                return 0
+            seq = self._next_seq
+            self._next_seq += 1
+            self._pending.append((seq, record_type, timestamp, payload))
+            # Wake the writer only when it is idle; otherwise the record
+            # joins the next group commit
+            if self._idle:
+                self._cond.notify_all()
+        return seq
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """
+        Wait until every record appended so far is on disk.
+
+        Args:
+            timeout: Maximum seconds to wait
+
+        Returns:
+            bool: True if everything was committed in time, False on
+            timeout or if a batch failed to write meanwhile
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            target = self._next_seq - 1
+            handled = self._processed_seq
+            self._flush_requested = True
+            self._cond.notify_all()
+            while self._processed_seq < target:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._running:
+                    break
+                self._cond.wait(remaining)
+            return self._processed_seq >= target and self._failed_seq <= handled
+
+    def close(self, timeout: float = 5.0) -> None:
+        """
+        Commit queued records and stop the writer.
+
+        Args:
+            timeout: Maximum seconds to wait for the writer
+        """
+        with self._cond:
+            if not self._running:
+                return
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+        if self._file:
+            self._file.close()
+            self._file = None
+        logger.info(f"Event journal closed: {self.written_count} records in {self.commit_count} commits, "
+                    f"{self.dropped_count} dropped")
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._idle = True
+                while not self._pending and self._running:
+                    self._cond.wait()
+                self._idle = False
+                if not self._pending:
+                    return
+                batch = list(self._pending)
+                self._pending.clear()
+                self._flush_requested = False
+
+            started = time.monotonic()
+            try:
+                self._write_batch(batch)
+                written = True
+            except Exception as e:
+                written = False
+                self._discard_batch(batch, e)
+            else:
+                _commit_seconds.observe(time.monotonic() - started)
+
+            with self._cond:
+                if written:
+                    self._committed_seq = batch[-1][0]
+                else:
+                    self._failed_seq = batch[-1][0]
+                self._processed_seq = batch[-1][0]
+                self._cond.notify_all()
+                # Let records accumulate for the next group commit
+                deadline = started + self.commit_interval_seconds
+                while self._running and not self._flush_requested:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+    def _discard_batch(self, batch, error: Exception) -> None:
+        self.dropped_count += len(batch)
+        _dropped_total.inc(len(batch))
+        logger.error(f"Error writing event journal batch of {len(batch)} records "
+                     f"(seq {batch[0][0]}-{batch[-1][0]}), dropped: {error}", exc_info=True)
+        # Part of the batch may have reached the segment; the next batch
+        # starts a fresh one instead of appending after a partial write
+        if self._file:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+    def _write_batch(self, batch) -> None:
+        if self._file is None:
+            self._open_segment(batch[0][0])
+        chunk = bytearray()
+        for seq, record_type, timestamp, payload in batch:
+            record = encode_record(seq, record_type, timestamp, payload)
+            if self._segment_size + len(chunk) + len(record) > self.segment_bytes and \
+                    self._segment_size + len(chunk) > _SEGMENT_HEADER.size:
+                self._commit(chunk)
+                chunk = bytearray()
+                self._open_segment(seq)
+            chunk += record
+        self._commit(chunk)
+        self.written_count += len(batch)
+        for _, record_type, _, _ in batch:
+            self._type_metrics[record_type].inc()
+
+    def _commit(self, chunk: bytes) -> None:
+        if chunk:
+            self._file.write(chunk)
+            self._segment_size += len(chunk)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.commit_count += 1
+
+    def _open_segment(self, first_seq: int) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+        path = os.path.join(self.directory, segment_name(first_seq))
+        self._file = open(path, 'wb')
+        self._file.write(_SEGMENT_HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION, first_seq))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._segment_size = _SEGMENT_HEADER.size
+        self._sync_directory()
+        self._apply_retention()
+
+    def _sync_directory(self) -> None:
+        # Make the new segment's directory entry durable (not supported on Windows)
+        try:
+            fd = os.open(self.directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def _apply_retention(self) -> None:
+        if self.max_segments <= 0:
+            return
+        segments = list_segments(self.directory)
+        for path in segments[:-self.max_segments]:
+            try:
+                os.unlink(path)
+                logger.info(f"Deleted old journal segment {path}")
+            except OSError as e:
+                logger.warning(f"Could not delete journal segment {path}: {e}")
+
+    def get_stats(self) -> Dict:
+        """
+        Get journal counters.
+
+        Returns:
+            Dict: Pending, written and dropped records, commits and last committed seq
+        """
+        return {
+            'pending': len(self._pending),
+            'written': self.written_count,
+            'dropped': self.dropped_count,
+            'commits': self.commit_count,
+            'committed_seq': self._committed_seq
+        }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Dump a SecureX event journal as JSON lines")
+    parser.add_argument('directory', help="Journal directory (JOURNAL_DIR)")
+    parser.add_argument('--since', type=int, default=0, help="Only records after this sequence number")
+    parser.add_argument('--type', action='append', choices=sorted(RECORD_TYPES), dest='types',
+                        help="Record type to include (repeatable; default all)")
+    args = parser.parse_args(argv)
+
+    reader = JournalReader(args.directory)
+    for record in reader.records(since_seq=args.since, types=args.types):
+        sys.stdout.write(json.dumps({'seq': record.seq, 'type': record.type,
+                                     'timestamp': record.timestamp, 'payload': record.payload}) + '\n')
+    if reader.torn_records:
+        sys.stderr.write(f"{reader.torn_records} torn record(s) skipped\n")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,279 @@
+"""
+Bounded queue + worker stages between the poller and event processing.
+
+The poller only normalizes device messages and hands them to the first
+stage; broadcasting, analysis and protocol execution run on the stages'
+worker threads, so a slow command or broadcast no longer delays the next
+poll. Each stage has one bounded queue and an explicit overflow policy:
+
+    drop_oldest   discard the oldest queued item (keep the freshest data)
+    drop_newest   discard the item being added
+    block         wait up to block_timeout_seconds for room, then drop it
+                  (``put(item, block=False)`` drops it at once instead)
+
+Stages are FIFO and single-worker by default, so items are processed in
+arrival order by one thread (the analyzer and alarm state machine are not
+thread-safe). Per-stage queue depth, queue wait, processing time and drops
+are exported as metrics.
+
+``call`` runs a function on the stage's worker between two items (ahead of
+queued items, never dropped). State owned by the worker, such as the
+analyzer or the alarm state, can be swapped this way without locking.
+
+``drain`` processes the queue on the calling thread instead; the replay
+engine uses it to run the stages deterministically without workers.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict
+
+from metrics import get_registry
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+OVERFLOW_DROP_NEWEST = 'drop_newest'
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_POLICIES = (OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_BLOCK)
+
+_metrics = get_registry()
+_queue_depth = _metrics.gauge(
+    'securex_pipeline_queue_depth', 'Items waiting in a pipeline stage queue', ('stage',))
+_queue_wait_seconds = _metrics.histogram(
+    'securex_pipeline_queue_wait_seconds', 'Time items waited in a pipeline stage queue', ('stage',))
+_process_seconds = _metrics.histogram(
+    'securex_pipeline_process_seconds', 'Time a pipeline stage spent on one item', ('stage',))
+_dropped_total = _metrics.counter(
+    'securex_pipeline_dropped_total', 'Items dropped by a pipeline stage overflow policy', ('stage', 'policy'))
+
+
+class PipelineStage:
+    """
+    One bounded queue served by worker threads running a handler.
+    """
+
+    def __init__(self, name: str, handler: Callable[[object], None], capacity: int = 1000,
+                 overflow: str = OVERFLOW_DROP_OLDEST, block_timeout_seconds: float = 1.0,
+                 workers: int = 1):
+        """
+        Initialize the stage.
+
+        Args:
+            name: Stage name (metrics label and thread name)
+            handler: Called with each item on a worker thread
+            capacity: Maximum number of queued items
+            overflow: What to do when the queue is full (see OVERFLOW_POLICIES)
+            block_timeout_seconds: Longest ``put`` waits under the block policy
+            workers: Number of worker threads (more than one loses ordering)
+
+        Raises:
+            ValueError: If the overflow policy is unknown
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{overflow}' (expected one of {OVERFLOW_POLICIES})")
+        self.name = name
+        self.handler = handler
+        self.capacity = capacity
+        self.overflow = overflow
+        self.block_timeout_seconds = block_timeout_seconds
+        self.workers = workers
+
+        self._queue = deque()
+        # Control calls (function, done event, outcome), run ahead of queued items
+        self._calls = deque()
+        self._cond = threading.Condition()
+        self._running = False
+        self._threads = []
+
+        # Counters
+        self.enqueued_count = 0
+        self.processed_count = 0
+        self.dropped_count = 0
+        self.failed_count = 0
+
+        self._wait_metric = _queue_wait_seconds.labels(name)
+        self._process_metric = _process_seconds.labels(name)
+        self._dropped_metric = _dropped_total.labels(name, overflow)
+        _queue_depth.labels(name).set_function(lambda: len(self._queue))
+
+    def put(self, item, block: bool = True) -> bool:
+        """
+        Queue an item for processing.
+
+        Args:
+            item: Item passed to the handler
+            block: False to never wait under the block policy: a full queue
+                   drops the item at once (for periodic items such as ticks,
+                   where the next one supersedes it)
+
+        Returns:
+            bool: True if the item was queued, False if it was dropped
+            (with drop_oldest the new item is always queued)
+        """
+        with self._cond:
+            if len(self._queue) >= self.capacity:
+                if self.overflow == OVERFLOW_DROP_OLDEST:
+                    self._queue.popleft()
+                    self._count_drop()
+                elif self.overflow == OVERFLOW_DROP_NEWEST or not block:
+                    self._count_drop()
+                    return False
+                else:
+                    deadline = time.monotonic() + self.block_timeout_seconds
+                    while len(self._queue) >= self.capacity:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._count_drop()
+                            return False
+                        self._cond.wait(remaining)
+            self._queue.append((time.monotonic(), item))
+            self.enqueued_count += 1
+            self._cond.notify_all()
+        return True
+
+    def call(self, function: Callable[[], None], timeout: float = 10.0) -> bool:
+        """
+        Run a function on a worker between two items and wait for it.
+
+        Runs the function on the calling thread if the stage is not running.
+
+        Args:
+            function: Function to run
+            timeout: Maximum seconds to wait for a worker to run it
+
+        Returns:
+            bool: True if the function ran, False on timeout (it still runs later)
+
+        Raises:
+            Exception: Whatever the function raised
+        """
+        with self._cond:
+            if not self._running:
+                function()
+                return True
+            done = threading.Event()
+            outcome = {}
+            self._calls.append((function, done, outcome))
+            self._cond.notify_all()
+        if not done.wait(timeout):
+            logger.warning(f"Pipeline stage '{self.name}' did not run a control call within {timeout}s")
+            return False
+        if 'error' in outcome:
+            raise outcome['error']
+        return True
+
+    def _count_drop(self) -> None:
+        self.dropped_count += 1
+        self._dropped_metric.inc()
+        if self.dropped_count == 1 or self.dropped_count % 100 == 0:
+            logger.warning(f"Pipeline stage '{self.name}' is full ({self.overflow}); "
+                           f"{self.dropped_count} items dropped so far")
+
+    def start(self) -> None:
+        """Start the worker threads."""
+        self._running = True
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"pipeline-{self.name}-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Pipeline stage '{self.name}' started ({self.workers} worker(s), capacity {self.capacity})")
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """
+        Process what is queued, then stop the workers.
+
+        Args:
+            timeout: Maximum seconds to wait for the queue to drain
+        """
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        if self._queue:
+            logger.warning(f"Pipeline stage '{self.name}' stopped with {len(self._queue)} items unprocessed")
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue and not self._calls and self._running:
+                    self._cond.wait()
+                if self._calls:
+                    call = self._calls.popleft()
+                elif self._queue:
+                    call = None
+                    enqueued_at, item = self._queue.popleft()
+                    # Wake producers blocked on a full queue
+                    self._cond.notify_all()
+                else:
+                    return
+            if call is not None:
+                self._run_call(*call)
+                continue
+            self._process(enqueued_at, item)
+
+    def drain(self) -> int:
+        """
+        Process every queued item on the calling thread.
+
+        For a stage that was not started; items queued by the handlers of
+        the drained items are processed too.
+
+        Returns:
+            int: Number of items processed
+
+        Raises:
+            RuntimeError: If the stage's workers are running
+        """
+        processed = 0
+        while True:
+            with self._cond:
+                if self._running:
+                    raise RuntimeError(f"Pipeline stage '{self.name}' is running; drain() needs a stopped stage")
+                if not self._queue:
+                    return processed
+                enqueued_at, item = self._queue.popleft()
+            self._process(enqueued_at, item)
+            processed += 1
+
+    def _process(self, enqueued_at: float, item) -> None:
+        started = time.monotonic()
+        self._wait_metric.observe(started - enqueued_at)
+        try:
+            self.handler(item)
+        except Exception as e:
+            self.failed_count += 1
+            logger.error(f"Error in pipeline stage '{self.name}': {e}", exc_info=True)
+        self._process_metric.observe(time.monotonic() - started)
+        self.processed_count += 1
+
+    @staticmethod
+    def _run_call(function: Callable[[], None], done: threading.Event, outcome: Dict) -> None:
+        try:
+            function()
+        except Exception as e:
+            outcome['error'] = e
+        done.set()
+
+    def depth(self) -> int:
+        """Get the number of queued items."""
+        return len(self._queue)
+
+    def get_stats(self) -> Dict:
+        """
+        Get stage counters.
+
+        Returns:
+            Dict: Queue depth, enqueued, processed, dropped and failed items
+        """
+        return {
+            'depth': len(self._queue),
+            'enqueued': self.enqueued_count,
+            'processed': self.processed_count,
+            'dropped': self.dropped_count,
+            'failed': self.failed_count
+        }
@@ -6,6 +6,7 @@ for broadcasting security status updates.
 """
 
 from websocket_server import WebSocketServer
+from structured_logging import configure_logging
 import time
 import threading
 
@@ -42,6 +43,8 @@ def simulate_security_events(server):
 
 def main():
     """Main function to run the WebSocket server example."""
+    configure_logging()
+    
     print("Starting WebSocket Server Example...")
     print("Server will listen on http://localhost:5000")
     print("WebSocket endpoint: ws://localhost:5000/socket.io/")
@@ -0,0 +1,358 @@
+"""
+End-to-end detection-to-actuation latency tracing.
+
+A trace is started when the poller detects a device state change and its
+ID travels with the event through the agent, analyzer, orchestrator,
+command dispatcher and WebSocket emit. Each stage records a timed span;
+the trace ends when the last actuator command of the resulting protocol
+is acknowledged (see ``Tracer.expect_ends``).
+
+Spans are aggregated in-process into per-stage latency histograms and,
+if an export path is configured, appended as JSON lines to a local file
+by a background writer thread.
+
+Stages recorded by the agent:
+    poll_api        Tuya status GET for one device (every poll)
+    ingest_queue    Time a message waited in the ingestion queue
+    ingest          Whole handling of one message by the ingestion worker
+    analysis        Analyzer insert + sequence analysis
+    response        Alarm state evaluation and protocol submission
+    broadcast       Hand-off to the broadcast aggregator -> WebSocket emit done
+                    (device_update includes the wait for the next frame tick)
+    command_queue   Time a command waited in the dispatcher
+    command_api     Tuya command request including retries
+    end_to_end      State change detected -> last protocol command acknowledged
+
+Summarise an exported file with:
+    python latency_tracing.py spans.jsonl
+"""
+
+import bisect
+import itertools
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in milliseconds
+BUCKET_BOUNDS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram with percentile estimates."""
+
+    def __init__(self, bounds_ms: Iterable[float] = BUCKET_BOUNDS_MS):
+        self.bounds_ms = tuple(bounds_ms)
+        self.counts = [0] * (len(self.bounds_ms) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, value_ms: float) -> None:
+        """
+        Add one observation.
+
+        Args:
+            value_ms: Latency in milliseconds
+        """
+        self.counts[bisect.bisect_left(self.bounds_ms, value_ms)] += 1
+        self.count += 1
+        self.total_ms += value_ms
+        if value_ms > self.max_ms:
+            self.max_ms = value_ms
+
+    def percentile(self, p: float) -> Optional[float]:
+        """
+        Estimate a percentile as the upper bound of the bucket containing it.
+
+        Args:
+            p: Percentile as a fraction (0.95 = p95)
+
+        Returns:
+            Optional[float]: Estimated latency in ms, or None if empty
+        """
+        if not self.count:
+            return None
+        rank = p * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                if index < len(self.bounds_ms):
+                    return min(float(self.bounds_ms[index]), self.max_ms)
+                return self.max_ms
+        return self.max_ms
+
+    def summary(self) -> Dict:
+        """Get count, mean, p50/p95/p99, max and bucket counts."""
+        return {
+            'count': self.count,
+            'mean_ms': (self.total_ms / self.count) if self.count else None,
+            'p50_ms': self.percentile(0.50),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': self.max_ms if self.count else None,
+            'buckets': {
+                (f"le_{bound}" if i < len(self.bounds_ms) else "inf"): count
+                for i, (bound, count) in enumerate(
+                    itertools.zip_longest(self.bounds_ms, self.counts, fillvalue=None))
+            }
+        }
+
+
+class Tracer:
+    """
+    Records spans per trace and aggregates them into stage histograms.
+
+    All methods are thread-safe and cheap enough for the hot path; span
+    export to disk happens on a background writer thread.
+    """
+
+    def __init__(self, export_path: Optional[str] = None, max_open_traces: int = 10000):
+        """
+        Initialize the tracer.
+
+        Args:
+            export_path: JSON-lines file to append spans to (None = no export)
+            max_open_traces: Maximum traces awaiting completion before the
+                             oldest are forgotten
+        """
+        self.export_path = export_path
+        self.max_open_traces = max_open_traces
+        self._ids = itertools.count(1)
+        self._prefix = f"{os.getpid():x}-{int(time.time()):x}"
+        self._open: "OrderedDict[str, float]" = OrderedDict()
+        # Open traces that end only after several end_trace calls
+        self._remaining_ends: Dict[str, int] = {}
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+        self._export_queue: Optional[queue.Queue] = None
+        self._writer: Optional[threading.Thread] = None
+        if export_path:
+            self._export_queue = queue.Queue(maxsize=100000)
+            self._writer = threading.Thread(target=self._write_loop, name='trace-exporter', daemon=True)
+            self._writer.start()
+
+    def start_trace(self, started_at: Optional[float] = None, **attrs) -> str:
+        """
+        Start a new trace.
+
+        Args:
+            started_at: time.monotonic() at which the trace began (default now)
+            **attrs: Attributes recorded on the trace start span
+
+        Returns:
+            str: New trace ID
+        """
+        trace_id = f"{self._prefix}-{next(self._ids):x}"
+        start = started_at if started_at is not None else time.monotonic()
+        with self._lock:
+            self._open[trace_id] = start
+            while len(self._open) > self.max_open_traces:
+                evicted, _ = self._open.popitem(last=False)
+                self._remaining_ends.pop(evicted, None)
+        self._export({'trace_id': trace_id, 'stage': 'trace_start', 'ts': time.time(), **attrs})
+        return trace_id
+
+    def record(self, trace_id: Optional[str], stage: str, duration_s: float, **attrs) -> None:
+        """
+        Record a completed span.
+
+        Args:
+            trace_id: Trace the span belongs to (None for untraced work)
+            stage: Stage name
+            duration_s: Span duration in seconds
+            **attrs: Extra span attributes for the export
+        """
+        duration_ms = duration_s * 1000.0
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = LatencyHistogram()
+            histogram.observe(duration_ms)
+        if self._export_queue is not None:
+            self._export({'trace_id': trace_id, 'stage': stage,
+                          'duration_ms': round(duration_ms, 3), 'ts': time.time(), **attrs})
+
+    @contextmanager
+    def span(self, trace_id: Optional[str], stage: str, **attrs):
+        """
+        Time a block of code as a span.
+
+        Args:
+            trace_id: Trace the span belongs to
+            stage: Stage name
+            **attrs: Extra span attributes
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(trace_id, stage, time.perf_counter() - start, **attrs)
+
+    def expect_ends(self, trace_id: Optional[str], count: int) -> None:
+        """
+        Make an open trace end only on its ``count``-th ``end_trace`` call.
+
+        A protocol that sends several commands calls this with its number
+        of commands, so the end-to-end latency runs until the last one is
+        acknowledged, whichever device answers last.
+
+        Args:
+            trace_id: Open trace
+            count: Number of end_trace calls that complete it
+        """
+        if trace_id is None:
+            return
+        with self._lock:
+            if trace_id in self._open and count > 1:
+                self._remaining_ends[trace_id] = count
+
+    def end_trace(self, trace_id: Optional[str], stage: str = 'end_to_end', **attrs) -> None:
+        """
+        Complete a trace, recording its total duration.
+
+        Ending an unknown or already-ended trace is a no-op. A trace set up
+        with ``expect_ends`` only completes on the last expected call.
+
+        Args:
+            trace_id: Trace to end
+            stage: Stage name for the total duration
+            **attrs: Extra span attributes
+        """
+        if trace_id is None:
+            return
+        with self._lock:
+            remaining = self._remaining_ends.pop(trace_id, 1)
+            if remaining > 1:
+                self._remaining_ends[trace_id] = remaining - 1
+                return
+            start = self._open.pop(trace_id, None)
+        if start is not None:
+            self.record(trace_id, stage, time.monotonic() - start, **attrs)
+
+    def summary(self) -> Dict[str, Dict]:
+        """
+        Get per-stage latency histogram summaries.
+
+        Returns:
+            Dict[str, Dict]: Stage name mapped to its histogram summary
+        """
+        with self._lock:
+            return {stage: histogram.summary() for stage, histogram in sorted(self._histograms.items())}
+
+    def format_summary(self) -> str:
+        """Render the per-stage summary as a text table."""
+        return format_summary(self.summary())
+
+    def _export(self, span: Dict) -> None:
+        if self._export_queue is None:
+            return
+        try:
+            self._export_queue.put_nowait(span)
+        except queue.Full:
+            pass
+
+    def _write_loop(self) -> None:
+        with open(self.export_path, 'a', encoding='utf-8') as out:
+            while True:
+                span = self._export_queue.get()
+                if span is None:
+                    out.flush()
+                    return
+                out.write(json.dumps(span, default=str) + '\n')
+                if self._export_queue.empty():
+                    out.flush()
+
+    def close(self) -> None:
+        """Flush exported spans and stop the writer thread."""
+        if self._export_queue is not None and self._writer is not None:
+            self._export_queue.put(None)
+            self._writer.join(5.0)
+            self._writer = None
+
+
+def format_summary(summary: Dict[str, Dict]) -> str:
+    """
+    Render a per-stage summary as a text table.
+
+    Args:
+        summary: Output of Tracer.summary()
+
+    Returns:
+        str: Table with one row per stage
+    """
+    def fmt(value):
+        return '-' if value is None else f"{value:.1f}"
+
+    lines = [f"{'stage':<15}{'count':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)"]
+    for stage, stats in summary.items():
+        lines.append(f"{stage:<15}{stats['count']:>8}{fmt(stats['mean_ms']):>10}{fmt(stats['p50_ms']):>10}"
+                     f"{fmt(stats['p95_ms']):>10}{fmt(stats['p99_ms']):>10}{fmt(stats['max_ms']):>10}")
+    return '\n'.join(lines)
+
+
+def summarize_file(path: str) -> Dict[str, Dict]:
+    """
+    Build per-stage histograms from an exported span file.
+
+    Args:
+        path: JSON-lines span file
+
+    Returns:
+        Dict[str, Dict]: Stage name mapped to its histogram summary
+    """
+    histograms: Dict[str, LatencyHistogram] = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            span = json.loads(line)
+            if 'duration_ms' not in span:
+                continue
+            histograms.setdefault(span['stage'], LatencyHistogram()).observe(span['duration_ms'])
+    return {stage: histogram.summary() for stage, histogram in sorted(histograms.items())}
+
+
+# Process-wide tracer, replaced by configure_tracing()
+_tracer = Tracer()
+
+
+def configure_tracing(export_path: Optional[str] = None) -> Tracer:
+    """
+    Configure the process-wide tracer. Call once from the entry point.
+
+    Args:
+        export_path: JSON-lines file to export spans to (None = histograms only)
+
+    Returns:
+        Tracer: The new tracer
+    """
+    global _tracer
+    _tracer.close()
+    _tracer = Tracer(export_path=export_path)
+    return _tracer
+
+
+def get_tracer() -> Tracer:
+    """Get the process-wide tracer."""
+    return _tracer
+
+
+def main(argv: List[str]) -> int:
+    if len(argv) != 2:
+        print("Usage: python latency_tracing.py <spans.jsonl>")
+        return 1
+    print(format_summary(summarize_file(argv[1])))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,328 @@
+"""
+In-process metrics registry with Prometheus text exposition.
+
+Components create their metrics once at import time from the process-wide
+registry and update them on the hot path; ``GET /metrics`` renders the
+registry in the Prometheus text format (version 0.0.4).
+
+Updating a metric is a dict lookup (for labelled metrics) plus a short
+locked update, so instrumenting every event and every API call is cheap.
+Histograms reuse latency_tracing.LatencyHistogram buckets and are exposed
+in seconds, as Prometheus expects.
+
+Metrics:
+    securex_poll_cycle_seconds               one pass over all polled devices
+    securex_tuya_api_latency_seconds         Tuya API request {operation, device_id}
+    securex_tuya_api_errors_total            failed Tuya API requests {operation}
+    securex_tuya_api_throttled_total         rate-limited Tuya API requests {operation}
+    securex_events_ingested_total            device events accepted {device_type}
+    securex_events_suppressed_total          device events dropped {reason}
+    securex_analyzer_evaluation_seconds      analyzer insert + sequence analysis
+    securex_classifications_total            classifications {status}
+    securex_command_latency_seconds          command send incl. retries {priority}
+    securex_command_retries_total            command retries {device_id}
+    securex_command_rate_limited_total       dispatcher rate-limit waits {priority}
+    securex_broadcast_fanout_seconds         emit to all recipients {event}
+    securex_connected_clients                connected dashboard clients
+    securex_site_*                           per-site accounting {site} (see sites)
+    securex_config_*                         configuration reloads (see config_reload)
+    securex_journal_*                        event journal records, drops and commits (see event_journal)
+    securex_log_records_dropped_total        log records dropped on a full log queue
+    securex_notification_*                   webhook delivery latency, backlog, retries (see notification_outbox)
+"""
+
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from latency_tracing import BUCKET_BOUNDS_MS, LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base class: a metric family with optional labels."""
+
+    type_name = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """
+        Get the child metric for a set of label values.
+
+        Args:
+            *values: One value per label name, in order
+
+        Returns:
+            The child metric (cache it on hot paths)
+
+        Raises:
+            ValueError: If the number of values does not match the labels
+        """
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._children[key] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _render_child(self, key: Tuple[str, ...], child) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        """Render the family in the Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            children = sorted(self._children.items())
+        for key, child in children:
+            lines.extend(self._render_child(key, child))
+        return lines
+
+
+class _Value:
+    """A single locked number (counter or gauge child)."""
+
+    __slots__ = ('value', '_lock', 'function')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+        self.function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Compute the value at scrape time instead of tracking it."""
+        self.function = function
+
+    def get(self) -> float:
+        if self.function is not None:
+            try:
+                return self.function()
+            except Exception as e:
+                logger.debug(f"Metric callback failed: {e}")
+                return float('nan')
+        return self.value
+
+
+class _Histogram:
+    """A single locked latency histogram (histogram child)."""
+
+    __slots__ = ('histogram', '_lock')
+
+    def __init__(self, bounds_ms: Iterable[float]):
+        self.histogram = LatencyHistogram(bounds_ms)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self.histogram.observe(seconds * 1000.0)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    type_name = 'counter'
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Increment the unlabelled counter."""
+        self.labels().inc(amount)
+
+    def _render_child(self, key, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.get())}"]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, or be computed at scrape time."""
+
+    type_name = 'gauge'
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def set(self, value: float) -> None:
+        """Set the unlabelled gauge."""
+        self.labels().set(value)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Compute the unlabelled gauge at scrape time."""
+        self.labels().set_function(function)
+
+    def _render_child(self, key, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.get())}"]
+
+
+class Histogram(_Metric):
+    """Latency distribution, observed in seconds."""
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 bounds_ms: Iterable[float] = BUCKET_BOUNDS_MS):
+        super().__init__(name, documentation, labelnames)
+        self.bounds_ms = tuple(bounds_ms)
+
+    def _new_child(self) -> _Histogram:
+        return _Histogram(self.bounds_ms)
+
+    def observe(self, seconds: float) -> None:
+        """Observe a duration on the unlabelled histogram."""
+        self.labels().observe(seconds)
+
+    def _render_child(self, key, child) -> List[str]:
+        with child._lock:
+            counts = list(child.histogram.counts)
+            total_ms = child.histogram.total_ms
+            count = child.histogram.count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.bounds_ms + (float('inf'),), counts):
+            cumulative += bucket_count
+            le = '+Inf' if bound == float('inf') else repr(bound / 1000.0)
+            labels = _format_labels(self.labelnames, key, f'le="{le}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total_ms / 1000.0)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Named collection of metric families.
+
+    The factory methods return the existing family if one with the same
+    name was already registered, so modules can declare their metrics
+    independently.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, documentation: str, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.type_name}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        """Get or create a counter."""
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        """Get or create a gauge."""
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  bounds_ms: Iterable[float] = BUCKET_BOUNDS_MS) -> Histogram:
+        """Get or create a histogram (bucket bounds in milliseconds)."""
+        return self._get_or_create(Histogram, name, documentation, labelnames, bounds_ms=bounds_ms)
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text format.
+
+        Returns:
+            str: Exposition text
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines = []
+        for _, metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Process-wide registry
+_registry = MetricsRegistry()
+
+
+def get_registry() -> MetricsRegistry:
+    """Get the process-wide metrics registry."""
+    return _registry
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = _registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(host: str, port: int) -> ThreadingHTTPServer:
+    """
+    Serve ``GET /metrics`` on a standalone port (for processes without a web server).
+
+    Args:
+        host: Host address to bind to
+        port: Port to listen on
+
+    Returns:
+        ThreadingHTTPServer: The server, running on a daemon thread
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info(f"Metrics endpoint listening on {host}:{port}/metrics")
+    return server
@@ -0,0 +1,493 @@
+"""
+Durable, asynchronous webhook notification outbox.
+
+Notifications are written to a local SQLite outbox and delivered by a
+background worker, so alarm protocols never wait on the network. The
+worker:
+- Reuses one keep-alive HTTP(S) connection per webhook host
+- Retries failed deliveries with exponential backoff
+- Batches pending notifications per channel into a single request
+- Drops duplicates of a notification enqueued within the dedupe window
+- Prunes delivered and failed notifications after the retention period
+
+Delivery latency (enqueue to delivery), backlog, retries and failures are
+exported as ``securex_notification_*`` metrics.
+
+Supported webhook formats are Discord (``content``), Slack (``text``) and
+a custom JSON endpoint (``message``/``priority``/``timestamp``/``zone``).
+"""
+
+import http.client
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from metrics import get_registry
+
+logger = logging.getLogger(__name__)
+
+_metrics = get_registry()
+_delivery_seconds = _metrics.histogram(
+    'securex_notification_delivery_seconds', 'Time from enqueue to webhook delivery', ('channel',),
+    bounds_ms=(100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 300000, 900000, 3600000))
+_delivered_total = _metrics.counter(
+    'securex_notification_delivered_total', 'Notifications delivered', ('channel',))
+_retries_total = _metrics.counter(
+    'securex_notification_retries_total', 'Failed deliveries scheduled for a retry', ('channel',))
+_failed_total = _metrics.counter(
+    'securex_notification_failed_total', 'Notifications given up on', ('channel',))
+_backlog = _metrics.gauge(
+    'securex_notification_backlog', 'Notifications waiting for delivery')
+_oldest_pending_seconds = _metrics.gauge(
+    'securex_notification_oldest_pending_seconds', 'Age of the oldest undelivered notification')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    dedupe_key TEXT,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    last_error TEXT,
+    delivered_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_outbox_dedupe ON outbox (channel, dedupe_key, created_at);
+"""
+
+
+class DeliveryError(Exception):
+    """Raised when a webhook delivery fails."""
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def format_webhook_body(url: str, notifications: List[Dict]) -> Dict:
+    """
+    Build the webhook request body for a batch of notifications.
+
+    Args:
+        url: Webhook URL (used to detect Discord/Slack)
+        notifications: Notification payloads in enqueue order
+
+    Returns:
+        Dict: JSON body for the webhook
+    """
+    host = urlsplit(url).netloc
+    lines = [f"🚨 {n['message']}" if n.get('priority') == 'high' else n['message']
+             for n in notifications]
+
+    if 'discord' in host:
+        return {"content": "\n".join(lines), "username": "Security System"}
+    if 'slack' in host:
+        return {"text": "\n".join(lines)}
+    if len(notifications) == 1:
+        return notifications[0]
+    return {"notifications": notifications}
+
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections, one per scheme/host/port."""
+
+    def __init__(self, timeout: float = 10.0):
+        self.timeout = timeout
+        self._connections: Dict[Tuple[str, str], http.client.HTTPConnection] = {}
+
+    def post_json(self, url: str, body: Dict) -> int:
+        """
+        POST a JSON body over a pooled connection.
+
+        Args:
+            url: Target URL
+            body: JSON-serializable request body
+
+        Returns:
+            int: HTTP status code
+
+        Raises:
+            DeliveryError: On transport errors or non-2xx responses
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = parts.path or '/'
+        if parts.query:
+            path = f"{path}?{parts.query}"
+        data = json.dumps(body).encode('utf-8')
+
+        conn = self._connections.get(key)
+        if conn is None:
+            conn_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+            conn = conn_class(parts.netloc, timeout=self.timeout)
+            self._connections[key] = conn
+
+        try:
+            conn.request('POST', path, body=data, headers={
+                'Content-Type': 'application/json',
+                'Connection': 'keep-alive'
+            })
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException) as e:
+            self._drop(key)
+            raise DeliveryError(f"Transport error: {e}")
+
+        if response.will_close:
+            self._drop(key)
+
+        if 200 <= response.status < 300:
+            return response.status
+        retryable = response.status == 429 or response.status >= 500
+        raise DeliveryError(f"HTTP {response.status}", retryable=retryable)
+
+    def _drop(self, key: Tuple[str, str]) -> None:
+        conn = self._connections.pop(key, None)
+        if conn is not None:
+            conn.close()
+
+    def close(self) -> None:
+        """Close all pooled connections."""
+        for key in list(self._connections):
+            self._drop(key)
+
+
+class NotificationOutbox:
+    """
+    Durable notification queue with a background delivery worker.
+
+    ``enqueue`` only writes to the local outbox and returns; delivery,
+    batching and retries happen on the worker thread started by ``start``.
+    """
+
+    def __init__(self, path: str, channels: Dict[str, str],
+                 batch_size: int = 10, max_attempts: int = 8,
+                 base_backoff_seconds: float = 1.0, max_backoff_seconds: float = 300.0,
+                 dedupe_window_seconds: float = 60.0, poll_interval_seconds: float = 1.0,
+                 timeout_seconds: float = 10.0, retention_seconds: float = 7 * 24 * 3600):
+        """
+        Initialize the outbox and its storage.
+
+        Args:
+            path: SQLite database path (":memory:" for non-durable use)
+            channels: Channel name mapped to webhook URL
+            batch_size: Maximum notifications delivered per request per channel
+            max_attempts: Attempts before a notification is marked failed
+            base_backoff_seconds: Initial retry delay
+            max_backoff_seconds: Maximum retry delay
+            dedupe_window_seconds: Identical notifications within this window are dropped
+            poll_interval_seconds: Worker wake-up interval when idle
+            timeout_seconds: HTTP request timeout
+            retention_seconds: Delivered and failed notifications older than
+                               this are deleted (at least the dedupe window)
+        """
+        self.path = path
+        self.channels = dict(channels)
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_backoff_seconds = base_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.dedupe_window_seconds = dedupe_window_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self.retention_seconds = max(retention_seconds, dedupe_window_seconds)
+        self.prune_interval_seconds = min(3600.0, self.retention_seconds)
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(_SCHEMA)
+        self._db_lock = threading.Lock()
+
+        self._pool = ConnectionPool(timeout=timeout_seconds)
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+
+        # Metrics
+        self.enqueued_count = 0
+        self.delivered_count = 0
+        self.failed_count = 0
+        self.retry_count = 0
+        self.deduped_count = 0
+        self.request_count = 0
+        self.pruned_count = 0
+        self._latencies = deque(maxlen=1000)
+
+        _backlog.set_function(self.get_backlog)
+        _oldest_pending_seconds.set_function(self.get_oldest_pending_age)
+
+        logger.info(f"NotificationOutbox initialized ({path}, {len(self.channels)} channels)")
+
+    def enqueue(self, channel: str, payload: Dict, dedupe_key: Optional[str] = None) -> bool:
+        """
+        Durably enqueue a notification for delivery.
+
+        Args:
+            channel: Channel name (must be configured)
+            payload: Notification payload (message, priority, timestamp, ...)
+            dedupe_key: Optional key; an identical key on the same channel
+                        within the dedupe window drops this notification
+
+        Returns:
+            bool: True if enqueued, False if dropped as duplicate or unknown channel
+        """
+        if channel not in self.channels:
+            logger.warning(f"Notification for unknown channel '{channel}' dropped")
+            return False
+
+        now = time.time()
+        with self._db_lock:
+            if dedupe_key is not None:
+                row = self._db.execute(
+                    "SELECT 1 FROM outbox WHERE channel = ? AND dedupe_key = ? "
+                    "AND created_at >= ? AND status != 'failed' LIMIT 1",
+                    (channel, dedupe_key, now - self.dedupe_window_seconds)
+                ).fetchone()
+                if row is not None:
+                    self.deduped_count += 1
+                    logger.debug(f"Duplicate notification dropped: {dedupe_key}")
+                    return False
+
+            self._db.execute(
+                "INSERT INTO outbox (channel, dedupe_key, payload, created_at, next_attempt_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (channel, dedupe_key, json.dumps(payload), now, now)
+            )
+
+        self.enqueued_count += 1
+        self._wakeup.set()
+        return True
+
+    def start(self) -> None:
+        """Start the background delivery worker."""
+        if self._worker is not None and self._worker.is_alive():
+            return
+        self._stop.clear()
+        self._worker = threading.Thread(target=self._run, name='notification-outbox', daemon=True)
+        self._worker.start()
+        logger.info("Notification outbox worker started")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        Stop the worker after a final delivery pass.
+
+        Undelivered notifications stay in the outbox for the next start.
+
+        Args:
+            timeout: Maximum seconds to wait for the worker to exit
+        """
+        self._stop.set()
+        self._wakeup.set()
+        if self._worker is not None:
+            self._worker.join(timeout)
+            self._worker = None
+        self._pool.close()
+        logger.info(f"Notification outbox stopped ({self.get_backlog()} pending)")
+
+    def _run(self) -> None:
+        last_prune = 0.0
+        while not self._stop.is_set():
+            self._wakeup.wait(self.poll_interval_seconds)
+            self._wakeup.clear()
+            try:
+                self.deliver_due()
+                if not last_prune or time.monotonic() - last_prune >= self.prune_interval_seconds:
+                    last_prune = time.monotonic()
+                    self.prune()
+            except Exception as e:
+                logger.error(f"Notification outbox worker error: {e}", exc_info=True)
+        # Final best-effort pass so shutdown does not strand fresh alarms
+        try:
+            self.deliver_due()
+        except Exception as e:
+            logger.error(f"Notification outbox final flush error: {e}")
+
+    def deliver_due(self) -> int:
+        """
+        Deliver all notifications that are due, batched per channel.
+
+        Returns:
+            int: Number of notifications delivered
+        """
+        now = time.time()
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT id, channel, payload, created_at, attempts FROM outbox "
+                "WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY id",
+                (now,)
+            ).fetchall()
+
+        by_channel: Dict[str, List[tuple]] = {}
+        for row in rows:
+            by_channel.setdefault(row[1], []).append(row)
+
+        delivered = 0
+        for channel, channel_rows in by_channel.items():
+            for start in range(0, len(channel_rows), self.batch_size):
+                batch = channel_rows[start:start + self.batch_size]
+                delivered += self._deliver_batch(channel, batch)
+        return delivered
+
+    def _deliver_batch(self, channel: str, batch: List[tuple]) -> int:
+        url = self.channels.get(channel)
+        ids = [row[0] for row in batch]
+        notifications = [json.loads(row[2]) for row in batch]
+        self.request_count += 1
+
+        try:
+            if url is None:
+                raise DeliveryError(f"Channel '{channel}' is not configured", retryable=False)
+            self._pool.post_json(url, format_webhook_body(url, notifications))
+        except DeliveryError as e:
+            self._record_failure(batch, str(e), e.retryable)
+            return 0
+
+        now = time.time()
+        with self._db_lock:
+            self._db.executemany(
+                "UPDATE outbox SET status = 'delivered', delivered_at = ?, attempts = attempts + 1 "
+                "WHERE id = ?",
+                [(now, row_id) for row_id in ids]
+            )
+        latency_metric = _delivery_seconds.labels(channel)
+        for row in batch:
+            self._latencies.append(now - row[3])
+            latency_metric.observe(now - row[3])
+        self.delivered_count += len(batch)
+        _delivered_total.labels(channel).inc(len(batch))
+        logger.info(f"Delivered {len(batch)} notification(s) to channel '{channel}'")
+        return len(batch)
+
+    def _record_failure(self, batch: List[tuple], error: str, retryable: bool) -> None:
+        now = time.time()
+        updates = []
+        for row_id, channel, _, _, attempts in batch:
+            attempts += 1
+            if not retryable or attempts >= self.max_attempts:
+                updates.append(('failed', attempts, now, error, row_id))
+                self.failed_count += 1
+                _failed_total.labels(channel).inc()
+            else:
+                delay = min(self.base_backoff_seconds * (2 ** (attempts - 1)), self.max_backoff_seconds)
+                updates.append(('pending', attempts, now + delay, error, row_id))
+                self.retry_count += 1
+                _retries_total.labels(channel).inc()
+        with self._db_lock:
+            self._db.executemany(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ? "
+                "WHERE id = ?",
+                updates
+            )
+        logger.warning(f"Notification delivery failed ({error}); {len(batch)} notification(s) affected")
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """
+        Delete delivered and failed notifications older than the retention period.
+
+        Pending notifications are never deleted.
+
+        Args:
+            now: Current epoch seconds (default the current time)
+
+        Returns:
+            int: Number of notifications deleted
+        """
+        cutoff = (time.time() if now is None else now) - self.retention_seconds
+        with self._db_lock:
+            deleted = self._db.execute(
+                "DELETE FROM outbox WHERE status != 'pending' AND created_at < ?", (cutoff,)
+            ).rowcount
+        if deleted:
+            self.pruned_count += deleted
+            logger.info(f"Pruned {deleted} delivered/failed notification(s) from the outbox")
+        return deleted
+
+    def get_oldest_pending_age(self) -> float:
+        """
+        Get the age of the oldest notification waiting for delivery.
+
+        Returns:
+            float: Seconds since it was enqueued (0 if nothing is pending)
+        """
+        with self._db_lock:
+            (oldest,) = self._db.execute(
+                "SELECT MIN(created_at) FROM outbox WHERE status = 'pending'"
+            ).fetchone()
+        return (time.time() - oldest) if oldest else 0.0
+
+    def get_backlog(self) -> int:
+        """
+        Get the number of notifications waiting for delivery.
+
+        Returns:
+            int: Pending notification count
+        """
+        with self._db_lock:
+            (count,) = self._db.execute(
+                "SELECT COUNT(*) FROM outbox WHERE status = 'pending'"
+            ).fetchone()
+        return count
+
+    def get_metrics(self) -> Dict:
+        """
+        Get delivery latency and backlog metrics.
+
+        Returns:
+            Dict: Counters, backlog, oldest pending age and latency percentiles (seconds)
+        """
+        with self._db_lock:
+            pending, oldest = self._db.execute(
+                "SELECT COUNT(*), MIN(created_at) FROM outbox WHERE status = 'pending'"
+            ).fetchone()
+
+        latencies = sorted(self._latencies)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+        return {
+            'enqueued': self.enqueued_count,
+            'delivered': self.delivered_count,
+            'failed': self.failed_count,
+            'retries': self.retry_count,
+            'deduped': self.deduped_count,
+            'requests': self.request_count,
+            'pruned': self.pruned_count,
+            'backlog': pending,
+            'oldest_pending_age_seconds': (time.time() - oldest) if oldest else 0.0,
+            'latency_p50_seconds': percentile(0.5),
+            'latency_p95_seconds': percentile(0.95),
+            'latency_max_seconds': latencies[-1] if latencies else None
+        }
+
+
+def build_notification(message: str, priority: str, zone: Optional[str] = None) -> Dict:
+    """
+    Build a notification payload in the custom webhook format.
+
+    Args:
+        message: Notification message text
+        priority: Priority level (high, medium, low)
+        zone: Optional zone identifier
+
+    Returns:
+        Dict: Notification payload
+    """
+    payload = {
+        "message": message,
+        "priority": priority,
+        "timestamp": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+    }
+    if zone is not None:
+        payload["zone"] = zone
+    return payload
@@ -0,0 +1,393 @@
+"""
+Declarative response protocol definitions compiled to command plans.
+
+Response protocols are described as data (a JSON file, or the built-in
+DEFAULT_PROTOCOLS) instead of hand-written methods. Each status lists its
+actions: target device selectors by type, zone or ID, the command payload,
+ordering constraints, timeouts and priority class, plus the notification, warning-state
+and broadcast behaviour.
+
+At startup ``compile_protocols`` resolves selectors against the device
+inventory, validates everything, orders the steps and prebuilds every
+command payload, producing one immutable ProtocolPlan per (status, zone).
+Executing a protocol at runtime is then a lookup plus dispatch.
+
+Example definition::
+
+    {
+      "protocols": {
+        "RED_CRITICAL": {
+          "actions": [
+            {"name": "bulb_alert", "target": {"type": "bulb"},
+             "commands": [{"code": "switch_led", "value": true}],
+             "timeout_seconds": 5},
+            {"name": "siren_on", "target": {"type": "siren"}, "after": ["bulb_alert"],
+             "commands": [{"code": "alarm_switch", "value": true}]}
+          ],
+          "notify": {"message": "CRITICAL: Break-in attempt detected!", "priority": "high"},
+          "broadcast_zone": "HOUSE"
+        }
+      }
+    }
+
+Selectors: ``{"type": "bulb"}``, ``{"zone": "Foyer"}``, ``{"device": "<id>"}``
+and ``{"zone": "@alarm"}`` (devices in the zone of the classification;
+HOUSE matches every device). Keys in one selector are combined with AND.
+
+``after`` (a list of action names) orders submission only: the action's
+commands are handed to the command dispatcher after those of the named
+actions, but are not held back until those commands are acknowledged.
+The dispatcher sends commands to different devices concurrently, so a
+step that must not start before another has taken effect cannot rely on
+``after``.
+"""
+
+import json
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from command_dispatcher import PRIORITY_CRITICAL, PRIORITY_RANKS, PRIORITY_ROUTINE, PRIORITY_WARNING
+
+logger = logging.getLogger(__name__)
+
+KNOWN_STATUSES = ("RED_CRITICAL", "YELLOW_WARNING", "GREEN_SAFE")
+WARNING_ACTIONS = (None, "track", "clear")
+HOUSE_ZONE = "HOUSE"
+ALARM_ZONE_SELECTOR = "@alarm"
+
+# Command priority class of each status, unless an action sets "priority"
+STATUS_PRIORITIES = {
+    "RED_CRITICAL": PRIORITY_CRITICAL,
+    "YELLOW_WARNING": PRIORITY_WARNING,
+    "GREEN_SAFE": PRIORITY_ROUTINE
+}
+
+# Built-in protocols, equivalent to the original hand-written protocol methods
+DEFAULT_PROTOCOLS = {
+    "protocols": {
+        "RED_CRITICAL": {
+            "actions": [
+                {
+                    "name": "bulb_alert",
+                    "target": {"type": "bulb"},
+                    "commands": [
+                        {"code": "switch_led", "value": True},
+                        {"code": "work_mode", "value": "scene"}
+                    ],
+                    "description": "RED_CRITICAL: Smart bulb set to red"
+                },
+                {
+                    "name": "siren_on",
+                    "target": {"type": "siren"},
+                    "commands": [
+                        {"code": "alarm_switch", "value": True},
+                        {"code": "alarm_volume", "value": "high"}
+                    ],
+                    "description": "RED_CRITICAL: Siren activated"
+                }
+            ],
+            "notify": {"message": "CRITICAL: Break-in attempt detected!", "priority": "high"},
+            "broadcast_zone": HOUSE_ZONE
+        },
+        "YELLOW_WARNING": {
+            "actions": [
+                {
+                    "name": "bulb_warning",
+                    "target": {"type": "bulb"},
+                    "commands": [
+                        {"code": "switch_led", "value": True},
+                        {"code": "work_mode", "value": "white"}
+                    ],
+                    "description": "YELLOW_WARNING: Smart bulb set to soft yellow"
+                }
+            ],
+            "warning": "track"
+        },
+        "GREEN_SAFE": {
+            "actions": [
+                {
+                    "name": "bulb_safe",
+                    "target": {"type": "bulb"},
+                    "commands": [
+                        {"code": "switch_led", "value": True},
+                        {"code": "work_mode", "value": "white"}
+                    ],
+                    "description": "GREEN_SAFE: Smart bulb set to warm white at 20%"
+                },
+                {
+                    "name": "siren_off",
+                    "target": {"type": "siren"},
+                    "commands": [
+                        {"code": "alarm_switch", "value": False}
+                    ],
+                    "description": "GREEN_SAFE: Siren silenced"
+                }
+            ],
+            "warning": "clear",
+            "broadcast_zone": HOUSE_ZONE
+        }
+    }
+}
+
+
+class ProtocolConfigError(ValueError):
+    """Raised when a protocol definition is invalid."""
+
+
+@dataclass(frozen=True)
+class CommandStep:
+    """
+    A single prebuilt device command within a protocol plan.
+
+    Attributes:
+        name: Step name (action name, suffixed with the device ID if the
+              selector matched several devices)
+        device_id: Target device ID
+        payload: Prebuilt Tuya command payload ({"commands": [...]})
+        timeout_seconds: Maximum time to spend on this command, including retries
+        description: Optional log line emitted after dispatch
+        priority: Command priority class (critical, warning or routine)
+    """
+    name: str
+    device_id: str
+    payload: Dict
+    timeout_seconds: Optional[float] = None
+    description: Optional[str] = None
+    priority: str = PRIORITY_ROUTINE
+
+
+@dataclass(frozen=True)
+class ProtocolPlan:
+    """
+    Compiled, validated plan for one status in one zone.
+
+    Attributes:
+        status: Status the plan responds to
+        zone: Zone the plan was compiled for
+        steps: Command steps in submission order
+        notify: Notification (message, priority) or None
+        broadcast_zone: Zone to broadcast, or None to use the classification zone
+        warning_action: "track", "clear" or None
+    """
+    status: str
+    zone: str
+    steps: Tuple[CommandStep, ...]
+    notify: Optional[Dict] = None
+    broadcast_zone: Optional[str] = None
+    warning_action: Optional[str] = None
+
+
+class CompiledProtocols:
+    """Lookup table of compiled protocol plans keyed by (status, zone)."""
+
+    def __init__(self, plans: Dict[Tuple[str, str], ProtocolPlan]):
+        self.plans = plans
+
+    def get(self, status: str, zone: str) -> Optional[ProtocolPlan]:
+        """
+        Get the plan for a status and zone.
+
+        Falls back to the HOUSE plan for zones that were not compiled.
+
+        Args:
+            status: Status code
+            zone: Zone identifier
+
+        Returns:
+            Optional[ProtocolPlan]: The plan, or None if the status has no protocol
+        """
+        plan = self.plans.get((status, zone))
+        if plan is None:
+            plan = self.plans.get((status, HOUSE_ZONE))
+        return plan
+
+    def statuses(self) -> List[str]:
+        """Get the statuses that have compiled plans."""
+        return sorted({status for status, _ in self.plans})
+
+
+def load_protocol_file(path: str) -> Dict:
+    """
+    Load a protocol definition from a JSON file.
+
+    Args:
+        path: Path to the JSON protocol file
+
+    Returns:
+        Dict: Protocol definition
+
+    Raises:
+        ProtocolConfigError: If the file cannot be read or parsed
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise ProtocolConfigError(f"Cannot load protocol file {path}: {e}")
+
+
+def _select_devices(selector: Dict, devices: List[Dict], zone: str, where: str) -> List[Dict]:
+    unknown = set(selector) - {'type', 'zone', 'device'}
+    if not selector or unknown:
+        raise ProtocolConfigError(f"{where}: invalid target selector {selector}")
+
+    matched = []
+    for device in devices:
+        if 'device' in selector and device['id'] != selector['device']:
+            continue
+        if 'type' in selector and device.get('type') != selector['type']:
+            continue
+        if 'zone' in selector:
+            wanted = zone if selector['zone'] == ALARM_ZONE_SELECTOR else selector['zone']
+            if wanted != HOUSE_ZONE and device.get('zone') != wanted:
+                continue
+        matched.append(device)
+    return matched
+
+
+def _order_actions(actions: List[Dict], where: str) -> List[Dict]:
+    """
+    Topologically order actions by their "after" constraints, keeping file order otherwise.
+
+    This is the order the steps are submitted in, not a wait for acknowledgement.
+    """
+    for action in actions:
+        after = action.get('after', [])
+        if not isinstance(after, list) or not all(isinstance(name, str) for name in after):
+            raise ProtocolConfigError(f"{where}: action '{action['name']}': 'after' must be a list of action names")
+    names = [action['name'] for action in actions]
+    if len(set(names)) != len(names):
+        raise ProtocolConfigError(f"{where}: duplicate action names {names}")
+
+    remaining = list(actions)
+    ordered: List[Dict] = []
+    done = set()
+    while remaining:
+        for action in remaining:
+            after = action.get('after', [])
+            missing = [name for name in after if name not in names]
+            if missing:
+                raise ProtocolConfigError(f"{where}: action '{action['name']}' is after unknown {missing}")
+            if all(name in done for name in after):
+                ordered.append(action)
+                done.add(action['name'])
+                remaining.remove(action)
+                break
+        else:
+            raise ProtocolConfigError(f"{where}: circular 'after' constraints among "
+                                      f"{[a['name'] for a in remaining]}")
+    return ordered
+
+
+def _compile_plan(status: str, spec: Dict, devices: List[Dict], zone: str) -> ProtocolPlan:
+    where = f"protocol {status}"
+    actions = spec.get('actions', [])
+    if not isinstance(actions, list):
+        raise ProtocolConfigError(f"{where}: 'actions' must be a list")
+
+    for index, action in enumerate(actions):
+        if not isinstance(action, dict):
+            raise ProtocolConfigError(f"{where}: action {index} must be an object, got {action!r}")
+        action.setdefault('name', f"action_{index}")
+        if not isinstance(action['name'], str):
+            raise ProtocolConfigError(f"{where}: action {index}: 'name' must be a string")
+
+    steps: List[CommandStep] = []
+    for action in _order_actions(actions, where):
+        action_where = f"{where} action '{action['name']}'"
+        commands = action.get('commands')
+        if not isinstance(commands, list) or not commands:
+            raise ProtocolConfigError(f"{action_where}: 'commands' must be a non-empty list")
+        for command in commands:
+            if not isinstance(command, dict) or not command.get('code') or 'value' not in command:
+                raise ProtocolConfigError(f"{action_where}: invalid command {command}")
+
+        timeout = action.get('timeout_seconds')
+        if timeout is not None and (not isinstance(timeout, (int, float)) or timeout <= 0):
+            raise ProtocolConfigError(f"{action_where}: timeout_seconds must be positive")
+
+        priority = action.get('priority', STATUS_PRIORITIES[status])
+        if priority not in PRIORITY_RANKS:
+            raise ProtocolConfigError(f"{action_where}: priority must be one of {list(PRIORITY_RANKS)}")
+
+        targets = _select_devices(action.get('target', {}), devices, zone, action_where)
+        if not targets:
+            logger.warning(f"{action_where}: no devices match {action.get('target')} in zone {zone}")
+            continue
+
+        payload = {"commands": [{"code": c['code'], "value": c['value']} for c in commands]}
+        for device in targets:
+            name = action['name'] if len(targets) == 1 else f"{action['name']}:{device['id']}"
+            steps.append(CommandStep(
+                name=name,
+                device_id=device['id'],
+                payload=payload,
+                timeout_seconds=timeout,
+                description=action.get('description'),
+                priority=priority
+            ))
+
+    notify = spec.get('notify')
+    if notify is not None and (not isinstance(notify, dict) or not notify.get('message')):
+        raise ProtocolConfigError(f"{where}: 'notify' needs a message")
+    if notify is not None:
+        notify = {"message": notify['message'], "priority": notify.get('priority', 'medium')}
+
+    warning_action = spec.get('warning')
+    if warning_action not in WARNING_ACTIONS:
+        raise ProtocolConfigError(f"{where}: 'warning' must be one of {WARNING_ACTIONS}")
+
+    return ProtocolPlan(
+        status=status,
+        zone=zone,
+        steps=tuple(steps),
+        notify=notify,
+        broadcast_zone=spec.get('broadcast_zone'),
+        warning_action=warning_action
+    )
+
+
+def compile_protocols(definition: Dict, devices: List[Dict]) -> CompiledProtocols:
+    """
+    Compile a protocol definition against a device inventory.
+
+    Plans are compiled for every zone present in the inventory plus HOUSE,
+    so ``@alarm`` selectors are resolved at startup rather than per event.
+
+    Args:
+        definition: Protocol definition ({"protocols": {...}, "devices": [...]})
+        devices: Device inventory, each {"id": ..., "type": ..., "zone": ...};
+                 extra devices listed in the definition are appended
+
+    Returns:
+        CompiledProtocols: Prebuilt plans
+
+    Raises:
+        ProtocolConfigError: If the definition is invalid
+    """
+    protocols = definition.get('protocols')
+    if not isinstance(protocols, dict) or not protocols:
+        raise ProtocolConfigError("Protocol definition needs a non-empty 'protocols' mapping")
+
+    inventory = [dict(device) for device in devices if device.get('id')]
+    for device in definition.get('devices', []):
+        if not device.get('id'):
+            raise ProtocolConfigError(f"Device entry without id: {device}")
+        inventory.append(dict(device))
+
+    zones = {HOUSE_ZONE} | {device['zone'] for device in inventory if device.get('zone')}
+
+    plans: Dict[Tuple[str, str], ProtocolPlan] = {}
+    for status, spec in protocols.items():
+        if status not in KNOWN_STATUSES:
+            raise ProtocolConfigError(f"Unknown status '{status}' (expected one of {KNOWN_STATUSES})")
+        if not isinstance(spec, dict):
+            raise ProtocolConfigError(f"protocol {status}: definition must be an object")
+        for zone in sorted(zones):
+            # Deep-copy the spec per zone; compilation fills in defaults
+            plans[(status, zone)] = _compile_plan(status, json.loads(json.dumps(spec)), inventory, zone)
+
+    logger.info(f"Compiled {len(protocols)} protocols for {len(zones)} zones "
+                f"({len(inventory)} devices)")
+    return CompiledProtocols(plans)
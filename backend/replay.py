@@ -0,0 +1,530 @@
+"""
+Deterministic, accelerated replay of event streams through the real pipeline.
+
+The replay engine builds a complete agent (sites, analyzers, alarm state
+machines, protocols, debouncers, command dispatcher and pipeline stages)
+on a VirtualClock, with a recording transport in place of Tuya Cloud and a
+recording sink in place of the dashboards. Device messages go through the
+agent's own _on_tuya_message path; the pipeline stages and the command
+dispatcher run on the calling thread instead of their workers, and the
+clock jumps from one due time to the next (message, auto-clear tick every
+tick_seconds as in the main loop, coalescing deadline). An hour-long
+scenario runs in milliseconds and gives the same result on every run.
+
+Input is either a scripted scenario or the raw messages of an event
+journal (see event_journal). Scenario files hold one scenario or a list:
+
+    [
+      {"name": "break-in at night",
+       "start": "2024-01-01T23:00:00",
+       "events": [
+         {"at": 0, "type": "motion", "data": {"type": "motion", "code": "pir_state", "value": "pir"}},
+         {"at": 5, "type": "window", "data": {"type": "vibration", "code": "shock_state", "value": "vibration"}}
+       ],
+       "until": 600,
+       "expect": {"statuses": ["GREEN_SAFE", "RED_CRITICAL"], "final_state": "RED_CRITICAL"}}
+    ]
+
+An event names its device by ``device`` (ID) or by ``type`` (the first
+device of that type of ``home``, default the configured home); ``at`` is
+seconds after ``start``. ``expect`` is optional and makes the scenario a
+regression test: ``statuses`` (classifications in order), ``alarm_states``
+(status broadcasts in order), ``final_state`` (alarm state of the
+configured home, or {home: state}) and ``commands`` (number of device
+commands sent).
+
+Usage:
+    python replay.py scenarios.example.json
+    python replay.py --journal /var/lib/securex/journal --since 1000
+
+Exits with status 1 if a scenario does not meet its expectations.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ai_agent import AIAgent
+from clock import VirtualClock
+from event_history import KIND_CLASSIFICATION
+from event_journal import JournalReader
+
+logger = logging.getLogger(__name__)
+
+# Settings with side effects outside the replay are turned off
+REPLAY_OVERRIDES = {
+    'webhook_url': '',
+    'journal_dir': '',
+    'broadcast_workers': 0,
+    'config_watch_interval_seconds': 0
+}
+
+
+class ReplayConfig:
+    """
+    View of a loaded configuration with replay overrides applied.
+    """
+
+    def __init__(self, config, overrides: Optional[Dict] = None):
+        """
+        Initialize the view.
+
+        Args:
+            config: Loaded configuration
+            overrides: Lowercase setting name mapped to its replay value
+        """
+        self._config = config
+        self._overrides = dict(REPLAY_OVERRIDES if overrides is None else overrides)
+
+    def __getattr__(self, name: str):
+        if name in self._overrides:
+            return self._overrides[name]
+        return getattr(self._config, name)
+
+
+class ReplayTransport:
+    """
+    Stands in for TuyaConnectionManager: records commands instead of sending them.
+    """
+
+    def __init__(self, clock: VirtualClock):
+        """
+        Initialize the transport.
+
+        Args:
+            clock: Replay clock, used to time-stamp commands
+        """
+        self.clock = clock
+        self.device_states: Dict[str, List] = {}
+        self.subscribed_devices: List[str] = []
+        self.commands: List[Dict] = []
+
+    def send_command(self, device_id: str, commands: Dict, timeout: Optional[float] = None,
+                     should_abort=None) -> bool:
+        """Record a command (always succeeds)."""
+        self.commands.append({
+            'time': self.clock.now().isoformat(),
+            'device_id': device_id,
+            'commands': commands.get('commands', [])
+        })
+        return True
+
+    def poll_device_changes(self) -> None:
+        """Nothing to poll; messages are fed by the replay engine."""
+
+    def disconnect(self) -> None:
+        """Nothing to disconnect."""
+
+
+class ReplaySink:
+    """
+    Stands in for the WebSocket server: records status broadcasts.
+    """
+
+    def __init__(self, clock: VirtualClock):
+        """
+        Initialize the sink.
+
+        Args:
+            clock: Replay clock, used to time-stamp broadcasts
+        """
+        self.clock = clock
+        self.status_updates: List[Dict] = []
+        self.device_updates = 0
+
+    def emit(self, event: str, data: Dict) -> None:
+        if event == 'status_update':
+            self.status_updates.append({'time': self.clock.now().isoformat(),
+                                        'status': data.get('status'), 'zone': data.get('zone'),
+                                        'home': data.get('home')})
+
+    def emit_device_frame(self, updates: List[Dict]) -> None:
+        self.device_updates += len(updates)
+
+
+@dataclass(frozen=True)
+class ScriptedEvent:
+    """
+    One event of a scripted scenario.
+
+    Attributes:
+        at_seconds: Seconds after the scenario start
+        data: Device status payload
+        device_id: Device ID ('' = resolve from device_type)
+        device_type: Device type, resolved to the first such device of the home
+        home: Home of a device given by type ('' = the configured home)
+    """
+    at_seconds: float
+    data: Dict
+    device_id: str = ''
+    device_type: str = ''
+    home: str = ''
+
+
+@dataclass
+class Scenario:
+    """
+    A named scripted event stream, optionally with expected results.
+
+    Attributes:
+        name: Scenario name
+        events: Events, in any order (sorted by time when replayed)
+        start: Virtual start time (decides the time-of-day weighting)
+        until_seconds: Keep the clock running this long after the start
+                       (auto-clear), or stop after the last event if None
+        expect: Expected results (see check_expectations)
+    """
+    name: str
+    events: List[ScriptedEvent]
+    start: datetime = field(default_factory=lambda: datetime(2024, 1, 1))
+    until_seconds: Optional[float] = None
+    expect: Dict = field(default_factory=dict)
+
+
+@dataclass
+class ReplayResult:
+    """
+    Outcome of a replay.
+
+    Attributes:
+        classifications: Classification history records, in order
+        status_updates: Status broadcasts (alarm transitions), in order
+        commands: Device commands sent, in order
+        final_states: Alarm state per home at the end
+        events: Device messages replayed
+        virtual_seconds: Virtual time covered
+        wall_seconds: Real time the replay took (not part of the outcome)
+    """
+    classifications: List[Dict]
+    status_updates: List[Dict]
+    commands: List[Dict]
+    final_states: Dict[str, str]
+    events: int
+    virtual_seconds: float
+    wall_seconds: float
+
+    def outcome(self) -> Dict:
+        """Get everything but the wall time (identical for identical input)."""
+        return {
+            'classifications': self.classifications,
+            'status_updates': self.status_updates,
+            'commands': self.commands,
+            'final_states': self.final_states,
+            'events': self.events,
+            'virtual_seconds': self.virtual_seconds
+        }
+
+    def digest(self) -> str:
+        """Get a SHA-256 digest of the outcome, for comparing runs."""
+        canonical = json.dumps(self.outcome(), sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class ReplayEngine:
+    """
+    Runs event streams through a freshly built agent on virtual time.
+
+    One engine replays one stream (detection and alarm state carry over
+    between calls to ``run``); build a new engine for an independent run.
+    """
+
+    def __init__(self, config, start: Optional[datetime] = None, tick_seconds: float = 2.0):
+        """
+        Build the agent.
+
+        Args:
+            config: Loaded configuration (devices, sites, protocols, thresholds)
+            start: Virtual start time (default 2024-01-01 00:00)
+            tick_seconds: Auto-clear tick interval (the agent's poll interval)
+
+        Raises:
+            ValueError: If the device or sites configuration is invalid
+        """
+        self.clock = VirtualClock(start)
+        self.tick_seconds = tick_seconds
+        self.transport = ReplayTransport(self.clock)
+        self.sink = ReplaySink(self.clock)
+        self.agent = AIAgent(
+            config=ReplayConfig(config),
+            clock=self.clock,
+            tuya_manager=self.transport,
+            broadcast_sink=self.sink
+        )
+        self.agent.initialize_components()
+        self.classifications: List[Dict] = []
+        self.agent.event_history.add_listener(self._on_history_record)
+        self.events = 0
+        self._next_tick = tick_seconds
+
+    def _on_history_record(self, record: Dict) -> None:
+        if record['kind'] == KIND_CLASSIFICATION:
+            self.classifications.append(record)
+
+    def resolve_device(self, event: ScriptedEvent) -> str:
+        """
+        Get the device ID of a scripted event.
+
+        Raises:
+            ValueError: If the device or home is unknown
+        """
+        if event.device_id:
+            if event.device_id not in self.agent.device_sites:
+                raise ValueError(f"Unknown device ID '{event.device_id}'")
+            return event.device_id
+        site = self.agent.sites.get(event.home) if event.home else self.agent.default_site
+        if site is None:
+            raise ValueError(f"Unknown home '{event.home}'")
+        device_id = site.registry.first(event.device_type)
+        if device_id is None:
+            raise ValueError(f"Home '{site.home_id}' has no device of type '{event.device_type}'")
+        return device_id
+
+    def run_script(self, events: Iterable[ScriptedEvent],
+                   until_seconds: Optional[float] = None) -> ReplayResult:
+        """
+        Replay scripted events, relative to the clock's start.
+
+        Args:
+            events: Events to replay (sorted by time; ties keep their order)
+            until_seconds: Run the clock until this many seconds after the start
+
+        Returns:
+            ReplayResult: The outcome so far
+        """
+        start = self.clock.start
+        messages = [
+            (start + timedelta(seconds=event.at_seconds),
+             {'devId': self.resolve_device(event), 'status': event.data})
+            for event in sorted(events, key=lambda e: e.at_seconds)
+        ]
+        until = start + timedelta(seconds=until_seconds) if until_seconds is not None else None
+        return self.run(messages, until=until)
+
+    def run(self, messages: Iterable[Tuple[datetime, Dict]], until: Optional[datetime] = None) -> ReplayResult:
+        """
+        Replay device messages at their times.
+
+        Messages without their own ``timestamp`` get the virtual time as
+        event time. A message dated before the clock is processed at the
+        current virtual time (the clock never moves back).
+
+        Args:
+            messages: (receive time, Tuya message) in receive order
+            until: Run the clock until this time after the last message
+
+        Returns:
+            ReplayResult: The outcome so far
+        """
+        started = time.perf_counter()
+        for when, msg in messages:
+            self._advance_to(when)
+            self.agent._on_tuya_message(msg)
+            self.events += 1
+            self._settle()
+        if until is not None:
+            self._advance_to(until)
+        else:
+            # Let the last commands' coalescing windows elapse
+            dispatcher = self.agent.command_dispatcher
+            flush_at = dispatcher.next_flush_at()
+            while flush_at is not None and flush_at > self.clock.elapsed:
+                self._advance_to(self.clock.start + timedelta(seconds=flush_at))
+                flush_at = dispatcher.next_flush_at()
+        return self.result(time.perf_counter() - started)
+
+    def _advance_to(self, when: datetime) -> None:
+        """Move the clock to a time, running the ticks and command deadlines on the way."""
+        clock = self.clock
+        target = (when - clock.start).total_seconds()
+        dispatcher = self.agent.command_dispatcher
+        while True:
+            due = self._next_tick
+            flush_at = dispatcher.next_flush_at()
+            # Batches due but not sent (rate limit) are retried at the next tick
+            if flush_at is not None and clock.elapsed < flush_at < due:
+                due = flush_at
+            if due > target:
+                break
+            clock.advance(due - clock.elapsed)
+            if due == self._next_tick:
+                self.agent.response_stage.put({'kind': 'tick', 'now': clock.now()})
+                self._next_tick += self.tick_seconds
+            self._settle()
+        clock.advance(target - clock.elapsed)
+
+    def _settle(self) -> None:
+        """Run the pipeline and command dispatch until nothing is left at the current time."""
+        agent = self.agent
+        agent.ingest_stage.drain()
+        agent.response_stage.drain()
+        agent.command_dispatcher.dispatch_due()
+        agent.broadcast_aggregator.flush()
+
+    def result(self, wall_seconds: float = 0.0) -> ReplayResult:
+        """
+        Get the outcome so far.
+
+        Args:
+            wall_seconds: Real time spent, reported as is
+
+        Returns:
+            ReplayResult: The outcome
+        """
+        return ReplayResult(
+            classifications=list(self.classifications),
+            status_updates=list(self.sink.status_updates),
+            commands=list(self.transport.commands),
+            final_states={home: site.response_orchestrator.alarm_state.state
+                          for home, site in self.agent.sites.items()},
+            events=self.events,
+            virtual_seconds=self.clock.elapsed,
+            wall_seconds=wall_seconds
+        )
+
+
+def check_expectations(result: ReplayResult, expect: Dict, default_home: str) -> List[str]:
+    """
+    Compare a replay outcome with a scenario's expectations.
+
+    Args:
+        result: Replay outcome
+        expect: {'statuses', 'alarm_states', 'final_state', 'commands'}, all optional
+        default_home: Home a plain ``final_state`` refers to
+
+    Returns:
+        List[str]: Mismatches (empty if the scenario passed)
+    """
+    failures = []
+    if 'statuses' in expect:
+        statuses = [record['status'] for record in result.classifications]
+        if statuses != expect['statuses']:
+            failures.append(f"statuses {statuses} != expected {expect['statuses']}")
+    if 'alarm_states' in expect:
+        states = [update['status'] for update in result.status_updates]
+        if states != expect['alarm_states']:
+            failures.append(f"alarm states {states} != expected {expect['alarm_states']}")
+    if 'final_state' in expect:
+        wanted = expect['final_state']
+        if not isinstance(wanted, dict):
+            wanted = {default_home: wanted}
+        for home, state in wanted.items():
+            if result.final_states.get(home) != state:
+                failures.append(f"final state of '{home}' {result.final_states.get(home)} != expected {state}")
+    if 'commands' in expect and len(result.commands) != expect['commands']:
+        failures.append(f"{len(result.commands)} commands != expected {expect['commands']}")
+    return failures
+
+
+def parse_scenario(entry: Dict, index: int = 0) -> Scenario:
+    """
+    Build a scenario from its JSON form.
+
+    Raises:
+        ValueError: If the entry is malformed
+    """
+    if not isinstance(entry, dict) or not isinstance(entry.get('events'), list):
+        raise ValueError(f"Scenario {index} needs an 'events' list")
+    events = []
+    for number, event in enumerate(entry['events']):
+        if not isinstance(event, dict) or 'at' not in event or not (event.get('device') or event.get('type')):
+            raise ValueError(f"Scenario {index}: event {number} needs 'at' and 'device' or 'type'")
+        events.append(ScriptedEvent(
+            at_seconds=float(event['at']),
+            data=event.get('data', {}),
+            device_id=event.get('device', ''),
+            device_type=event.get('type', ''),
+            home=event.get('home', '')
+        ))
+    return Scenario(
+        name=entry.get('name') or f"scenario {index}",
+        events=events,
+        start=datetime.fromisoformat(entry['start']) if entry.get('start') else datetime(2024, 1, 1),
+        until_seconds=entry.get('until'),
+        expect=entry.get('expect', {})
+    )
+
+
+def load_scenarios(path: str) -> List[Scenario]:
+    """
+    Load scenarios from a JSON scenario file (one scenario or a list).
+
+    Raises:
+        ValueError: If a scenario is malformed
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    if isinstance(entries, dict):
+        entries = [entries]
+    return [parse_scenario(entry, index) for index, entry in enumerate(entries)]
+
+
+def journal_messages(directory: str, since_seq: int = 0) -> Iterator[Tuple[datetime, Dict]]:
+    """
+    Read the raw device messages of an event journal.
+
+    Args:
+        directory: Journal directory
+        since_seq: Only records after this sequence number
+
+    Yields:
+        Tuple[datetime, Dict]: (receive time, Tuya message) in journal order
+    """
+    for record in JournalReader(directory).records(since_seq=since_seq, types=['raw']):
+        yield datetime.fromtimestamp(record.timestamp), record.payload
+
+
+def _summary(name: str, result: ReplayResult) -> str:
+    return (f"{name}: {result.events} events, {len(result.classifications)} classifications, "
+            f"{len(result.status_updates)} alarm changes, {len(result.commands)} commands, "
+            f"final {result.final_states}; {result.virtual_seconds:.0f}s virtual in "
+            f"{result.wall_seconds * 1000:.1f}ms, digest {result.digest()[:16]}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Replay SecureX event streams on virtual time")
+    parser.add_argument('scenarios', nargs='?', help="Scenario file (JSON)")
+    parser.add_argument('--journal', help="Replay the raw messages of this journal directory instead")
+    parser.add_argument('--since', type=int, default=0, help="Journal sequence number to start after")
+    parser.add_argument('--tick', type=float, default=2.0, help="Auto-clear tick interval in seconds")
+    parser.add_argument('--verbose', action='store_true', help="Log the pipeline (INFO)")
+    args = parser.parse_args(argv)
+    if not args.scenarios and not args.journal:
+        parser.error("give a scenario file or --journal")
+
+    from config import load_config
+    from structured_logging import configure_logging, shutdown_logging
+
+    configure_logging(level='INFO' if args.verbose else 'WARNING')
+    try:
+        config = load_config()
+        if args.journal:
+            messages = list(journal_messages(args.journal, args.since))
+            if not messages:
+                print("No raw messages in the journal")
+                return 0
+            engine = ReplayEngine(config, start=messages[0][0], tick_seconds=args.tick)
+            print(_summary(args.journal, engine.run(messages)))
+            return 0
+
+        failed = 0
+        for scenario in load_scenarios(args.scenarios):
+            engine = ReplayEngine(config, start=scenario.start, tick_seconds=args.tick)
+            result = engine.run_script(scenario.events, until_seconds=scenario.until_seconds)
+            failures = check_expectations(result, scenario.expect, engine.agent.default_site.home_id)
+            print(("FAIL " if failures else "ok   ") + _summary(scenario.name, result))
+            for failure in failures:
+                print(f"     {failure}")
+            failed += bool(failures)
+        return 1 if failed else 0
+    finally:
+        shutdown_logging()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
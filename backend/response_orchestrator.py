@@ -7,14 +7,22 @@ status updates to connected clients.
 """
 
 import logging
+import time
+from datetime import datetime
 from typing import Optional
+from clock import SYSTEM_CLOCK, Clock
 from tuya_connection_manager import TuyaConnectionManager
+from structured_logging import log_event
+from alarm_state_machine import AlarmStateMachine, Transition
+from broadcast_aggregator import BroadcastAggregator
+from notification_outbox import NotificationOutbox, build_notification
+from protocol_plans import DEFAULT_PROTOCOLS, CommandStep, CompiledProtocols, compile_protocols
+from command_dispatcher import CommandDispatcher, command_latency_seconds
+from latency_tracing import get_tracer
+from dashboard_state import DashboardState
+from event_history import KIND_PROTOCOL, EventHistory
+from event_journal import RECORD_COMMAND, EventJournal
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
 
@@ -25,19 +33,51 @@ class ResponseOrchestrator:
     Executes multi-step protocols for RED_CRITICAL, YELLOW_WARNING, and
     GREEN_SAFE statuses, including device control, notifications, and
     WebSocket broadcasts.
+    
+    Classifications are routed through an AlarmStateMachine by
+    ``handle_classification`` so protocols only run on real state
+    transitions; the ``execute_*_protocol`` methods run a protocol
+    unconditionally. Protocols are compiled command plans (see
+    protocol_plans) rather than hand-built command dicts.
     """
     
     def __init__(self, tuya_manager: TuyaConnectionManager, socketio, 
-                 smart_bulb_id: str, siren_id: str, front_door_lock_id: str):
+                 smart_bulb_id: str, siren_id: str, front_door_lock_id: str,
+                 alarm_state: Optional[AlarmStateMachine] = None,
+                 notification_outbox: Optional[NotificationOutbox] = None,
+                 protocol_plans: Optional[CompiledProtocols] = None,
+                 command_dispatcher: Optional[CommandDispatcher] = None,
+                 dashboard_state: Optional[DashboardState] = None,
+                 event_history: Optional[EventHistory] = None,
+                 home_id: Optional[str] = None,
+                 event_journal: Optional[EventJournal] = None,
+                 clock: Optional[Clock] = None):
         """
         Initialize Response Orchestrator.
         
         Args:
             tuya_manager: TuyaConnectionManager instance for device control
-            socketio: Flask-SocketIO instance for WebSocket broadcasts
+            socketio: Flask-SocketIO instance (or BroadcastAggregator) for
+                      WebSocket broadcasts
             smart_bulb_id: Device ID for smart bulb
             siren_id: Device ID for siren
             front_door_lock_id: Device ID for front door lock
+            alarm_state: Alarm state machine (default thresholds if omitted)
+            notification_outbox: Webhook outbox for push notifications
+                                 (console logging only if omitted)
+            protocol_plans: Compiled protocol plans (built-in protocols
+                            compiled for the given devices if omitted)
+            command_dispatcher: Coalescing command path; commands are sent
+                                synchronously through tuya_manager if omitted
+            dashboard_state: Versioned dashboard model; status broadcasts
+                             carry its version if provided
+            event_history: Recent event history; protocol executions are
+                           recorded in it if provided
+            home_id: Home (site) this orchestrator responds for; added to
+                     history records and log events in multi-site mode
+            event_journal: Append-only journal; every command sent is
+                           journaled if provided
+            clock: Time source for history records (the system clock if omitted)
         """
         self.tuya_manager = tuya_manager
         self.socketio = socketio
@@ -45,171 +85,229 @@ class ResponseOrchestrator:
         self.siren_id = siren_id
         self.front_door_lock_id = front_door_lock_id
         self.warning_states = set()
+        self.alarm_state = alarm_state or AlarmStateMachine()
+        self.notification_outbox = notification_outbox
+        
+        if protocol_plans is None:
+            protocol_plans = compile_protocols(DEFAULT_PROTOCOLS, [
+                {'id': smart_bulb_id, 'type': 'bulb', 'zone': 'MasterBedroom'},
+                {'id': siren_id, 'type': 'siren', 'zone': 'Foyer'},
+                {'id': front_door_lock_id, 'type': 'door-lock', 'zone': 'Foyer'}
+            ])
+        self.protocol_plans = protocol_plans
+        self.command_dispatcher = command_dispatcher
+        self.dashboard_state = dashboard_state
+        self.event_history = event_history
+        self.home_id = home_id
+        self.event_journal = event_journal
+        self.clock = clock or SYSTEM_CLOCK
+        # Extra fields identifying the site in history records and log events
+        self._site_fields = {'home': home_id} if home_id is not None else {}
         
         logger.info("ResponseOrchestrator initialized")
     
+    def handle_classification(self, status: str, zone: str, score: float,
+                              now: datetime, disarm: bool = False,
+                              trace_id: Optional[str] = None,
+                              pattern: Optional[str] = None) -> Optional[Transition]:
+        """
+        Feed a threat classification into the alarm state machine.
+        
+        Runs the protocol for the new state only if the classification
+        causes a transition; repeated classifications during an ongoing
+        incident produce no commands, notifications or broadcasts.
+        
+        Args:
+            status: Classified status (used for logging; the state machine
+                    applies its own hysteresis to ``score``)
+            zone: Zone of the classification
+            score: Final weighted threat score
+            now: Time of the classification
+            disarm: True for a safe-arrival pattern (door unlock)
+            trace_id: Latency trace of the triggering event, if traced
+            pattern: Analyzer pattern of the classification; 'none' never
+                     de-escalates an alarm
+            
+        Returns:
+            Optional[Transition]: The transition that was acted on, or None
+        """
+        transition = self.alarm_state.evaluate(score, zone, now, disarm=disarm, pattern=pattern)
+        if transition is None:
+            log_event(logger, logging.DEBUG, 'classification_no_transition',
+                      status=status, state=self.alarm_state.state, score=score)
+            return None
+        
+        self._execute_transition(transition, trace_id)
+        return transition
+    
+    def check_auto_clear(self, now: datetime) -> Optional[Transition]:
+        """
+        Clear the alarm if it has timed out without supporting events.
+        
+        Args:
+            now: Current time
+            
+        Returns:
+            Optional[Transition]: The auto-clear transition, or None
+        """
+        transition = self.alarm_state.tick(now)
+        if transition is not None:
+            self._execute_transition(transition)
+        return transition
+    
+    def _execute_transition(self, transition: Transition, trace_id: Optional[str] = None) -> None:
+        """
+        Run the protocol for the state a transition entered.
+        
+        Args:
+            transition: Alarm state transition
+            trace_id: Latency trace of the triggering event, if traced
+        """
+        self.execute_protocol(transition.to_state, transition.zone, trace_id=trace_id)
+    
+    def execute_protocol(self, status: str, zone: str, trace_id: Optional[str] = None) -> None:
+        """
+        Execute the compiled protocol plan for a status.
+        
+        Dispatches the plan's prebuilt commands in order, then applies its
+        warning-state action, notification and WebSocket broadcast.
+        
+        Args:
+            status: Status code (RED_CRITICAL, YELLOW_WARNING, GREEN_SAFE)
+            zone: The zone where the classification was made
+            trace_id: Latency trace of the triggering event, if traced
+        """
+        plan = self.protocol_plans.get(status, zone)
+        if plan is None:
+            logger.warning(f"No protocol defined for status: {status}")
+            return
+        
+        level = logging.WARNING if status == "RED_CRITICAL" else logging.INFO
+        log_event(logger, level, 'protocol_execute', status=status, zone=zone, steps=len(plan.steps),
+                  **self._site_fields)
+        
+        # The trace ends when the last of the plan's commands is acknowledged
+        get_tracer().expect_ends(trace_id, len(plan.steps))
+        for step in plan.steps:
+            self._dispatch(step, trace_id)
+            if step.description:
+                logger.info(step.description)
+        
+        if plan.warning_action == 'track':
+            self.warning_states.add(zone)
+        elif plan.warning_action == 'clear':
+            self.clear_warnings()
+        
+        if plan.notify:
+            self.send_push_notification(plan.notify['message'], plan.notify['priority'], zone=zone)
+        
+        if self.event_history:
+            self.event_history.record(
+                KIND_PROTOCOL,
+                timestamp=self.clock.now().strftime('%Y-%m-%dT%H:%M:%S'),
+                status=status,
+                zone=zone,
+                commands=[{'device_id': step.device_id, 'payload': step.payload} for step in plan.steps],
+                notified=bool(plan.notify),
+                **self._site_fields
+            )
+        
+        self.broadcast_status(status, plan.broadcast_zone or zone, trace_id=trace_id)
+    
+    def _dispatch(self, step: CommandStep, trace_id: Optional[str] = None) -> None:
+        """
+        Send a plan step's command, through the dispatcher if configured.
+        
+        Args:
+            step: Compiled command step
+            trace_id: Latency trace of the triggering event, if traced
+        """
+        if self.event_journal:
+            self.event_journal.append(RECORD_COMMAND, {
+                'device_id': step.device_id,
+                'payload': step.payload,
+                'priority': step.priority,
+                'trace_id': trace_id,
+                **self._site_fields
+            })
+        
+        if self.command_dispatcher:
+            self.command_dispatcher.submit(step.device_id, step.payload,
+                                           timeout=step.timeout_seconds, trace_id=trace_id,
+                                           priority=step.priority)
+            return
+        
+        tracer = get_tracer()
+        started = time.monotonic()
+        ok = self.tuya_manager.send_command(step.device_id, step.payload, timeout=step.timeout_seconds)
+        elapsed = time.monotonic() - started
+        tracer.record(trace_id, 'command_api', elapsed, device_id=step.device_id, ok=ok)
+        command_latency_seconds.labels(step.priority).observe(elapsed)
+        if ok:
+            tracer.end_trace(trace_id, device_id=step.device_id)
+    
     def execute_red_protocol(self, zone: str) -> None:
         """
         Execute RED_CRITICAL response protocol.
         
-        Performs all 5 required actions:
-        1. Send command to smart bulb for red strobe mode
-        2. Send command to siren to activate
-        3. Send command to front door lock to lock (via remote unlock request)
-        4. Send critical push notification
-        5. Broadcast WebSocket message with status RED_CRITICAL and zone HOUSE
+        With the default protocols: smart bulb to alert scene, siren on,
+        critical push notification, and broadcast of RED_CRITICAL in HOUSE.
+        The front door lock is read-only and is not commanded.
         
         Args:
             zone: The zone where threat was detected (typically HOUSE)
         """
-        logger.warning(f"Executing RED_CRITICAL protocol for zone: {zone}")
-        
-        # Action 1: Smart bulb - turn on and set to scene mode (red alert)
-        bulb_commands = {
-            "commands": [
-                {
-                    "code": "switch_led",
-                    "value": True
-                },
-                {
-                    "code": "work_mode",
-                    "value": "scene"  # Scene mode for alert
-                }
-            ]
-        }
-        self.tuya_manager.send_command(self.smart_bulb_id, bulb_commands)
-        logger.info("RED_CRITICAL: Smart bulb set to red")
-        
-        # Action 2: Activate siren
-        siren_commands = {
-            "commands": [
-                {
-                    "code": "alarm_switch",
-                    "value": True
-                },
-                {
-                    "code": "alarm_volume",
-                    "value": "high"
-                }
-            ]
-        }
-        self.tuya_manager.send_command(self.siren_id, siren_commands)
-        logger.info("RED_CRITICAL: Siren activated")
-        
-        # Action 3: Door lock - Note: This lock only supports remote unlock requests
-        # We can't directly lock it via API, only respond to unlock requests
-        logger.info("RED_CRITICAL: Door lock (read-only device, cannot control remotely)")
-        
-        # Action 4: Send push notification
-        self.send_push_notification(
-            "CRITICAL: Break-in attempt detected!",
-            "high"
-        )
-        
-        # Action 5: Broadcast status to WebSocket clients
-        self.broadcast_status("RED_CRITICAL", "HOUSE")
+        self.execute_protocol("RED_CRITICAL", zone)
     
     def execute_yellow_protocol(self, zone: str) -> None:
         """
         Execute YELLOW_WARNING response protocol.
         
-        Performs graduated response actions:
-        1. Send command to smart bulb for soft yellow at low brightness
-        2. Broadcast WebSocket message with status YELLOW_WARNING and specific zone
-        
-        Does NOT activate siren or lock door.
+        With the default protocols: smart bulb to soft warning light, zone
+        tracked as a warning state, and broadcast of YELLOW_WARNING in the
+        specific zone. Does NOT activate siren or lock door.
         
         Args:
             zone: The specific zone where potential concern was detected
         """
-        logger.info(f"Executing YELLOW_WARNING protocol for zone: {zone}")
-        
-        # Action 1: Smart bulb - turn on in white mode (warning)
-        bulb_commands = {
-            "commands": [
-                {
-                    "code": "switch_led",
-                    "value": True
-                },
-                {
-                    "code": "work_mode",
-                    "value": "white"  # White mode for warning
-                }
-            ]
-        }
-        self.tuya_manager.send_command(self.smart_bulb_id, bulb_commands)
-        logger.info("YELLOW_WARNING: Smart bulb set to soft yellow")
-        
-        # Track warning state
-        self.warning_states.add(zone)
-        
-        # Action 2: Broadcast status to WebSocket clients
-        self.broadcast_status("YELLOW_WARNING", zone)
+        self.execute_protocol("YELLOW_WARNING", zone)
     
     def execute_green_protocol(self, zone: str) -> None:
         """
         Execute GREEN_SAFE response protocol.
         
-        Performs welcoming actions:
-        1. Send command to smart bulb for warm white at 20% brightness
-        2. Clear all active warning states
-        3. Broadcast WebSocket message with status GREEN_SAFE and zone HOUSE
+        With the default protocols: smart bulb to warm white, all warning
+        states cleared, and broadcast of GREEN_SAFE in HOUSE.
         
         Args:
             zone: The zone (typically HOUSE for safe arrival)
         """
-        logger.info(f"Executing GREEN_SAFE protocol for zone: {zone}")
-        
-        # Action 1: Smart bulb - turn on in white mode (safe/welcoming)
-        bulb_commands = {
-            "commands": [
-                {
-                    "code": "switch_led",
-                    "value": True
-                },
-                {
-                    "code": "work_mode",
-                    "value": "white"  # White mode for safe status
-                }
-            ]
-        }
-        self.tuya_manager.send_command(self.smart_bulb_id, bulb_commands)
-        logger.info("GREEN_SAFE: Smart bulb set to warm white at 20%")
-        
-        # Action 2: Clear all warning states
-        self.clear_warnings()
-        
-        # Action 3: Broadcast status to WebSocket clients
-        self.broadcast_status("GREEN_SAFE", "HOUSE")
+        self.execute_protocol("GREEN_SAFE", zone)
     
-    def send_push_notification(self, message: str, priority: str) -> None:
+    def send_push_notification(self, message: str, priority: str,
+                               zone: Optional[str] = None) -> None:
         """
         Send push notification to user.
         
-        For hackathon/development purposes, this is implemented as console
-        logging with timestamp. In production, this would integrate with
-        a webhook service (Discord, Slack) or push notification service.
+        The notification is always logged. If a notification outbox is
+        configured it is also enqueued for asynchronous webhook delivery
+        (Discord, Slack or custom endpoint); this never blocks on the network.
         
         Args:
             message: Notification message text
             priority: Priority level (high, medium, low)
+            zone: Optional zone the notification refers to
         """
-        from datetime import datetime
-        
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        notification = {
-            "timestamp": timestamp,
-            "message": message,
-            "priority": priority
-        }
-        
-        # Console mock for development
         logger.critical(f"PUSH NOTIFICATION [{priority.upper()}]: {message}")
         
-        # In production, would send to webhook:
-        # requests.post(webhook_url, json=notification)
+        if self.notification_outbox:
+            self.notification_outbox.enqueue(
+                'default',
+                build_notification(message, priority, zone),
+                dedupe_key=f"{priority}:{message}:{zone}"
+            )
     
-    def broadcast_status(self, status: str, zone: str) -> None:
+    def broadcast_status(self, status: str, zone: str, trace_id: Optional[str] = None) -> None:
         """
         Broadcast security status update to all connected WebSocket clients.
         
@@ -219,17 +317,37 @@ class ResponseOrchestrator:
         Args:
             status: Status code (RED_CRITICAL, YELLOW_WARNING, GREEN_SAFE)
             zone: Zone identifier (HOUSE, LivingRoom, Foyer, MasterBedroom)
+            trace_id: Latency trace of the triggering event, if traced
         """
-        message = {
-            "status": status,
-            "zone": zone
-        }
-        
-        if self.socketio:
-            self.socketio.emit('status_update', message)
-            logger.info(f"Broadcast status update: {status} in {zone}")
+        if self.dashboard_state:
+            message = self.dashboard_state.apply_status(status, zone)
         else:
+            message = {
+                "status": status,
+                "zone": zone
+            }
+        
+        if not self.socketio:
             logger.warning("SocketIO not available, cannot broadcast status")
+            return
+        
+        if isinstance(self.socketio, BroadcastAggregator):
+            # The aggregator records the broadcast span once the update is sent
+            self.socketio.emit('status_update', message, trace_id=trace_id)
+        else:
+            with get_tracer().span(trace_id, 'broadcast', event='status_update'):
+                self.socketio.emit('status_update', message)
+        log_event(logger, logging.INFO, 'status_broadcast', status=status, zone=zone, **self._site_fields)
+    
+    def restore_warning_states(self, zones) -> None:
+        """
+        Restore active warning zones from a state snapshot.
+        
+        Args:
+            zones: Iterable of zone identifiers that were in warning state
+        """
+        self.warning_states.update(zones)
+        logger.info(f"Restored {len(self.warning_states)} warning states from snapshot")
     
     def clear_warnings(self) -> None:
         """Clear all active warning states."""
@@ -1,45 +1,75 @@
 """
 Simulate device events for testing the AI Agent.
 
-Since virtual sensors are read-only, this script manually triggers
-the AI agent's event processing logic with simulated events.
+Since virtual sensors are read-only, this script feeds scripted events
+through the AI agent's real processing pipeline with the replay engine
+(see replay). The scenarios run on virtual time at night, so time windows
+are exercised without waiting and the results do not depend on when the
+script is run.
 """
 
 from datetime import datetime
-from threat_analyzer import ThreatAnalyzer
 from response_orchestrator import ResponseOrchestrator
 from tuya_connection_manager import TuyaConnectionManager
-from websocket_server import WebSocketServer
+from replay import ReplayEngine, ScriptedEvent
 from config import load_config
+from structured_logging import configure_logging, shutdown_logging
 import time
 
+# Virtual start time of every scenario (nighttime weighting)
+SIMULATION_START = datetime(2024, 1, 1, 23, 0)
+
+MOTION_EVENT = {
+    'type': 'motion',
+    'code': 'pir_state',
+    'value': 'pir'
+}
+VIBRATION_EVENT = {
+    'type': 'vibration',
+    'code': 'shock_state',
+    'value': 'vibration'
+}
+LOCKED_EVENT = {
+    'type': 'lock',
+    'code': 'lock_motor_state',
+    'value': True
+}
+UNLOCK_EVENT = {
+    'type': 'lock',
+    'code': 'unlock_app',
+    'status': 'unlocked',
+    'value': 1
+}
+
+
+def _replay(events):
+    """
+    Replay scripted events and return the last classification.
+    
+    Args:
+        events: ScriptedEvent list
+        
+    Returns:
+        tuple: (status, zone) of the last classification
+    """
+    engine = ReplayEngine(load_config(), start=SIMULATION_START)
+    result = engine.run_script(events)
+    last = result.classifications[-1]
+    print(f"  ({result.virtual_seconds:.0f}s of virtual time in {result.wall_seconds * 1000:.1f}ms)")
+    return last['status'], last['zone']
+
+
 def simulate_motion_detection():
     """Simulate motion sensor detection."""
     print("\n🚶 Simulating MOTION DETECTION...")
     
-    config = load_config()
-    analyzer = ThreatAnalyzer()
-    
-    # Simulate motion event
-    motion_event = {
-        'type': 'motion',
-        'code': 'pir_state',
-        'value': 'pir',
-        'timestamp': datetime.now().isoformat()
-    }
-    
-    analyzer.add_event(config.living_room_motion_id, motion_event, datetime.now())
-    
-    # Wait 11 seconds (past the 10-second window for motion+vibration)
-    print("Waiting 11 seconds to analyze...")
-    time.sleep(11)
-    
-    # Analyze
-    status, zone = analyzer.analyze_sequence(
-        config.living_room_motion_id,
-        config.window_vibration_id,
-        config.front_door_lock_id
-    )
+    # Motion, then the door lock reports 11 seconds later (past the
+    # 10-second window for motion+vibration, with no vibration)
+    print("Motion, then no vibration for 11 seconds...")
+    status, zone = _replay([
+        ScriptedEvent(0, MOTION_EVENT, device_type='motion'),
+        ScriptedEvent(11, LOCKED_EVENT, device_type='door-lock')
+    ])
     
     print(f"✓ Analysis Result: {status} in {zone}")
     return status, zone
@@ -49,39 +79,13 @@ def simulate_motion_plus_vibration():
     """Simulate motion + vibration (break-in attempt)."""
     print("\n🚨 Simulating BREAK-IN ATTEMPT (Motion + Vibration)...")
     
-    config = load_config()
-    analyzer = ThreatAnalyzer()
-    
-    # Simulate motion event
+    # Window vibration 5 seconds after motion (within the 10-second window)
     print("1. Motion detected...")
-    motion_event = {
-        'type': 'motion',
-        'code': 'pir_state',
-        'value': 'pir',
-        'timestamp': datetime.now().isoformat()
-    }
-    analyzer.add_event(config.living_room_motion_id, motion_event, datetime.now())
-    
-    # Wait 5 seconds (within the 10-second window)
-    print("2. Waiting 5 seconds...")
-    time.sleep(5)
-    
-    # Simulate vibration event
-    print("3. Window vibration detected...")
-    vibration_event = {
-        'type': 'vibration',
-        'code': 'shock_state',
-        'value': 'vibration',
-        'timestamp': datetime.now().isoformat()
-    }
-    analyzer.add_event(config.window_vibration_id, vibration_event, datetime.now())
-    
-    # Analyze
-    status, zone = analyzer.analyze_sequence(
-        config.living_room_motion_id,
-        config.window_vibration_id,
-        config.front_door_lock_id
-    )
+    print("2. Window vibration detected 5 seconds later...")
+    status, zone = _replay([
+        ScriptedEvent(0, MOTION_EVENT, device_type='motion'),
+        ScriptedEvent(5, VIBRATION_EVENT, device_type='window')
+    ])
     
     print(f"✓ Analysis Result: {status} in {zone}")
     return status, zone
@@ -91,26 +95,9 @@ def simulate_door_unlock():
     """Simulate door unlock (safe arrival)."""
     print("\n🚪 Simulating DOOR UNLOCK (Safe Arrival)...")
     
-    config = load_config()
-    analyzer = ThreatAnalyzer()
-    
-    # Simulate door unlock event
-    unlock_event = {
-        'type': 'lock',
-        'code': 'unlock_app',
-        'status': 'unlocked',
-        'value': 1,
-        'timestamp': datetime.now().isoformat()
-    }
-    
-    analyzer.add_event(config.front_door_lock_id, unlock_event, datetime.now())
-    
-    # Analyze
-    status, zone = analyzer.analyze_sequence(
-        config.living_room_motion_id,
-        config.window_vibration_id,
-        config.front_door_lock_id
-    )
+    status, zone = _replay([
+        ScriptedEvent(0, UNLOCK_EVENT, device_type='door-lock')
+    ])
     
     print(f"✓ Analysis Result: {status} in {zone}")
     return status, zone
@@ -195,6 +182,8 @@ def simulate_with_response():
 
 
 def main():
+    configure_logging()
+    
     print("\n" + "="*60)
     print("EVENT SIMULATION FOR AI AGENT TESTING")
     print("="*60)
@@ -224,6 +213,8 @@ def main():
         print(f"\n✗ ERROR: {e}")
         import traceback
         traceback.print_exc()
+    finally:
+        shutdown_logging()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,336 @@
+"""
+Multi-site mode: many homes (sites) served by one agent process.
+
+Each site has its own device registry, threat analyzer, alarm state and
+response protocols, debouncer, dashboard model (and so its own WebSocket
+rooms and snapshot) and state snapshot file. The Tuya transport, command
+dispatcher, processing stages, broadcast layer and event history are
+shared: one poller reads every site's devices, and the pipeline routes
+each event to the site owning the device.
+
+The home configured in config.py (HOME_ID with the five configured
+devices and DEVICES_FILE) is always the default site. Further sites are
+listed in a sites file (SITES_FILE), a JSON list:
+
+    [
+      {"home": "cabin",
+       "devices": [
+         {"id": "bf...", "type": "motion", "name": "Cabin Motion", "zone": "LivingRoom"},
+         ...
+       ],
+       "protocols_file": "cabin_protocols.json"},
+      {"home": "office", "devices_file": "office_devices.json"}
+    ]
+
+Devices are given inline (``devices``) or in a device file
+(``devices_file``, see device_registry); ``protocols_file`` is optional
+(built-in protocols if omitted). A site's analyzer watches the first motion,
+window and door-lock device of its registry.
+
+A site's configuration is compiled into a SiteConfig (registry, protocol
+plans, debounce rules, analyzer and alarm parameters) before it is used.
+On a configuration reload (see config_reload) the new SiteConfig is
+swapped into the running site, keeping its analyzer buffer, debounce
+history and alarm state.
+
+Per-site accounting is kept on each Site and exported as metrics:
+
+    securex_site_events_total            events processed {site}
+    securex_site_processing_seconds      ingest processing time per event {site}
+    securex_site_cpu_seconds_total       worker CPU time spent on the site {site}
+    securex_site_transitions_total       alarm state transitions {site}
+    securex_site_devices                 registered devices {site}
+    securex_site_buffered_events         analyzer event buffer size {site}
+"""
+
+import json
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from device_registry import Device, DeviceRegistry, load_device_file, parse_devices
+from threat_analyzer import ThreatAnalyzer
+from response_orchestrator import ResponseOrchestrator
+from event_debouncer import DebounceRule, EventDebouncer
+from dashboard_state import DashboardState
+from state_snapshot import StateSnapshotter
+from protocol_plans import CompiledProtocols
+from metrics import get_registry
+
+logger = logging.getLogger(__name__)
+
+_metrics = get_registry()
+_site_events_total = _metrics.counter(
+    'securex_site_events_total', 'Device events processed per site', ('site',))
+_site_processing_seconds = _metrics.histogram(
+    'securex_site_processing_seconds', 'Ingest processing time of one event per site', ('site',))
+_site_cpu_seconds_total = _metrics.counter(
+    'securex_site_cpu_seconds_total', 'Pipeline worker CPU time spent on a site', ('site',))
+_site_transitions_total = _metrics.counter(
+    'securex_site_transitions_total', 'Alarm state transitions per site', ('site',))
+_site_devices = _metrics.gauge(
+    'securex_site_devices', 'Registered devices per site', ('site',))
+_site_buffered_events = _metrics.gauge(
+    'securex_site_buffered_events', 'Events in the threat analyzer buffer per site', ('site',))
+
+
+@dataclass
+class SiteDefinition:
+    """
+    One site as listed in the sites file.
+
+    Attributes:
+        home_id: Home ID (also the WebSocket home room and history ``home``)
+        devices: The site's devices
+        protocols_file: Response protocol file ('' = built-in protocols)
+        devices_file: Device file the devices were loaded from ('' = inline)
+    """
+    home_id: str
+    devices: List[Device]
+    protocols_file: str = ''
+    devices_file: str = ''
+
+
+@dataclass(frozen=True)
+class SiteConfig:
+    """
+    Validated, precompiled configuration of one site.
+
+    Attributes:
+        home_id: Home ID of the site
+        registry: The site's devices
+        protocol_plans: Compiled response protocols
+        default_debounce_rule: Debounce rule of devices without their own
+        debounce_rules: Debounce rule per device ID
+        window_seconds: Motion+vibration sequence window
+        allowed_lateness_seconds: Event-time lateness the analyzer accepts
+        critical_threshold: Classification and alarm score for RED_CRITICAL
+        warning_threshold: Classification and alarm score for YELLOW_WARNING
+        hysteresis: Alarm de-escalation hysteresis
+        min_hold_seconds: Minimum time in each alarm state
+        auto_clear_seconds: Quiet time after which each alarm state clears
+    """
+    home_id: str
+    registry: DeviceRegistry
+    protocol_plans: CompiledProtocols
+    default_debounce_rule: DebounceRule
+    debounce_rules: Dict[str, DebounceRule]
+    window_seconds: float
+    allowed_lateness_seconds: float
+    critical_threshold: float
+    warning_threshold: float
+    hysteresis: float
+    min_hold_seconds: Dict[str, float]
+    auto_clear_seconds: Dict[str, float]
+
+    def __post_init__(self):
+        if not self.warning_threshold < self.critical_threshold:
+            raise ValueError(f"Site '{self.home_id}': warning threshold ({self.warning_threshold}) "
+                             f"must be below the critical threshold ({self.critical_threshold})")
+        if self.window_seconds <= 0 or self.allowed_lateness_seconds < 0:
+            raise ValueError(f"Site '{self.home_id}': the sequence window must be positive "
+                             f"and the allowed lateness not negative")
+
+
+def load_sites_file(path: str) -> List[SiteDefinition]:
+    """
+    Load site definitions from a JSON sites file.
+
+    Args:
+        path: Path to the sites file
+
+    Returns:
+        List[SiteDefinition]: Sites in file order
+
+    Raises:
+        ValueError: If an entry is malformed, or a home or device is listed twice
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    if not isinstance(entries, list):
+        raise ValueError(f"Sites file {path} must contain a JSON list")
+
+    sites = []
+    seen = set()
+    device_homes: Dict[str, str] = {}
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict) or not entry.get('home'):
+            raise ValueError(f"Sites file {path}: entry {index} needs 'home'")
+        home_id = str(entry['home'])
+        if home_id in seen:
+            raise ValueError(f"Sites file {path}: home '{home_id}' is listed twice")
+        seen.add(home_id)
+
+        devices_file = entry.get('devices_file') or ''
+        if devices_file:
+            devices = load_device_file(devices_file, home_id)
+        else:
+            devices = parse_devices(entry.get('devices', []), home_id,
+                                    source=f"Sites file {path}: home '{home_id}'")
+        # A site owns all of its devices, whatever home an entry names
+        for device in devices:
+            if device.home != home_id:
+                raise ValueError(f"Sites file {path}: device {device.device_id} of home "
+                                 f"'{home_id}' names home '{device.home}'")
+            if device.device_id in device_homes:
+                raise ValueError(f"Sites file {path}: device {device.device_id} is listed for home "
+                                 f"'{device_homes[device.device_id]}' and home '{home_id}'")
+            device_homes[device.device_id] = home_id
+        sites.append(SiteDefinition(home_id, devices, entry.get('protocols_file') or '', devices_file))
+
+    logger.info(f"Loaded {len(sites)} sites from {path}")
+    return sites
+
+
+class Site:
+    """
+    Per-site detection state plus resource and latency accounting.
+
+    Only the pipeline stage workers touch a site's analyzer and
+    orchestrator (one thread each), so the components need no locking of
+    their own; the accounting counters are locked. For the same reason a
+    reloaded configuration is applied in two halves, each on the worker
+    that owns it.
+    """
+
+    def __init__(self, config: SiteConfig, threat_analyzer: ThreatAnalyzer,
+                 response_orchestrator: ResponseOrchestrator, event_debouncer: EventDebouncer,
+                 dashboard_state: DashboardState, state_snapshotter: Optional[StateSnapshotter] = None):
+        """
+        Initialize the site.
+
+        Args:
+            config: The site's compiled configuration
+            threat_analyzer: The site's analyzer
+            response_orchestrator: The site's orchestrator (with its own alarm state)
+            event_debouncer: The site's debounce stage
+            dashboard_state: The site's dashboard model
+            state_snapshotter: Warm-restart snapshots of the site (none if omitted)
+        """
+        home_id = config.home_id
+        registry = config.registry
+        self.config = config
+        self.home_id = home_id
+        self.registry = registry
+        self.threat_analyzer = threat_analyzer
+        self.response_orchestrator = response_orchestrator
+        self.event_debouncer = event_debouncer
+        self.dashboard_state = dashboard_state
+        self.state_snapshotter = state_snapshotter
+
+        # Devices the analyzer patterns look at
+        self.motion_id = registry.first('motion')
+        self.window_id = registry.first('window')
+        self.door_lock_id = registry.first('door-lock')
+
+        # Accounting
+        self.events_processed = 0
+        self.transitions = 0
+        self.processing_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self._lock = threading.Lock()
+        self._events_metric = _site_events_total.labels(home_id)
+        self._processing_metric = _site_processing_seconds.labels(home_id)
+        self._cpu_metric = _site_cpu_seconds_total.labels(home_id)
+        self._transitions_metric = _site_transitions_total.labels(home_id)
+        _site_devices.labels(home_id).set(len(registry))
+        _site_buffered_events.labels(home_id).set_function(threat_analyzer.get_event_count)
+
+    def apply_detection_config(self, config: SiteConfig) -> None:
+        """
+        Swap in a reloaded configuration's devices, debounce rules and analyzer parameters.
+
+        Must run on the ingestion stage worker. The analyzer's event buffer
+        and the debouncer's per-device history are kept.
+
+        Args:
+            config: The site's new configuration
+        """
+        self.registry = config.registry
+        self.motion_id = config.registry.first('motion')
+        self.window_id = config.registry.first('window')
+        self.door_lock_id = config.registry.first('door-lock')
+        self.threat_analyzer.window_seconds = config.window_seconds
+        self.threat_analyzer.allowed_lateness = timedelta(seconds=config.allowed_lateness_seconds)
+        self.threat_analyzer.critical_threshold = config.critical_threshold
+        self.threat_analyzer.warning_threshold = config.warning_threshold
+        self.event_debouncer.default_rule = config.default_debounce_rule
+        self.event_debouncer.device_rules = dict(config.debounce_rules)
+        _site_devices.labels(self.home_id).set(len(config.registry))
+
+    def apply_response_config(self, config: SiteConfig) -> None:
+        """
+        Swap in a reloaded configuration's protocols and alarm parameters.
+
+        Must run on the response stage worker. The alarm state, its timers
+        and the active warning zones are kept.
+
+        Args:
+            config: The site's new configuration
+        """
+        orchestrator = self.response_orchestrator
+        orchestrator.protocol_plans = config.protocol_plans
+        orchestrator.smart_bulb_id = config.registry.first('bulb')
+        orchestrator.siren_id = config.registry.first('siren')
+        orchestrator.front_door_lock_id = config.registry.first('door-lock')
+        alarm = orchestrator.alarm_state
+        alarm.critical_threshold = config.critical_threshold
+        alarm.warning_threshold = config.warning_threshold
+        alarm.hysteresis = config.hysteresis
+        alarm.min_hold_seconds = dict(config.min_hold_seconds)
+        alarm.auto_clear_seconds = dict(config.auto_clear_seconds)
+        self.config = config
+
+    def account_event(self, seconds: float, cpu_seconds: float) -> None:
+        """
+        Account one processed event to the site.
+
+        Args:
+            seconds: Wall-clock processing time
+            cpu_seconds: Worker thread CPU time
+        """
+        with self._lock:
+            self.events_processed += 1
+            self.processing_seconds += seconds
+            self.cpu_seconds += cpu_seconds
+        self._events_metric.inc()
+        self._processing_metric.observe(seconds)
+        self._cpu_metric.inc(cpu_seconds)
+
+    def account_work(self, cpu_seconds: float, transition: bool = False) -> None:
+        """
+        Account response-stage work to the site.
+
+        Args:
+            cpu_seconds: Worker thread CPU time
+            transition: Whether the work caused an alarm state transition
+        """
+        with self._lock:
+            self.cpu_seconds += cpu_seconds
+            if transition:
+                self.transitions += 1
+        self._cpu_metric.inc(cpu_seconds)
+        if transition:
+            self._transitions_metric.inc()
+
+    def get_stats(self) -> Dict:
+        """
+        Get the site's accounting.
+
+        Returns:
+            Dict: Devices, processed events, mean processing time, CPU time,
+            transitions and the current alarm state
+        """
+        with self._lock:
+            events = self.events_processed
+            return {
+                'home': self.home_id,
+                'devices': len(self.registry),
+                'events': events,
+                'mean_processing_ms': self.processing_seconds * 1000.0 / events if events else 0.0,
+                'cpu_seconds': round(self.cpu_seconds, 3),
+                'transitions': self.transitions,
+                'alarm_state': self.response_orchestrator.alarm_state.state
+            }
@@ -0,0 +1,325 @@
+"""
+State snapshots for warm restart of the AI Agent.
+
+This module persists the in-memory detection state (analyzer event buffer,
+pending sequence deadlines, orchestrator warning and alarm states and last
+known device states) to a compact binary file so a restarted agent can resume
+detection immediately instead of coming back blind.
+
+File layout (little-endian):
+    header:  magic "SXSN" | u16 version | f64 saved_at (epoch seconds)
+    section: u8 tag | u32 length | payload   (repeated)
+
+Snapshots are written atomically (temp file + fsync + rename) and read
+back through a memory map.
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from clock import SYSTEM_CLOCK, Clock
+from threat_analyzer import SensorEvent
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b'SXSN'
+SNAPSHOT_VERSION = 1
+
+_HEADER = struct.Struct('<4sHd')
+_SECTION = struct.Struct('<BI')
+_U16 = struct.Struct('<H')
+_U32 = struct.Struct('<I')
+_F64 = struct.Struct('<d')
+
+# Section tags
+TAG_EVENTS = 1
+TAG_DEADLINES = 2
+TAG_WARNINGS = 3
+TAG_DEVICE_STATES = 4
+TAG_ALARM = 5
+
+
+@dataclass
+class AgentSnapshot:
+    """
+    Detection state captured from a running agent.
+
+    Attributes:
+        saved_at: Epoch seconds when the snapshot was taken
+        events: Analyzer event buffer in chronological order
+        deadlines: Pending sequence deadlines (name -> epoch seconds)
+        warning_states: Active orchestrator warning zones
+        device_states: Last known Tuya status list per device ID
+        alarm_state: Alarm state machine state
+        alarm_zone: Zone of the alarm state
+        alarm_entered_at: Epoch seconds the alarm state was entered (0 = unset)
+        alarm_last_trigger_at: Epoch seconds of the last supporting event (0 = unset)
+    """
+    saved_at: float = 0.0
+    events: List[SensorEvent] = field(default_factory=list)
+    deadlines: Dict[str, float] = field(default_factory=dict)
+    warning_states: List[str] = field(default_factory=list)
+    device_states: Dict[str, list] = field(default_factory=dict)
+    alarm_state: str = "GREEN_SAFE"
+    alarm_zone: str = "HOUSE"
+    alarm_entered_at: float = 0.0
+    alarm_last_trigger_at: float = 0.0
+
+    def age_seconds(self, now: Optional[float] = None) -> float:
+        """Calculate age of the snapshot in seconds at ``now`` (epoch seconds, default the current time)."""
+        return (time.time() if now is None else now) - self.saved_at
+
+
+def _pack_str(value: str) -> bytes:
+    data = value.encode('utf-8')
+    return _U16.pack(len(data)) + data
+
+
+def _unpack_str(buf, offset: int):
+    (length,) = _U16.unpack_from(buf, offset)
+    offset += _U16.size
+    return bytes(buf[offset:offset + length]).decode('utf-8'), offset + length
+
+
+def _pack_blob(value) -> bytes:
+    data = json.dumps(value, separators=(',', ':'), default=str).encode('utf-8')
+    return _U32.pack(len(data)) + data
+
+
+def _unpack_blob(buf, offset: int):
+    (length,) = _U32.unpack_from(buf, offset)
+    offset += _U32.size
+    return json.loads(bytes(buf[offset:offset + length])), offset + length
+
+
+def encode_snapshot(snapshot: AgentSnapshot) -> bytes:
+    """
+    Encode a snapshot into the binary snapshot format.
+
+    Args:
+        snapshot: State to encode
+
+    Returns:
+        bytes: Encoded snapshot
+    """
+    sections = []
+
+    events = bytearray(_U16.pack(len(snapshot.events)))
+    for event in snapshot.events:
+        events += _pack_str(event.device_id)
+        events += _pack_str(event.device_type)
+        events += _F64.pack(event.timestamp.timestamp())
+        events += _pack_blob(event.data)
+    sections.append((TAG_EVENTS, bytes(events)))
+
+    deadlines = bytearray(_U16.pack(len(snapshot.deadlines)))
+    for name, due in snapshot.deadlines.items():
+        deadlines += _pack_str(name)
+        deadlines += _F64.pack(due)
+    sections.append((TAG_DEADLINES, bytes(deadlines)))
+
+    warnings = bytearray(_U16.pack(len(snapshot.warning_states)))
+    for zone in snapshot.warning_states:
+        warnings += _pack_str(zone)
+    sections.append((TAG_WARNINGS, bytes(warnings)))
+
+    sections.append((TAG_DEVICE_STATES, _pack_blob(snapshot.device_states)))
+
+    alarm = (_pack_str(snapshot.alarm_state) + _pack_str(snapshot.alarm_zone) +
+             _F64.pack(snapshot.alarm_entered_at) + _F64.pack(snapshot.alarm_last_trigger_at))
+    sections.append((TAG_ALARM, alarm))
+
+    out = bytearray(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, snapshot.saved_at))
+    for tag, payload in sections:
+        out += _SECTION.pack(tag, len(payload))
+        out += payload
+    return bytes(out)
+
+
+def decode_snapshot(buf) -> AgentSnapshot:
+    """
+    Decode a snapshot from a bytes-like object (bytes, mmap, memoryview).
+
+    Unknown section tags are skipped so newer writers stay readable.
+
+    Args:
+        buf: Buffer holding an encoded snapshot
+
+    Returns:
+        AgentSnapshot: Decoded state
+
+    Raises:
+        ValueError: If the buffer is not a valid snapshot
+    """
+    if len(buf) < _HEADER.size:
+        raise ValueError("Snapshot too short")
+
+    magic, version, saved_at = _HEADER.unpack_from(buf, 0)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError(f"Bad snapshot magic: {magic!r}")
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version: {version}")
+
+    snapshot = AgentSnapshot(saved_at=saved_at)
+    offset = _HEADER.size
+
+    while offset < len(buf):
+        tag, length = _SECTION.unpack_from(buf, offset)
+        offset += _SECTION.size
+        end = offset + length
+        if end > len(buf):
+            raise ValueError("Truncated snapshot section")
+
+        if tag == TAG_EVENTS:
+            (count,) = _U16.unpack_from(buf, offset)
+            pos = offset + _U16.size
+            for _ in range(count):
+                device_id, pos = _unpack_str(buf, pos)
+                device_type, pos = _unpack_str(buf, pos)
+                (ts,) = _F64.unpack_from(buf, pos)
+                pos += _F64.size
+                data, pos = _unpack_blob(buf, pos)
+                snapshot.events.append(SensorEvent(
+                    device_id=device_id,
+                    device_type=device_type,
+                    timestamp=datetime.fromtimestamp(ts),
+                    data=data
+                ))
+        elif tag == TAG_DEADLINES:
+            (count,) = _U16.unpack_from(buf, offset)
+            pos = offset + _U16.size
+            for _ in range(count):
+                name, pos = _unpack_str(buf, pos)
+                (due,) = _F64.unpack_from(buf, pos)
+                pos += _F64.size
+                snapshot.deadlines[name] = due
+        elif tag == TAG_WARNINGS:
+            (count,) = _U16.unpack_from(buf, offset)
+            pos = offset + _U16.size
+            for _ in range(count):
+                zone, pos = _unpack_str(buf, pos)
+                snapshot.warning_states.append(zone)
+        elif tag == TAG_DEVICE_STATES:
+            snapshot.device_states, _ = _unpack_blob(buf, offset)
+        elif tag == TAG_ALARM:
+            snapshot.alarm_state, pos = _unpack_str(buf, offset)
+            snapshot.alarm_zone, pos = _unpack_str(buf, pos)
+            snapshot.alarm_entered_at, snapshot.alarm_last_trigger_at = struct.unpack_from('<dd', buf, pos)
+
+        offset = end
+
+    return snapshot
+
+
+class StateSnapshotter:
+    """
+    Writes and loads agent state snapshots on disk.
+
+    Snapshots are taken periodically from the agent main loop and once on
+    shutdown, and loaded once at startup before devices are subscribed.
+    """
+
+    def __init__(self, path: str, interval_seconds: float = 30.0,
+                 max_age_seconds: float = 3600.0, clock: Optional[Clock] = None):
+        """
+        Initialize the snapshotter.
+
+        Args:
+            path: Snapshot file path
+            interval_seconds: Minimum time between periodic snapshots
+            max_age_seconds: Snapshots older than this are ignored on load
+            clock: Time source for the interval, save time and age (default: system clock)
+        """
+        self.path = path
+        self.interval_seconds = interval_seconds
+        self.max_age_seconds = max_age_seconds
+        self.clock = clock or SYSTEM_CLOCK
+        self._last_saved: Optional[float] = None
+
+        logger.info(f"StateSnapshotter initialized ({path}, every {interval_seconds}s)")
+
+    def is_due(self) -> bool:
+        """
+        Check whether a periodic snapshot should be taken now.
+
+        Returns:
+            bool: True if the snapshot interval has elapsed
+        """
+        if self._last_saved is None:
+            return True
+        return self.clock.monotonic() - self._last_saved >= self.interval_seconds
+
+    def save(self, snapshot: AgentSnapshot) -> int:
+        """
+        Atomically write a snapshot to disk.
+
+        The snapshot is written to a temp file in the same directory,
+        fsynced, then renamed over the previous snapshot, so a crash never
+        leaves a partially written file behind.
+
+        Args:
+            snapshot: State to persist
+
+        Returns:
+            int: Number of bytes written
+        """
+        if not snapshot.saved_at:
+            snapshot.saved_at = self.clock.time()
+        data = encode_snapshot(snapshot)
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.snapshot-', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(data)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        self._last_saved = self.clock.monotonic()
+        logger.debug(f"Snapshot written: {len(data)} bytes, {len(snapshot.events)} events")
+        return len(data)
+
+    def load(self) -> Optional[AgentSnapshot]:
+        """
+        Load the most recent snapshot through a memory map.
+
+        Returns:
+            Optional[AgentSnapshot]: The snapshot, or None if there is no
+            usable snapshot (missing, empty, corrupt or too old)
+        """
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            logger.info("No state snapshot found, starting cold")
+            return None
+
+        start = time.perf_counter()
+        try:
+            with open(self.path, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    snapshot = decode_snapshot(mapped)
+        except (ValueError, struct.error, OSError) as e:
+            logger.warning(f"Ignoring unreadable state snapshot {self.path}: {e}")
+            return None
+
+        age = snapshot.age_seconds(self.clock.time())
+        if age > self.max_age_seconds:
+            logger.info(f"Ignoring stale state snapshot ({age:.0f}s old)")
+            return None
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        logger.info(f"Loaded state snapshot in {elapsed_ms:.2f}ms: "
+                    f"{len(snapshot.events)} events, {len(snapshot.warning_states)} warnings, "
+                    f"{len(snapshot.device_states)} device states")
+        return snapshot
@@ -0,0 +1,254 @@
+"""
+Structured logging subsystem for the Tuya Security Digital Twin system.
+
+This module is the single configuration point for logging across the
+backend. It provides:
+- Lazy structured fields that are only formatted when a record is emitted
+- A queue-based handler so formatting and handler I/O happen on a
+  background thread instead of the detection path
+- Sampling for high-rate debug events
+- A helper to measure hot-path logging overhead
+
+Modules obtain loggers with ``logging.getLogger(__name__)`` as before and
+never call ``logging.basicConfig`` themselves; entry points call
+``configure_logging`` once at startup.
+"""
+
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from typing import Dict, Optional
+
+from metrics import get_registry
+
+DEFAULT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Module state for the active queue listener (one per process)
+_listener: Optional[logging.handlers.QueueListener] = None
+_listener_lock = threading.Lock()
+
+_records_dropped_total = get_registry().counter(
+    'securex_log_records_dropped_total', 'Log records dropped because the log queue was full')
+
+
+class LazyFields:
+    """
+    Deferred key=value rendering of structured log fields.
+
+    The fields dict is captured when the log call is made, but the string
+    is only built if a handler actually formats the record (on the
+    listener thread when the queue handler is installed).
+    """
+
+    __slots__ = ('event', 'fields')
+
+    def __init__(self, event: str, fields: Dict):
+        self.event = event
+        self.fields = fields
+
+    def __str__(self) -> str:
+        if not self.fields:
+            return self.event
+        rendered = ' '.join(f"{key}={value}" for key, value in self.fields.items())
+        return f"{self.event} {rendered}"
+
+
+def log_event(logger: logging.Logger, level: int, event: str, **fields) -> None:
+    """
+    Log a structured event with lazily formatted fields.
+
+    Returns immediately, without building any strings, when the level is
+    disabled for the logger.
+
+    Args:
+        logger: Logger to emit on
+        level: Logging level (e.g. logging.INFO)
+        event: Short event name (e.g. "event_added")
+        **fields: Structured fields attached to the event
+    """
+    if not logger.isEnabledFor(level):
+        return
+    logger.log(level, '%s', LazyFields(event, fields), extra={'fields': fields})
+
+
+class EventSampler:
+    """
+    Emits only every Nth occurrence of a high-rate event per key.
+
+    Used for debug events that fire on every poll or every event so that
+    enabling DEBUG does not flood the log queue.
+    """
+
+    def __init__(self, every_n: int = 100):
+        """
+        Initialize the sampler.
+
+        Args:
+            every_n: Emit one out of every N occurrences per key (1 = all)
+        """
+        self.every_n = max(1, every_n)
+        self._counts: Dict[str, int] = {}
+        # Poll, ingest and response threads share one sampler
+        self._lock = threading.Lock()
+
+    def should_log(self, key: str) -> bool:
+        """
+        Record an occurrence of ``key`` and decide whether to emit it.
+
+        Args:
+            key: Sampling key (typically the event name or device ID)
+
+        Returns:
+            bool: True if this occurrence should be logged
+        """
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        return count % self.every_n == 0
+
+    def suppressed(self, key: str) -> int:
+        """
+        Get the number of occurrences of ``key`` that were not emitted.
+
+        Args:
+            key: Sampling key
+
+        Returns:
+            int: Number of suppressed occurrences
+        """
+        with self._lock:
+            count = self._counts.get(key, 0)
+        emitted = (count + self.every_n - 1) // self.every_n
+        return count - emitted
+
+
+def log_sampled(logger: logging.Logger, sampler: EventSampler, level: int,
+                event: str, **fields) -> None:
+    """
+    Log a structured event subject to sampling.
+
+    The level check happens before the sampler is consulted, so a disabled
+    level costs a single ``isEnabledFor`` call.
+
+    Args:
+        logger: Logger to emit on
+        sampler: EventSampler deciding which occurrences are emitted
+        level: Logging level
+        event: Event name, also used as the sampling key
+        **fields: Structured fields attached to the event
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if not sampler.should_log(event):
+        return
+    fields['sampled_1_in'] = sampler.every_n
+    logger.log(level, '%s', LazyFields(event, fields), extra={'fields': fields})
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that defers message formatting to the listener thread.
+
+    The stock QueueHandler formats the record in the calling thread so it
+    can be pickled onto a multiprocessing queue. Our queue is in-process,
+    so the record is enqueued as-is and formatted by the listener.
+
+    When the bounded queue is full the record is dropped and counted in
+    ``securex_log_records_dropped_total``: the caller never blocks and no
+    traceback is printed from the detection path.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _records_dropped_total.inc()
+
+
+def configure_logging(level: str = 'INFO', fmt: str = DEFAULT_FORMAT,
+                      log_file: Optional[str] = None,
+                      queue_size: int = 10000) -> logging.handlers.QueueListener:
+    """
+    Configure process-wide logging. Call once from the entry point.
+
+    Installs a DeferredQueueHandler on the root logger and starts a
+    QueueListener that writes to stderr (and optionally a file) on a
+    background thread. Calling again replaces the previous configuration.
+
+    Args:
+        level: Root log level name (DEBUG, INFO, WARNING, ...)
+        fmt: Log record format string
+        log_file: Optional path of a file to write logs to in addition to stderr
+        queue_size: Maximum number of pending records (0 = unbounded);
+                    records beyond it are dropped and counted
+
+    Returns:
+        QueueListener: The started listener
+    """
+    global _listener
+
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+        formatter = logging.Formatter(fmt)
+        handlers = [logging.StreamHandler()]
+        if log_file:
+            handlers.append(logging.FileHandler(log_file))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        queue_handler = DeferredQueueHandler(log_queue)
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(queue_handler)
+        root.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+
+        _listener = logging.handlers.QueueListener(
+            log_queue, *handlers, respect_handler_level=True
+        )
+        _listener.start()
+
+    return _listener
+
+
+def shutdown_logging() -> None:
+    """Flush pending records and stop the background listener thread."""
+    global _listener
+
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def measure_logging_overhead(logger: logging.Logger, level: int = logging.DEBUG,
+                             iterations: int = 100000) -> float:
+    """
+    Measure the caller-side cost of a structured log call.
+
+    Useful for verifying that disabled levels are near zero cost and that
+    enabled levels only pay for enqueueing.
+
+    Args:
+        logger: Logger to measure
+        level: Level to log at
+        iterations: Number of calls to time
+
+    Returns:
+        float: Average nanoseconds per call
+    """
+    start = time.perf_counter_ns()
+    for i in range(iterations):
+        log_event(logger, level, 'overhead_probe', iteration=i, device_id='probe')
+    elapsed = time.perf_counter_ns() - start
+    return elapsed / iterations
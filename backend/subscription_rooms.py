@@ -0,0 +1,234 @@
+"""
+Home and zone subscription rooms for targeted WebSocket fan-out.
+
+Clients subscribe to a whole home or to selected zones of a home. Each
+subscription maps to a Socket.IO room:
+
+    home:<home_id>            every event of the home
+    zone:<home_id>:<zone>     events of one zone (plus house-wide status)
+
+A client subscribed to a whole home is never also in that home's zone
+rooms (a new subscription for a home replaces the previous one), so
+emitting to a home room and its zone rooms never duplicates a message.
+
+Clients using a non-JSON wire encoding are kept in separate rooms with
+the encoding as prefix (``msgpack/home:<home_id>``), so a broadcast can be
+encoded once per encoding and sent to each group of rooms as is.
+
+The RoomDirectory mirrors room membership so the server can skip rooms
+nobody listens to, pick targets without scanning clients and report
+per-room client counts. All operations are O(1) in the number of clients.
+"""
+
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOME = 'home'
+HOUSE_ZONE = 'HOUSE'
+DEFAULT_ENCODING = 'json'
+
+
+def _with_encoding(room: str, encoding: str) -> str:
+    return room if encoding == DEFAULT_ENCODING else f"{encoding}/{room}"
+
+
+def home_room(home_id: str, encoding: str = DEFAULT_ENCODING) -> str:
+    """Room name for all events of a home."""
+    return _with_encoding(f"home:{home_id}", encoding)
+
+
+def zone_room(home_id: str, zone: str, encoding: str = DEFAULT_ENCODING) -> str:
+    """Room name for the events of one zone of a home."""
+    return _with_encoding(f"zone:{home_id}:{zone}", encoding)
+
+
+def room_encoding(room: str) -> str:
+    """Wire encoding of the clients in a room."""
+    encoding, _, rest = room.partition('/')
+    return encoding if rest else DEFAULT_ENCODING
+
+
+def _room_base(room: str) -> str:
+    return room.partition('/')[2] or room
+
+
+def room_zone(room: str) -> Optional[str]:
+    """Zone of a zone room name (None for home rooms)."""
+    kind, _, rest = _room_base(room).partition(':')
+    return rest.split(':', 1)[1] if kind == 'zone' else None
+
+
+def room_home(room: str) -> str:
+    """Home of a room name."""
+    return _room_base(room).split(':')[1]
+
+
+class RoomDirectory:
+    """
+    Thread-safe record of which clients are in which subscription rooms.
+    """
+
+    def __init__(self):
+        self._members: Dict[str, Set[str]] = {}
+        self._client_rooms: Dict[str, Set[str]] = {}
+        self._client_encoding: Dict[str, str] = {}
+        # home_id -> home / zone rooms (all encodings) of that home that have members
+        self._home_rooms: Dict[str, Set[str]] = {}
+        self._home_zone_rooms: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def set_encoding(self, sid: str, encoding: str) -> None:
+        """
+        Record a client's wire encoding (before its first subscription).
+
+        Args:
+            sid: Client session ID
+            encoding: Negotiated wire encoding
+        """
+        with self._lock:
+            if encoding == DEFAULT_ENCODING:
+                self._client_encoding.pop(sid, None)
+            else:
+                self._client_encoding[sid] = encoding
+
+    def get_encoding(self, sid: str) -> str:
+        """Get a client's wire encoding."""
+        return self._client_encoding.get(sid, DEFAULT_ENCODING)
+
+    def subscribe(self, sid: str, home_id: str, zones: Optional[Iterable[str]] = None):
+        """
+        Set a client's subscription for one home.
+
+        Args:
+            sid: Client session ID
+            home_id: Home to subscribe to
+            zones: Zones to subscribe to (None or empty = the whole home)
+
+        Returns:
+            Tuple[List[str], List[str]]: Rooms to join and rooms to leave
+        """
+        with self._lock:
+            encoding = self._client_encoding.get(sid, DEFAULT_ENCODING)
+            if zones:
+                wanted = {zone_room(home_id, zone, encoding) for zone in zones}
+            else:
+                wanted = {home_room(home_id, encoding)}
+            current = {room for room in self._client_rooms.get(sid, set())
+                       if room_home(room) == home_id}
+            join = wanted - current
+            leave = current - wanted
+            for room in leave:
+                self._remove(sid, room)
+            for room in join:
+                self._add(sid, room)
+        return sorted(join), sorted(leave)
+
+    def unsubscribe(self, sid: str, home_id: str) -> List[str]:
+        """
+        Remove a client's subscription for one home.
+
+        Args:
+            sid: Client session ID
+            home_id: Home to unsubscribe from
+
+        Returns:
+            List[str]: Rooms to leave
+        """
+        with self._lock:
+            leave = [room for room in self._client_rooms.get(sid, set())
+                     if room_home(room) == home_id]
+            for room in leave:
+                self._remove(sid, room)
+        return sorted(leave)
+
+    def remove_client(self, sid: str) -> None:
+        """
+        Forget a disconnected client.
+
+        Args:
+            sid: Client session ID
+        """
+        with self._lock:
+            for room in list(self._client_rooms.get(sid, ())):
+                self._remove(sid, room)
+            self._client_encoding.pop(sid, None)
+
+    def rooms_for(self, home_id: str, zone: Optional[str]) -> List[str]:
+        """
+        Get the rooms with members that should receive an event.
+
+        Args:
+            home_id: Home the event belongs to
+            zone: Zone of the event; HOUSE (or None) reaches every zone room of the home
+
+        Returns:
+            List[str]: Target rooms (empty if nobody is interested)
+        """
+        with self._lock:
+            rooms = list(self._home_rooms.get(home_id, ()))
+            zone_rooms = self._home_zone_rooms.get(home_id, ())
+            if zone is None or zone == HOUSE_ZONE:
+                rooms.extend(zone_rooms)
+            else:
+                rooms.extend(room for room in zone_rooms if room_zone(room) == zone)
+            return rooms
+
+    def home_rooms(self, home_id: str) -> List[str]:
+        """Get the whole-home rooms (one per encoding) of a home that have members."""
+        with self._lock:
+            return list(self._home_rooms.get(home_id, ()))
+
+    def zone_rooms(self, home_id: str) -> List[str]:
+        """Get the zone rooms of a home that have members."""
+        with self._lock:
+            return list(self._home_zone_rooms.get(home_id, ()))
+
+    def is_member(self, sid: str, room: str) -> bool:
+        """Check whether a client is in a room."""
+        with self._lock:
+            return room in self._client_rooms.get(sid, ())
+
+    def client_homes(self, sid: str) -> List[str]:
+        """Get the homes a client is subscribed to."""
+        with self._lock:
+            return sorted({room_home(room) for room in self._client_rooms.get(sid, ())})
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Get per-room client counts.
+
+        Returns:
+            Dict[str, int]: Room name mapped to its number of clients
+        """
+        with self._lock:
+            return {room: len(sids) for room, sids in sorted(self._members.items())}
+
+    def _index_for(self, room: str) -> Dict[str, Set[str]]:
+        return self._home_zone_rooms if room_zone(room) is not None else self._home_rooms
+
+    def _add(self, sid: str, room: str) -> None:
+        self._members.setdefault(room, set()).add(sid)
+        self._client_rooms.setdefault(sid, set()).add(room)
+        self._index_for(room).setdefault(room_home(room), set()).add(room)
+
+    def _remove(self, sid: str, room: str) -> None:
+        members = self._members.get(room)
+        if members is not None:
+            members.discard(sid)
+            if not members:
+                del self._members[room]
+                index = self._index_for(room)
+                home_id = room_home(room)
+                rooms = index.get(home_id)
+                if rooms is not None:
+                    rooms.discard(room)
+                    if not rooms:
+                        del index[home_id]
+        rooms = self._client_rooms.get(sid)
+        if rooms is not None:
+            rooms.discard(room)
+            if not rooms:
+                del self._client_rooms[sid]
@@ -0,0 +1,99 @@
+"""
+Behaviour tests for the alarm state machine.
+"""
+
+from datetime import datetime, timedelta
+
+from alarm_state_machine import (GREEN_SAFE, REASON_AUTO_CLEAR, REASON_DEESCALATE, REASON_DISARM,
+                                 REASON_ESCALATE, REASON_ZONE_CHANGE, RED_CRITICAL, YELLOW_WARNING,
+                                 AlarmStateMachine)
+
+T0 = datetime(2024, 1, 1, 23, 0)
+
+
+def at(seconds: float) -> datetime:
+    return T0 + timedelta(seconds=seconds)
+
+
+def red_alarm() -> AlarmStateMachine:
+    machine = AlarmStateMachine()
+    machine.evaluate(90, 'HOUSE', at(0), pattern='motion_vibration')
+    assert machine.state == RED_CRITICAL
+    return machine
+
+
+class TestAlarmStateMachine:
+
+    def test_escalation_is_immediate(self):
+        machine = AlarmStateMachine()
+        transition = machine.evaluate(50, 'LivingRoom', at(0), pattern='motion_alone')
+        assert (transition.from_state, transition.to_state) == (GREEN_SAFE, YELLOW_WARNING)
+        assert transition.reason == REASON_ESCALATE
+        assert machine.evaluate(90, 'HOUSE', at(1), pattern='motion_vibration').to_state == RED_CRITICAL
+
+    def test_repeated_classification_is_suppressed(self):
+        machine = red_alarm()
+        assert machine.evaluate(95, 'HOUSE', at(10), pattern='motion_vibration') is None
+        assert machine.suppressed_count == 1
+        assert machine.last_trigger_at == at(10)
+
+    def test_hysteresis_keeps_state_just_below_threshold(self):
+        machine = red_alarm()
+        assert machine.evaluate(75, 'HOUSE', at(120), pattern='motion_vibration') is None
+        assert machine.state == RED_CRITICAL
+
+    def test_deescalation_waits_for_min_hold(self):
+        machine = red_alarm()
+        assert machine.evaluate(10, 'LivingRoom', at(30), pattern='motion_alone') is None
+        transition = machine.evaluate(10, 'LivingRoom', at(60), pattern='motion_alone')
+        assert (transition.to_state, transition.zone) == (GREEN_SAFE, 'HOUSE')
+        assert transition.reason == REASON_DEESCALATE
+
+    def test_no_pattern_never_deescalates(self):
+        # PIR back to idle during a break-in carries no evidence the
+        # intruder left: the alarm holds until auto-clear
+        machine = red_alarm()
+        assert machine.evaluate(0, 'HOUSE', at(65), pattern='none') is None
+        assert machine.evaluate(0, 'HOUSE', at(250), pattern='none') is None
+        assert machine.state == RED_CRITICAL
+        # Nor does it count as a supporting event
+        assert machine.last_trigger_at == at(0)
+
+    def test_disarm_clears_immediately(self):
+        machine = red_alarm()
+        transition = machine.evaluate(0, 'HOUSE', at(1), disarm=True, pattern='door_unlock')
+        assert transition.to_state == GREEN_SAFE
+        assert transition.reason == REASON_DISARM
+
+    def test_disarm_when_safe_is_suppressed(self):
+        machine = AlarmStateMachine()
+        assert machine.evaluate(0, 'HOUSE', at(0), disarm=True) is None
+
+    def test_warning_zone_change(self):
+        machine = AlarmStateMachine()
+        machine.evaluate(50, 'LivingRoom', at(0), pattern='motion_alone')
+        transition = machine.evaluate(50, 'Foyer', at(1), pattern='motion_alone')
+        assert transition.reason == REASON_ZONE_CHANGE
+        assert machine.zone == 'Foyer'
+
+    def test_auto_clear_after_quiet_period(self):
+        machine = red_alarm()
+        assert machine.tick(at(299)) is None
+        assert machine.get_auto_clear_deadline() == at(300).timestamp()
+        transition = machine.tick(at(300))
+        assert transition.reason == REASON_AUTO_CLEAR
+        assert machine.state == GREEN_SAFE
+        assert machine.get_auto_clear_deadline() is None
+
+    def test_supporting_event_extends_auto_clear(self):
+        machine = red_alarm()
+        machine.evaluate(90, 'HOUSE', at(200), pattern='motion_vibration')
+        assert machine.tick(at(300)) is None
+        assert machine.tick(at(500)).to_state == GREEN_SAFE
+
+    def test_restore_ignores_unknown_state(self):
+        machine = AlarmStateMachine()
+        machine.restore('PURPLE', 'HOUSE', None, None)
+        assert machine.state == GREEN_SAFE
+        machine.restore(YELLOW_WARNING, 'Foyer', at(0), at(0))
+        assert (machine.state, machine.zone) == (YELLOW_WARNING, 'Foyer')
@@ -0,0 +1,119 @@
+"""
+Behaviour tests for the broadcast bus framing and its publisher and
+subscriber, over a temporary Unix socket.
+"""
+
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+import pytest
+
+from broadcast_bus import (_LENGTH, KIND_EMIT, KIND_FRAME, KIND_HISTORY, KIND_HISTORY_SNAPSHOT, KIND_SNAPSHOT,
+                           BusPublisher, BusSubscriber, _encode_frame, _recv_exact)
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason="needs Unix domain sockets")
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+@pytest.fixture
+def bus_path():
+    # Short directory: Unix socket paths are limited to ~100 bytes
+    directory = tempfile.mkdtemp(prefix='bus')
+    yield os.path.join(directory, 'bus.sock')
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+@pytest.fixture
+def publisher(bus_path):
+    bus = BusPublisher(bus_path, lambda: {'version': 3, 'status': 'GREEN_SAFE'},
+                       send_timeout_seconds=0.2, history_provider=lambda: [{'seq': 1}])
+    bus.start()
+    yield bus
+    bus.stop()
+
+
+def read_frame(sock):
+    (length,) = _LENGTH.unpack(_recv_exact(sock, _LENGTH.size))
+    return _recv_exact(sock, length)
+
+
+class TestFraming:
+
+    def test_frame_is_length_prefixed_json(self):
+        frame = _encode_frame(KIND_EMIT, 'status_update', {'status': 'RED_CRITICAL'})
+        (length,) = _LENGTH.unpack_from(frame)
+        assert frame[_LENGTH.size:] == b'["emit","status_update",{"status":"RED_CRITICAL"}]'
+        assert length == len(frame) - _LENGTH.size
+
+
+class TestPublisherSubscriber:
+
+    def test_snapshot_then_history_then_frames_in_order(self, publisher, bus_path):
+        received = []
+        lock = threading.Lock()
+
+        def on_message(kind, event, data):
+            with lock:
+                received.append((kind, event, data))
+
+        subscriber = BusSubscriber(bus_path, on_message, reconnect_delay_seconds=0.01)
+        subscriber.start()
+        try:
+            assert wait_for(lambda: publisher.get_subscriber_count() == 1)
+            publisher.emit('status_update', {'status': 'RED_CRITICAL', 'version': 4})
+            publisher.emit_device_frame([{'device_id': 'm1', 'version': 5}])
+            publisher.emit_history({'seq': 2})
+            assert wait_for(lambda: len(received) == 5)
+        finally:
+            subscriber.stop()
+        assert received == [
+            (KIND_SNAPSHOT, None, {'version': 3, 'status': 'GREEN_SAFE'}),
+            (KIND_HISTORY_SNAPSHOT, None, [{'seq': 1}]),
+            (KIND_EMIT, 'status_update', {'status': 'RED_CRITICAL', 'version': 4}),
+            (KIND_FRAME, None, [{'device_id': 'm1', 'version': 5}]),
+            (KIND_HISTORY, None, {'seq': 2})
+        ]
+        assert publisher.published_count == 3
+
+    def test_subscriber_whose_send_fails_is_dropped(self, publisher, bus_path):
+        healthy = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        healthy.connect(bus_path)
+        stalled.connect(bus_path)
+        try:
+            assert wait_for(lambda: publisher.get_subscriber_count() == 2)
+            for _ in range(2):
+                # Snapshot and history snapshot
+                read_frame(healthy)
+            # The stalled worker never reads: a large frame fills its buffer
+            # and the send times out
+            received = []
+            reader = threading.Thread(target=lambda: received.extend(read_frame(healthy) for _ in range(2)))
+            reader.start()
+            publisher.emit('status_update', {'padding': 'x' * (4 * 1024 * 1024)})
+            publisher.emit('status_update', {'status': 'GREEN_SAFE'})
+            reader.join(5)
+            assert publisher.get_subscriber_count() == 1
+            assert publisher.dropped_subscribers == 1
+            assert received[-1] == b'["emit","status_update",{"status":"GREEN_SAFE"}]'
+        finally:
+            healthy.close()
+            stalled.close()
+
+    def test_closed_subscriber_is_dropped(self, publisher, bus_path):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(bus_path)
+        assert wait_for(lambda: publisher.get_subscriber_count() == 1)
+        sock.close()
+        publisher.emit('status_update', {'status': 'GREEN_SAFE'})
+        assert publisher.get_subscriber_count() == 0
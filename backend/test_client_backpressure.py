@@ -0,0 +1,124 @@
+"""
+Behaviour tests for the slow-client backpressure policy.
+"""
+
+import logging
+import queue
+
+import pytest
+
+import client_backpressure
+from client_backpressure import (DISCONNECT_BACKLOG_OVERFLOW, DISCONNECT_SLOW_CONSUMER, ClientBackpressure,
+                                 transport_backlog)
+
+HEALTHY = 'healthy'
+LAGGING = 'lagging'
+RESYNC = 'resync'
+
+
+def policy() -> ClientBackpressure:
+    # Lagging above 4 queued frames, caught up at 2, disconnected at 10 or after 30s lagging
+    return ClientBackpressure(max_backlog_frames=4, disconnect_backlog_frames=10, slow_consumer_seconds=30)
+
+
+def outcome(backpressure: ClientBackpressure, backlog: int, now: float) -> str:
+    resync, disconnect = backpressure.evaluate({'sid': backlog}, now)
+    if disconnect:
+        return disconnect[0][1]
+    if resync:
+        return RESYNC
+    return LAGGING if 'sid' in backpressure.lagging_clients() else HEALTHY
+
+
+class TestEvaluate:
+
+    @pytest.mark.parametrize('steps', [
+        # (backlog, now, expected)
+        [(4, 0, HEALTHY), (0, 1, HEALTHY)],
+        [(5, 0, LAGGING), (3, 1, LAGGING), (2, 2, RESYNC), (2, 3, HEALTHY)],
+        [(5, 0, LAGGING), (0, 1, RESYNC)],
+        [(5, 0, LAGGING), (8, 30, LAGGING), (8, 31, DISCONNECT_SLOW_CONSUMER)],
+        [(5, 0, LAGGING), (3, 31, DISCONNECT_SLOW_CONSUMER)],
+        [(10, 0, DISCONNECT_BACKLOG_OVERFLOW)],
+        [(5, 0, LAGGING), (10, 1, DISCONNECT_BACKLOG_OVERFLOW), (5, 2, LAGGING)],
+    ], ids=['healthy', 'resume-at-half', 'caught-up-at-once', 'slow-consumer', 'slow-while-draining',
+            'overflow', 'overflow-then-reconnect'])
+    def test_transitions(self, steps):
+        backpressure = policy()
+        assert [outcome(backpressure, backlog, now) for backlog, now, _ in steps] == \
+            [expected for _, _, expected in steps]
+
+    def test_counters(self):
+        backpressure = policy()
+        backpressure.evaluate({'a': 5, 'b': 10}, 0)
+        backpressure.evaluate({'a': 1}, 1)
+        backpressure.note_dropped(3)
+        assert backpressure.get_stats() == {
+            'lagging_clients': 0,
+            'dropped': {'lagging': 3},
+            'disconnects': {DISCONNECT_SLOW_CONSUMER: 0, DISCONNECT_BACKLOG_OVERFLOW: 1},
+            'resyncs': 1
+        }
+
+    def test_removed_client_starts_fresh(self):
+        backpressure = policy()
+        backpressure.evaluate({'sid': 5}, 0)
+        backpressure.remove_client('sid')
+        assert outcome(backpressure, 5, 40) == LAGGING
+
+
+class _Manager:
+
+    def eio_sid_from_sid(self, sid, namespace):
+        return {'sid': 'eio-sid'}.get(sid)
+
+
+class _Socket:
+
+    def __init__(self, depth):
+        self.queue = queue.Queue()
+        for _ in range(depth):
+            self.queue.put(None)
+
+
+class _Engine:
+
+    def __init__(self, sockets):
+        self.sockets = sockets
+
+    def _get_socket(self, eio_sid):
+        return self.sockets[eio_sid]
+
+
+class _Server:
+
+    def __init__(self, eio):
+        self.manager = _Manager()
+        self.eio = eio
+
+
+class TestTransportBacklog:
+
+    @pytest.fixture(autouse=True)
+    def fresh_warning(self, monkeypatch):
+        monkeypatch.setattr(client_backpressure, '_internals_missing_logged', False)
+
+    def test_reads_queue_depth(self):
+        assert transport_backlog(_Server(_Engine({'eio-sid': _Socket(3)})), 'sid') == 3
+
+    def test_gone_client_is_zero(self):
+        server = _Server(_Engine({}))
+        assert transport_backlog(server, 'sid') == 0
+        assert transport_backlog(server, 'unknown') == 0
+
+    def test_missing_internals_log_once(self, caplog):
+        server = _Server(object())
+        with caplog.at_level(logging.WARNING, logger='client_backpressure'):
+            assert transport_backlog(server, 'sid') == 0
+            assert transport_backlog(server, 'sid') == 0
+        assert len(caplog.records) == 1
+
+    def test_socket_without_queue_is_zero(self, caplog):
+        with caplog.at_level(logging.WARNING, logger='client_backpressure'):
+            assert transport_backlog(_Server(_Engine({'eio-sid': object()})), 'sid') == 0
+        assert 'no packet queue' in caplog.text
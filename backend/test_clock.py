@@ -0,0 +1,41 @@
+"""
+Behaviour tests for the injectable clocks.
+"""
+
+from datetime import datetime
+
+import pytest
+
+from clock import Clock, VirtualClock
+
+
+class TestClock:
+
+    def test_clock_is_abstract(self):
+        with pytest.raises(TypeError):
+            Clock()
+
+    def test_incomplete_clock_cannot_be_built(self):
+        class NowOnly(Clock):
+            def now(self):
+                return datetime(2024, 1, 1)
+
+        with pytest.raises(TypeError):
+            NowOnly()
+
+
+class TestVirtualClock:
+
+    def test_sleep_advances_instead_of_waiting(self):
+        clock = VirtualClock(datetime(2024, 1, 1, 23, 0))
+        clock.sleep(90)
+        assert clock.monotonic() == 90
+        assert clock.now() == datetime(2024, 1, 1, 23, 1, 30)
+        assert clock.time() == datetime(2024, 1, 1, 23, 1, 30).timestamp()
+
+    def test_never_moves_backwards(self):
+        clock = VirtualClock(datetime(2024, 1, 1, 23, 0))
+        clock.advance_to(datetime(2024, 1, 1, 23, 5))
+        clock.advance_to(datetime(2024, 1, 1, 23, 1))
+        clock.advance(-10)
+        assert clock.now() == datetime(2024, 1, 1, 23, 5)
@@ -0,0 +1,133 @@
+"""
+Behaviour tests for command coalescing, priority scheduling and rate limiting.
+
+The dispatcher runs without its threads: a VirtualClock moves time and
+``dispatch_due`` sends the due batches on the test thread.
+"""
+
+import pytest
+
+from clock import VirtualClock
+from command_dispatcher import (PRIORITY_CRITICAL, PRIORITY_ROUTINE, PRIORITY_WARNING, CommandDispatcher,
+                                TokenBucket)
+
+
+class _RecordingManager:
+
+    def __init__(self):
+        self.sent = []
+
+    def send_command(self, device_id, commands, timeout=None, should_abort=None):
+        self.sent.append((device_id, {c['code']: c['value'] for c in commands['commands']}))
+        return True
+
+
+def commands(**codes):
+    return {'commands': [{'code': code, 'value': value} for code, value in codes.items()]}
+
+
+@pytest.fixture
+def clock():
+    return VirtualClock()
+
+
+@pytest.fixture
+def manager():
+    return _RecordingManager()
+
+
+def dispatcher(manager, clock, **kwargs) -> CommandDispatcher:
+    return CommandDispatcher(manager, coalesce_window_seconds=0.15, clock=clock, **kwargs)
+
+
+class TestCoalescing:
+
+    def test_commands_within_window_are_merged(self, manager, clock):
+        d = dispatcher(manager, clock)
+        d.submit('bulb', commands(switch_led=True, work_mode='white'))
+        clock.advance(0.1)
+        d.submit('bulb', commands(work_mode='scene'))
+        assert d.dispatch_due() == 0
+
+        clock.advance(0.05)
+        assert d.dispatch_due() == 1
+        assert manager.sent == [('bulb', {'switch_led': True, 'work_mode': 'scene'})]
+        stats = d.get_stats()
+        assert stats['coalesced'] == 1
+        assert stats['superseded_codes'] == 1
+
+    def test_devices_are_batched_separately(self, manager, clock):
+        d = dispatcher(manager, clock)
+        d.submit('bulb', commands(switch_led=True))
+        d.submit('siren', commands(alarm_switch=True))
+        clock.advance(d.next_flush_at() - clock.monotonic())
+        assert d.dispatch_due() == 2
+        assert sorted(device for device, _ in manager.sent) == ['bulb', 'siren']
+
+    def test_unknown_priority_is_rejected(self, manager, clock):
+        with pytest.raises(ValueError):
+            dispatcher(manager, clock).submit('bulb', commands(switch_led=True), priority='urgent')
+
+
+class TestPriority:
+
+    def test_critical_skips_window(self, manager, clock):
+        d = dispatcher(manager, clock)
+        d.submit('siren', commands(alarm_switch=True), priority=PRIORITY_CRITICAL)
+        assert d.dispatch_due() == 1
+
+    def test_critical_keeps_codes_it_does_not_override(self, manager, clock):
+        d = dispatcher(manager, clock)
+        d.submit('bulb', commands(switch_led=True, work_mode='white', bright_value=20),
+                 priority=PRIORITY_WARNING)
+        d.submit('bulb', commands(work_mode='scene'), priority=PRIORITY_CRITICAL)
+        assert d.dispatch_due() == 1
+        assert manager.sent == [('bulb', {'switch_led': True, 'bright_value': 20, 'work_mode': 'scene'})]
+        assert d.get_stats()['cancelled'] == 1
+
+    def test_due_batches_are_sent_most_urgent_first(self, manager, clock):
+        d = dispatcher(manager, clock)
+        d.submit('lamp', commands(switch_led=True), priority=PRIORITY_ROUTINE)
+        d.submit('bulb', commands(switch_led=True), priority=PRIORITY_WARNING)
+        clock.advance(0.15)
+        d.submit('siren', commands(alarm_switch=True), priority=PRIORITY_CRITICAL)
+        d.dispatch_due()
+        assert [device for device, _ in manager.sent] == ['siren', 'bulb', 'lamp']
+
+
+class TestTokenBucket:
+
+    def test_reserved_tokens_are_for_critical_only(self):
+        bucket = TokenBucket(rate_per_second=1.0, burst=3, reserved_tokens=2, now=0.0)
+        assert bucket.try_take(False, 0.0) == 0.0
+        # One token left above the floor of 2 reserved: routine must wait
+        assert bucket.try_take(False, 0.0) == pytest.approx(1.0)
+        assert bucket.try_take(True, 0.0) == 0.0
+        assert bucket.try_take(True, 0.0) == 0.0
+        assert bucket.try_take(True, 0.0) == pytest.approx(1.0)
+
+    def test_refills_at_rate(self):
+        bucket = TokenBucket(rate_per_second=2.0, burst=1, now=0.0)
+        assert bucket.try_take(False, 0.0) == 0.0
+        assert bucket.try_take(False, 0.25) == pytest.approx(0.25)
+        assert bucket.try_take(False, 0.5) == 0.0
+
+    def test_unlimited_rate(self):
+        bucket = TokenBucket(rate_per_second=0.0, burst=1, now=0.0)
+        assert all(bucket.try_take(False, 0.0) == 0.0 for _ in range(100))
+
+    def test_dispatcher_holds_routine_batch_until_refill(self, manager, clock):
+        d = dispatcher(manager, clock, rate_limit_per_second=1.0, rate_limit_burst=2,
+                       critical_reserved_tokens=1.0)
+        d.submit('bulb', commands(switch_led=True))
+        d.submit('lamp', commands(switch_led=True))
+        clock.advance(0.15)
+        assert d.dispatch_due() == 1
+        # The reserved token still lets a critical command through at once
+        d.submit('siren', commands(alarm_switch=True), priority=PRIORITY_CRITICAL)
+        assert d.dispatch_due() == 1
+        clock.advance(1.0)
+        assert d.dispatch_due() == 0
+        clock.advance(1.0)
+        assert d.dispatch_due() == 1
+        assert [device for device, _ in manager.sent] == ['bulb', 'siren', 'lamp']
@@ -0,0 +1,190 @@
+"""
+Behaviour tests for configuration reloads: change detection by the
+config watcher, and the agent's reload applying, rejecting or (when a
+pipeline stage does not run its swap in time) deferring a configuration.
+
+The reload tests drive a full AIAgent, so they need the server
+dependencies and a config.py (see config.example.py); they are skipped
+without them. The watcher tests always run.
+"""
+
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from config_reload import ConfigWatcher
+
+DEVICES = dict(
+    client_id='client',
+    secret_key='secret',
+    living_room_motion_id='motion1',
+    window_vibration_id='window1',
+    front_door_lock_id='lock1',
+    smart_bulb_id='bulb1',
+    siren_id='siren1'
+)
+
+
+def touch(path: str, mtime: float) -> None:
+    with open(path, 'a', encoding='utf-8'):
+        pass
+    os.utime(path, (mtime, mtime))
+
+
+class TestConfigWatcher:
+    def test_reports_modified_created_and_removed_files(self, tmp_path):
+        modified = str(tmp_path / 'devices.json')
+        removed = str(tmp_path / 'sites.json')
+        created = str(tmp_path / 'protocols.json')
+        touch(modified, 1000.0)
+        touch(removed, 1000.0)
+        watcher = ConfigWatcher(interval_seconds=5.0)
+        watcher.watch([modified, removed, created, ''])
+        assert watcher.paths() == sorted([modified, removed, created])
+        assert watcher.poll(now=100.0) == []
+
+        touch(modified, 2000.0)
+        os.remove(removed)
+        touch(created, 1000.0)
+        assert sorted(watcher.poll(now=105.0)) == sorted([modified, removed, created])
+        # Each change is reported once
+        assert watcher.poll(now=110.0) == []
+
+    def test_checks_once_per_interval(self, tmp_path):
+        path = str(tmp_path / 'devices.json')
+        touch(path, 1000.0)
+        watcher = ConfigWatcher(interval_seconds=5.0)
+        watcher.watch([path])
+        assert watcher.poll(now=100.0) == []
+
+        touch(path, 2000.0)
+        assert watcher.poll(now=102.0) == []
+        assert watcher.poll(now=105.0) == [path]
+
+    def test_zero_interval_never_checks(self, tmp_path):
+        path = str(tmp_path / 'devices.json')
+        touch(path, 1000.0)
+        watcher = ConfigWatcher(interval_seconds=0)
+        watcher.watch([path])
+        touch(path, 2000.0)
+        assert watcher.poll(now=100.0) == []
+
+
+def write_sites(path, homes) -> str:
+    entries = [
+        {'home': home, 'devices': [
+            {'id': f'{home}-motion', 'type': 'motion', 'zone': 'LivingRoom'},
+            {'id': f'{home}-window', 'type': 'window', 'zone': 'Bedroom'},
+            {'id': f'{home}-siren', 'type': 'siren', 'zone': 'LivingRoom'}
+        ]}
+        for home in homes
+    ]
+    path.write_text(json.dumps(entries))
+    return str(path)
+
+
+def make_config(tmp_path, sites_file: str, **settings) -> SimpleNamespace:
+    return SimpleNamespace(
+        **DEVICES,
+        home_id='home',
+        sites_file=sites_file,
+        snapshot_path=str(tmp_path / 'securex_state.snap'),
+        webhook_url='',
+        journal_dir='',
+        broadcast_workers=0,
+        config_watch_interval_seconds=0,
+        **settings
+    )
+
+
+@pytest.fixture
+def reload_env(tmp_path, monkeypatch):
+    """A running agent with sites 'cabin' and 'office', and a slot for the next config.py."""
+    pytest.importorskip('flask_socketio')
+    pytest.importorskip('tuya_connector')
+    pytest.importorskip('config')
+    import ai_agent
+    from clock import VirtualClock
+    from replay import ReplaySink, ReplayTransport
+
+    clock = VirtualClock()
+    sites_file = write_sites(tmp_path / 'sites.json', ['cabin', 'office'])
+    agent = ai_agent.AIAgent(
+        config=make_config(tmp_path, sites_file),
+        clock=clock,
+        tuya_manager=ReplayTransport(clock),
+        broadcast_sink=ReplaySink(clock)
+    )
+    agent.initialize_components()
+    saved = []
+    monkeypatch.setattr(agent, '_save_site', lambda site: saved.append(site.home_id))
+    env = SimpleNamespace(agent=agent, saved=saved, next_config=None, tmp_path=tmp_path)
+    monkeypatch.setattr(ai_agent, 'load_fresh_config', lambda: env.next_config)
+    return env
+
+
+class TestReloadConfig:
+    def test_applies_thresholds_and_adds_and_removes_sites(self, reload_env):
+        agent = reload_env.agent
+        cabin = agent.sites['cabin']
+        sites_file = write_sites(reload_env.tmp_path / 'sites.json', ['cabin', 'lake'])
+        reload_env.next_config = make_config(reload_env.tmp_path, sites_file, critical_threat_threshold=90.0)
+
+        assert agent.reload_config('SIGHUP')
+
+        # The running site is kept and gets the new thresholds
+        assert agent.sites['cabin'] is cabin
+        assert cabin.threat_analyzer.critical_threshold == 90.0
+        assert cabin.response_orchestrator.alarm_state.critical_threshold == 90.0
+        assert sorted(agent.sites) == ['cabin', 'home', 'lake']
+        assert agent.device_sites['lake-motion'] is agent.sites['lake']
+        assert 'office-motion' not in agent.device_sites
+        assert 'office-motion' not in agent.device_registry
+        assert reload_env.saved == ['office']
+        assert agent.config_generation == 2
+
+    def test_invalid_sites_file_keeps_the_running_config(self, reload_env):
+        agent = reload_env.agent
+        config = agent.config
+        sites = dict(agent.sites)
+        (reload_env.tmp_path / 'sites.json').write_text(json.dumps([{'devices': []}]))
+        reload_env.next_config = make_config(reload_env.tmp_path, str(reload_env.tmp_path / 'sites.json'),
+                                             critical_threat_threshold=90.0)
+
+        assert not agent.reload_config('sites.json')
+
+        assert agent.config is config
+        assert agent.sites == sites
+        assert agent.sites['cabin'].threat_analyzer.critical_threshold == 80.0
+        assert reload_env.saved == []
+        assert agent.config_generation == 1
+
+    def test_stage_timeout_defers_the_rest_of_the_reload(self, reload_env, monkeypatch):
+        agent = reload_env.agent
+        late_swaps = []
+
+        def timed_out_call(function, timeout=10.0):
+            late_swaps.append(function)
+            return False
+
+        monkeypatch.setattr(agent.response_stage, 'call', timed_out_call)
+        sites_file = write_sites(reload_env.tmp_path / 'sites.json', ['cabin'])
+        reload_env.next_config = make_config(reload_env.tmp_path, sites_file)
+
+        assert not agent.reload_config('SIGHUP')
+
+        # Removed sites stay saved and subscribed until both swaps have run
+        assert reload_env.saved == []
+        assert 'office-motion' in agent.device_registry
+        assert agent.config_generation == 1
+        assert not agent.finish_pending_reload()
+
+        late_swaps[0]()
+        assert agent.finish_pending_reload()
+        assert sorted(agent.sites) == ['cabin', 'home']
+        assert 'office-motion' not in agent.device_registry
+        assert reload_env.saved == ['office']
+        assert agent.config_generation == 2
+        assert agent.finish_pending_reload()
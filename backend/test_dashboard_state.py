@@ -0,0 +1,82 @@
+"""
+Behaviour tests for the versioned dashboard model (snapshot plus deltas).
+"""
+
+from dashboard_state import DashboardState, normalize_state
+
+MOTION = {'type': 'motion', 'name': 'Hall Motion', 'location': 'Hallway', 'zone': 'Hallway'}
+BULB = {'type': 'bulb', 'name': 'Smart Bulb', 'location': 'Bedroom', 'zone': 'Bedroom'}
+
+
+class TestApplyDevice:
+
+    def test_first_report_carries_the_description(self):
+        state = DashboardState(home='home')
+        delta = state.apply_device('m1', MOTION, [{'code': 'pir_state', 'value': 'pir'}], '2024-01-01T23:00:00')
+        assert delta == {
+            'version': 1, 'device_id': 'm1', 'device_type': 'motion', 'zone': 'Hallway',
+            'state': {'pir_state': 'pir'}, 'timestamp': '2024-01-01T23:00:00',
+            'device_name': 'Hall Motion', 'location': 'Hallway', 'home': 'home'
+        }
+
+    def test_returns_only_changed_datapoints(self):
+        state = DashboardState()
+        state.apply_device('b1', BULB, {'switch_led': True, 'bright_value': 20}, '2024-01-01T23:00:00')
+        delta = state.apply_device('b1', BULB, {'switch_led': True, 'bright_value': 80}, '2024-01-01T23:00:01')
+        assert delta['state'] == {'bright_value': 80}
+        assert 'device_name' not in delta
+        assert state.devices['b1']['state'] == {'switch_led': True, 'bright_value': 80}
+
+    def test_unchanged_report_is_none(self):
+        state = DashboardState()
+        state.apply_device('b1', BULB, {'switch_led': True}, '2024-01-01T23:00:00')
+        assert state.apply_device('b1', BULB, {'switch_led': True}, '2024-01-01T23:00:05') is None
+        assert state.apply_device('b1', BULB, {}, '2024-01-01T23:00:05') is None
+        assert state.version == 1
+        assert state.devices['b1']['timestamp'] == '2024-01-01T23:00:00'
+
+    def test_every_change_bumps_the_version(self):
+        state = DashboardState()
+        versions = [
+            state.apply_status('YELLOW_WARNING', 'Hallway')['version'],
+            state.apply_device('m1', MOTION, {'pir_state': 'pir'}, '2024-01-01T23:00:00')['version'],
+            state.apply_device('m1', MOTION, {'pir_state': 'none'}, '2024-01-01T23:00:01')['version']
+        ]
+        assert versions == [1, 2, 3]
+        assert state.snapshot()['version'] == 3
+
+    def test_normalize_state(self):
+        assert normalize_state(None) == {}
+        assert normalize_state([{'code': 'a', 'value': 1}, {'value': 2}, 'junk']) == {'a': 1}
+
+
+class TestMirror:
+
+    def test_snapshot_plus_deltas_reproduce_the_publisher(self):
+        publisher = DashboardState(home='home')
+        publisher.apply_device('m1', MOTION, {'pir_state': 'pir'}, '2024-01-01T23:00:00')
+        publisher.apply_status('YELLOW_WARNING', 'Hallway')
+
+        mirror = DashboardState(home='home')
+        mirror.load_snapshot(publisher.snapshot())
+        deltas = [
+            ('device_update', publisher.apply_device('m1', MOTION, {'pir_state': 'none'}, '2024-01-01T23:00:05')),
+            ('device_update', publisher.apply_device('b1', BULB, {'switch_led': True}, '2024-01-01T23:00:06')),
+            ('status_update', publisher.apply_status('RED_CRITICAL', 'HOUSE'))
+        ]
+        for event, data in deltas:
+            mirror.apply_message(event, data)
+        assert mirror.snapshot() == publisher.snapshot()
+
+    def test_snapshot_is_a_copy(self):
+        publisher = DashboardState()
+        publisher.apply_device('m1', MOTION, {'pir_state': 'pir'}, '2024-01-01T23:00:00')
+        mirror = DashboardState()
+        mirror.load_snapshot(publisher.snapshot())
+        publisher.apply_device('m1', MOTION, {'pir_state': 'none'}, '2024-01-01T23:00:05')
+        assert mirror.devices['m1']['state'] == {'pir_state': 'pir'}
+
+    def test_unknown_event_is_ignored(self):
+        mirror = DashboardState()
+        mirror.apply_message('protocol_executed', {'version': 99})
+        assert mirror.version == 0
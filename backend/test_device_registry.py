@@ -0,0 +1,62 @@
+"""
+Behaviour tests for the device registry and device file parsing.
+"""
+
+import pytest
+
+from device_registry import DeviceRegistry, make_device, parse_devices
+
+
+def entry(device_id, device_type='motion', zone='Hallway', **extra):
+    return {'id': device_id, 'type': device_type, 'zone': zone, **extra}
+
+
+class TestParseDevices:
+
+    def test_defaults_and_roles(self):
+        devices = parse_devices([entry('m1'), entry('b1', 'bulb', home='cabin', name='Porch')], 'home')
+        assert [(d.device_id, d.role, d.name, d.location, d.home) for d in devices] == [
+            ('m1', 'sensor', 'motion', 'Hallway', 'home'),
+            ('b1', 'actuator', 'Porch', 'Hallway', 'cabin')
+        ]
+
+    @pytest.mark.parametrize('missing', ['id', 'type', 'zone'])
+    def test_missing_field_is_rejected(self, missing):
+        bad = entry('m1')
+        del bad[missing]
+        with pytest.raises(ValueError, match="needs 'id', 'type' and 'zone'"):
+            parse_devices([bad], 'home')
+
+    def test_unknown_type_is_rejected(self):
+        with pytest.raises(ValueError, match="Unknown device type 'camera'"):
+            parse_devices([entry('c1', 'camera')], 'home')
+
+    def test_duplicate_id_is_rejected(self):
+        with pytest.raises(ValueError, match='repeats device ID m1'):
+            parse_devices([entry('m1'), entry('m1', 'window')], 'home')
+
+    def test_must_be_a_list(self):
+        with pytest.raises(ValueError, match='must be a JSON list'):
+            parse_devices({'id': 'm1'}, 'home')
+
+
+class TestDeviceRegistry:
+
+    def test_lookups(self):
+        registry = DeviceRegistry(parse_devices(
+            [entry('m1'), entry('w1', 'window', 'Bedroom'), entry('b1', 'bulb', 'Bedroom')], 'home'))
+        assert registry.ids() == ('m1', 'w1', 'b1')
+        assert registry.is_sensor('w1') and not registry.is_sensor('b1')
+        assert registry.ids_in_zone('Bedroom') == ('w1', 'b1')
+        assert registry.ids_of_type('motion', 'window') == ('m1', 'w1')
+        assert registry.first('siren') is None
+
+    def test_duplicate_registration_is_rejected(self):
+        device = make_device('m1', 'motion', 'Hallway', 'home')
+        with pytest.raises(ValueError, match='registered twice'):
+            DeviceRegistry([device, device])
+
+    def test_repeated_names_get_distinct_keys(self):
+        registry = DeviceRegistry(parse_devices(
+            [entry('m1', name='Motion'), entry('m2', name='Motion'), entry('m3', name='Motion')], 'home'))
+        assert registry.name_map() == {'Motion': 'm1', 'Motion (m2)': 'm2', 'Motion (m3)': 'm3'}
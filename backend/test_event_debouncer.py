@@ -0,0 +1,85 @@
+"""
+Behaviour tests for the per-device debounce and dedup stage.
+"""
+
+from datetime import datetime, timedelta
+
+from event_debouncer import (REASON_BURST, REASON_DUPLICATE, REASON_RETRIGGER, DebounceRule,
+                             EventDebouncer)
+
+T0 = datetime(2024, 1, 1, 23, 0)
+PIR = {'pir_state': 'pir'}
+IDLE = {'pir_state': 'none'}
+
+
+def at(seconds: float) -> datetime:
+    return T0 + timedelta(seconds=seconds)
+
+
+class TestEventDebouncer:
+
+    def test_first_event_is_accepted(self):
+        debouncer = EventDebouncer()
+        assert debouncer.should_process('motion', PIR, at(0))
+        assert debouncer.get_stats()['accepted'] == 1
+
+    def test_identical_consecutive_values_are_collapsed(self):
+        debouncer = EventDebouncer()
+        assert debouncer.should_process('motion', PIR, at(0))
+        assert not debouncer.should_process('motion', dict(PIR), at(30))
+        assert debouncer.suppressed_counts['motion'] == {REASON_DUPLICATE: 1}
+
+    def test_tuya_status_lists_compare_by_datapoint(self):
+        debouncer = EventDebouncer()
+        assert debouncer.should_process('motion', [{'code': 'pir_state', 'value': 'pir'}], at(0))
+        assert not debouncer.should_process('motion', PIR, at(30))
+
+    def test_changed_datapoint_is_accepted(self):
+        debouncer = EventDebouncer()
+        assert debouncer.should_process('motion', PIR, at(0))
+        assert debouncer.should_process('motion', IDLE, at(30))
+        assert debouncer.should_process('motion', PIR, at(60))
+
+    def test_trigger_after_suppressed_reset_is_not_a_duplicate(self):
+        # The reset to 'none' is suppressed as a retrigger, but it was seen:
+        # the next real 'pir' must get through
+        debouncer = EventDebouncer(DebounceRule(min_retrigger_seconds=2.0))
+        assert debouncer.should_process('motion', PIR, at(0))
+        assert not debouncer.should_process('motion', IDLE, at(1.5))
+        assert debouncer.suppressed_counts['motion'] == {REASON_RETRIGGER: 1}
+        assert debouncer.should_process('motion', PIR, at(900))
+
+    def test_min_retrigger_interval(self):
+        debouncer = EventDebouncer(DebounceRule(min_retrigger_seconds=2.0, collapse_identical=False))
+        assert debouncer.should_process('motion', PIR, at(0))
+        assert not debouncer.should_process('motion', PIR, at(1.9))
+        assert debouncer.should_process('motion', PIR, at(2.0))
+
+    def test_burst_accepts_leader_until_quiet(self):
+        rule = DebounceRule(collapse_identical=False, burst_window_seconds=1.0)
+        debouncer = EventDebouncer(rule)
+        assert debouncer.should_process('window', {'shock': 1}, at(0))
+        assert not debouncer.should_process('window', {'shock': 2}, at(0.5))
+        assert not debouncer.should_process('window', {'shock': 3}, at(1.2))
+        assert debouncer.should_process('window', {'shock': 4}, at(2.5))
+        assert debouncer.suppressed_counts['window'] == {REASON_BURST: 2}
+
+    def test_device_rules_override_default(self):
+        debouncer = EventDebouncer(DebounceRule(min_retrigger_seconds=10.0),
+                                   {'window': DebounceRule(collapse_identical=False)})
+        assert debouncer.should_process('window', {'shock': 1}, at(0))
+        assert debouncer.should_process('window', {'shock': 1}, at(1))
+        assert debouncer.should_process('motion', PIR, at(0))
+        assert not debouncer.should_process('motion', IDLE, at(1))
+
+    def test_devices_are_independent(self):
+        debouncer = EventDebouncer()
+        assert debouncer.should_process('a', PIR, at(0))
+        assert debouncer.should_process('b', PIR, at(0))
+
+    def test_reset_forgets_device(self):
+        debouncer = EventDebouncer()
+        assert debouncer.should_process('motion', PIR, at(0))
+        debouncer.reset('motion')
+        assert debouncer.should_process('motion', PIR, at(1))
+        assert debouncer.get_suppressed_total() == 0
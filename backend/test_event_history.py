@@ -0,0 +1,107 @@
+"""
+Behaviour tests for the event history ring buffer and its cursor paging.
+"""
+
+from event_history import KIND_CLASSIFICATION, KIND_SENSOR_EVENT, EventHistory
+
+
+def fill(history: EventHistory, count: int):
+    for n in range(count):
+        history.record(KIND_SENSOR_EVENT, '2024-01-01T23:00:00', device_id=f"d{n % 2}", zone='Hall')
+
+
+def seqs(records):
+    return [record['seq'] for record in records]
+
+
+def mirror_record(seq: int):
+    return {'seq': seq, 'kind': KIND_SENSOR_EVENT, 'timestamp': '2024-01-01T23:00:00'}
+
+
+class TestPaging:
+
+    def test_pages_follow_the_cursor(self):
+        history = EventHistory(capacity=10)
+        fill(history, 7)
+        page, cursor = history.query(limit=3)
+        assert (seqs(page), cursor) == ([1, 2, 3], 3)
+        page, cursor = history.query(since=cursor, limit=3)
+        assert (seqs(page), cursor) == ([4, 5, 6], 6)
+        page, cursor = history.query(since=cursor, limit=3)
+        assert (seqs(page), cursor) == ([7], 7)
+        assert history.query(since=cursor) == ([], 7)
+
+    def test_paging_across_evictions(self):
+        history = EventHistory(capacity=5)
+        fill(history, 3)
+        _, cursor = history.query(limit=2)
+        fill(history, 20)
+        # Records 3..18 were evicted meanwhile: continue from the oldest retained
+        page, cursor = history.query(since=cursor, limit=2)
+        assert (seqs(page), cursor) == ([19, 20], 20)
+        page, cursor = history.query(since=cursor)
+        assert (seqs(page), cursor) == ([21, 22, 23], 23)
+        assert seqs(history.records()) == [19, 20, 21, 22, 23]
+        assert len(history._buffer) <= 2 * history.capacity
+
+    def test_filters(self):
+        history = EventHistory()
+        fill(history, 4)
+        history.record(KIND_CLASSIFICATION, status='RED_CRITICAL', zone='HOUSE', home='cabin')
+        assert seqs(history.query(device_id='d1')[0]) == [2, 4]
+        assert seqs(history.query(kinds=(KIND_CLASSIFICATION,))[0]) == [5]
+        assert seqs(history.query(zone='Hall')[0]) == [1, 2, 3, 4]
+        assert seqs(history.query(status='RED_CRITICAL', home='cabin')[0]) == [5]
+        assert history.query(home='home') == ([], 5)
+
+    def test_filtered_cursor_skips_scanned_records(self):
+        history = EventHistory()
+        fill(history, 6)
+        page, cursor = history.query(device_id='d0', limit=2)
+        assert (seqs(page), cursor) == ([1, 3], 3)
+
+
+class TestAppendRecord:
+
+    def test_out_of_order_and_duplicates(self):
+        history = EventHistory()
+        for seq in (1, 3, 2, 3, 4, 2):
+            history.append_record(mirror_record(seq))
+        assert seqs(history.records()) == [1, 2, 3, 4]
+        assert history.last_seq == 4
+
+    def test_late_record_on_a_full_buffer_evicts_the_oldest(self):
+        history = EventHistory(capacity=3)
+        for seq in (1, 2, 4):
+            history.append_record(mirror_record(seq))
+        history.append_record(mirror_record(3))
+        assert seqs(history.records()) == [2, 3, 4]
+        # Older than everything retained: dropped
+        history.append_record(mirror_record(1))
+        assert seqs(history.records()) == [2, 3, 4]
+
+    def test_cursor_steps_back_over_gaps(self):
+        history = EventHistory()
+        history.load([mirror_record(seq) for seq in (10, 20, 30)])
+        assert seqs(history.query(since=15)[0]) == [20, 30]
+        assert seqs(history.query(since=0)[0]) == [10, 20, 30]
+
+
+class TestEtag:
+
+    def test_changes_only_on_append(self):
+        history = EventHistory(capacity=3)
+        fill(history, 3)
+        etag = history.etag('events', 0, 100)
+        history.query()
+        assert history.etag('events', 0, 100) == etag
+        assert history.etag('events', 0, 50) != etag
+        fill(history, 1)
+        assert history.etag('events', 0, 100) != etag
+
+    def test_duplicate_mirror_record_keeps_the_etag(self):
+        history = EventHistory()
+        history.append_record(mirror_record(1))
+        etag = history.etag()
+        history.append_record(mirror_record(1))
+        assert history.etag() == etag
@@ -0,0 +1,99 @@
+"""
+Behaviour tests for the event journal writer and reader.
+"""
+
+import os
+
+from event_journal import (_SEGMENT_HEADER, RECORD_CLASSIFICATION, RECORD_EVENT, RECORD_RAW, EventJournal,
+                           JournalReader, encode_record, list_segments)
+
+SEGMENT_HEADER_SIZE = _SEGMENT_HEADER.size
+
+
+def write(directory, records, **kwargs) -> EventJournal:
+    journal = EventJournal(str(directory), **kwargs)
+    journal.start()
+    for record_type, payload in records:
+        journal.append(record_type, payload, timestamp=1000.0)
+    assert journal.flush()
+    journal.close()
+    return journal
+
+
+def read(directory, **kwargs):
+    return [(record.seq, record.type, record.payload)
+            for record in JournalReader(str(directory)).records(**kwargs)]
+
+
+class TestEventJournal:
+
+    def test_round_trip(self, tmp_path):
+        write(tmp_path, [(RECORD_RAW, {'n': 1}), (RECORD_EVENT, {'n': 2}), (RECORD_CLASSIFICATION, {'n': 3})])
+        assert read(tmp_path) == [(1, 'raw', {'n': 1}), (2, 'event', {'n': 2}), (3, 'classification', {'n': 3})]
+        assert read(tmp_path, types=['event']) == [(2, 'event', {'n': 2})]
+        assert read(tmp_path, since_seq=2) == [(3, 'classification', {'n': 3})]
+
+    def test_restart_continues_sequence_in_new_segment(self, tmp_path):
+        write(tmp_path, [(RECORD_RAW, {'n': 1}), (RECORD_RAW, {'n': 2})])
+        write(tmp_path, [(RECORD_RAW, {'n': 3})])
+        assert [seq for seq, _, _ in read(tmp_path)] == [1, 2, 3]
+        assert len(list_segments(str(tmp_path))) == 2
+
+    def test_segments_rotate_at_size(self, tmp_path):
+        write(tmp_path, [(RECORD_RAW, {'pad': 'x' * 100}) for _ in range(10)], segment_bytes=400)
+        assert len(list_segments(str(tmp_path))) > 1
+        assert [seq for seq, _, _ in read(tmp_path)] == list(range(1, 11))
+
+    def test_torn_tail_ends_segment(self, tmp_path):
+        write(tmp_path, [(RECORD_RAW, {'n': 1}), (RECORD_RAW, {'n': 2})])
+        segment = list_segments(str(tmp_path))[-1]
+        # Crash mid-write: half of a third record
+        with open(segment, 'ab') as f:
+            f.write(encode_record(3, RECORD_RAW, 1000.0, {'n': 3})[:20])
+        reader = JournalReader(str(tmp_path))
+        assert [record.seq for record in reader.records()] == [1, 2]
+        assert reader.torn_records == 1
+
+        # The writer resumes after the last complete record
+        write(tmp_path, [(RECORD_RAW, {'n': 'next'})])
+        assert read(tmp_path)[-1] == (3, 'raw', {'n': 'next'})
+
+    def test_corrupt_record_of_unwanted_type_ends_segment(self, tmp_path):
+        write(tmp_path, [(RECORD_RAW, {'n': 1}), (RECORD_EVENT, {'n': 2}), (RECORD_RAW, {'n': 3})])
+        segment = list_segments(str(tmp_path))[0]
+        first_length = len(encode_record(1, RECORD_RAW, 1000.0, {'n': 1}))
+        with open(segment, 'r+b') as f:
+            # Flip a payload byte of the raw record
+            f.seek(SEGMENT_HEADER_SIZE + first_length - 3)
+            byte = f.read(1)
+            f.seek(-1, os.SEEK_CUR)
+            f.write(bytes([byte[0] ^ 0xFF]))
+        reader = JournalReader(str(tmp_path))
+        assert list(reader.records(types=['event'])) == []
+        assert reader.torn_records == 1
+
+    def test_failed_batch_is_dropped_and_writer_moves_on(self, tmp_path):
+        journal = EventJournal(str(tmp_path))
+        journal.start()
+        original_commit = journal._commit
+        failures = []
+
+        def failing_commit(chunk):
+            if not failures:
+                failures.append(chunk)
+                raise OSError('disk full')
+            original_commit(chunk)
+
+        journal._commit = failing_commit
+        journal.append(RECORD_RAW, {'n': 1})
+        assert not journal.flush()
+        stats = journal.get_stats()
+        assert stats['committed_seq'] == 0
+        assert stats['dropped'] == 1
+
+        journal.append(RECORD_RAW, {'n': 2})
+        assert journal.flush()
+        journal.close()
+        assert journal.get_stats()['committed_seq'] == 2
+        assert read(tmp_path) == [(2, 'raw', {'n': 2})]
+        assert len(list_segments(str(tmp_path))) == 2
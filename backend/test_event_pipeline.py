@@ -0,0 +1,120 @@
+"""
+Behaviour tests for the bounded pipeline stages and their overflow policies.
+"""
+
+import threading
+import time
+
+import pytest
+
+from event_pipeline import OVERFLOW_BLOCK, OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST, PipelineStage
+
+
+def collecting_stage(overflow: str, capacity: int = 2, **kwargs):
+    processed = []
+    stage = PipelineStage(f'test-{overflow}', processed.append, capacity=capacity,
+                          overflow=overflow, **kwargs)
+    return stage, processed
+
+
+class TestPipelineStage:
+
+    def test_unknown_policy_is_rejected(self):
+        with pytest.raises(ValueError):
+            PipelineStage('bad', lambda item: None, overflow='spill')
+
+    def test_drop_oldest_keeps_freshest(self):
+        stage, processed = collecting_stage(OVERFLOW_DROP_OLDEST)
+        assert all(stage.put(item) for item in (1, 2, 3))
+        assert stage.drain() == 2
+        assert processed == [2, 3]
+        assert stage.get_stats()['dropped'] == 1
+
+    def test_drop_newest_rejects_new_item(self):
+        stage, processed = collecting_stage(OVERFLOW_DROP_NEWEST)
+        assert stage.put(1) and stage.put(2)
+        assert not stage.put(3)
+        stage.drain()
+        assert processed == [1, 2]
+        assert stage.get_stats()['dropped'] == 1
+
+    def test_block_times_out_then_drops(self):
+        stage, processed = collecting_stage(OVERFLOW_BLOCK, block_timeout_seconds=0.05)
+        stage.put(1)
+        stage.put(2)
+        started = time.monotonic()
+        assert not stage.put(3)
+        assert time.monotonic() - started >= 0.05
+        stage.drain()
+        assert processed == [1, 2]
+
+    def test_non_blocking_put_never_waits(self):
+        stage, processed = collecting_stage(OVERFLOW_BLOCK, block_timeout_seconds=60.0)
+        stage.put(1)
+        stage.put(2)
+        started = time.monotonic()
+        assert not stage.put('tick', block=False)
+        assert time.monotonic() - started < 1.0
+        assert stage.get_stats()['dropped'] == 1
+
+    def test_block_waits_for_worker_to_make_room(self):
+        release = threading.Event()
+        processed = []
+
+        def slow(item):
+            release.wait(5)
+            processed.append(item)
+
+        stage = PipelineStage('test-block-room', slow, capacity=1, overflow=OVERFLOW_BLOCK,
+                              block_timeout_seconds=5.0)
+        stage.start()
+        try:
+            stage.put(1)
+            # Wait until the worker holds item 1, so the queue has one free slot
+            deadline = time.monotonic() + 5
+            while stage.depth() and time.monotonic() < deadline:
+                time.sleep(0.001)
+            stage.put(2)
+            threading.Timer(0.05, release.set).start()
+            assert stage.put(3)
+        finally:
+            release.set()
+            stage.stop()
+        assert processed == [1, 2, 3]
+        assert stage.get_stats()['dropped'] == 0
+
+    def test_fifo_order_and_failures_are_counted(self):
+        processed = []
+
+        def handler(item):
+            if item == 'bad':
+                raise RuntimeError('boom')
+            processed.append(item)
+
+        stage = PipelineStage('test-fifo', handler, capacity=10)
+        stage.start()
+        for item in (1, 'bad', 2, 3):
+            stage.put(item)
+        stage.stop()
+        assert processed == [1, 2, 3]
+        assert stage.get_stats()['failed'] == 1
+
+    def test_call_runs_on_worker_ahead_of_queue(self):
+        order = []
+        stage = PipelineStage('test-call', order.append, capacity=10)
+        assert stage.call(lambda: order.append('inline'))
+        stage.start()
+        try:
+            assert stage.call(lambda: order.append('control'))
+        finally:
+            stage.stop()
+        assert order == ['inline', 'control']
+
+    def test_drain_refuses_running_stage(self):
+        stage, _ = collecting_stage(OVERFLOW_DROP_OLDEST)
+        stage.start()
+        try:
+            with pytest.raises(RuntimeError):
+                stage.drain()
+        finally:
+            stage.stop()
@@ -0,0 +1,92 @@
+"""
+Behaviour tests for latency traces and the broadcast span.
+"""
+
+import time
+
+import pytest
+
+from broadcast_aggregator import BroadcastAggregator
+from latency_tracing import Tracer, configure_tracing
+
+
+def count(tracer: Tracer, stage: str) -> int:
+    return tracer.summary().get(stage, {}).get('count', 0)
+
+
+class _Server:
+
+    def __init__(self):
+        self.events = []
+        self.frames = []
+
+    def emit(self, event, data):
+        self.events.append((event, data))
+
+    def emit_device_frame(self, updates):
+        self.frames.append(updates)
+
+
+@pytest.fixture
+def tracer():
+    return configure_tracing()
+
+
+class TestTracer:
+
+    def test_trace_ends_once(self):
+        tracer = Tracer()
+        trace_id = tracer.start_trace()
+        tracer.end_trace(trace_id)
+        tracer.end_trace(trace_id)
+        assert count(tracer, 'end_to_end') == 1
+
+    def test_trace_ends_on_last_expected_command(self):
+        tracer = Tracer()
+        trace_id = tracer.start_trace()
+        tracer.expect_ends(trace_id, 2)
+        tracer.end_trace(trace_id, device_id='bulb')
+        assert count(tracer, 'end_to_end') == 0
+        time.sleep(0.01)
+        tracer.end_trace(trace_id, device_id='siren')
+        assert count(tracer, 'end_to_end') == 1
+        assert tracer.summary()['end_to_end']['max_ms'] >= 10
+
+    def test_expect_on_unknown_trace_is_ignored(self):
+        tracer = Tracer()
+        tracer.expect_ends('nope', 3)
+        tracer.expect_ends(None, 3)
+        assert tracer._remaining_ends == {}
+
+    def test_evicted_trace_forgets_expected_ends(self):
+        tracer = Tracer(max_open_traces=1)
+        first = tracer.start_trace()
+        tracer.expect_ends(first, 2)
+        tracer.start_trace()
+        assert first not in tracer._remaining_ends
+
+
+class TestBroadcastSpan:
+
+    def test_immediate_event_records_span(self, tracer):
+        server = _Server()
+        aggregator = BroadcastAggregator(server, tick_seconds=0.1)
+        aggregator.emit('status_update', {'status': 'RED_CRITICAL'}, trace_id=tracer.start_trace())
+        assert server.events and count(tracer, 'broadcast') == 1
+
+    def test_device_update_span_covers_tick_wait(self, tracer):
+        server = _Server()
+        aggregator = BroadcastAggregator(server, tick_seconds=0.2)
+        aggregator.start()
+        try:
+            aggregator.emit('device_update', {'device_id': 'm', 'state': {'pir': 'pir'}},
+                            trace_id=tracer.start_trace())
+            # Queued for the tick: nothing sent, no span yet
+            assert count(tracer, 'broadcast') == 0
+            deadline = time.monotonic() + 5
+            while not server.frames and time.monotonic() < deadline:
+                time.sleep(0.005)
+        finally:
+            aggregator.stop()
+        assert count(tracer, 'broadcast') == 1
+        assert tracer.summary()['broadcast']['max_ms'] > 0
@@ -0,0 +1,80 @@
+"""
+Behaviour tests for the metrics registry and the Prometheus text exposition.
+"""
+
+import pytest
+
+from metrics import MetricsRegistry
+
+
+@pytest.fixture
+def registry():
+    return MetricsRegistry()
+
+
+class TestExposition:
+
+    def test_counter(self, registry):
+        counter = registry.counter('test_events_total', 'Events seen', ['kind'])
+        counter.labels('motion').inc()
+        counter.labels('motion').inc(2)
+        counter.labels('door "front"').inc()
+        assert registry.render().splitlines() == [
+            '# HELP test_events_total Events seen',
+            '# TYPE test_events_total counter',
+            'test_events_total{kind="door \\"front\\""} 1',
+            'test_events_total{kind="motion"} 3'
+        ]
+
+    def test_labelled_histogram(self, registry):
+        histogram = registry.histogram('test_latency_seconds', 'Latency', ['op'], bounds_ms=(10, 100))
+        child = histogram.labels('get')
+        child.observe(0.005)
+        child.observe(0.01)
+        child.observe(0.05)
+        child.observe(0.5)
+        assert registry.render().splitlines() == [
+            '# HELP test_latency_seconds Latency',
+            '# TYPE test_latency_seconds histogram',
+            'test_latency_seconds_bucket{op="get",le="0.01"} 2',
+            'test_latency_seconds_bucket{op="get",le="0.1"} 3',
+            'test_latency_seconds_bucket{op="get",le="+Inf"} 4',
+            'test_latency_seconds_sum{op="get"} 0.565',
+            'test_latency_seconds_count{op="get"} 4'
+        ]
+
+    def test_function_gauge(self, registry):
+        backlog = [3]
+        registry.gauge('test_backlog', 'Pending items').set_function(lambda: backlog[0])
+        assert 'test_backlog 3' in registry.render()
+        backlog[0] = 0
+        assert registry.render().splitlines() == [
+            '# HELP test_backlog Pending items',
+            '# TYPE test_backlog gauge',
+            'test_backlog 0'
+        ]
+
+    def test_failing_function_renders_nan(self, registry):
+        registry.gauge('test_broken', 'Broken').set_function(lambda: 1 / 0)
+        assert 'test_broken nan' in registry.render()
+
+    def test_families_are_sorted_by_name(self, registry):
+        registry.counter('test_b_total', 'B').inc()
+        registry.counter('test_a_total', 'A').inc()
+        names = [line.split()[2] for line in registry.render().splitlines() if line.startswith('# TYPE')]
+        assert names == ['test_a_total', 'test_b_total']
+
+
+class TestRegistry:
+
+    def test_same_name_returns_same_family(self, registry):
+        assert registry.counter('test_total', 'T') is registry.counter('test_total', 'T')
+
+    def test_type_conflict_is_rejected(self, registry):
+        registry.counter('test_total', 'T')
+        with pytest.raises(ValueError, match='already registered as a counter'):
+            registry.gauge('test_total', 'T')
+
+    def test_wrong_label_count_is_rejected(self, registry):
+        with pytest.raises(ValueError, match='expects labels'):
+            registry.counter('test_total', 'T', ['a', 'b']).labels('x')
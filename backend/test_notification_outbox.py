@@ -0,0 +1,131 @@
+"""
+Behaviour tests for the webhook notification outbox, delivering to a local
+http.server stand-in for the webhook.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from metrics import get_registry
+from notification_outbox import NotificationOutbox, build_notification
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        server = self.server
+        with server.lock:
+            server.requests.append(body)
+            status = server.statuses.pop(0) if server.statuses else 204
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def webhook():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _WebhookHandler)
+    server.requests = []
+    server.statuses = []
+    server.lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_outbox(server, **kwargs) -> NotificationOutbox:
+    url = f"http://127.0.0.1:{server.server_address[1]}/hook"
+    return NotificationOutbox(':memory:', {'default': url}, **kwargs)
+
+
+def notify(outbox, message, **kwargs):
+    return outbox.enqueue('default', build_notification(message, 'high'), **kwargs)
+
+
+class TestNotificationOutbox:
+
+    def test_pending_notifications_are_batched(self, webhook):
+        outbox = make_outbox(webhook, batch_size=2)
+        for n in range(3):
+            assert notify(outbox, f"alert {n}")
+        assert outbox.deliver_due() == 3
+        assert [len(body.get('notifications', [body])) for body in webhook.requests] == [2, 1]
+        assert webhook.requests[0]['notifications'][0]['message'] == 'alert 0'
+        assert outbox.get_backlog() == 0
+
+    def test_duplicates_within_window_are_dropped(self, webhook):
+        outbox = make_outbox(webhook)
+        assert notify(outbox, 'break-in', dedupe_key='red')
+        assert not notify(outbox, 'break-in', dedupe_key='red')
+        assert notify(outbox, 'break-in', dedupe_key='other')
+        outbox.deliver_due()
+        assert len(webhook.requests[0]['notifications']) == 2
+        assert outbox.get_metrics()['deduped'] == 1
+
+    def test_retryable_failure_backs_off_then_delivers(self, webhook):
+        webhook.statuses = [503]
+        outbox = make_outbox(webhook, base_backoff_seconds=0.2)
+        notify(outbox, 'break-in')
+
+        assert outbox.deliver_due() == 0
+        assert outbox.get_metrics()['retries'] == 1
+        # Not due again until the backoff has passed
+        assert outbox.deliver_due() == 0
+        assert len(webhook.requests) == 1
+
+        time.sleep(0.25)
+        assert outbox.deliver_due() == 1
+        assert len(webhook.requests) == 2
+        assert outbox.get_backlog() == 0
+
+    def test_client_error_is_not_retried(self, webhook):
+        webhook.statuses = [400]
+        outbox = make_outbox(webhook)
+        notify(outbox, 'break-in')
+        assert outbox.deliver_due() == 0
+        assert outbox.get_metrics()['failed'] == 1
+        assert outbox.get_backlog() == 0
+
+    def test_worker_delivers_in_background(self, webhook):
+        outbox = make_outbox(webhook, poll_interval_seconds=0.05)
+        outbox.start()
+        try:
+            notify(outbox, 'break-in')
+            deadline = time.monotonic() + 5
+            while outbox.get_backlog() and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            outbox.stop()
+        assert len(webhook.requests) == 1
+
+    def test_prune_removes_only_old_finished_rows(self, webhook):
+        webhook.statuses = [204, 503]
+        outbox = make_outbox(webhook, retention_seconds=3600, dedupe_window_seconds=0)
+        notify(outbox, 'delivered')
+        outbox.deliver_due()
+        notify(outbox, 'still pending')
+        outbox.deliver_due()
+
+        assert outbox.prune() == 0
+        assert outbox.prune(now=time.time() + 3601) == 1
+        assert outbox.get_backlog() == 1
+
+    def test_metrics_are_registered(self, webhook):
+        outbox = make_outbox(webhook)
+        notify(outbox, 'break-in')
+        outbox.deliver_due()
+        exposition = get_registry().render()
+        assert 'securex_notification_delivery_seconds_count{channel="default"}' in exposition
+        assert 'securex_notification_backlog 0' in exposition
+        assert 'securex_notification_retries_total' in exposition
@@ -0,0 +1,65 @@
+"""
+Behaviour tests for compiling declarative response protocols.
+"""
+
+import pytest
+
+from protocol_plans import DEFAULT_PROTOCOLS, ProtocolConfigError, compile_protocols
+
+DEVICES = [
+    {'id': 'bulb-1', 'type': 'bulb', 'zone': 'LivingRoom'},
+    {'id': 'siren-1', 'type': 'siren', 'zone': 'Foyer'}
+]
+
+
+def protocol(*actions):
+    return {'protocols': {'RED_CRITICAL': {'actions': list(actions)}}}
+
+
+def action(name, device_type, **extra):
+    return {'name': name, 'target': {'type': device_type},
+            'commands': [{'code': 'switch', 'value': True}], **extra}
+
+
+class TestCompileProtocols:
+
+    def test_default_protocols_compile(self):
+        plans = compile_protocols(DEFAULT_PROTOCOLS, DEVICES)
+        red = plans.get('RED_CRITICAL', 'HOUSE')
+        assert [step.device_id for step in red.steps] == ['bulb-1', 'siren-1']
+        green = plans.get('GREEN_SAFE', 'HOUSE')
+        assert [step.name for step in green.steps] == ['bulb_safe', 'siren_off']
+
+    def test_after_orders_submission(self):
+        plans = compile_protocols(protocol(action('siren', 'siren', after=['bulb']), action('bulb', 'bulb')),
+                                  DEVICES)
+        assert [step.name for step in plans.get('RED_CRITICAL', 'HOUSE').steps] == ['bulb', 'siren']
+
+    def test_after_must_be_a_list(self):
+        # A string used to be iterated character by character
+        with pytest.raises(ProtocolConfigError, match="'after' must be a list"):
+            compile_protocols(protocol(action('siren', 'siren', after='bulb'), action('bulb', 'bulb')), DEVICES)
+
+    def test_after_unknown_or_circular(self):
+        with pytest.raises(ProtocolConfigError, match='unknown'):
+            compile_protocols(protocol(action('siren', 'siren', after=['lamp'])), DEVICES)
+        with pytest.raises(ProtocolConfigError, match='circular'):
+            compile_protocols(protocol(action('a', 'bulb', after=['b']), action('b', 'siren', after=['a'])),
+                              DEVICES)
+
+    def test_action_must_be_an_object(self):
+        with pytest.raises(ValueError, match='must be an object'):
+            compile_protocols(protocol(action('bulb', 'bulb'), 'siren_on'), DEVICES)
+
+    def test_invalid_command_is_rejected(self):
+        bad = action('bulb', 'bulb')
+        bad['commands'] = [{'code': 'switch'}]
+        with pytest.raises(ProtocolConfigError, match='invalid command'):
+            compile_protocols(protocol(bad), DEVICES)
+
+    def test_alarm_zone_selector(self):
+        plans = compile_protocols(
+            protocol({'name': 'local', 'target': {'zone': '@alarm'}, 'commands': [{'code': 'switch', 'value': True}]}),
+            DEVICES)
+        assert [step.device_id for step in plans.get('RED_CRITICAL', 'Foyer').steps] == ['siren-1']
+        assert len(plans.get('RED_CRITICAL', 'HOUSE').steps) == 2
@@ -0,0 +1,167 @@
+"""
+Behaviour tests for the sites file, site configurations and the
+configuration swap on a running site.
+
+Sites hold a ResponseOrchestrator, which imports the Tuya transport, so
+these tests need tuya_connector.
+"""
+
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('tuya_connector')
+
+from alarm_state_machine import AlarmStateMachine  # noqa: E402
+from dashboard_state import DashboardState  # noqa: E402
+from device_registry import DeviceRegistry, parse_devices  # noqa: E402
+from event_debouncer import DebounceRule, EventDebouncer  # noqa: E402
+from protocol_plans import DEFAULT_PROTOCOLS, compile_protocols  # noqa: E402
+from response_orchestrator import ResponseOrchestrator  # noqa: E402
+from sites import Site, SiteConfig, load_sites_file  # noqa: E402
+from threat_analyzer import ThreatAnalyzer  # noqa: E402
+
+CABIN_DEVICES = [
+    {'id': 'cm', 'type': 'motion', 'zone': 'LivingRoom'},
+    {'id': 'cw', 'type': 'window', 'zone': 'Bedroom'},
+    {'id': 'cb', 'type': 'bulb', 'zone': 'Bedroom'},
+    {'id': 'cs', 'type': 'siren', 'zone': 'LivingRoom'}
+]
+
+
+def write_json(tmp_path, name, content) -> str:
+    path = tmp_path / name
+    path.write_text(json.dumps(content))
+    return str(path)
+
+
+def site_config(home_id='cabin', devices=CABIN_DEVICES, **overrides) -> SiteConfig:
+    registry = DeviceRegistry(parse_devices(devices, home_id))
+    fields = dict(
+        home_id=home_id,
+        registry=registry,
+        protocol_plans=compile_protocols(DEFAULT_PROTOCOLS, registry.inventory()),
+        default_debounce_rule=DebounceRule(collapse_identical=True),
+        debounce_rules={},
+        window_seconds=10.0,
+        allowed_lateness_seconds=30.0,
+        critical_threshold=80.0,
+        warning_threshold=40.0,
+        hysteresis=10.0,
+        min_hold_seconds={'RED_CRITICAL': 60.0, 'YELLOW_WARNING': 15.0},
+        auto_clear_seconds={'RED_CRITICAL': 300.0, 'YELLOW_WARNING': 120.0}
+    )
+    fields.update(overrides)
+    return SiteConfig(**fields)
+
+
+def build_site(config: SiteConfig) -> Site:
+    registry = config.registry
+    orchestrator = ResponseOrchestrator(
+        tuya_manager=None,
+        socketio=None,
+        smart_bulb_id=registry.first('bulb'),
+        siren_id=registry.first('siren'),
+        front_door_lock_id=registry.first('door-lock'),
+        alarm_state=AlarmStateMachine(critical_threshold=config.critical_threshold,
+                                      warning_threshold=config.warning_threshold),
+        protocol_plans=config.protocol_plans,
+        home_id=config.home_id
+    )
+    analyzer = ThreatAnalyzer(critical_threshold=config.critical_threshold,
+                              warning_threshold=config.warning_threshold)
+    return Site(config, analyzer, orchestrator, EventDebouncer(config.default_debounce_rule),
+                DashboardState(home=config.home_id))
+
+
+class TestLoadSitesFile:
+
+    def test_multi_home_file(self, tmp_path):
+        office = write_json(tmp_path, 'office.json', [{'id': 'om', 'type': 'motion', 'zone': 'Desk'}])
+        path = write_json(tmp_path, 'sites.json', [
+            {'home': 'cabin', 'devices': CABIN_DEVICES, 'protocols_file': 'cabin_protocols.json'},
+            {'home': 'office', 'devices_file': office}
+        ])
+        cabin, office_site = load_sites_file(path)
+        assert (cabin.home_id, [d.device_id for d in cabin.devices]) == ('cabin', ['cm', 'cw', 'cb', 'cs'])
+        assert cabin.protocols_file == 'cabin_protocols.json'
+        assert all(d.home == 'cabin' for d in cabin.devices)
+        assert (office_site.home_id, office_site.devices_file) == ('office', office)
+        assert office_site.devices[0].home == 'office'
+
+    def test_duplicate_home_is_rejected(self, tmp_path):
+        path = write_json(tmp_path, 'sites.json', [{'home': 'cabin', 'devices': []},
+                                                   {'home': 'cabin', 'devices': []}])
+        with pytest.raises(ValueError, match="home 'cabin' is listed twice"):
+            load_sites_file(path)
+
+    def test_duplicate_device_is_rejected(self, tmp_path):
+        path = write_json(tmp_path, 'sites.json', [
+            {'home': 'cabin', 'devices': CABIN_DEVICES},
+            {'home': 'office', 'devices': [{'id': 'cm', 'type': 'motion', 'zone': 'Desk'}]}
+        ])
+        with pytest.raises(ValueError, match="device cm is listed for home 'cabin' and home 'office'"):
+            load_sites_file(path)
+        path = write_json(tmp_path, 'sites.json', [{'home': 'cabin', 'devices': CABIN_DEVICES + CABIN_DEVICES[:1]}])
+        with pytest.raises(ValueError, match='repeats device ID cm'):
+            load_sites_file(path)
+
+    def test_device_of_another_home_is_rejected(self, tmp_path):
+        path = write_json(tmp_path, 'sites.json', [
+            {'home': 'cabin', 'devices': [dict(CABIN_DEVICES[0], home='office')]}
+        ])
+        with pytest.raises(ValueError, match="names home 'office'"):
+            load_sites_file(path)
+
+
+class TestSiteConfig:
+
+    def test_thresholds_must_be_ordered(self):
+        with pytest.raises(ValueError, match='must be below the critical threshold'):
+            site_config(warning_threshold=80.0)
+
+    def test_window_must_be_positive(self):
+        with pytest.raises(ValueError, match='sequence window'):
+            site_config(window_seconds=0)
+
+
+class TestConfigSwap:
+
+    def test_detection_swap_keeps_the_buffer(self):
+        site = build_site(site_config())
+        site.threat_analyzer.add_event('cm', {'type': 'motion'}, datetime(2024, 1, 1, 23, 0))
+        devices = CABIN_DEVICES + [{'id': 'cl', 'type': 'door-lock', 'zone': 'Foyer'}]
+        new = site_config(devices=devices, critical_threshold=120.0, warning_threshold=60.0,
+                          window_seconds=20.0, allowed_lateness_seconds=5.0,
+                          debounce_rules={'cm': DebounceRule(min_retrigger_seconds=5.0)})
+        site.apply_detection_config(new)
+
+        analyzer = site.threat_analyzer
+        assert (analyzer.critical_threshold, analyzer.warning_threshold) == (120.0, 60.0)
+        assert analyzer.window_seconds == 20.0
+        assert analyzer.allowed_lateness == timedelta(seconds=5)
+        assert analyzer.classify_threat(100) == 'YELLOW_WARNING'
+        assert analyzer.get_event_count() == 1
+        assert site.door_lock_id == 'cl' and len(site.registry) == 5
+        assert site.event_debouncer.device_rules['cm'].min_retrigger_seconds == 5.0
+        # The response half has not been applied yet
+        assert site.config.critical_threshold == 80.0
+
+    def test_response_swap_keeps_the_alarm_state(self):
+        site = build_site(site_config())
+        alarm = site.response_orchestrator.alarm_state
+        alarm.evaluate(90, 'HOUSE', datetime(2024, 1, 1, 23, 0))
+        assert alarm.state == 'RED_CRITICAL'
+
+        new = site_config(devices=CABIN_DEVICES[:3], critical_threshold=120.0, warning_threshold=60.0,
+                          hysteresis=5.0, min_hold_seconds={'RED_CRITICAL': 10.0, 'YELLOW_WARNING': 5.0})
+        site.apply_response_config(new)
+
+        assert (alarm.critical_threshold, alarm.warning_threshold, alarm.hysteresis) == (120.0, 60.0, 5.0)
+        assert alarm.min_hold_seconds['RED_CRITICAL'] == 10.0
+        assert alarm.state == 'RED_CRITICAL'
+        orchestrator = site.response_orchestrator
+        assert (orchestrator.smart_bulb_id, orchestrator.siren_id) == ('cb', None)
+        assert orchestrator.protocol_plans is new.protocol_plans
+        assert site.config is new
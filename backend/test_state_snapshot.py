@@ -0,0 +1,128 @@
+"""
+Behaviour tests for the binary state snapshot format and warm restart.
+"""
+
+import struct
+from datetime import datetime
+
+import pytest
+
+from alarm_state_machine import AlarmStateMachine
+from clock import VirtualClock
+from state_snapshot import (SNAPSHOT_VERSION, AgentSnapshot, StateSnapshotter, decode_snapshot,
+                            encode_snapshot)
+from threat_analyzer import ThreatAnalyzer
+
+T0 = datetime(2024, 1, 1, 23, 0)
+
+
+@pytest.fixture
+def clock():
+    return VirtualClock(T0)
+
+
+def snapshotter(tmp_path, clock, **kwargs) -> StateSnapshotter:
+    return StateSnapshotter(str(tmp_path / 'state.snap'), clock=clock, **kwargs)
+
+
+def capture(analyzer: ThreatAnalyzer, alarm: AlarmStateMachine, warnings) -> AgentSnapshot:
+    return AgentSnapshot(
+        events=analyzer.get_events(),
+        deadlines=analyzer.get_pending_deadlines('motion', 'window'),
+        warning_states=sorted(warnings),
+        device_states={'motion': [{'code': 'pir_state', 'value': 'pir'}]},
+        alarm_state=alarm.state,
+        alarm_zone=alarm.zone,
+        alarm_entered_at=alarm.entered_at.timestamp(),
+        alarm_last_trigger_at=alarm.last_trigger_at.timestamp()
+    )
+
+
+class TestRoundTrip:
+
+    def test_detection_state_survives_a_restart(self, tmp_path, clock):
+        analyzer = ThreatAnalyzer()
+        analyzer.add_event('motion', {'type': 'motion', 'value': 'pir'}, T0)
+        alarm = AlarmStateMachine()
+        alarm.evaluate(50, 'LivingRoom', T0)
+        snapshotter(tmp_path, clock).save(capture(analyzer, alarm, {'LivingRoom'}))
+
+        clock.advance(60)
+        snapshot = snapshotter(tmp_path, clock).load()
+        assert snapshot.saved_at == T0.timestamp()
+        assert snapshot.age_seconds(clock.time()) == 60
+        restored = ThreatAnalyzer()
+        restored.restore_events(snapshot.events)
+        restored_alarm = AlarmStateMachine()
+        restored_alarm.restore(snapshot.alarm_state, snapshot.alarm_zone,
+                               datetime.fromtimestamp(snapshot.alarm_entered_at),
+                               datetime.fromtimestamp(snapshot.alarm_last_trigger_at))
+
+        assert [(e.device_id, e.device_type, e.timestamp, e.data) for e in restored.get_events()] == \
+            [(e.device_id, e.device_type, e.timestamp, e.data) for e in analyzer.get_events()]
+        assert snapshot.deadlines == analyzer.get_pending_deadlines('motion', 'window')
+        assert snapshot.warning_states == ['LivingRoom']
+        assert snapshot.device_states == {'motion': [{'code': 'pir_state', 'value': 'pir'}]}
+        assert (restored_alarm.state, restored_alarm.zone) == ('YELLOW_WARNING', 'LivingRoom')
+        assert restored_alarm.get_auto_clear_deadline() == alarm.get_auto_clear_deadline()
+
+        # The restored window still completes the sequence
+        restored.add_event('window', {'type': 'vibration'}, datetime(2024, 1, 1, 23, 0, 5))
+        assert restored.analyze_sequence('motion', 'window', 'lock') == ('RED_CRITICAL', 'HOUSE')
+
+    def test_unknown_sections_are_skipped(self):
+        data = encode_snapshot(AgentSnapshot(saved_at=1.0, warning_states=['Foyer']))
+        data += struct.pack('<BI', 99, 3) + b'new'
+        assert decode_snapshot(data).warning_states == ['Foyer']
+
+
+class TestColdStart:
+
+    def test_missing_file(self, tmp_path, clock):
+        assert snapshotter(tmp_path, clock).load() is None
+
+    @pytest.mark.parametrize('damage', ['truncated', 'corrupt_blob', 'bad_magic', 'bad_version', 'empty'])
+    def test_unreadable_file_falls_back(self, tmp_path, clock, damage):
+        writer = snapshotter(tmp_path, clock)
+        writer.save(AgentSnapshot(device_states={'motion': [{'code': 'pir_state', 'value': 'pir'}]}))
+        path = tmp_path / 'state.snap'
+        data = path.read_bytes()
+        if damage == 'truncated':
+            data = data[:-5]
+        elif damage == 'corrupt_blob':
+            data = data.replace(b'pir_state', b'\xff\xfe_state')
+        elif damage == 'bad_magic':
+            data = b'XXXX' + data[4:]
+        elif damage == 'bad_version':
+            data = data[:4] + struct.pack('<H', SNAPSHOT_VERSION + 1) + data[6:]
+        else:
+            data = b''
+        path.write_bytes(data)
+        assert writer.load() is None
+
+    def test_stale_snapshot_is_ignored(self, tmp_path, clock):
+        writer = snapshotter(tmp_path, clock, max_age_seconds=3600)
+        writer.save(AgentSnapshot())
+        clock.advance(3599)
+        assert writer.load() is not None
+        clock.advance(2)
+        assert writer.load() is None
+
+
+class TestSchedule:
+
+    def test_first_snapshot_is_due_then_every_interval(self, tmp_path, clock):
+        writer = snapshotter(tmp_path, clock, interval_seconds=30)
+        assert writer.is_due()
+        writer.save(AgentSnapshot())
+        clock.advance(29)
+        assert not writer.is_due()
+        clock.advance(1)
+        assert writer.is_due()
+
+    def test_save_is_atomic(self, tmp_path, clock):
+        writer = snapshotter(tmp_path, clock)
+        writer.save(AgentSnapshot(warning_states=['Foyer']))
+        writer.save(AgentSnapshot(warning_states=['Hall']))
+        assert [p.name for p in tmp_path.iterdir()] == ['state.snap']
+        assert writer.load().warning_states == ['Hall']
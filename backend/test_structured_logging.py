@@ -0,0 +1,68 @@
+"""
+Behaviour tests for the queue-based log handler and the event sampler.
+"""
+
+import logging
+import queue
+import threading
+
+from structured_logging import DeferredQueueHandler, EventSampler, _records_dropped_total
+
+
+def dropped() -> float:
+    return _records_dropped_total.labels().get()
+
+
+class TestDeferredQueueHandler:
+
+    def test_full_queue_drops_and_counts(self, capsys):
+        log_queue: queue.Queue = queue.Queue(maxsize=1)
+        logger = logging.getLogger('test_structured_logging.full')
+        logger.propagate = False
+        logger.addHandler(DeferredQueueHandler(log_queue))
+        before = dropped()
+
+        logger.warning('first')
+        logger.warning('second')
+        logger.warning('third')
+
+        assert log_queue.qsize() == 1
+        assert log_queue.get_nowait().getMessage() == 'first'
+        assert dropped() - before == 2
+        # No handleError traceback on stderr
+        assert capsys.readouterr().err == ''
+
+    def test_record_is_not_formatted_by_caller(self):
+        log_queue: queue.Queue = queue.Queue()
+        handler = DeferredQueueHandler(log_queue)
+        record = logging.LogRecord('x', logging.INFO, __file__, 1, 'value=%s', ('lazy',), None)
+        handler.emit(record)
+        queued = log_queue.get_nowait()
+        assert queued is record
+        assert queued.args == ('lazy',)
+
+
+class TestEventSampler:
+
+    def test_emits_every_nth_per_key(self):
+        sampler = EventSampler(every_n=3)
+        decisions = [sampler.should_log('poll') for _ in range(7)]
+        assert decisions == [True, False, False, True, False, False, True]
+        assert sampler.suppressed('poll') == 4
+        assert sampler.should_log('other')
+
+    def test_counts_are_exact_across_threads(self):
+        sampler = EventSampler(every_n=10)
+        emitted = []
+
+        def worker():
+            emitted.append(sum(sampler.should_log('poll') for _ in range(10000)))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sum(emitted) == 8000
+        assert sampler.suppressed('poll') == 72000
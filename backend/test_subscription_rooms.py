@@ -0,0 +1,65 @@
+"""
+Behaviour tests for home and zone subscription rooms.
+"""
+
+from subscription_rooms import (HOUSE_ZONE, RoomDirectory, home_room, room_encoding, room_home, room_zone,
+                                zone_room)
+
+
+def directory() -> RoomDirectory:
+    rooms = RoomDirectory()
+    rooms.subscribe('whole', 'home')
+    rooms.subscribe('foyer', 'home', ['Foyer'])
+    rooms.subscribe('bedroom', 'home', ['MasterBedroom'])
+    rooms.subscribe('cabin', 'cabin')
+    return rooms
+
+
+class TestRoomNames:
+
+    def test_round_trip(self):
+        room = zone_room('home', 'Foyer', 'msgpack')
+        assert room == 'msgpack/zone:home:Foyer'
+        assert (room_encoding(room), room_home(room), room_zone(room)) == ('msgpack', 'home', 'Foyer')
+        assert (room_encoding(home_room('home')), room_zone(home_room('home'))) == ('json', None)
+
+
+class TestRoomsFor:
+
+    def test_zone_event_reaches_home_and_matching_zone(self):
+        assert sorted(directory().rooms_for('home', 'Foyer')) == ['home:home', 'zone:home:Foyer']
+
+    def test_house_wide_event_reaches_every_zone(self):
+        expected = ['home:home', 'zone:home:Foyer', 'zone:home:MasterBedroom']
+        assert sorted(directory().rooms_for('home', None)) == expected
+        assert sorted(directory().rooms_for('home', HOUSE_ZONE)) == expected
+
+    def test_homes_are_separate(self):
+        assert directory().rooms_for('cabin', 'Foyer') == ['home:cabin']
+        assert directory().rooms_for('elsewhere', None) == []
+
+    def test_rooms_are_separated_by_encoding(self):
+        rooms = directory()
+        rooms.set_encoding('compact', 'msgpack')
+        rooms.subscribe('compact', 'home', ['Foyer'])
+        assert sorted(rooms.rooms_for('home', 'Foyer')) == ['home:home', 'msgpack/zone:home:Foyer',
+                                                             'zone:home:Foyer']
+        assert rooms.counts()['msgpack/zone:home:Foyer'] == 1
+        assert rooms.counts()['zone:home:Foyer'] == 1
+
+    def test_empty_rooms_are_not_targeted(self):
+        rooms = directory()
+        rooms.remove_client('foyer')
+        rooms.unsubscribe('whole', 'home')
+        assert rooms.rooms_for('home', 'Foyer') == []
+
+
+class TestSubscribe:
+
+    def test_new_subscription_replaces_previous(self):
+        rooms = RoomDirectory()
+        assert rooms.subscribe('sid', 'home', ['Foyer']) == (['zone:home:Foyer'], [])
+        assert rooms.subscribe('sid', 'home') == (['home:home'], ['zone:home:Foyer'])
+        assert rooms.subscribe('sid', 'cabin') == (['home:cabin'], [])
+        assert rooms.client_homes('sid') == ['cabin', 'home']
+        assert rooms.zone_rooms('home') == []
@@ -0,0 +1,71 @@
+"""
+Behaviour tests for threat classification and late-event handling.
+"""
+
+from datetime import datetime, timedelta
+
+from threat_analyzer import ThreatAnalyzer
+
+T0 = datetime(2024, 1, 1, 23, 0)
+MOTION = 'motion'
+WINDOW = 'window'
+LOCK = 'lock'
+
+
+def at(seconds: float) -> datetime:
+    return T0 + timedelta(seconds=seconds)
+
+
+def analyze(analyzer: ThreatAnalyzer):
+    return analyzer.analyze_sequence(MOTION, WINDOW, LOCK)
+
+
+class TestThreatAnalyzer:
+
+    def test_default_thresholds(self):
+        analyzer = ThreatAnalyzer()
+        assert analyzer.classify_threat(80) == 'RED_CRITICAL'
+        assert analyzer.classify_threat(79.9) == 'YELLOW_WARNING'
+        assert analyzer.classify_threat(40) == 'YELLOW_WARNING'
+        assert analyzer.classify_threat(39.9) == 'GREEN_SAFE'
+
+    def test_configured_thresholds(self):
+        analyzer = ThreatAnalyzer(critical_threshold=130, warning_threshold=30)
+        assert analyzer.classify_threat(135) == 'RED_CRITICAL'
+        assert analyzer.classify_threat(100) == 'YELLOW_WARNING'
+        # Motion alone during the day scores 35: a warning with these thresholds
+        analyzer.add_event(MOTION, {'type': 'motion'}, datetime(2024, 1, 1, 12, 0))
+        analyzer.add_event(LOCK, {'type': 'lock'}, datetime(2024, 1, 1, 12, 0, 11))
+        assert analyze(analyzer) == ('YELLOW_WARNING', 'LivingRoom')
+
+    def test_motion_then_vibration_at_night(self):
+        analyzer = ThreatAnalyzer()
+        analyzer.add_event(MOTION, {'type': 'motion'}, at(0))
+        analyzer.add_event(WINDOW, {'type': 'vibration'}, at(5))
+        assert analyze(analyzer) == ('RED_CRITICAL', 'HOUSE')
+        assert analyzer.last_pattern == 'motion_vibration'
+
+    def test_late_vibration_completes_window(self):
+        analyzer = ThreatAnalyzer()
+        analyzer.add_event(MOTION, {'type': 'motion'}, at(0))
+        analyzer.add_event(LOCK, {'type': 'lock'}, at(8))
+        late = analyzer.add_event(WINDOW, {'type': 'vibration'}, at(4))
+        assert analyzer.is_late(late)
+        assert analyzer.analyze_late_event(late, MOTION, WINDOW) == ('RED_CRITICAL', 'HOUSE')
+
+    def test_late_event_evicted_by_trim_is_not_classified(self):
+        analyzer = ThreatAnalyzer()
+        analyzer.add_event(WINDOW, {'type': 'vibration'}, at(12))
+        analyzer.add_event('a', {'type': 'other'}, at(20))
+        analyzer.add_event('b', {'type': 'other'}, at(30))
+        # Older than every buffered event: inserted first, then trimmed
+        late = analyzer.add_event(MOTION, {'type': 'motion'}, at(5))
+        assert late is not None
+        assert late not in analyzer.get_events()
+        assert analyzer.analyze_late_event(late, MOTION, WINDOW) is None
+
+    def test_event_behind_watermark_is_dropped(self):
+        analyzer = ThreatAnalyzer(allowed_lateness_seconds=30)
+        analyzer.add_event(MOTION, {'type': 'motion'}, at(100))
+        assert analyzer.add_event(WINDOW, {'type': 'vibration'}, at(60)) is None
+        assert analyzer.dropped_late_count == 1
@@ -0,0 +1,167 @@
+"""
+Behaviour tests for the compact MessagePack wire encoding, decoded the way
+a dashboard client does.
+"""
+
+import pytest
+
+msgpack = pytest.importorskip('msgpack')
+
+from wire_codec import CompactCodec  # noqa: E402
+
+T0 = '2024-01-01T23:00:00'
+T0_MS = 1704150000000
+
+
+class _Client:
+    """Decoder with the client's copy of the dictionary."""
+
+    def __init__(self):
+        self.names = {}
+
+    def unpack(self, payload: bytes):
+        return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+
+    def snapshot(self, payload: bytes) -> dict:
+        version, status, zone, dictionary, devices = self.unpack(payload)
+        self.names = dict(enumerate(dictionary))
+        return {
+            'version': version, 'status': status, 'zone': zone,
+            'devices': {self.names[device]: {
+                'device_type': self.names[body[0]], 'device_name': body[1], 'location': body[2],
+                'zone': body[3], 'state': {self.names[code]: value for code, value in body[4].items()},
+                'timestamp_ms': body[5]
+            } for device, body in devices.items()}
+        }
+
+    def update(self, body: list) -> dict:
+        if len(body) > 5:
+            self.names.update(body[5])
+        version, device, state, timestamp_ms, zone = body[:5]
+        return {'version': version, 'device_id': self.names[device], 'zone': zone,
+                'state': {self.names[code]: value for code, value in state.items()}, 'timestamp_ms': timestamp_ms}
+
+    def frame(self, event: str, payload: bytes) -> list:
+        body = self.unpack(payload)
+        return [self.update(body)] if event == 'device_update' else [self.update(item) for item in body]
+
+
+def update(device_id, zone, version=1, timestamp=T0, **state):
+    return {'version': version, 'device_id': device_id, 'device_type': 'motion', 'zone': zone,
+            'state': state, 'timestamp': timestamp, 'home': 'home'}
+
+
+@pytest.fixture
+def codec():
+    return CompactCodec()
+
+
+class TestLayouts:
+
+    def test_status_update(self, codec):
+        payload = codec.encode('status_update', {'status': 'RED_CRITICAL', 'zone': 'HOUSE', 'version': 7})
+        assert _Client().unpack(payload) == [7, 'RED_CRITICAL', 'HOUSE']
+
+    def test_device_update_defines_new_strings_once(self, codec):
+        client = _Client()
+        first = client.unpack(codec.encode('device_update', update('m1', 'Hall', pir_state='pir')))
+        assert first[5] == {0: 'm1', 1: 'pir_state'}
+        assert client.update(first) == {'version': 1, 'device_id': 'm1', 'zone': 'Hall',
+                                        'state': {'pir_state': 'pir'}, 'timestamp_ms': T0_MS}
+        again = client.unpack(codec.encode('device_update', update('m1', 'Hall', version=2, pir_state='none')))
+        assert len(again) == 5
+        assert client.update(again)['state'] == {'pir_state': 'none'}
+
+    def test_device_updates_share_new_definitions(self, codec):
+        client = _Client()
+        payload = codec.encode('device_updates', {'updates': [update('m1', 'Hall', pir_state='pir'),
+                                                             update('m2', 'Yard', pir_state='pir')]})
+        decoded = client.frame('device_updates', payload)
+        assert [(u['device_id'], u['state']) for u in decoded] == [('m1', {'pir_state': 'pir'}),
+                                                                  ('m2', {'pir_state': 'pir'})]
+        # Each update carries what it uses, so either decodes on its own
+        second = client.unpack(payload)[1]
+        assert _Client().update(second)['device_id'] == 'm2'
+
+    def test_state_snapshot(self, codec):
+        codec.encode('device_update', update('m1', 'Hall', pir_state='pir'))
+        snapshot = {'version': 3, 'status': 'GREEN_SAFE', 'zone': 'HOUSE', 'devices': {
+            'b1': {'device_type': 'bulb', 'device_name': 'Bulb', 'location': 'Bedroom', 'zone': 'Bedroom',
+                   'state': {'switch_led': True}, 'timestamp': T0}
+        }}
+        assert _Client().snapshot(codec.encode('state_snapshot', snapshot)) == {
+            'version': 3, 'status': 'GREEN_SAFE', 'zone': 'HOUSE',
+            'devices': {'b1': {'device_type': 'bulb', 'device_name': 'Bulb', 'location': 'Bedroom',
+                               'zone': 'Bedroom', 'state': {'switch_led': True}, 'timestamp_ms': T0_MS}}
+        }
+        assert codec.dictionary_size() == 5
+
+    @pytest.mark.parametrize('timestamp', [None, '', 'yesterday', 12345])
+    def test_missing_or_malformed_timestamp(self, codec, timestamp):
+        body = _Client().unpack(codec.encode('device_update', update('m1', 'Hall', timestamp=timestamp, pir_state='pir')))
+        assert body[3] is None
+
+    def test_other_events_pass_through(self, codec):
+        assert _Client().unpack(codec.encode('protocol_executed', {'status': 'RED_CRITICAL'})) == \
+            {'status': 'RED_CRITICAL'}
+
+
+class TestDeviceFrames:
+
+    def test_zone_room_decodes_strings_introduced_in_the_home_room(self, codec):
+        hall = update('m1', 'Hall', pir_state='pir')
+        yard = update('m2', 'Yard', version=2, pir_state='pir')
+        home_frame = [hall, yard]
+        frames = {'msgpack/home:home': home_frame, 'msgpack/zone:home:Yard': [yard],
+                  'msgpack/zone:home:Hall': [hall]}
+        encoded = codec.encode_device_frames(frames)
+
+        home_client, yard_client, hall_client = _Client(), _Client(), _Client()
+        assert [u['device_id'] for u in home_client.frame('device_updates', encoded['msgpack/home:home'])] == \
+            ['m1', 'm2']
+        # 'pir_state' was introduced by the Hall update, which the Yard room never sees
+        assert yard_client.frame('device_update', encoded['msgpack/zone:home:Yard'])[0]['state'] == \
+            {'pir_state': 'pir'}
+        assert hall_client.frame('device_update', encoded['msgpack/zone:home:Hall'])[0]['device_id'] == 'm1'
+
+    def test_same_frame_is_packed_once(self, codec):
+        frame = [update('m1', 'Hall', pir_state='pir')]
+        encoded = codec.encode_device_frames({'msgpack/home:home': frame, 'msgpack/zone:home:Hall': frame})
+        assert encoded['msgpack/home:home'] is encoded['msgpack/zone:home:Hall']
+
+    def test_known_strings_are_not_redefined(self, codec):
+        codec.encode('device_update', update('m1', 'Hall', pir_state='pir'))
+        encoded = codec.encode_device_frames({'msgpack/home:home': [update('m1', 'Hall', pir_state='none')]})
+        assert len(_Client().unpack(encoded['msgpack/home:home'])) == 5
+
+
+class TestServerRoundTrip:
+
+    @pytest.fixture
+    def server(self):
+        pytest.importorskip('flask_socketio')
+        from websocket_server import WebSocketServer
+        return WebSocketServer()
+
+    def connect(self, server, zones=None):
+        client = server.socketio.test_client(server.app, query_string='encoding=msgpack')
+        if zones:
+            client.emit('subscribe', {'home': 'home', 'zones': zones})
+        decoder = _Client()
+        for message in client.get_received():
+            if message['name'] == 'state_snapshot':
+                decoder.snapshot(message['args'][0])
+        return client, decoder
+
+    def test_home_and_zone_rooms_decode_the_same_tick(self, server):
+        home_client, home_decoder = self.connect(server)
+        zone_client, zone_decoder = self.connect(server, zones=['Yard'])
+        server.emit_device_frame([update('m1', 'Hall', pir_state='pir'),
+                                  update('m2', 'Yard', version=2, pir_state='pir')])
+
+        home = [(m['name'], m['args'][0]) for m in home_client.get_received()]
+        zone = [(m['name'], m['args'][0]) for m in zone_client.get_received()]
+        assert [u['device_id'] for event, payload in home for u in home_decoder.frame(event, payload)] == \
+            ['m1', 'm2']
+        assert [(u['device_id'], u['state']) for event, payload in zone
+                for u in zone_decoder.frame(event, payload)] == [('m2', {'pir_state': 'pir'})]
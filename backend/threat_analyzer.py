@@ -6,17 +6,17 @@ for threat analysis based on temporal patterns.
 """
 
 import logging
-from datetime import datetime
-from typing import List, Optional
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+from structured_logging import EventSampler, log_event, log_sampled
+
 logger = logging.getLogger(__name__)
 
+# Time weight is computed for every analysis; sample its debug output
+_weight_sampler = EventSampler(every_n=100)
+
 
 @dataclass
 class SensorEvent:
@@ -28,15 +28,17 @@ class SensorEvent:
         device_type: Type of device (motion, vibration, lock)
         timestamp: When the event occurred
         data: Raw event data from Tuya
+        trace_id: Latency trace the event belongs to, if traced
     """
     device_id: str
     device_type: str
     timestamp: datetime
     data: dict
+    trace_id: Optional[str] = None
     
-    def age_seconds(self) -> float:
-        """Calculate age of event in seconds from current time."""
-        return (datetime.now() - self.timestamp).total_seconds()
+    def age_seconds(self, now: Optional[datetime] = None) -> float:
+        """Calculate age of event in seconds from the given (default current) time."""
+        return ((now or datetime.now()) - self.timestamp).total_seconds()
 
 
 class ThreatAnalyzer:
@@ -45,26 +47,95 @@ class ThreatAnalyzer:
     
     Maintains a bounded buffer of recent events (max 3) and provides
     methods for threat pattern detection and scoring.
+    
+    Events are processed in event time (the source timestamp). A watermark
+    trails the newest event time by the allowed lateness; events older than
+    the watermark are dropped, and events that arrive out of order but
+    within the lateness bound are inserted in place.
     """
     
-    def __init__(self):
-        """Initialize ThreatAnalyzer with empty event sequence."""
+    def __init__(self, allowed_lateness_seconds: float = 30.0, window_seconds: float = 10.0,
+                 critical_threshold: float = 80.0, warning_threshold: float = 40.0):
+        """
+        Initialize ThreatAnalyzer with empty event sequence.
+        
+        Args:
+            allowed_lateness_seconds: How far behind the newest event time an
+                event may arrive and still be analyzed
+            window_seconds: Motion+vibration sequence window length
+            critical_threshold: Score at or above which RED_CRITICAL is classified
+            warning_threshold: Score at or above which YELLOW_WARNING is classified
+                (the alarm state machine's thresholds)
+        """
         self.event_sequence: List[SensorEvent] = []
         self.max_events = 3
+        self.window_seconds = window_seconds
+        self.critical_threshold = critical_threshold
+        self.warning_threshold = warning_threshold
+        self.allowed_lateness = timedelta(seconds=allowed_lateness_seconds)
+        
+        # Event-time tracking
+        self.max_event_time: Optional[datetime] = None
+        self.late_event_count = 0
+        self.dropped_late_count = 0
+        
+        # Outcome of the most recent analysis, for the alarm state machine
+        self.last_score = 0.0
+        self.last_pattern = 'none'
+        
         logger.info("ThreatAnalyzer initialized")
     
-    def add_event(self, device_id: str, event_data: dict, timestamp: datetime) -> None:
+    def get_watermark(self) -> Optional[datetime]:
+        """
+        Get the current event-time watermark.
+        
+        Returns:
+            Optional[datetime]: Newest event time minus allowed lateness, or
+            None if no events have been seen yet
+        """
+        if self.max_event_time is None:
+            return None
+        return self.max_event_time - self.allowed_lateness
+    
+    def is_late(self, event: SensorEvent) -> bool:
         """
-        Append a sensor event to the sequence with timestamp.
+        Check whether an event arrived after a newer event was already seen.
+        
+        Args:
+            event: Event returned by add_event
+            
+        Returns:
+            bool: True if the event is older than the newest event time
+        """
+        return self.max_event_time is not None and event.timestamp < self.max_event_time
+    
+    def add_event(self, device_id: str, event_data: dict, timestamp: datetime,
+                  trace_id: Optional[str] = None) -> Optional[SensorEvent]:
+        """
+        Insert a sensor event into the sequence by its event time.
         
         Maintains bounded buffer by removing oldest event when exceeding
-        maximum of 3 events. Preserves chronological ordering.
+        maximum of 3 events. In-order events are appended; late events are
+        inserted at their position by walking back from the tail, which is
+        cheap because late events are close to the tail.
         
         Args:
             device_id: Device identifier
             event_data: Raw event data from device
-            timestamp: When the event occurred
+            timestamp: When the event occurred at the source
+            trace_id: Optional latency trace ID carried with the event
+            
+        Returns:
+            Optional[SensorEvent]: The buffered event, or None if it was older
+            than the watermark and dropped
         """
+        watermark = self.get_watermark()
+        if watermark is not None and timestamp < watermark:
+            self.dropped_late_count += 1
+            log_event(logger, logging.WARNING, 'event_dropped_late',
+                      device_id=device_id, lateness=(self.max_event_time - timestamp).total_seconds())
+            return None
+        
         # Determine device type from device_id or event_data
         device_type = event_data.get('type', 'unknown')
         
@@ -73,22 +144,30 @@ class ThreatAnalyzer:
             device_id=device_id,
             device_type=device_type,
             timestamp=timestamp,
-            data=event_data
+            data=event_data,
+            trace_id=trace_id
         )
         
-        # Append event to sequence
-        self.event_sequence.append(event)
+        # Insert in event-time order (append for the in-order common case)
+        index = len(self.event_sequence)
+        while index > 0 and self.event_sequence[index - 1].timestamp > timestamp:
+            index -= 1
+        self.event_sequence.insert(index, event)
+        
+        if self.is_late(event):
+            self.late_event_count += 1
+        else:
+            self.max_event_time = timestamp
         
         # Maintain bounded buffer - remove oldest if exceeding max
         if len(self.event_sequence) > self.max_events:
             removed_event = self.event_sequence.pop(0)
-            logger.debug(f"Removed oldest event from buffer: {removed_event.device_id}")
+            log_event(logger, logging.DEBUG, 'event_evicted', device_id=removed_event.device_id)
         
-        # Ensure chronological ordering is maintained
-        # Events should be added in order, but we verify
-        self.event_sequence.sort(key=lambda e: e.timestamp)
-        
-        logger.info(f"Added event from device {device_id}. Buffer size: {len(self.event_sequence)}")
+        log_event(logger, logging.INFO, 'event_added',
+                  device_id=device_id, buffer_size=len(self.event_sequence),
+                  late=self.is_late(event))
+        return event
     
     def clear_warnings(self) -> None:
         """
@@ -116,6 +195,42 @@ class ThreatAnalyzer:
             List of sensor events in chronological order
         """
         return self.event_sequence.copy()
+    
+    def restore_events(self, events: List[SensorEvent]) -> None:
+        """
+        Restore the event sequence from a state snapshot.
+        
+        Keeps only the most recent events that fit in the bounded buffer.
+        
+        Args:
+            events: Previously captured events in chronological order
+        """
+        self.event_sequence = sorted(events, key=lambda e: e.timestamp)[-self.max_events:]
+        if self.event_sequence:
+            self.max_event_time = self.event_sequence[-1].timestamp
+        logger.info(f"Restored {len(self.event_sequence)} events from snapshot")
+    
+    def get_pending_deadlines(self, motion_device_id: str,
+                              vibration_device_id: str) -> Dict[str, float]:
+        """
+        Get open sequence windows that are still waiting for a follow-up event.
+        
+        A motion event with no later vibration event opens a motion+vibration
+        window that closes ``window_seconds`` after the motion.
+        
+        Args:
+            motion_device_id: Device ID for living room motion sensor
+            vibration_device_id: Device ID for window vibration sensor
+            
+        Returns:
+            Dict[str, float]: Deadline name mapped to its epoch-seconds due time
+        """
+        for event in reversed(self.event_sequence):
+            if event.device_id == vibration_device_id:
+                return {}
+            if event.device_id == motion_device_id:
+                return {'motion_vibration': event.timestamp.timestamp() + self.window_seconds}
+        return {}
 
     
     def get_time_weight(self, current_time: datetime) -> float:
@@ -137,11 +252,13 @@ class ThreatAnalyzer:
         # Nighttime: 22:00 (10 PM) to 06:00 (6 AM)
         if hour >= 22 or hour < 6:
             weight = 1.5
-            logger.debug(f"Nighttime weight applied: {weight}x at {hour:02d}:00")
+            log_sampled(logger, _weight_sampler, logging.DEBUG, 'time_weight',
+                        period='night', weight=weight, hour=hour)
         # Daytime: 06:00 (6 AM) to 22:00 (10 PM)
         else:
             weight = 0.7
-            logger.debug(f"Daytime weight applied: {weight}x at {hour:02d}:00")
+            log_sampled(logger, _weight_sampler, logging.DEBUG, 'time_weight',
+                        period='day', weight=weight, hour=hour)
         
         return weight
     
@@ -161,8 +278,10 @@ class ThreatAnalyzer:
         """
         time_weight = self.get_time_weight(current_time)
         final_score = base_score * time_weight
+        self.last_score = final_score
         
-        logger.info(f"Calculated threat score: base={base_score}, weight={time_weight}, final={final_score}")
+        log_event(logger, logging.INFO, 'threat_score',
+                  base=base_score, weight=time_weight, final=final_score)
         
         return final_score
     
@@ -170,10 +289,10 @@ class ThreatAnalyzer:
         """
         Classify threat level based on final weighted score.
         
-        Classification thresholds:
-        - score >= 80: RED_CRITICAL (immediate threat)
-        - 40 <= score < 80: YELLOW_WARNING (potential concern)
-        - score < 40: GREEN_SAFE (normal activity)
+        Classification thresholds (configurable, 80 and 40 by default):
+        - score >= critical_threshold: RED_CRITICAL (immediate threat)
+        - warning_threshold <= score < critical_threshold: YELLOW_WARNING (potential concern)
+        - score < warning_threshold: GREEN_SAFE (normal activity)
         
         Args:
             final_score: The weighted threat score
@@ -181,14 +300,14 @@ class ThreatAnalyzer:
         Returns:
             str: Status code (RED_CRITICAL, YELLOW_WARNING, or GREEN_SAFE)
         """
-        if final_score >= 80:
+        if final_score >= self.critical_threshold:
             status = "RED_CRITICAL"
-        elif final_score >= 40:
+        elif final_score >= self.warning_threshold:
             status = "YELLOW_WARNING"
         else:
             status = "GREEN_SAFE"
         
-        logger.info(f"Threat classified as {status} (score: {final_score})")
+        log_event(logger, logging.INFO, 'threat_classified', status=status, score=final_score)
         
         return status
     
@@ -219,6 +338,8 @@ class ThreatAnalyzer:
         """
         if not self.event_sequence:
             logger.debug("Empty event sequence, returning GREEN_SAFE")
+            self.last_score = 0.0
+            self.last_pattern = 'none'
             return ("GREEN_SAFE", "HOUSE")
         
         # Get the most recent event and use its timestamp for time weighting
@@ -238,7 +359,8 @@ class ThreatAnalyzer:
                 base_score = 0
                 final_score = self.calculate_threat_score(base_score, current_time)
                 status = self.classify_threat(final_score)
-                logger.info(f"Door unlock detected: {status}")
+                log_event(logger, logging.INFO, 'pattern_door_unlock', status=status)
+                self.last_pattern = 'door_unlock'
                 return (status, "HOUSE")
         
         # Check for motion + vibration pattern (RED_CRITICAL or YELLOW_WARNING)
@@ -257,12 +379,14 @@ class ThreatAnalyzer:
             # Check if vibration occurred within 10 seconds after motion
             time_diff = (vibration_event.timestamp - motion_event.timestamp).total_seconds()
             
-            if 0 <= time_diff <= 10:
+            if 0 <= time_diff <= self.window_seconds:
                 # Motion + Vibration pattern detected
                 base_score = 90
                 final_score = self.calculate_threat_score(base_score, current_time)
                 status = self.classify_threat(final_score)
-                logger.info(f"Motion + Vibration pattern detected (time_diff={time_diff:.2f}s): {status}")
+                log_event(logger, logging.INFO, 'pattern_motion_vibration',
+                          time_diff=round(time_diff, 2), status=status)
+                self.last_pattern = 'motion_vibration'
                 return (status, "HOUSE")
         
         # If we have motion but no vibration follow-up within 10 seconds
@@ -272,18 +396,73 @@ class ThreatAnalyzer:
             
             # If more than 10 seconds have passed since motion, or if we have a vibration
             # event but it's not within the 10-second window
-            if time_since_motion > 10 or (vibration_event and 
-                (vibration_event.timestamp - motion_event.timestamp).total_seconds() > 10):
+            if time_since_motion > self.window_seconds or (vibration_event and 
+                (vibration_event.timestamp - motion_event.timestamp).total_seconds() > self.window_seconds):
                 # Motion alone pattern
                 base_score = 50
                 final_score = self.calculate_threat_score(base_score, current_time)
                 status = self.classify_threat(final_score)
-                logger.info(f"Motion alone detected (time_since={time_since_motion:.2f}s): {status}")
+                log_event(logger, logging.INFO, 'pattern_motion_alone',
+                          time_since=round(time_since_motion, 2), status=status)
+                self.last_pattern = 'motion_alone'
                 return (status, "LivingRoom")
         
         # Default to GREEN_SAFE if no patterns detected
         base_score = 0
         final_score = self.calculate_threat_score(base_score, current_time)
         status = self.classify_threat(final_score)
-        logger.debug(f"No threat pattern detected: {status}")
+        log_event(logger, logging.DEBUG, 'pattern_none', status=status)
+        self.last_pattern = 'none'
+        return (status, "HOUSE")
+    
+    def analyze_late_event(self, event: SensorEvent, living_room_motion_id: str,
+                           window_vibration_id: str) -> Optional[Tuple[str, str]]:
+        """
+        Re-evaluate only the rule windows that a late event falls into.
+        
+        A late event cannot change the classification of events that came
+        after it, except by completing a motion+vibration window it belongs
+        to: a late vibration may follow an earlier motion, and a late motion
+        may precede a buffered vibration. Other late events are ignored.
+        
+        Args:
+            event: Late event returned by add_event
+            living_room_motion_id: Device ID for living room motion sensor
+            window_vibration_id: Device ID for window vibration sensor
+            
+        Returns:
+            Optional[Tuple[str, str]]: (status, zone) if the late event
+            completes a pattern, otherwise None
+        """
+        # A late event older than the whole buffer is evicted by add_event's
+        # trim right after insertion; it is no longer part of any window
+        if not any(buffered is event for buffered in self.event_sequence):
+            log_event(logger, logging.DEBUG, 'late_event_evicted', device_id=event.device_id)
+            return None
+        
+        window = timedelta(seconds=self.window_seconds)
+        
+        if event.device_id == window_vibration_id:
+            partners = [e for e in self.event_sequence
+                        if e.device_id == living_room_motion_id
+                        and event.timestamp - window <= e.timestamp <= event.timestamp]
+        elif event.device_id == living_room_motion_id:
+            partners = [e for e in self.event_sequence
+                        if e.device_id == window_vibration_id
+                        and event.timestamp <= e.timestamp <= event.timestamp + window]
+        else:
+            log_event(logger, logging.DEBUG, 'late_event_ignored', device_id=event.device_id)
+            return None
+        
+        if not partners:
+            log_event(logger, logging.DEBUG, 'late_event_no_window', device_id=event.device_id)
+            return None
+        
+        # Score at the time the pattern completed (the later of the pair)
+        completed_at = max(event.timestamp, partners[-1].timestamp)
+        final_score = self.calculate_threat_score(90, completed_at)
+        status = self.classify_threat(final_score)
+        log_event(logger, logging.INFO, 'pattern_motion_vibration_late',
+                  device_id=event.device_id, status=status)
+        self.last_pattern = 'motion_vibration'
         return (status, "HOUSE")
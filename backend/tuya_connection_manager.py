@@ -11,19 +11,50 @@ import os
 from typing import Callable, Dict, List, Optional
 from tuya_connector import TuyaOpenAPI, TuyaOpenPulsar, TuyaCloudPulsarTopic, TUYA_LOGGER
 from dotenv import load_dotenv
+from structured_logging import EventSampler, log_event, log_sampled
+from latency_tracing import get_tracer
+from metrics import get_registry
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
+_metrics = get_registry()
+_poll_cycle_seconds = _metrics.histogram(
+    'securex_poll_cycle_seconds', 'Duration of one pass over all polled devices')
+_api_latency_seconds = _metrics.histogram(
+    'securex_tuya_api_latency_seconds', 'Tuya API request latency', ('operation', 'device_id'))
+_api_errors_total = _metrics.counter(
+    'securex_tuya_api_errors_total', 'Failed Tuya API requests', ('operation',))
+_api_throttled_total = _metrics.counter(
+    'securex_tuya_api_throttled_total', 'Tuya API requests rejected by rate limiting', ('operation',))
+_command_retries_total = _metrics.counter(
+    'securex_command_retries_total', 'Device command retries', ('device_id',))
+
+# Poll errors repeat every cycle for an offline device; sample them
+_poll_error_sampler = EventSampler(every_n=50)
+
 # Set Tuya SDK logger to WARNING to reduce noise
 TUYA_LOGGER.setLevel(logging.WARNING)
 
 
+def _count_api_failure(operation: str, response: Optional[Dict] = None) -> None:
+    """
+    Count a failed Tuya API request, separating rate-limit rejections.
+    
+    Tuya reports throttling as an unsuccessful response whose message
+    mentions the request frequency or limit.
+    
+    Args:
+        operation: API operation (status, command)
+        response: The unsuccessful response, or None for an exception
+    """
+    message = str((response or {}).get('msg', '')).lower()
+    if 'frequen' in message or 'limit' in message:
+        _api_throttled_total.labels(operation).inc()
+    else:
+        _api_errors_total.labels(operation).inc()
+
+
 class TuyaConnectionManager:
     """
     Manages connection to Tuya Cloud and device communication.
@@ -106,15 +137,21 @@ class TuyaConnectionManager:
         logger.error(f"Failed to connect after {self.max_connection_attempts} attempts")
         return False
     
-    def subscribe_to_devices(self, device_ids: List[str]) -> None:
+    def subscribe_to_devices(self, device_ids: List[str],
+                             initial_states: Optional[Dict[str, list]] = None) -> None:
         """
         Subscribe to device status changes using polling.
         
         For SaaS projects, Pulsar WebSocket often fails. We use polling instead
         to check device status periodically and detect changes.
         
+        Devices present in ``initial_states`` (e.g. restored from a state
+        snapshot) skip the initial status fetch, so changes made while the
+        agent was down are detected on the first poll.
+        
         Args:
             device_ids: List of device IDs to subscribe to
+            initial_states: Optional last known status list per device ID
             
         Raises:
             RuntimeError: If not connected to Tuya Cloud
@@ -130,7 +167,11 @@ class TuyaConnectionManager:
             
             # Initialize last known state for each device
             self.device_states = {}
+            initial_states = initial_states or {}
             for device_id in device_ids:
+                if device_id in initial_states:
+                    self.device_states[device_id] = initial_states[device_id]
+                    continue
                 try:
                     response = self.api.get(f'/v1.0/iot-03/devices/{device_id}/status')
                     if response.get('success'):
@@ -159,12 +200,19 @@ class TuyaConnectionManager:
         if not hasattr(self, 'subscribed_devices'):
             return
         
+        tracer = get_tracer()
+        cycle_started = time.monotonic()
         for device_id in self.subscribed_devices:
             try:
                 # Get current device status
+                poll_started = time.monotonic()
                 response = self.api.get(f'/v1.0/iot-03/devices/{device_id}/status')
+                poll_seconds = time.monotonic() - poll_started
+                tracer.record(None, 'poll_api', poll_seconds, device_id=device_id)
+                _api_latency_seconds.labels('status', device_id).observe(poll_seconds)
                 
                 if not response.get('success'):
+                    _count_api_failure('status', response)
                     continue
                 
                 current_state = response.get('result', [])
@@ -172,7 +220,7 @@ class TuyaConnectionManager:
                 
                 # Check if state has changed
                 if current_state != last_state:
-                    logger.info(f"Device {device_id} state changed")
+                    log_event(logger, logging.INFO, 'device_state_changed', device_id=device_id)
                     
                     # Update stored state
                     self.device_states[device_id] = current_state
@@ -185,14 +233,22 @@ class TuyaConnectionManager:
                             'device_id': device_id,
                             'status': {item['code']: item['value'] for item in current_state},
                             'data': current_state,
-                            'timestamp': time.time()
+                            'timestamp': time.time(),
+                            # Trace starts when the detecting poll request was issued
+                            'trace_id': tracer.start_trace(poll_started, device_id=device_id)
                         }
                         self.message_callback(message)
                 
             except Exception as e:
-                logger.debug(f"Error polling device {device_id}: {e}")
+                _count_api_failure('status')
+                log_sampled(logger, _poll_error_sampler, logging.DEBUG, 'poll_error',
+                            device_id=device_id, error=e)
+        
+        _poll_cycle_seconds.observe(time.monotonic() - cycle_started)
     
-    def send_command(self, device_id: str, commands: Dict) -> bool:
+    def send_command(self, device_id: str, commands: Dict,
+                     timeout: Optional[float] = None,
+                     should_abort: Optional[Callable[[], bool]] = None) -> bool:
         """
         Send control command to a device with retry logic.
         
@@ -202,6 +258,10 @@ class TuyaConnectionManager:
             device_id: Target device ID
             commands: Command dictionary in Tuya format
                      {"commands": [{"code": "switch_led", "value": true}]}
+            timeout: Optional overall time budget in seconds; no retry is
+                     started that would exceed it
+            should_abort: Optional check before each retry; returning True
+                          abandons the command (e.g. superseded by a newer one)
             
         Returns:
             bool: True if command sent successfully, False otherwise
@@ -212,40 +272,73 @@ class TuyaConnectionManager:
         
         max_retries = 3
         retry_delay = 2  # seconds
+        deadline = time.monotonic() + timeout if timeout else None
         
         for attempt in range(1, max_retries + 1):
+            if attempt > 1:
+                _command_retries_total.labels(device_id).inc()
             try:
-                logger.info(f"Sending command to device {device_id} (attempt {attempt}/{max_retries})")
-                logger.debug(f"Command: {commands}")
+                log_event(logger, logging.INFO, 'command_send',
+                          device_id=device_id, attempt=attempt, max_retries=max_retries)
+                log_event(logger, logging.DEBUG, 'command_payload', commands=commands)
                 
                 # Use v1.0 API for device control (as per Tuya support documentation)
                 # Endpoint: POST /v1.0/iot-03/devices/{device_id}/commands
+                request_started = time.monotonic()
                 response = self.api.post(
                     f'/v1.0/iot-03/devices/{device_id}/commands',
                     commands
                 )
+                _api_latency_seconds.labels('command', device_id).observe(time.monotonic() - request_started)
                 
                 if response.get('success', False):
-                    logger.info(f"Command sent successfully to device {device_id}")
+                    log_event(logger, logging.INFO, 'command_ok', device_id=device_id)
                     return True
                 else:
+                    _count_api_failure('command', response)
                     error_msg = response.get('msg', 'Unknown error')
                     logger.error(f"Command failed: {error_msg}")
                     
-                    if attempt < max_retries:
-                        logger.info(f"Retrying in {retry_delay} seconds...")
-                        time.sleep(retry_delay)
+                    if attempt < max_retries and not self._wait_before_retry(
+                            device_id, retry_delay, deadline, should_abort):
+                        return False
                     
             except Exception as e:
+                _count_api_failure('command')
                 logger.error(f"Exception sending command to device {device_id}: {e}")
                 
-                if attempt < max_retries:
-                    logger.info(f"Retrying in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
+                if attempt < max_retries and not self._wait_before_retry(
+                        device_id, retry_delay, deadline, should_abort):
+                    return False
         
         logger.error(f"Failed to send command to device {device_id} after {max_retries} attempts")
         return False
     
+    def _wait_before_retry(self, device_id: str, retry_delay: float,
+                           deadline: Optional[float],
+                           should_abort: Optional[Callable[[], bool]]) -> bool:
+        """
+        Sleep before a command retry unless the retry should not happen.
+        
+        Args:
+            device_id: Target device ID (for logging)
+            retry_delay: Seconds to wait before the retry
+            deadline: Monotonic deadline of the command, or None
+            should_abort: Optional abort check
+            
+        Returns:
+            bool: True if the caller should retry, False to give up
+        """
+        if deadline is not None and time.monotonic() + retry_delay > deadline:
+            logger.error(f"Command to device {device_id} timed out")
+            return False
+        if should_abort is not None and should_abort():
+            logger.info(f"Command to device {device_id} superseded, not retrying")
+            return False
+        logger.info(f"Retrying in {retry_delay} seconds...")
+        time.sleep(retry_delay)
+        return True
+    
     def on_message(self, callback: Callable) -> None:
         """
         Register callback for incoming device messages.
@@ -3,20 +3,74 @@ Flask WebSocket Server for IoT security system.
 
 This module provides a WebSocket server endpoint for real-time
 communication with frontend clients, broadcasting security status updates.
+
+Two server modes are supported:
+- ``threading``: Werkzeug development server, one OS thread per client
+- ``gevent``: gevent WSGI server with native WebSockets, one greenlet per
+  client; suited to thousands of concurrent dashboard connections. The
+  process must call ``gevent.monkey.patch_all()`` before importing anything
+  else (ai_agent does this when WEBSOCKET_ASYNC_MODE=gevent).
+
+Clients are routed through home and zone subscription rooms (see
+subscription_rooms). A client that never subscribes is placed in the
+default home's room and receives all of that home's events. In multi-site
+mode (see sites) each further home has its own dashboard model; a client
+subscribing to such a home gets that home's snapshot.
+
+Clients may negotiate the compact MessagePack encoding (see wire_codec)
+with ``?encoding=msgpack`` in the handshake query; each broadcast is then
+encoded once per encoding and sent to every room of that encoding.
+
+Recent history is served over plain HTTP from an in-memory ring buffer
+(see event_history):
+
+    GET /events            sensor events
+    GET /status/history    classifications and protocol executions
+
+Both accept ``since`` (sequence cursor), ``limit``, ``device``, ``zone``,
+``status`` and ``home`` query parameters and honour ``If-None-Match``.
+
+Slow clients are handled by the backpressure policy in
+client_backpressure: device frames are skipped for a client whose
+outbound queue is backed up (it is resynced with a snapshot once it
+catches up), ``status_update`` never is, and clients that stay stalled
+are disconnected.
+
+``GET /metrics`` exposes the process's metrics registry (see metrics) in
+the Prometheus text format.
 """
 
 import logging
+import time
 from flask import Flask
-from flask_socketio import SocketIO, emit, disconnect
+from typing import Dict, List, Optional
+from flask_socketio import SocketIO, emit, disconnect, join_room, leave_room
 from flask_cors import CORS
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+from structured_logging import log_event
+from dashboard_state import DashboardState
+from client_backpressure import DROP_LAGGING, DROPPABLE_EVENTS, ClientBackpressure, transport_backlog
+from event_history import KIND_CLASSIFICATION, KIND_PROTOCOL, KIND_SENSOR_EVENT, EventHistory
+from subscription_rooms import DEFAULT_HOME, RoomDirectory, room_encoding, room_home, room_zone
+from wire_codec import ENCODING_JSON, ENCODING_MSGPACK, CompactCodec, msgpack_available
+from metrics import CONTENT_TYPE, get_registry
+
 logger = logging.getLogger(__name__)
 
+_broadcast_fanout_seconds = get_registry().histogram(
+    'securex_broadcast_fanout_seconds', 'Time to emit one broadcast to all recipients', ('event',))
+_client_frames_dropped_total = get_registry().counter(
+    'securex_client_frames_dropped_total', 'Frames skipped for lagging clients', ('reason',))
+_client_disconnects_total = get_registry().counter(
+    'securex_client_disconnects_total', 'Clients disconnected by backpressure', ('reason',))
+_client_resyncs_total = get_registry().counter(
+    'securex_client_resyncs_total', 'Snapshots sent to clients that caught up after lagging')
+
+ASYNC_MODES = ('threading', 'gevent')
+
+# Largest page a history request may ask for
+MAX_HISTORY_LIMIT = 1000
+
 
 class WebSocketServer:
     """
@@ -26,37 +80,93 @@ class WebSocketServer:
     JSON messages to all connected clients.
     """
     
-    def __init__(self, host: str = '0.0.0.0', port: int = 5000):
+    def __init__(self, host: str = '0.0.0.0', port: int = 5000, async_mode: str = 'threading',
+                 ping_interval: int = 25, ping_timeout: int = 20,
+                 max_http_buffer_size: int = 64 * 1024,
+                 state: DashboardState = None, default_home: str = DEFAULT_HOME,
+                 history: EventHistory = None, max_backlog_frames: int = 32,
+                 disconnect_backlog_frames: int = 512, slow_consumer_seconds: float = 30.0,
+                 backpressure_interval_seconds: float = 0.5,
+                 site_states: Optional[Dict[str, DashboardState]] = None):
         """
         Initialize Flask WebSocket server.
         
         Args:
             host: Host address to bind to (default: 0.0.0.0)
             port: Port number to listen on (default: 5000)
+            async_mode: Server mode, 'threading' (development) or 'gevent' (production)
+            ping_interval: Seconds between keep-alive pings to each client
+            ping_timeout: Seconds without a pong before a client is dropped
+            max_http_buffer_size: Maximum size of a message accepted from a client
+            state: Authoritative dashboard model sent to clients on connect
+                   (a new empty model if omitted)
+            default_home: Home new clients are subscribed to and events
+                          without a "home" field belong to
+            history: Recent event history served by the REST endpoints
+                     (a new empty history if omitted)
+            max_backlog_frames: Queued outbound frames above which a client
+                                stops receiving device frames
+            disconnect_backlog_frames: Queued outbound frames at which a
+                                       client is disconnected
+            slow_consumer_seconds: Longest a client may lag before it is
+                                   disconnected
+            backpressure_interval_seconds: How often client backlogs are checked
+            site_states: Dashboard model of each further home served by this
+                         server (multi-site mode); other homes use ``state``
+        
+        Raises:
+            ValueError: If the async mode is not supported
         """
+        if async_mode not in ASYNC_MODES:
+            raise ValueError(f"Unsupported WebSocket async mode '{async_mode}' (expected one of {ASYNC_MODES})")
+        if async_mode == 'gevent':
+            from gevent import monkey
+            if not monkey.is_module_patched('socket'):
+                logger.warning("gevent mode without monkey patching: blocking calls will stall all clients")
+        
         self.host = host
         self.port = port
+        self.async_mode = async_mode
+        self.state = state or DashboardState()
+        self.default_home = default_home
+        self.site_states = site_states or {}
+        self.history = history or EventHistory()
+        self.rooms = RoomDirectory()
+        self.backpressure = ClientBackpressure(
+            max_backlog_frames=max_backlog_frames,
+            disconnect_backlog_frames=disconnect_backlog_frames,
+            slow_consumer_seconds=slow_consumer_seconds
+        )
+        self.backpressure_interval_seconds = backpressure_interval_seconds
+        self.codec = CompactCodec() if msgpack_available() else None
         self.app = Flask(__name__)
         self.app.config['SECRET_KEY'] = 'tuya-security-digital-twin-secret'
         
         # Enable CORS for frontend communication
         CORS(self.app)
         
-        # Initialize SocketIO with CORS support
+        # Initialize SocketIO with CORS support. Idle clients only cost a
+        # ping every ping_interval; client messages are size-capped.
         self.socketio = SocketIO(
             self.app,
             cors_allowed_origins="*",
-            async_mode='threading'
+            async_mode=async_mode,
+            ping_interval=ping_interval,
+            ping_timeout=ping_timeout,
+            max_http_buffer_size=max_http_buffer_size
         )
         
         # Track connected clients
         self.connected_clients = set()
+        get_registry().gauge(
+            'securex_connected_clients', 'Connected dashboard clients'
+        ).set_function(lambda: len(self.connected_clients))
         
         # Set up routes and event handlers
         self._setup_routes()
         self._setup_socketio_handlers()
         
-        logger.info(f"WebSocketServer initialized on {host}:{port}")
+        logger.info(f"WebSocketServer initialized on {host}:{port} ({async_mode} mode)")
     
     def _setup_routes(self):
         """Set up HTTP routes."""
@@ -67,8 +177,61 @@ class WebSocketServer:
             return {
                 'status': 'ok',
                 'service': 'tuya-security-digital-twin',
-                'connected_clients': len(self.connected_clients)
+                'connected_clients': len(self.connected_clients),
+                'rooms': self.rooms.counts(),
+                'backpressure': self.backpressure.get_stats()
             }, 200
+        
+        @self.app.route('/metrics', methods=['GET'])
+        def metrics():
+            """Prometheus metrics endpoint."""
+            return get_registry().render(), 200, {'Content-Type': CONTENT_TYPE}
+        
+        @self.app.route('/events', methods=['GET'])
+        def events():
+            """Recent sensor events."""
+            return self._history_response((KIND_SENSOR_EVENT,))
+        
+        @self.app.route('/status/history', methods=['GET'])
+        def status_history():
+            """Recent classifications and protocol executions."""
+            return self._history_response((KIND_CLASSIFICATION, KIND_PROTOCOL))
+    
+    def _history_response(self, kinds):
+        """
+        Answer a history request from the ring buffer.
+        
+        The response is ``{"events": [...], "next_since": <seq>,
+        "last_seq": <seq>}``; pass ``next_since`` as ``since`` to get the
+        next page. A request whose ETag matches ``If-None-Match`` gets an
+        empty 304 without the buffer being scanned.
+        
+        Args:
+            kinds: Record kinds served by the endpoint
+        """
+        from flask import Response, jsonify, request
+        try:
+            since = int(request.args.get('since', 0))
+            limit = int(request.args.get('limit', 100))
+        except ValueError:
+            return {'error': "'since' and 'limit' must be integers"}, 400
+        limit = max(1, min(limit, MAX_HISTORY_LIMIT))
+        device_id = request.args.get('device')
+        zone = request.args.get('zone')
+        status = request.args.get('status')
+        home_id = request.args.get('home')
+        
+        etag = self.history.etag(kinds, since, limit, device_id, zone, status, home_id)
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers={'ETag': f'"{etag}"'})
+        
+        records, next_since = self.history.query(
+            kinds, since=since, limit=limit, device_id=device_id, zone=zone, status=status,
+            home=home_id
+        )
+        response = jsonify({'events': records, 'next_since': next_since, 'last_seq': self.history.last_seq})
+        response.set_etag(etag)
+        return response
     
     def _setup_socketio_handlers(self):
         """Set up WebSocket event handlers."""
@@ -79,11 +242,20 @@ class WebSocketServer:
             from flask import request
             client_id = request.sid
             
+            # Negotiate the wire encoding (JSON unless MessagePack is requested and available)
+            encoding = ENCODING_JSON
+            if request.args.get('encoding') == ENCODING_MSGPACK and self.codec is not None:
+                encoding = ENCODING_MSGPACK
+            
             self.connected_clients.add(client_id)
-            logger.info(f"Client connected: {client_id}. Total clients: {len(self.connected_clients)}")
+            self.rooms.set_encoding(client_id, encoding)
+            self._apply_subscription(client_id, self.default_home, None)
+            logger.info(f"Client connected: {client_id} ({encoding}). Total clients: {len(self.connected_clients)}")
             
-            # Send connection acknowledgment
-            emit('connected', {'client_id': client_id})
+            # Send connection acknowledgment, then the current picture so the
+            # client does not have to wait for the next change
+            emit('connected', {'client_id': client_id, 'encoding': encoding})
+            emit('state_snapshot', self._encode('state_snapshot', self.state.snapshot(), encoding))
         
         @self.socketio.on('disconnect')
         def handle_disconnect():
@@ -91,34 +263,216 @@ class WebSocketServer:
             from flask import request
             client_id = request.sid
             
+            self.rooms.remove_client(client_id)
+            self.backpressure.remove_client(client_id)
             if client_id in self.connected_clients:
                 self.connected_clients.remove(client_id)
                 logger.info(f"Client disconnected: {client_id}. Total clients: {len(self.connected_clients)}")
         
+        @self.socketio.on('subscribe')
+        def handle_subscribe(data):
+            """
+            Subscribe to a home, or to some of its zones.
+            
+            Payload: {"home": "<home_id>", "zones": ["Foyer", ...]} (zones optional)
+            """
+            from flask import request
+            data = data if isinstance(data, dict) else {}
+            home_id = str(data.get('home') or self.default_home)
+            zones = data.get('zones')
+            if zones is not None and (not isinstance(zones, list) or not all(isinstance(z, str) for z in zones)):
+                emit('subscription_error', {'error': "'zones' must be a list of zone names"})
+                return
+            rooms = self._apply_subscription(request.sid, home_id, zones)
+            emit('subscribed', {'home': home_id, 'zones': zones or [], 'rooms': rooms})
+            if home_id in self.site_states:
+                # Another site: the client only has the default home's picture
+                encoding = self.rooms.get_encoding(request.sid)
+                emit('state_snapshot', self._encode('state_snapshot', self._state_for(home_id).snapshot(), encoding))
+        
+        @self.socketio.on('unsubscribe')
+        def handle_unsubscribe(data):
+            """Unsubscribe from a home. Payload: {"home": "<home_id>"}"""
+            from flask import request
+            data = data if isinstance(data, dict) else {}
+            home_id = str(data.get('home') or self.default_home)
+            for room in self.rooms.unsubscribe(request.sid, home_id):
+                leave_room(room)
+            emit('unsubscribed', {'home': home_id})
+        
+        @self.socketio.on('sync')
+        def handle_sync(data=None):
+            """
+            Resend the full state to a client that lost track of deltas.
+            
+            Payload: {"home": "<home_id>"} (optional, default home if omitted)
+            """
+            from flask import request
+            data = data if isinstance(data, dict) else {}
+            home_id = str(data.get('home') or self.default_home)
+            encoding = self.rooms.get_encoding(request.sid)
+            emit('state_snapshot', self._encode('state_snapshot', self._state_for(home_id).snapshot(), encoding))
+        
         @self.socketio.on('ping')
         def handle_ping():
             """Handle ping from client."""
             from datetime import datetime
             emit('pong', {'timestamp': str(datetime.now())})
     
+    def _apply_subscription(self, sid: str, home_id: str, zones) -> List[str]:
+        """Replace a client's subscription for a home; return its rooms for that home."""
+        join, leave = self.rooms.subscribe(sid, home_id, zones)
+        for room in leave:
+            leave_room(room, sid=sid)
+        for room in join:
+            join_room(room, sid=sid)
+        log_event(logger, logging.DEBUG, 'client_subscribed', sid=sid, home=home_id, joined=join, left=leave)
+        return join
+    
+    def _state_for(self, home_id: str) -> DashboardState:
+        """Get the dashboard model of a home."""
+        return self.site_states.get(home_id, self.state)
+    
+    def _encode(self, event: str, data: Dict, encoding: str):
+        """Encode a message for clients of one wire encoding."""
+        if encoding == ENCODING_MSGPACK:
+            return self.codec.encode(event, data)
+        return data
+    
+    def emit(self, event: str, data: Dict) -> None:
+        """
+        Emit an event to the clients subscribed to its home and zone.
+        
+        The event is routed by the payload's "home" (default home if
+        absent) and "zone" fields; house-wide events reach every zone room
+        of the home. Nothing is sent if nobody is subscribed. The payload
+        is encoded once per wire encoding.
+        
+        Args:
+            event: Event name
+            data: Event payload
+        """
+        started = time.perf_counter()
+        rooms = self.rooms.rooms_for(data.get('home', self.default_home), data.get('zone'))
+        by_encoding: Dict[str, List[str]] = {}
+        for room in rooms:
+            by_encoding.setdefault(room_encoding(room), []).append(room)
+        skip = self._lagging_in(rooms) if event in DROPPABLE_EVENTS else None
+        for encoding, targets in by_encoding.items():
+            self.socketio.emit(event, self._encode(event, data, encoding), to=targets, skip_sid=skip)
+        _broadcast_fanout_seconds.labels(event).observe(time.perf_counter() - started)
+    
+    def emit_device_frame(self, updates: List[Dict]) -> None:
+        """
+        Emit one tick's device updates, one frame per subscription room.
+        
+        Whole-home subscribers get every update of their home, zone
+        subscribers only their zones' updates. A frame with one update is
+        sent as ``device_update``, otherwise as ``device_updates``.
+        
+        Args:
+            updates: device_update deltas collected during the tick
+        """
+        started = time.perf_counter()
+        by_home: Dict[str, List[Dict]] = {}
+        for update in updates:
+            by_home.setdefault(update.get('home', self.default_home), []).append(update)
+        
+        for home_id, home_updates in by_home.items():
+            frames = {room: home_updates for room in self.rooms.home_rooms(home_id)}
+            for room in self.rooms.zone_rooms(home_id):
+                zone = room_zone(room)
+                zone_updates = [update for update in home_updates if update.get('zone') == zone]
+                if zone_updates:
+                    frames[room] = zone_updates
+            skip = self._lagging_in(frames)
+            # MessagePack frames are encoded together so each carries the
+            # dictionary entries it needs (see CompactCodec.encode_device_frames)
+            compact = {room: frame for room, frame in frames.items() if room_encoding(room) == ENCODING_MSGPACK}
+            encoded = self.codec.encode_device_frames(compact) if compact else {}
+            for room, frame in frames.items():
+                event = 'device_update' if len(frame) == 1 else 'device_updates'
+                if room in encoded:
+                    payload = encoded[room]
+                else:
+                    payload = frame[0] if len(frame) == 1 else {'updates': frame}
+                self.socketio.emit(event, payload, to=room, skip_sid=skip)
+        _broadcast_fanout_seconds.labels('device_frame').observe(time.perf_counter() - started)
+    
+    def _lagging_in(self, rooms) -> Optional[List[str]]:
+        """Get the lagging clients to skip for a device frame, counting the skips."""
+        lagging = self.backpressure.lagging_clients()
+        if not lagging:
+            return None
+        skipped = sum(1 for sid in lagging for room in rooms if self.rooms.is_member(sid, room))
+        if skipped:
+            self.backpressure.note_dropped(skipped)
+            _client_frames_dropped_total.labels(DROP_LAGGING).inc(skipped)
+        return lagging
+    
+    def check_backpressure(self) -> None:
+        """Classify clients by backlog; resync caught-up clients and disconnect stalled ones."""
+        server = self.socketio.server
+        backlogs = {sid: transport_backlog(server, sid) for sid in list(self.connected_clients)}
+        resync, disconnect = self.backpressure.evaluate(backlogs, time.monotonic())
+        if resync:
+            snapshots = {}
+            for sid in resync:
+                encoding = self.rooms.get_encoding(sid)
+                for home_id in self.rooms.client_homes(sid) or [self.default_home]:
+                    if home_id not in snapshots:
+                        snapshots[home_id] = self._state_for(home_id).snapshot()
+                    self.socketio.emit('state_snapshot',
+                                       self._encode('state_snapshot', snapshots[home_id], encoding), to=sid)
+                _client_resyncs_total.inc()
+        for sid, reason in disconnect:
+            log_event(logger, logging.WARNING, 'client_disconnected_backpressure', sid=sid, reason=reason)
+            _client_disconnects_total.labels(reason).inc()
+            self.socketio.server.disconnect(sid, namespace='/')
+    
+    def _backpressure_loop(self) -> None:
+        while True:
+            self.socketio.sleep(self.backpressure_interval_seconds)
+            try:
+                self.check_backpressure()
+            except Exception as e:
+                logger.error(f"Error checking client backpressure: {e}", exc_info=True)
+    
+    def resync_clients(self) -> None:
+        """Send a fresh snapshot to every subscribed client (after the model was replaced)."""
+        by_home: Dict[str, Dict[str, List[str]]] = {}
+        for room in self.rooms.counts():
+            by_home.setdefault(room_home(room), {}).setdefault(room_encoding(room), []).append(room)
+        for home_id, by_encoding in by_home.items():
+            snapshot = self._state_for(home_id).snapshot()
+            for encoding, targets in by_encoding.items():
+                self.socketio.emit('state_snapshot', self._encode('state_snapshot', snapshot, encoding), to=targets)
+    
+    def get_room_counts(self) -> Dict[str, int]:
+        """
+        Get the number of clients in each subscription room.
+        
+        Returns:
+            Dict[str, int]: Room name mapped to client count
+        """
+        return self.rooms.counts()
+    
     def broadcast_status(self, status: str, zone: str) -> None:
         """
-        Broadcast security status update to all connected clients.
+        Broadcast security status update to subscribed clients.
         
-        Sends JSON message containing status and zone fields to all
-        connected WebSocket clients.
+        Sends JSON message containing status, zone and state version fields
+        to the clients subscribed to the default home or the zone.
         
         Args:
             status: Status code (RED_CRITICAL, YELLOW_WARNING, GREEN_SAFE)
             zone: Zone identifier (HOUSE, LivingRoom, Foyer, MasterBedroom)
         """
-        message = {
-            'status': status,
-            'zone': zone
-        }
+        message = self.state.apply_status(status, zone)
         
-        self.socketio.emit('status_update', message)
-        logger.info(f"Broadcast status update to {len(self.connected_clients)} clients: {status} in {zone}")
+        self.emit('status_update', message)
+        log_event(logger, logging.INFO, 'status_broadcast',
+                  clients=len(self.connected_clients), status=status, zone=zone)
     
     def get_connected_client_count(self) -> int:
         """
@@ -136,7 +490,19 @@ class WebSocketServer:
         Args:
             debug: Enable debug mode (default: False)
         """
-        logger.info(f"Starting WebSocket server on {self.host}:{self.port}")
+        logger.info(f"Starting WebSocket server on {self.host}:{self.port} ({self.async_mode} mode)")
+        self.socketio.start_background_task(self._backpressure_loop)
+        if self.async_mode == 'gevent':
+            # gevent pywsgi server; per-request access logging is disabled
+            self.socketio.run(
+                self.app,
+                host=self.host,
+                port=self.port,
+                debug=debug,
+                log_output=False
+            )
+            return
+        
         self.socketio.run(
             self.app,
             host=self.host,
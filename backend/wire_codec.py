@@ -0,0 +1,174 @@
+"""
+Compact MessagePack wire encoding for dashboard broadcasts.
+
+Clients choose their encoding when connecting (``?encoding=msgpack`` in the
+Socket.IO handshake query); JSON stays the default. For MessagePack
+clients each broadcast is encoded once and the same bytes are sent to every
+recipient room (a tick's device frames, which differ per room, once per
+distinct frame).
+
+Device IDs, datapoint codes and device types are dictionary coded: each
+string is assigned a small integer the first time it is sent, and the
+message that first uses it carries the new definitions. A tick's device
+frames (see encode_device_frames) are encoded together: every update in
+them carries the definitions of the indexes it uses that the tick
+introduced, so each room's frame decodes on its own whichever rooms it
+is sent to. The full dictionary is part of every snapshot, so a client
+that sees an unknown index can simply request a ``sync``.
+
+Payload layouts (MessagePack arrays; ``defs`` is ``{index: string}``):
+
+    status_update    [version, status, zone]
+    device_update    [version, device, {code: value}, timestamp_ms, zone, defs?]
+    device_updates   [<device_update>, ...]
+    state_snapshot   [version, status, zone, dictionary,
+                      {device: [type, name, location, zone, {code: value}, timestamp_ms]}]
+
+``device``, ``code`` and ``type`` are dictionary indexes, ``dictionary``
+is the list of strings by index and timestamps are epoch milliseconds.
+Maps use integer keys (Python clients unpack with ``strict_map_key=False``).
+"""
+
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+try:
+    import msgpack
+except ImportError:  # Optional dependency: JSON only without it
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+ENCODING_JSON = 'json'
+ENCODING_MSGPACK = 'msgpack'
+ENCODINGS = (ENCODING_JSON, ENCODING_MSGPACK)
+
+
+def msgpack_available() -> bool:
+    """Check whether the MessagePack encoding can be offered."""
+    return msgpack is not None
+
+
+def _timestamp_ms(timestamp) -> Optional[int]:
+    if not timestamp:
+        return None
+    try:
+        return int(datetime.fromisoformat(timestamp).timestamp() * 1000)
+    except (TypeError, ValueError):
+        return None
+
+
+class CompactCodec:
+    """
+    Encodes dashboard messages to dictionary-coded MessagePack.
+
+    The dictionary only grows, so indexes stay valid for the lifetime of
+    the process and every client can share it.
+    """
+
+    def __init__(self):
+        if msgpack is None:
+            raise RuntimeError("MessagePack encoding requires the msgpack package")
+        self._ids: Dict[str, int] = {}
+        self._names: List[str] = []
+        self._lock = threading.Lock()
+
+    def _intern(self, name: str, defs: Dict[int, str]) -> int:
+        index = self._ids.get(name)
+        if index is None:
+            with self._lock:
+                index = self._ids.get(name)
+                if index is None:
+                    index = len(self._names)
+                    self._names.append(name)
+                    self._ids[name] = index
+                    defs[index] = name
+        return index
+
+    def _device_update(self, data: Dict, defs: Dict[int, str]) -> list:
+        device = self._intern(data['device_id'], defs)
+        state = {self._intern(code, defs): value for code, value in data.get('state', {}).items()}
+        return [data.get('version'), device, state, _timestamp_ms(data.get('timestamp')), data.get('zone')]
+
+    @staticmethod
+    def _with_defs(body: list, defs: Dict[int, str]) -> list:
+        used = {index: defs[index] for index in (body[1], *body[2]) if index in defs}
+        return body + [used] if used else body
+
+    def _device_updates(self, updates: List[Dict]) -> List[list]:
+        defs: Dict[int, str] = {}
+        bodies = [self._device_update(update, defs) for update in updates]
+        return [self._with_defs(body, defs) for body in bodies]
+
+    def _snapshot(self, data: Dict) -> list:
+        defs: Dict[int, str] = {}
+        devices = {}
+        for device_id, device in data.get('devices', {}).items():
+            devices[self._intern(device_id, defs)] = [
+                self._intern(device['device_type'], defs),
+                device.get('device_name'),
+                device.get('location'),
+                device.get('zone'),
+                {self._intern(code, defs): value for code, value in device.get('state', {}).items()},
+                _timestamp_ms(device.get('timestamp'))
+            ]
+        with self._lock:
+            dictionary = list(self._names)
+        return [data.get('version'), data.get('status'), data.get('zone'), dictionary, devices]
+
+    def encode(self, event: str, data: Dict) -> bytes:
+        """
+        Encode one message.
+
+        Args:
+            event: Event name
+            data: JSON form of the message
+
+        Returns:
+            bytes: MessagePack payload
+        """
+        if event == 'device_update':
+            body = self._device_updates([data])[0]
+        elif event == 'device_updates':
+            body = self._device_updates(data.get('updates', []))
+        elif event == 'status_update':
+            body = [data.get('version'), data.get('status'), data.get('zone')]
+        elif event == 'state_snapshot':
+            body = self._snapshot(data)
+        else:
+            body = data
+        return msgpack.packb(body, use_bin_type=True)
+
+    def encode_device_frames(self, frames: Dict[str, List[Dict]]) -> Dict[str, bytes]:
+        """
+        Encode one tick's device frames, one per room.
+
+        Each distinct update is encoded once. It carries the definitions of
+        every index it uses that this tick introduced, so a zone room's
+        frame decodes even if the update that introduced a string went
+        only to another room.
+
+        Args:
+            frames: Room mapped to its device_update deltas (a frame with one
+                    update is a ``device_update``, otherwise ``device_updates``)
+
+        Returns:
+            Dict[str, bytes]: Room mapped to its MessagePack payload
+        """
+        updates = list({id(update): update for frame in frames.values() for update in frame}.values())
+        bodies = dict(zip((id(update) for update in updates), self._device_updates(updates)))
+        packed: Dict[int, bytes] = {}
+        encoded = {}
+        for room, frame in frames.items():
+            payload = packed.get(id(frame))
+            if payload is None:
+                body = bodies[id(frame[0])] if len(frame) == 1 else [bodies[id(update)] for update in frame]
+                payload = packed[id(frame)] = msgpack.packb(body, use_bin_type=True)
+            encoded[room] = payload
+        return encoded
+
+    def dictionary_size(self) -> int:
+        """Get the number of dictionary-coded strings."""
+        return len(self._names)